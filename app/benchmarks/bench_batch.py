@@ -0,0 +1,45 @@
+"""
+Turning a scan's wire JSON into a summary.
+
+`resource` is what the boto3 resource layer did: a TypeDeserializer pass (a
+Decimal per number) into dict rows, then the summary over the dicts. `batch`
+decodes the same items straight into a columnar TransactionBatch.
+"""
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from routes.get_summary.get_summary import calculate_summary
+from storage.batch import TransactionBatch
+from . import data
+
+SIZES = [1_000, 10_000]
+
+
+def wire_items(count: int) -> list:
+    serializer = TypeSerializer()
+    return [
+        {name: serializer.serialize(value) for name, value in row.items()}
+        for row in data.movement_rows("bench-user", count, days=365)
+    ]
+
+
+def resource_summary(items: list) -> dict:
+    deserializer = TypeDeserializer()
+    rows = [
+        {name: deserializer.deserialize(value) for name, value in item.items()}
+        for item in items
+    ]
+    return calculate_summary(rows)
+
+
+def batch_summary(items: list) -> dict:
+    return calculate_summary(TransactionBatch.from_wire(items))
+
+
+DECODERS = {"resource": resource_summary, "batch": batch_summary}
+
+
+@pytest.mark.parametrize("decoder", list(DECODERS))
+@pytest.mark.parametrize("transactions", SIZES)
+def bench_summary_from_wire(bench, transactions, decoder):
+    bench(DECODERS[decoder], wire_items(transactions))
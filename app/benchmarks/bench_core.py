@@ -0,0 +1,31 @@
+"""Benchmarks of the summary building blocks, without HTTP"""
+
+import pytest
+from local_aws import LocalAWS
+from routes.get_summary.get_summary import calculate_summary, send_summary_email
+from . import data
+
+SIZES = [100, 1_000, 10_000]
+
+
+@pytest.mark.parametrize("transactions", SIZES)
+def bench_calculate_summary(bench, transactions):
+    rows = data.movement_rows("bench-user", transactions, days=365)
+    bench(calculate_summary, rows)
+
+
+@pytest.mark.parametrize("months", [1, 12, 120])
+def bench_send_summary_email(bench, months):
+    """HTML rendering plus the (fake) SES call"""
+    summary = {
+        "total_balance": 1234.56,
+        "transactions_by_month": {
+            f"{2000 + month // 12}-{month % 12 + 1:02d}": month
+            for month in range(months)
+        },
+        "avg_debit": -12.5,
+        "avg_credit": 80.25,
+    }
+    with LocalAWS().install() as aws:
+        bench(send_summary_email, "user0@bench.local", summary)
+        assert aws.ses.sent > 0
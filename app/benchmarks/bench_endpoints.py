@@ -0,0 +1,121 @@
+"""End-to-end endpoint benchmarks through the FastAPI app against LocalAWS"""
+
+from datetime import date, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from common import metrics
+from local_aws import LocalAWS
+from main import init_lambda
+from . import data
+
+SIZES = [100, 1_000, 10_000]
+
+
+@pytest.fixture
+def aws():
+    metrics.configure("off")
+    with LocalAWS().install() as local_aws:
+        yield local_aws
+
+
+@pytest.fixture
+def client(aws):
+    return TestClient(init_lambda())
+
+
+@pytest.mark.parametrize("users", SIZES)
+def bench_login(bench, aws, client, users):
+    """Login scans the users table, cost grows with the number of users"""
+    data.seed_users(aws, users)
+    credentials = {"email": data.email_for(users - 1), "password": data.PASSWORD}
+
+    def login():
+        response = client.post("/login", json=credentials)
+        assert response.status_code == 200
+
+    bench(login, rounds=3)
+
+
+@pytest.mark.parametrize("users", SIZES)
+def bench_register(bench, aws, client, users):
+    data.seed_users(aws, users)
+    counter = iter(range(users, users + 1_000_000))
+
+    def register():
+        index = next(counter)
+        response = client.post(
+            "/register",
+            json={
+                "email": data.email_for(index),
+                "password": data.PASSWORD,
+                "name": "Bench",
+            },
+        )
+        assert response.status_code == 200
+
+    bench(register, rounds=3)
+
+
+@pytest.mark.parametrize("rows", SIZES)
+def bench_upload_file(bench, aws, client, rows):
+    [user_id] = data.seed_users(aws, 1)
+    token = data.seed_token(aws, data.email_for(0))
+    statement = data.statement_csv(user_id, rows, token=token).encode()
+
+    def upload():
+        response = client.post(
+            "/upload-file", files={"file": ("statement.csv", statement, "text/csv")}
+        )
+        assert response.status_code == 200
+
+    bench(upload)
+
+
+@pytest.mark.parametrize("movements", SIZES)
+def bench_get_summary(bench, aws, client, movements):
+    """Last 30 days summary, computed from the user's movements"""
+    user_ids = data.seed_users(aws, 2)
+    token = data.seed_token(aws, data.email_for(0))
+    data.seed_movements(aws, user_ids[0], movements)
+    # Another user's rows that the scan must skip
+    data.seed_movements(aws, user_ids[1], movements)
+
+    def get_summary():
+        response = client.post("/get-summary", json={"access_token": token})
+        assert response.status_code == 200
+
+    bench(get_summary)
+
+
+@pytest.mark.parametrize("movements", SIZES)
+def bench_get_summary_ranged(bench, aws, client, movements):
+    """Two year monthly summary served from rollups"""
+    [user_id] = data.seed_users(aws, 1)
+    token = data.seed_token(aws, data.email_for(0))
+    data.seed_movements(aws, user_id, movements, days=730)
+    request = {
+        "access_token": token,
+        "start": (date.today() - timedelta(days=730)).isoformat(),
+        "end": date.today().isoformat(),
+        "granularity": "month",
+    }
+
+    def get_summary():
+        response = client.post("/get-summary", json=request)
+        assert response.status_code == 200
+
+    bench(get_summary)
+
+
+@pytest.mark.parametrize("movements", SIZES)
+def bench_transactions_page(bench, aws, client, movements):
+    [user_id] = data.seed_users(aws, 1)
+    token = data.seed_token(aws, data.email_for(0))
+    data.seed_movements(aws, user_id, movements)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def list_page():
+        response = client.get("/transactions", params={"limit": 100}, headers=headers)
+        assert response.status_code == 200
+
+    bench(list_page)
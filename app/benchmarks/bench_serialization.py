@@ -0,0 +1,44 @@
+"""
+Response serialization of large history and summary payloads.
+
+`stdlib` is what a route returning a dict used to cost (jsonable_encoder plus
+the stdlib JSONResponse), `orjson` is the FastJSONResponse a hot route returns.
+"""
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from common.responses import FastJSONResponse
+from routes.get_summary.get_summary import calculate_summary
+from routes.transactions.transactions import serialize_transaction
+from . import data
+
+RENDERERS = {
+    "stdlib": lambda content: JSONResponse(jsonable_encoder(content)),
+    "orjson": FastJSONResponse,
+}
+
+
+@pytest.mark.parametrize("renderer", list(RENDERERS))
+@pytest.mark.parametrize("transactions", [100, 1_000])
+def bench_history_response(bench, transactions, renderer):
+    """A /transactions page (MAX_PAGE_SIZE is 1000)"""
+    rows = data.movement_rows("bench-user", transactions, days=365)
+    content = {
+        "transactions": [serialize_transaction(row) for row in rows],
+        "next_cursor": "eyJEYXRlIjoiMjAyNC0wMS0wMSJ9",
+    }
+    bench(RENDERERS[renderer], content)
+
+
+@pytest.mark.parametrize("renderer", list(RENDERERS))
+@pytest.mark.parametrize("months", [12, 120])
+def bench_summary_response(bench, months, renderer):
+    """A /get-summary response with `months` months of activity"""
+    rows = data.movement_rows("bench-user", months * 20, days=months * 30)
+    content = {
+        "status": "success",
+        "message": "Summary generated and sent successfully",
+        "summary": calculate_summary(rows),
+    }
+    bench(RENDERERS[renderer], content)
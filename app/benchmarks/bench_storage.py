@@ -0,0 +1,50 @@
+"""Storage backends compared on the access patterns of the API"""
+
+import pytest
+from local_aws import LocalAWS
+from storage.base import MAX_DATE, MIN_DATE
+from . import data
+
+BACKENDS = ["dynamodb", "memory", "sqlite"]
+SIZES = [1_000, 10_000]
+
+
+@pytest.mark.parametrize("movements", SIZES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def bench_storage_put_movements(bench, backend, movements):
+    rows = data.movement_rows("bench-user", movements)
+    aws = LocalAWS(storage=backend)
+    # Re-putting the same ids replaces them, every round does the same work
+    bench(aws.storage.put_movements, rows, rounds=3)
+
+
+@pytest.mark.parametrize("movements", SIZES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def bench_storage_get_movements(bench, backend, movements):
+    """Every movement of one user, with another user's movements in storage"""
+    aws = LocalAWS(storage=backend)
+    user_ids = data.seed_users(aws, 2)
+    for user_id in user_ids:
+        data.seed_movements(aws, user_id, movements)
+    bench(aws.storage.get_movements, user_ids[0], MIN_DATE, MAX_DATE)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def bench_storage_query_page(bench, backend):
+    aws = LocalAWS(storage=backend)
+    [user_id] = data.seed_users(aws, 1)
+    data.seed_movements(aws, user_id, 10_000)
+    bench(aws.storage.query_movements, user_id, limit=100)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def bench_storage_user_and_token_lookup(bench, backend):
+    aws = LocalAWS(storage=backend)
+    data.seed_users(aws, 10_000)
+    token = data.seed_token(aws, data.email_for(9_999))
+
+    def lookup():
+        token_data = aws.storage.get_token(token)
+        assert aws.storage.get_user_by_email(token_data["email"]) is not None
+
+    bench(lookup)
@@ -0,0 +1,91 @@
+"""Synthetic users, tokens, movements and statement files for benchmarks"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import random
+import uuid
+from passlib.apps import custom_app_context as pwd_context
+from routes.get_summary.rollups import build_rollups
+
+PASSWORD = "bench-password-123"
+_password_hash = None
+
+
+def password_hash() -> str:
+    # Hashing is deliberately slow, do it once per process
+    global _password_hash
+    if _password_hash is None:
+        _password_hash = pwd_context.hash(PASSWORD)
+    return _password_hash
+
+
+def email_for(index: int) -> str:
+    return f"user{index}@bench.local"
+
+
+def seed_users(aws, count: int) -> list:
+    """Create `count` users, returns their ids in creation order"""
+    ids = []
+    for index in range(count):
+        user_id = str(uuid.UUID(int=index))
+        aws.storage.create_user(
+            {
+                "id": user_id,
+                "email": email_for(index),
+                "name": f"User {index}",
+                "password": password_hash(),
+            }
+        )
+        ids.append(user_id)
+    return ids
+
+
+def seed_token(aws, email: str, token: str = None) -> str:
+    token = token or f"token-{uuid.uuid4()}"
+    aws.storage.save_token(
+        {
+            "email": email,
+            "token": token,
+            "expiration": (datetime.utcnow() + timedelta(days=1)).isoformat(),
+        }
+    )
+    return token
+
+
+def movement_rows(user_id: str, count: int, days: int = 30, seed: int = 7) -> list:
+    """Movements spread over the last `days` days, mixed credits and debits"""
+    rng = random.Random(seed)
+    today = date.today()
+    return [
+        {
+            "id": f"{user_id}-{index}",
+            "UserId": user_id,
+            "Date": (today - timedelta(days=rng.randrange(days))).isoformat(),
+            "amount": Decimal(rng.randrange(-50000, 50000)) / 100,
+            "processed": "Ok",
+        }
+        for index in range(count)
+    ]
+
+
+def seed_movements(aws, user_id: str, count: int, days: int = 30) -> list:
+    rows = movement_rows(user_id, count, days)
+    aws.storage.put_movements(rows)
+    aws.storage.add_to_rollups(
+        user_id, {bucket: rollup for (_, bucket), rollup in build_rollups(rows).items()}
+    )
+    return rows
+
+
+def statement_csv(
+    user_id: str, rows: int, token: str = None, seed: int = 11, days: int = 365
+) -> str:
+    """A statement in the movments.csv format, optionally with the token line"""
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=days - 1)
+    lines = [token] if token else []
+    for _ in range(rows):
+        day = start + timedelta(days=rng.randrange(days))
+        amount = rng.randrange(-50000, 50000) / 100
+        lines.append(f"{user_id},{day.isoformat()},{amount:.2f}")
+    return "\n".join(lines) + "\n"
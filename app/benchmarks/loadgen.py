@@ -0,0 +1,184 @@
+"""
+End-to-end load generator: upload -> process -> summary.
+
+Each concurrency level starts from empty LocalAWS tables with one user per
+client. Every client uploads statements in the movments.csv format through
+/upload-file, the local file processor ingests them from the S3 stand-in on
+its own worker threads (like asynchronous Lambda invocations), and once a
+statement is ingested the client asks /get-summary for it. Reported per level:
+
+- ingest rows/sec: movements saved by the processor per second of wall time
+- freshness lag: upload request start -> /get-summary response including it
+- p50/p99 latency of /upload-file and /get-summary
+- lost rows: saved movements overwritten by another row with the same id
+- duplicates: parsed movements skipped because their id was already stored
+- stale: summaries requested after ingestion that still missed rows
+
+    cd app && python -m benchmarks.loadgen --ramp 1,2,4,8 --rows 500
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import logging
+import time
+from fastapi.testclient import TestClient
+from common import metrics
+from common.metrics import percentile
+from local_aws import FileProcessor, LocalAWS
+from main import init_lambda
+from routes.upload_file.upload_file import BUCKET_NAME
+from storage import BACKENDS
+from storage.base import MAX_DATE, MIN_DATE
+from . import data
+
+
+def run_client(client, processor, user_id: str, token: str, args, worker: int):
+    """Upload `args.statements` statements one after the other"""
+    samples = {"upload": [], "summary": [], "freshness": [], "errors": 0, "stale": 0}
+    expected = 0
+    for index in range(args.statements):
+        seed = worker * 1_000_003 + index
+        statement = data.statement_csv(
+            user_id, args.rows, token=token, seed=seed, days=30
+        ).encode()
+        file_name = f"loadgen-{user_id}-{index}.csv"
+
+        started = time.perf_counter()
+        response = client.post(
+            "/upload-file", files={"file": (file_name, statement, "text/csv")}
+        )
+        uploaded = time.perf_counter()
+        samples["upload"].append((uploaded - started) * 1000)
+        if response.status_code != 200:
+            samples["errors"] += 1
+            continue
+
+        expected += processor.wait_for(BUCKET_NAME, file_name, args.timeout).saved
+
+        summary_started = time.perf_counter()
+        response = client.post("/get-summary", json={"access_token": token})
+        finished = time.perf_counter()
+        samples["summary"].append((finished - summary_started) * 1000)
+        if response.status_code != 200:
+            samples["errors"] += 1
+            continue
+        counts = response.json()["summary"]["transactions_by_month"]
+        if sum(counts.values()) < expected:
+            # The summary does not include every row ingested so far
+            samples["stale"] += 1
+            continue
+        samples["freshness"].append((finished - started) * 1000)
+    return samples
+
+
+def run_level(concurrency: int, args) -> dict:
+    aws = LocalAWS(storage=args.storage)
+    with aws.install():
+        user_ids = data.seed_users(aws, concurrency)
+        tokens = [
+            data.seed_token(aws, data.email_for(index)) for index in range(concurrency)
+        ]
+        client = TestClient(init_lambda())
+        processor = FileProcessor(
+            aws, workers=args.processors, batch_size=args.batch_size
+        ).start()
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [
+                    pool.submit(
+                        run_client, client, processor, user_id, token, args, worker
+                    )
+                    for worker, (user_id, token) in enumerate(zip(user_ids, tokens))
+                ]
+                results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+        finally:
+            processor.stop()
+
+    merged = {
+        key: sorted(sample for result in results for sample in result[key])
+        for key in ("upload", "summary", "freshness")
+    }
+    saved = sum(result.saved for result in processor.results.values())
+    stored = sum(
+        len(aws.storage.get_movements(user_id, MIN_DATE, MAX_DATE))
+        for user_id in user_ids
+    )
+    return {
+        "concurrency": concurrency,
+        "statements": len(processor.results),
+        "rows_saved": saved,
+        "lost_rows": saved - stored,
+        "duplicate_rows": sum(
+            result.duplicates for result in processor.results.values()
+        ),
+        "errors": sum(r["errors"] for r in results),
+        "stale_summaries": sum(r["stale"] for r in results),
+        "elapsed_s": round(elapsed, 3),
+        "ingest_rows_per_s": round(saved / elapsed, 1),
+        "freshness_p50_ms": round(percentile(merged["freshness"], 50), 2),
+        "freshness_p99_ms": round(percentile(merged["freshness"], 99), 2),
+        "upload_p50_ms": round(percentile(merged["upload"], 50), 2),
+        "upload_p99_ms": round(percentile(merged["upload"], 99), 2),
+        "summary_p50_ms": round(percentile(merged["summary"], 50), 2),
+        "summary_p99_ms": round(percentile(merged["summary"], 99), 2),
+    }
+
+
+COLUMNS = [
+    ("concurrency", "conc", 5),
+    ("statements", "files", 6),
+    ("ingest_rows_per_s", "rows/s", 10),
+    ("freshness_p50_ms", "fresh p50", 10),
+    ("freshness_p99_ms", "fresh p99", 10),
+    ("upload_p99_ms", "upload p99", 11),
+    ("summary_p99_ms", "summary p99", 12),
+    ("lost_rows", "lost", 6),
+    ("duplicate_rows", "dups", 6),
+    ("stale_summaries", "stale", 6),
+    ("errors", "errors", 7),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ramp", default="1,2,4,8", help="client concurrency levels")
+    parser.add_argument("--statements", type=int, default=5, help="per client")
+    parser.add_argument("--rows", type=int, default=500, help="per statement")
+    parser.add_argument(
+        "--processors", type=int, default=4, help="concurrent processor invocations"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="read uploads from the ingest queue in batches of this size",
+    )
+    parser.add_argument("--storage", choices=BACKENDS, default="dynamodb")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    logging.getLogger().handlers[:] = [logging.NullHandler()]
+    metrics.configure("off")
+
+    print(
+        f"{args.statements} statements x {args.rows} rows per client, "
+        f"{args.processors} processor workers, {args.storage} storage"
+        + (f", ingest queue batches of {args.batch_size}" if args.batch_size else "")
+    )
+    print("  ".join(f"{title:>{width}}" for _, title, width in COLUMNS))
+    levels = []
+    for concurrency in (int(level) for level in args.ramp.split(",")):
+        level = run_level(concurrency, args)
+        levels.append(level)
+        print("  ".join(f"{level[key]:>{width}}" for key, _, width in COLUMNS))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "levels": levels}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
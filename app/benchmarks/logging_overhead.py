@@ -0,0 +1,80 @@
+"""
+Logging overhead of calculate_summary on a large synthetic user.
+
+Compares per-row logging (what the code did before HotPathLogger) with the
+sampled and aggregate-only modes, with a synchronous handler and with the
+queue-backed sink from common.log.
+
+    cd app && python -m benchmarks.logging_overhead --rows 100000
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+import argparse
+import logging
+import os
+import time
+from common import log
+from routes.get_summary import get_summary
+
+
+def synthetic_transactions(rows: int) -> list:
+    start = date(2024, 1, 1)
+    return [
+        {
+            "UserId": "bench-user",
+            "Date": (start + timedelta(days=i % 365)).isoformat(),
+            "amount": Decimal(i % 500 - 250) / 4,
+        }
+        for i in range(rows)
+    ]
+
+
+def run(transactions: list, sample_rate: float, repeat: int) -> float:
+    row_logger = get_summary.summary_row_logger
+    row_logger.sample_rate = sample_rate
+    # No rate limit so the per-row mode really logs every row, like before
+    row_logger.limiter = None
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        get_summary.calculate_summary(transactions)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    transactions = synthetic_transactions(args.rows)
+    root = logging.getLogger()
+    root.handlers[:] = [logging.StreamHandler(open(os.devnull, "w"))]
+    root.setLevel(logging.INFO)
+
+    scenarios = [
+        ("per-row, sync handler", 1.0, False),
+        ("per-row, queue handler", 1.0, True),
+        ("sampled 1%, queue handler", 0.01, True),
+        ("aggregate only (default)", 0.0, True),
+    ]
+    print(f"calculate_summary over {args.rows} transactions (best of {args.repeat})")
+    baseline = None
+    for name, sample_rate, queued in scenarios:
+        if queued:
+            log.configure_logging(logging.INFO)
+        elapsed = run(transactions, sample_rate, args.repeat)
+        if queued:
+            log.flush_logging(timeout=60)
+        baseline = baseline or elapsed
+        print(
+            f"  {name:<28} {elapsed * 1000:9.1f} ms "
+            f"{elapsed / args.rows * 1e9:8.0f} ns/row {baseline / elapsed:6.1f}x"
+        )
+    log.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
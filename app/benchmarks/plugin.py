@@ -0,0 +1,185 @@
+"""
+Minimal benchmark harness for the pytest run configured in benchmarks/pytest.ini.
+
+The `bench` fixture times a callable (warm-up, auto-calibrated inner loops,
+median of several rounds). At the end of the session every result is compared
+with benchmarks/baselines.json. Timings are normalized by a fixed pure-Python
+calibration workload measured in the same run, so baselines recorded on one
+machine remain meaningful on another. Any benchmark slower than its baseline by
+more than the threshold fails the run.
+
+    cd app
+    python -m pytest -c benchmarks/pytest.ini benchmarks                  # compare
+    python -m pytest -c benchmarks/pytest.ini benchmarks --bench-save     # rebaseline
+"""
+
+from statistics import median
+import json
+import logging
+import os
+import platform
+import time
+import pytest
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_THRESHOLD = 0.25
+MIN_ROUND_SECONDS = 0.02
+DEFAULT_ROUNDS = 5
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("bench", "performance benchmarks")
+    group.addoption(
+        "--bench-save",
+        action="store_true",
+        help="write the results of this run as the new baselines",
+    )
+    group.addoption(
+        "--bench-threshold",
+        type=float,
+        default=None,
+        help=f"allowed slowdown vs baseline before failing (default {DEFAULT_THRESHOLD})",
+    )
+    group.addoption(
+        "--bench-json",
+        default=None,
+        help="also write the results of this run to this JSON file",
+    )
+    group.addoption(
+        "--bench-baselines",
+        default=BASELINES_PATH,
+        help="baselines file to compare with / save to",
+    )
+
+
+def calibrate() -> float:
+    """Seconds for a fixed mix of dict, string and arithmetic work"""
+
+    def workload():
+        data = {}
+        for i in range(20_000):
+            data[str(i)] = i * 3 % 7
+        return sum(value for key, value in data.items() if key.endswith("7"))
+
+    return measure(workload, rounds=7)
+
+
+def measure(fn, *args, rounds: int = DEFAULT_ROUNDS, **kwargs) -> float:
+    """Median seconds per call of fn(*args, **kwargs)"""
+    started = time.perf_counter()
+    fn(*args, **kwargs)  # warm-up, also sizes the inner loop
+    first = time.perf_counter() - started
+    loops = max(1, int(MIN_ROUND_SECONDS / first)) if first > 0 else 1000
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn(*args, **kwargs)
+        timings.append((time.perf_counter() - started) / loops)
+    return median(timings)
+
+
+class BenchSession:
+    def __init__(self, config):
+        self.config = config
+        self.results = {}
+        self.calibration = calibrate()
+        self.regressions = []
+
+    def record(self, name: str, seconds: float):
+        self.results[name] = {
+            "median_s": seconds,
+            "normalized": seconds / self.calibration,
+        }
+
+    def load_baselines(self) -> dict:
+        path = self.config.getoption("--bench-baselines")
+        if not os.path.exists(path):
+            return {}
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+
+    def payload(self, threshold: float) -> dict:
+        return {
+            "machine": platform.platform(),
+            "python": platform.python_version(),
+            "calibration_s": self.calibration,
+            "threshold": threshold,
+            "benchmarks": dict(sorted(self.results.items())),
+        }
+
+
+@pytest.fixture(scope="session")
+def bench_session(request):
+    return request.config._bench_session
+
+
+@pytest.fixture
+def bench(request, bench_session):
+    """bench(fn, *args, rounds=5) -> median seconds per call, recorded by test id"""
+    name = request.node.nodeid.split("::", 1)[-1]
+
+    def run(fn, *args, rounds: int = DEFAULT_ROUNDS, **kwargs):
+        seconds = measure(fn, *args, rounds=rounds, **kwargs)
+        bench_session.record(name, seconds)
+        return seconds
+
+    return run
+
+
+def pytest_configure(config):
+    # Route application logs to a null handler so they do not dominate timings
+    logging.getLogger().handlers[:] = [logging.NullHandler()]
+    config._bench_session = BenchSession(config)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    bench_session = config._bench_session
+    baselines = bench_session.load_baselines()
+    threshold = config.getoption("--bench-threshold")
+    if threshold is None:
+        threshold = baselines.get("threshold", DEFAULT_THRESHOLD)
+
+    for name, result in bench_session.results.items():
+        baseline = baselines.get("benchmarks", {}).get(name)
+        if baseline is None:
+            continue
+        change = result["normalized"] / baseline["normalized"] - 1
+        result["change"] = change
+        if change > threshold:
+            bench_session.regressions.append((name, change))
+
+    payload = bench_session.payload(threshold)
+    if config.getoption("--bench-json"):
+        with open(config.getoption("--bench-json"), "w") as json_file:
+            json.dump(payload, json_file, indent=2)
+    if config.getoption("--bench-save"):
+        for result in payload["benchmarks"].values():
+            result.pop("change", None)
+        with open(config.getoption("--bench-baselines"), "w") as baseline_file:
+            json.dump(payload, baseline_file, indent=2)
+            baseline_file.write("\n")
+    elif bench_session.regressions and session.exitstatus == 0:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    bench_session = config._bench_session
+    if not bench_session.results:
+        return
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(
+        f"calibration: {bench_session.calibration * 1000:.2f} ms"
+    )
+    for name, result in sorted(bench_session.results.items()):
+        change = result.get("change")
+        change_text = f"{change:+7.1%}" if change is not None else "    new"
+        terminalreporter.write_line(
+            f"{result['median_s'] * 1000:11.3f} ms  {change_text}  {name}"
+        )
+    for name, change in bench_session.regressions:
+        terminalreporter.write_line(
+            f"REGRESSION {name}: {change:+.1%} slower than baseline", red=True
+        )
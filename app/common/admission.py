@@ -0,0 +1,290 @@
+"""
+Admission control in front of DynamoDB.
+
+Two guards, both answering 429 Too Many Requests with Retry-After:
+
+- A token bucket per route and caller. The caller is identified by the
+  credential it presents (access token or email), so a burst is turned away
+  before it costs a single table read. Limits come from RATE_LIMITS, e.g.
+  "login=1/5,get-summary=0.2/3" (tokens per second / burst); routes without a
+  limit are not rate limited.
+- At most DYNAMODB_CONCURRENCY DynamoDB-heavy requests (scans, summaries,
+  exports) in flight per process. When all slots are taken the request is
+  rejected right away instead of queueing behind the table; 0 disables it.
+
+RATE_LIMIT_BACKEND=local keeps the buckets in process memory, so limits apply
+per Lambda container or server worker. RATE_LIMIT_BACKEND=storage counts in
+the storage backend instead, shared by every container (DynamoDB) or worker
+(SQLite), as fixed windows of `burst` requests per burst/rate seconds.
+
+Rejections are counted in the request metrics as `RateLimited` and
+`ConcurrencyRejected`. Endpoints opt in with the `admitted` decorator:
+
+    @router.post("/login")
+    @admitted("login", lambda args: args["login_request"].email)
+    def login(login_request: LoginRequest):
+
+A streaming response keeps its slot until AdmissionMiddleware sees the
+request end, sent, failed or never started.
+"""
+
+from collections import OrderedDict
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Callable, Optional
+import contextvars
+import functools
+import hashlib
+import inspect
+import logging
+import math
+import threading
+import time
+from common import metrics
+from common.config import Settings, get_settings
+
+logger = logging.getLogger()
+
+# Buckets kept by the local limiter, least recently used are dropped first
+MAX_LOCAL_BUCKETS = 10_000
+
+# AdmissionControl of every slot the current request's streaming responses
+# hold, set by AdmissionMiddleware
+_held_slots = contextvars.ContextVar("admission_slots", default=None)
+
+
+class TooManyRequests(HTTPException):
+    def __init__(self, retry_after: float, detail: str = "Too many requests"):
+        super().__init__(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def parse_rate_limits(spec: str) -> dict:
+    """Parse "route=rate/burst,..." into {route: (rate, burst)}"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, limit = entry.partition("=")
+        rate, _, burst = limit.partition("/")
+        rate = float(rate)
+        limits[route.strip()] = (rate, int(burst) if burst else max(1, math.ceil(rate)))
+    return limits
+
+
+class LocalRateLimiter:
+    """Token buckets in process memory"""
+
+    def __init__(self, max_buckets: int = MAX_LOCAL_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, burst: int, now: float = None) -> float:
+        """Take a token; returns 0 when admitted, else seconds until one is free"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(burst), now]
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+
+class StorageRateLimiter:
+    """Fixed windows counted in the storage backend, shared between processes"""
+
+    def __init__(self, storage=None):
+        self._storage = storage
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from storage import get_storage
+
+            self._storage = get_storage()
+        return self._storage
+
+    def acquire(self, key: str, rate: float, burst: int, now: float = None) -> float:
+        now = time.time() if now is None else now
+        # `burst` requests per window refill at `rate` on average
+        window = max(1, math.ceil(burst / rate))
+        index = int(now // window)
+        if self.storage.consume_quota(f"{key}#{index}", burst, (index + 2) * window):
+            return 0.0
+        return (index + 1) * window - now
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+    def try_acquire(self) -> bool:
+        return self._slots is None or self._slots.acquire(blocking=False)
+
+    def release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+
+class AdmissionControl:
+    def __init__(self, limits: dict, rate_limiter, concurrency: int):
+        self.limits = limits
+        self.rate_limiter = rate_limiter
+        self.concurrency = ConcurrencyLimiter(concurrency)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AdmissionControl":
+        if settings.rate_limit_backend == "storage":
+            rate_limiter = StorageRateLimiter()
+        elif settings.rate_limit_backend == "local":
+            rate_limiter = LocalRateLimiter()
+        else:
+            raise ValueError(
+                f"Unknown rate limit backend: {settings.rate_limit_backend}"
+            )
+        return cls(
+            parse_rate_limits(settings.rate_limits),
+            rate_limiter,
+            settings.dynamodb_concurrency,
+        )
+
+    def check_rate(self, route: str, identity: Optional[str]):
+        """Raise TooManyRequests when `identity` is over its limit on `route`"""
+        limit = self.limits.get(route)
+        if limit is None or not identity:
+            return
+        # Hashed, the identity is usually a credential
+        key = f"{route}#{hashlib.sha256(identity.encode()).hexdigest()[:32]}"
+        try:
+            retry_after = self.rate_limiter.acquire(key, *limit)
+        except Exception as e:
+            # Fail open, an unavailable limiter must not take the API down
+            logger.error("💥 Error checking rate limit: %s", e)
+            return
+        if retry_after > 0:
+            metrics.increment("RateLimited")
+            raise TooManyRequests(retry_after)
+
+    def acquire_slot(self):
+        """Take a DynamoDB slot or raise TooManyRequests"""
+        if not self.concurrency.try_acquire():
+            metrics.increment("ConcurrencyRejected")
+            raise TooManyRequests(1, detail="Server busy, retry later")
+
+    def release_slot(self):
+        self.concurrency.release()
+
+
+_admission = None
+_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionControl:
+    global _admission
+    with _lock:
+        if _admission is None:
+            _admission = AdmissionControl.from_settings(get_settings())
+        return _admission
+
+
+async def _release_after(body_iterator, admission: AdmissionControl):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        admission.release_slot()
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware that frees the slots held by streaming responses
+    once the request ends. Releasing from the body iterator alone leaks the
+    slot when the body is never iterated, e.g. the client is gone before
+    the response starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        held = []
+        token = _held_slots.set(held)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _held_slots.reset(token)
+            for admission in held:
+                admission.release_slot()
+
+
+def _hold_for(response, admission: AdmissionControl):
+    """Free the slot now, or once a streaming response is done with it"""
+    held = _held_slots.get()
+    if not isinstance(response, StreamingResponse):
+        admission.release_slot()
+    elif held is not None:
+        held.append(admission)
+    else:
+        response.body_iterator = _release_after(response.body_iterator, admission)
+    return response
+
+
+def admitted(route: str, identity: Callable[[dict], Optional[str]] = None):
+    """
+    Decorate an endpoint: check the caller's rate limit for `route` (identity
+    gets the endpoint's keyword arguments) and hold a DynamoDB slot while it
+    runs, for streaming responses until the request ends. Without
+    AdmissionMiddleware a streaming response frees it after its last chunk.
+    Plain `def` endpoints stay sync, so FastAPI still runs them in its thread
+    pool.
+    """
+
+    def decorator(endpoint):
+        def admit(kwargs) -> AdmissionControl:
+            admission = get_admission()
+            admission.check_rate(route, identity(kwargs) if identity else None)
+            admission.acquire_slot()
+            return admission
+
+        if not inspect.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            def sync_wrapper(*args, **kwargs):
+                admission = admit(kwargs)
+                try:
+                    response = endpoint(*args, **kwargs)
+                except BaseException:
+                    admission.release_slot()
+                    raise
+                return _hold_for(response, admission)
+
+            return sync_wrapper
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            admission = admit(kwargs)
+            try:
+                response = await endpoint(*args, **kwargs)
+            except BaseException:
+                admission.release_slot()
+                raise
+            return _hold_for(response, admission)
+
+        return wrapper
+
+    return decorator
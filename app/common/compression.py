@@ -0,0 +1,184 @@
+"""
+Negotiated gzip/brotli response compression.
+
+`CompressionMiddleware` is pure ASGI, like MetricsMiddleware. The first body
+message decides:
+
+- complete responses (no `more_body`) smaller than `minimum_size`, responses
+  that are already encoded, marked `no-transform` or of a binary media type
+  are sent untouched
+- other complete responses are compressed in one go with a new Content-Length
+- streaming responses (the transaction exports) are compressed chunk by chunk
+  with a flush after each one, so every chunk still reaches the client as soon
+  as it is produced and memory stays at one chunk
+
+On Lambda, Mangum base64 encodes (`isBase64Encoded`) JSON bodies that are not
+valid UTF-8 and returns the rest as text. Compressed bodies round-trip exactly
+both ways. A REST API Gateway also needs `*/*` in its binary media types.
+"""
+
+from starlette.datastructures import Headers, MutableHeaders
+import brotli
+import zlib
+
+DEFAULT_MINIMUM_SIZE = 1024
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+# Preferred first when the client weighs both the same
+ENCODINGS = ("br", "gzip")
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Parse "gzip;q=0.8, br" into {coding: q}"""
+    weights = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        coding, *params = (piece.strip() for piece in entry.split(";"))
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    return weights
+
+
+def choose_encoding(header: str):
+    """The supported coding the client weighs highest, None for identity"""
+    weights = parse_accept_encoding(header)
+    best, best_weight = None, 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", ""):
+        return False
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+    )
+
+
+class GzipCompressor:
+    def __init__(self, level: int = 6):
+        # wbits=31: zlib stream with a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, the stream stays open"""
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int = 4):
+        # Quality 4 compresses close to gzip -6 at a similar speed, the
+        # default 11 is meant for static assets compressed once
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = DEFAULT_MINIMUM_SIZE,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compressor(self, encoding: str):
+        if encoding == "br":
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # Held back until the first body message shows the size
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=start.setdefault("headers", []))
+                if not is_compressible(headers):
+                    await send(start)
+                    await send(message)
+                    return
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = self.compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                if more_body:
+                    # Final size unknown, the body goes out chunked
+                    del headers["Content-Length"]
+                    body = compressor.compress(body)
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": more_body}
+                )
+                return
+
+            if compressor is None:
+                await send(message)
+                return
+            body = compressor.compress(body) if more_body else compressor.finish(body)
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_wrapper)
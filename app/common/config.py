@@ -0,0 +1,109 @@
+"""
+Settings shared by every deployment mode.
+
+Both the Lambda handler and the long-lived server (server.py) build the app
+with `main.create_app`, and everything environment dependent is read here,
+once per process, so both modes run the same code with the same knobs.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Optional
+import os
+import threading
+from botocore.config import Config
+
+
+def _bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    aws_region: str = "us-east-1"
+    # botocore keeps up to this many open connections per client
+    aws_max_pool_connections: int = 10
+    aws_connect_timeout: float = 5.0
+    aws_read_timeout: float = 30.0
+    # Per operation deadlines and hedged reads, see common/resilience.py
+    aws_deadlines: str = ""
+    aws_hedging: bool = True
+    storage_backend: str = "dynamodb"
+    storage_sqlite_path: str = "stori.db"
+    # Read heavy users' movements from every write shard, see storage/base.py
+    movement_sharding: bool = False
+    # Cold tier for old movements, see storage/cold.py; off without a bucket
+    cold_bucket: str = ""
+    cold_after_days: int = 0
+    cold_cache_dir: str = "/tmp/cold-movements"
+    log_level: str = "INFO"
+    log_format: str = "text"
+    log_sampling: str = ""
+    metrics_sink: str = "stdout"
+    metrics_dump_path: Optional[str] = None
+    metrics_namespace: str = "StoriChallenge"
+    # Smaller complete responses are not worth compressing
+    compression_minimum_size: int = 1024
+    # Seconds a completed Idempotency-Key request is replayed
+    idempotency_ttl: int = 86400
+    # Admission control, see common/admission.py
+    rate_limits: str = ""
+    rate_limit_backend: str = "local"
+    dynamodb_concurrency: int = 64
+    # On-demand profiling, see common/profiling.py; off without a sink
+    profile_sink: str = ""
+    profile_token: str = ""
+    profile_sample_rate: float = 0.0
+    profile_interval: float = 0.005
+    profile_routes: str = "/get-summary,/upload-file"
+    # Server mode only
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 1
+    server_threads: int = 40
+    server_access_log: bool = False
+    # Set by the Lambda runtime
+    aws_lambda_function_name: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, environ=None) -> "Settings":
+        """Each field is read from the upper-cased env var of the same name"""
+        environ = os.environ if environ is None else environ
+        values = {}
+        for field in fields(cls):
+            raw = environ.get(field.name.upper())
+            if raw is None:
+                continue
+            if field.type is int:
+                values[field.name] = int(raw)
+            elif field.type is float:
+                values[field.name] = float(raw)
+            elif field.type is bool:
+                values[field.name] = _bool(raw)
+            else:
+                values[field.name] = raw
+        return cls(**values)
+
+    @property
+    def on_lambda(self) -> bool:
+        return self.aws_lambda_function_name is not None
+
+    def boto_config(self) -> Config:
+        """botocore client config for every AWS client of the app"""
+        return Config(
+            region_name=self.aws_region,
+            max_pool_connections=self.aws_max_pool_connections,
+            connect_timeout=self.aws_connect_timeout,
+            read_timeout=self.aws_read_timeout,
+        )
+
+
+_settings = None
+_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    global _settings
+    with _lock:
+        if _settings is None:
+            _settings = Settings.from_env()
+        return _settings
@@ -0,0 +1,149 @@
+"""
+`Idempotency-Key` support for endpoints with side effects.
+
+A client that may retry a request sends a unique `Idempotency-Key` header and
+reuses it on every retry. The first request claims the key in storage (scoped
+to the route and the caller's token) and records its 2xx response. Retries
+within IDEMPOTENCY_TTL get that response back, marked `Idempotent-Replayed`,
+without a new S3 object, ingest or email:
+
+    idempotency = IdempotentRequest(storage, key, "upload-file", token, payload)
+    replay = idempotency.start()
+    if replay is not None:
+        return replay
+    try:
+        result = do_the_work()
+    except DependencyUnavailable:
+        raise
+    except Exception:
+        idempotency.release()
+        raise
+    idempotency.complete(result)
+
+Failed requests release the key so the retry runs again. A request that
+gave up on a dependency (DependencyUnavailable, e.g. DeadlineExceeded) keeps
+its claim instead: the abandoned call may still succeed. A key in use by a
+request that is still running gets 409; if that request dies, its claim
+expires after IN_PROGRESS_TTL seconds. Reusing a key with a different payload
+gets 422. Without the header every method is a no-op.
+"""
+
+from typing import Optional
+import hashlib
+import json
+import logging
+import time
+from common.config import get_settings
+from common.responses import FastJSONResponse, dumps
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# Lease of a claimed key while its request runs (Lambda's timeout is lower)
+IN_PROGRESS_TTL = 60
+
+logger = logging.getLogger()
+
+
+class InvalidIdempotencyKey(ValueError):
+    pass
+
+
+def _digest(value: bytes) -> str:
+    return hashlib.sha256(value).hexdigest()
+
+
+class IdempotentRequest:
+    def __init__(
+        self,
+        storage,
+        key: Optional[str],
+        route: str,
+        token: str,
+        payload: bytes,
+        ttl: int = None,
+    ):
+        if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+            raise InvalidIdempotencyKey(
+                f"{IDEMPOTENCY_HEADER} must have 1 to {MAX_KEY_LENGTH} characters"
+            )
+        self.storage = storage
+        # The token is hashed so the table never holds credentials
+        self.key = f"{route}#{_digest(token.encode())[:32]}#{key}" if key else None
+        self.fingerprint = _digest(payload)
+        self.ttl = ttl or get_settings().idempotency_ttl
+
+    def start(self) -> Optional[FastJSONResponse]:
+        """Claim the key, or return the response to send instead of running"""
+        if self.key is None:
+            return None
+
+        now = int(time.time())
+        existing = self.storage.claim_idempotency_key(
+            {
+                "key": self.key,
+                "fingerprint": self.fingerprint,
+                "status": "in_progress",
+                "expires_at": now + IN_PROGRESS_TTL,
+            },
+            now,
+        )
+        if existing is None:
+            return None
+
+        if existing["fingerprint"] != self.fingerprint:
+            logger.warning("🚫 Idempotency key reused with a different request")
+            return FastJSONResponse(
+                status_code=422,
+                content={
+                    "detail": f"{IDEMPOTENCY_HEADER} was already used with a "
+                    "different request"
+                },
+            )
+        if existing["status"] != "completed":
+            logger.warning("⏳ Idempotency key still in progress")
+            return FastJSONResponse(
+                status_code=409,
+                content={
+                    "detail": f"A request with this {IDEMPOTENCY_HEADER} is in progress"
+                },
+                headers={"Retry-After": "1"},
+            )
+
+        logger.info("🔁 Replaying recorded response for idempotency key")
+        return FastJSONResponse(
+            status_code=int(existing["status_code"]),
+            content=json.loads(existing["body"]),
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    def complete(self, content: dict, status_code: int = 200):
+        """Record the response replays will get"""
+        if self.key is None:
+            return
+        try:
+            self.storage.save_idempotency_record(
+                {
+                    "key": self.key,
+                    "fingerprint": self.fingerprint,
+                    "status": "completed",
+                    "status_code": status_code,
+                    # A JSON string, DynamoDB items cannot hold floats
+                    "body": dumps(content).decode("utf-8"),
+                    "expires_at": int(time.time()) + self.ttl,
+                }
+            )
+        except Exception as e:
+            # The work is done, answer anyway; retries get 409 until the
+            # claim expires instead of a replay
+            logger.error("💥 Error recording idempotent response: %s", e)
+
+    def release(self):
+        """Forget the claim after a failure so a retry runs again"""
+        if self.key is None:
+            return
+        try:
+            self.storage.delete_idempotency_key(self.key)
+        except Exception as e:
+            # The claim still expires after IN_PROGRESS_TTL
+            logger.error("💥 Error releasing idempotency key: %s", e)
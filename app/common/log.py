@@ -0,0 +1,202 @@
+"""
+Structured, low-overhead logging.
+
+- `configure_logging` puts a `QueueHandler` in front of the root handlers so
+  records are written by a background `QueueListener` thread instead of the
+  request thread. Existing handlers (e.g. the Lambda runtime one) are kept and
+  moved behind the queue. LOG_FORMAT=json adds a JSON formatter.
+- `HotPathLogger` is for per-row logs inside loops: records are only built when
+  the level is enabled, the key is sampled in and the per-key rate limit allows
+  it. Sample rates come from LOG_SAMPLING, e.g.
+  "calculate_summary.row=0.01,get_user_transactions.row=0". Unlisted hot paths
+  default to 0 so only the aggregate logs are written.
+
+Always pass arguments instead of f-strings on hot paths so formatting happens
+only for records that are actually emitted.
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from .config import get_settings
+
+# Attributes every LogRecord has, anything else came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+def parse_sampling(spec: str) -> dict:
+    """Parse "key=rate,key=rate" into {key: rate}"""
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, rate = entry.partition("=")
+        rates[key.strip()] = float(rate)
+    return rates
+
+
+SAMPLE_RATES = parse_sampling(get_settings().log_sampling)
+
+
+class RateLimiter:
+    """Token bucket allowing `per_second` events with bursts of the same size"""
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self._tokens = per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.per_second,
+                self._tokens + (now - self._updated) * self.per_second,
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class HotPathLogger:
+    """
+    Logger wrapper for a single hot path, identified by `key`.
+
+    The cheapest checks go first: a disabled level or a zero sample rate costs
+    one comparison per call and never builds a LogRecord.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        key: str,
+        sample_rate: float = None,
+        max_per_second: float = 10,
+    ):
+        self.logger = logger
+        self.key = key
+        self.sample_rate = (
+            SAMPLE_RATES.get(key, 0.0) if sample_rate is None else sample_rate
+        )
+        self.limiter = RateLimiter(max_per_second) if max_per_second else None
+        self.suppressed = 0
+
+    def enabled_for(self, level: int) -> bool:
+        """Hoist this check out of loops to skip even the per-row call"""
+        return self.sample_rate > 0 and self.logger.isEnabledFor(level)
+
+    def log(self, level: int, msg: str, *args, **kwargs):
+        if not self.enabled_for(level):
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        if self.limiter is not None and not self.limiter.allow():
+            self.suppressed += 1
+            return
+        kwargs.setdefault("extra", {})["hot_path"] = self.key
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg: str, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: str, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+
+class _FlushingQueueListener(QueueListener):
+    def handle(self, record):
+        # Flush markers only wake up the thread waiting in flush_logging
+        flushed = getattr(record, "_flushed", None)
+        if flushed is not None:
+            flushed.set()
+            return
+        super().handle(record)
+
+
+def configure_logging(level: int = logging.INFO, json_format: bool = None):
+    """
+    Route root logging through a queue drained by a background thread.
+    Idempotent, later calls only update the level.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if json_format is None:
+        json_format = get_settings().log_format == "json"
+
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        handlers = list(root.handlers) or [logging.StreamHandler()]
+        if json_format:
+            for handler in handlers:
+                handler.setFormatter(JsonFormatter())
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+
+        log_queue = queue.SimpleQueue()
+        root.addHandler(QueueHandler(log_queue))
+        _listener = _FlushingQueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def flush_logging(timeout: float = 1.0) -> bool:
+    """
+    Block until every record queued so far has been written. Lambda freezes the
+    process between invocations, so call this before returning a response.
+    """
+    listener = _listener
+    if listener is None:
+        return True
+    flushed = threading.Event()
+    marker = logging.makeLogRecord({"_flushed": flushed})
+    listener.queue.put_nowait(marker)
+    return flushed.wait(timeout)
+
+
+def shutdown_logging():
+    """Flush queued records and restore the original handlers"""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, QueueHandler):
+                root.removeHandler(handler)
+        for handler in _listener.handlers:
+            root.addHandler(handler)
+        _listener = None
@@ -0,0 +1,324 @@
+"""
+Per-request performance metrics.
+
+`MetricsMiddleware` times every HTTP request and `instrument_client` hooks a
+boto3 client so each AWS call made while serving the request is timed and
+counted, with DynamoDB consumed capacity split into read and write units.
+When the request ends a single CloudWatch Embedded Metric Format (EMF) line is
+emitted. Sinks are selected with METRICS_SINK:
+
+- stdout: EMF lines on stdout, picked up by CloudWatch Logs in Lambda (default)
+- local: records kept in memory (and appended to METRICS_DUMP_PATH if set)
+- off: nothing is emitted
+"""
+
+from collections import defaultdict, deque
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from .config import get_settings
+
+logger = logging.getLogger()
+
+NAMESPACE = get_settings().metrics_namespace
+PERCENTILE_WINDOW = 512
+
+# Operations that accept ReturnConsumedCapacity, split by the capacity they use
+DYNAMODB_READ_OPERATIONS = {
+    "GetItem",
+    "Query",
+    "Scan",
+    "BatchGetItem",
+    "TransactGetItems",
+}
+DYNAMODB_WRITE_OPERATIONS = {
+    "PutItem",
+    "UpdateItem",
+    "DeleteItem",
+    "BatchWriteItem",
+    "TransactWriteItems",
+}
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Everything measured while serving one request"""
+
+    __slots__ = (
+        "route",
+        "status_code",
+        "started",
+        "latency_ms",
+        "aws_calls",
+        "aws_time_ms",
+        "aws_errors",
+        "read_capacity_units",
+        "write_capacity_units",
+        "operations",
+        "counters",
+    )
+
+    def __init__(self, route: str):
+        self.route = route
+        self.status_code = None
+        self.started = time.perf_counter()
+        self.latency_ms = 0.0
+        self.aws_calls = 0
+        self.aws_time_ms = 0.0
+        self.aws_errors = 0
+        self.read_capacity_units = 0.0
+        self.write_capacity_units = 0.0
+        # "dynamodb.Scan" -> [calls, total ms]
+        self.operations = defaultdict(lambda: [0, 0.0])
+        self.counters = defaultdict(float)
+
+    def record_aws_call(self, operation: str, elapsed_ms: float, failed=False):
+        self.aws_calls += 1
+        self.aws_time_ms += elapsed_ms
+        if failed:
+            self.aws_errors += 1
+        stats = self.operations[operation]
+        stats[0] += 1
+        stats[1] += elapsed_ms
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies per route, used for percentiles"""
+
+    def __init__(self, size: int = PERCENTILE_WINDOW):
+        self._size = size
+        self._samples = defaultdict(lambda: deque(maxlen=self._size))
+        self._lock = threading.Lock()
+
+    def add(self, route: str, value: float) -> dict:
+        with self._lock:
+            samples = self._samples[route]
+            samples.append(value)
+            ordered = sorted(samples)
+        return {
+            "p50": percentile(ordered, 50),
+            "p90": percentile(ordered, 90),
+            "p99": percentile(ordered, 99),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class MetricsSink:
+    def __init__(self, mode: str = "stdout", dump_path: str = None):
+        self.mode = mode
+        self.dump_path = dump_path
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record: dict):
+        if self.mode == "off":
+            return
+        line = json.dumps(record, separators=(",", ":"), default=str)
+        if self.mode == "stdout":
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+            return
+        with self._lock:
+            self.records.append(record)
+            if self.dump_path:
+                with open(self.dump_path, "a") as dump_file:
+                    dump_file.write(line + "\n")
+
+
+sink = MetricsSink(get_settings().metrics_sink, get_settings().metrics_dump_path)
+latencies = LatencyWindow()
+
+
+def configure(mode: str, dump_path: str = None) -> MetricsSink:
+    """Swap the active sink, e.g. configure("local") in tests"""
+    global sink
+    sink = MetricsSink(mode, dump_path)
+    latencies.clear()
+    return sink
+
+
+def current() -> RequestMetrics:
+    """Metrics of the request being served, or None outside of a request"""
+    return _current.get()
+
+
+def increment(name: str, value: float = 1):
+    """Add to a custom counter of the current request (no-op outside requests)"""
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.counters[name] += value
+
+
+# -------------------------- boto3 hooks --------------------------
+
+
+def _request_consumed_capacity(params, model, **kwargs):
+    if model.name in DYNAMODB_READ_OPERATIONS | DYNAMODB_WRITE_OPERATIONS:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _before_call(model, context, **kwargs):
+    context["metrics_call"] = (
+        model.service_model.service_name,
+        model.name,
+        time.perf_counter(),
+    )
+
+
+def _consumed_units(parsed: dict) -> float:
+    consumed = parsed.get("ConsumedCapacity")
+    if not consumed:
+        return 0.0
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(float(entry.get("CapacityUnits", 0)) for entry in consumed)
+
+
+def _record_call(context, parsed=None, failed=False):
+    request_metrics = _current.get()
+    call = context.pop("metrics_call", None)
+    if request_metrics is None or call is None:
+        return
+
+    service, operation, started = call
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    request_metrics.record_aws_call(f"{service}.{operation}", elapsed_ms, failed)
+
+    if service == "dynamodb" and parsed:
+        units = _consumed_units(parsed)
+        if operation in DYNAMODB_WRITE_OPERATIONS:
+            request_metrics.write_capacity_units += units
+        else:
+            request_metrics.read_capacity_units += units
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    _record_call(context, parsed, failed=http_response.status_code >= 300)
+
+
+def _after_call_error(context, **kwargs):
+    _record_call(context, failed=True)
+
+
+def instrument_client(client):
+    """
+    Register timing and capacity hooks on a boto3 client (for resources pass
+    `resource.meta.client`). Safe to call more than once for the same client.
+    """
+    events = client.meta.events
+    if getattr(client.meta, "metrics_instrumented", False):
+        return client
+    if client.meta.service_model.service_name == "dynamodb":
+        events.register("provide-client-params.dynamodb.*", _request_consumed_capacity)
+    events.register("before-call.*.*", _before_call)
+    events.register("after-call.*.*", _after_call)
+    events.register("after-call-error.*.*", _after_call_error)
+    client.meta.metrics_instrumented = True
+    return client
+
+
+# -------------------------- ASGI middleware --------------------------
+
+
+def build_emf_record(request_metrics: RequestMetrics, percentiles: dict) -> dict:
+    metrics = [
+        ("Latency", "Milliseconds", request_metrics.latency_ms),
+        ("LatencyP50", "Milliseconds", percentiles["p50"]),
+        ("LatencyP90", "Milliseconds", percentiles["p90"]),
+        ("LatencyP99", "Milliseconds", percentiles["p99"]),
+        ("AwsCalls", "Count", request_metrics.aws_calls),
+        ("AwsTime", "Milliseconds", request_metrics.aws_time_ms),
+        ("AwsErrors", "Count", request_metrics.aws_errors),
+        ("ReadCapacityUnits", "Count", request_metrics.read_capacity_units),
+        ("WriteCapacityUnits", "Count", request_metrics.write_capacity_units),
+    ]
+    metrics.extend(
+        (name, "Count", value) for name, value in request_metrics.counters.items()
+    )
+
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Route"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit} for name, unit, _ in metrics
+                    ],
+                }
+            ],
+        },
+        "Route": request_metrics.route,
+        "StatusCode": request_metrics.status_code,
+        # Per-operation breakdown kept as properties to avoid metric cardinality
+        "AwsOperations": {
+            operation: {"calls": calls, "time_ms": round(total_ms, 3)}
+            for operation, (calls, total_ms) in request_metrics.operations.items()
+        },
+    }
+    for name, _, value in metrics:
+        record[name] = round(value, 3) if isinstance(value, float) else value
+    return record
+
+
+def _route_name(scope: dict) -> str:
+    # FastAPI stores the matched route in the scope, use its template so
+    # /items/{id} does not create one metric stream per id
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "unmatched"
+    return f"{scope['method']} {path}"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed end to end"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or sink.mode == "off":
+            await self.app(scope, receive, send)
+            return
+
+        request_metrics = RequestMetrics(route=scope["path"])
+        token = _current.set(request_metrics)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                request_metrics.status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            request_metrics.status_code = 500
+            raise
+        finally:
+            _current.reset(token)
+            request_metrics.route = _route_name(scope)
+            request_metrics.latency_ms = (
+                time.perf_counter() - request_metrics.started
+            ) * 1000
+            percentiles = latencies.add(
+                request_metrics.route, request_metrics.latency_ms
+            )
+            try:
+                sink.emit(build_emf_record(request_metrics, percentiles))
+            except Exception as e:
+                logger.error("💥 Error emitting request metrics: %s", e)
@@ -0,0 +1,208 @@
+"""
+On-demand request profiling.
+
+`ProfilingMiddleware` runs a statistical sampler while a request is served:
+every PROFILE_INTERVAL seconds a thread snapshots the stack of every thread
+of the process (the event loop, the sync endpoint pool and the AWS call pool
+of common/resilience.py). The samples are written as collapsed stacks, one
+"frame;frame;frame count" line per distinct stack, ready for flamegraph.pl or
+speedscope.
+
+A request of one of PROFILE_ROUTES is profiled when it carries
+`X-Profile: <PROFILE_TOKEN>` or, at random, for a PROFILE_SAMPLE_RATE share of
+requests. The response gets an `X-Profile-Id` header with the name of the
+profile written to PROFILE_SINK, a local directory or "s3://bucket/prefix".
+
+Without PROFILE_SINK the middleware is not installed at all. Only one request
+is profiled at a time per process, and on a busy server worker its profile
+also holds the stacks of the requests served concurrently.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from starlette.datastructures import MutableHeaders
+import anyio.to_thread
+import logging
+import os
+import random
+import sys
+import threading
+import uuid
+from common import metrics
+from common.config import Settings
+
+logger = logging.getLogger()
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Idle pool threads wait here (under threading.py frames), their stacks say
+# nothing about the request
+_IDLE_FRAMES = {("queue.py", "get"), ("thread.py", "_worker")}
+_CWD = os.getcwd() + os.sep
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    marker = filename.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        filename = filename[marker + len("site-packages") + 1 :]
+    elif filename.startswith(_CWD):
+        filename = filename[len(_CWD) :]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _is_idle(codes: list) -> bool:
+    """codes innermost first"""
+    for code in codes:
+        filename = os.path.basename(code.co_filename)
+        if filename != "threading.py":
+            return (filename, code.co_name) in _IDLE_FRAMES
+    return True
+
+
+class StackSampler:
+    """Collapsed stacks of every thread, sampled every `interval` seconds"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                if not codes or _is_idle(codes):
+                    continue
+                stack = [_frame_label(code) for code in codes]
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class LocalProfileSink:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def write(self, name: str, body: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write(body)
+
+
+class S3ProfileSink:
+    def __init__(self, bucket: str, prefix: str = "", client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from common.config import get_settings
+
+            # Not instrumented, profile uploads are not the request's AWS calls
+            self._client = boto3.client("s3", config=get_settings().boto_config())
+        return self._client
+
+    def write(self, name: str, body: str):
+        key = f"{self.prefix.rstrip('/')}/{name}" if self.prefix else name
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body.encode("utf-8"))
+
+
+def create_sink(spec: str):
+    """An S3 sink for "s3://bucket/prefix", else a local directory"""
+    if spec.startswith("s3://"):
+        bucket, _, prefix = spec[len("s3://") :].partition("/")
+        return S3ProfileSink(bucket, prefix)
+    return LocalProfileSink(spec)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI, like MetricsMiddleware; add it only when profiling is on"""
+
+    def __init__(
+        self,
+        app,
+        sink,
+        routes=(),
+        token: str = "",
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+    ):
+        self.app = app
+        self.sink = sink
+        self.routes = set(routes)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    @staticmethod
+    def enabled(settings: Settings) -> bool:
+        return bool(settings.profile_sink) and (
+            settings.profile_sample_rate > 0 or bool(settings.profile_token)
+        )
+
+    def wanted(self, scope) -> bool:
+        if scope["type"] != "http" or scope["path"] not in self.routes:
+            return False
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode() and value.decode() == self.token:
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self.wanted(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        route = scope["path"].strip("/").replace("/", "-")
+        name = f"{route}-{started}-{uuid.uuid4().hex[:8]}.folded"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, name)
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self._busy.release()
+            metrics.increment("Profiled")
+            try:
+                await anyio.to_thread.run_sync(
+                    self.sink.write, name, sampler.collapsed()
+                )
+                logger.info("🔬 Profile %s written (%s samples)", name, sampler.samples)
+            except Exception as e:
+                logger.error("💥 Error writing profile: %s", e)
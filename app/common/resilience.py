@@ -0,0 +1,313 @@
+"""
+Deadlines, hedged reads and circuit breakers for AWS calls.
+
+`Resilience.call(dependency, kind, fn)` runs an AWS call on a worker thread
+and waits for it at most the deadline of its kind (AWS_DEADLINES, e.g.
+"dynamodb.read=2,ses.send=5"). botocore's own timeouts still apply underneath;
+the deadline bounds the whole call, retries included, from the request's
+point of view.
+
+Idempotent reads can be hedged: when the call is still running after the
+p95 latency of that operation, an identical second call is sent and the
+first to succeed wins. One slow node or connection then costs a p95 instead
+of a timeout, for about 5% more reads.
+
+Each dependency (dynamodb, s3, ses) has a circuit breaker. When at least
+half of its recent calls failed (timeouts, throttling, 5xx, connection
+errors) it opens and calls fail fast for BREAKER_COOLDOWN seconds, then one
+probe call decides between closing it and another cooldown.
+
+Deadlines and open circuits raise DependencyUnavailable, a 503 with
+Retry-After, so clients can tell an overloaded dependency from a bug.
+"""
+
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fastapi import HTTPException
+from botocore.exceptions import BotoCoreError, ClientError
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from common import metrics
+from common.config import Settings, get_settings
+
+logger = logging.getLogger()
+
+# Seconds per dependency.kind, AWS_DEADLINES overrides them
+DEFAULT_DEADLINES = {
+    "dynamodb.read": 2.0,
+    "dynamodb.write": 3.0,
+    # Per page of a paginated scan or query (up to 1 MB read), and bulk writes
+    "dynamodb.scan": 10.0,
+    "dynamodb.bulk": 30.0,
+    "s3.read": 10.0,
+    "s3.write": 10.0,
+    "ses.send": 5.0,
+}
+# Latency samples per hedged operation and how many before hedging starts
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.005
+BREAKER_WINDOW = 50
+BREAKER_MIN_CALLS = 10
+BREAKER_FAILURE_RATIO = 0.5
+BREAKER_COOLDOWN = 5.0
+
+# Errors that mean the dependency is struggling, not that the request is wrong
+_DEPENDENCY_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+    "Throttling",
+    "SlowDown",
+    "InternalServerError",
+    "InternalFailure",
+    "ServiceUnavailable",
+}
+
+
+class DependencyUnavailable(HTTPException):
+    def __init__(self, detail: str, retry_after: float = 1):
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    pass
+
+
+class CircuitOpen(DependencyUnavailable):
+    pass
+
+
+def parse_deadlines(spec: str) -> dict:
+    """Parse "dynamodb.read=2,ses.send=5" into {key: seconds}"""
+    deadlines = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, seconds = entry.partition("=")
+        deadlines[key.strip()] = float(seconds)
+    return deadlines
+
+
+def is_dependency_failure(error: BaseException) -> bool:
+    if isinstance(error, (DeadlineExceeded, BotoCoreError)):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in _DEPENDENCY_ERROR_CODES or status >= 500
+    return False
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_ratio: float = BREAKER_FAILURE_RATIO,
+        cooldown: float = BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)  # True for failures
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half-open"
+
+    def before_call(self):
+        """Raise CircuitOpen unless the call may go through"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining <= 0 and not self._probing:
+                # Half-open: this call is the probe
+                self._probing = True
+                return
+        metrics.increment("CircuitOpen")
+        raise CircuitOpen(f"{self.name} is unavailable, retry later", max(remaining, 1))
+
+    def record(self, failed: bool):
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                if failed:
+                    self._opened_at = time.monotonic()
+                    return
+                self._opened_at = None
+                self._outcomes.clear()
+                logger.info("✅ Circuit closed for %s", self.name)
+                return
+            if self._opened_at is not None:
+                # Calls that started before it opened
+                return
+            self._outcomes.append(failed)
+            calls, failures = len(self._outcomes), sum(self._outcomes)
+            if calls >= self.min_calls and failures >= self.failure_ratio * calls:
+                self._opened_at = time.monotonic()
+                logger.error(
+                    "🔌 Circuit opened for %s: %s/%s recent calls failed",
+                    self.name,
+                    failures,
+                    calls,
+                )
+
+
+class LatencyTracker:
+    """Recent successful latencies per operation, for the hedge delay"""
+
+    def __init__(self, size: int = HEDGE_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=size))
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, seconds: float):
+        with self._lock:
+            self._samples[operation].append(seconds)
+
+    def p95(self, operation: str):
+        """None until there are enough samples to trust it"""
+        with self._lock:
+            samples = self._samples.get(operation)
+            if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class Resilience:
+    def __init__(self, deadlines: dict = None, hedging: bool = True, workers: int = 32):
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self.hedging = hedging
+        self.latencies = LatencyTracker()
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="aws"
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "Resilience":
+        return cls(
+            parse_deadlines(settings.aws_deadlines),
+            settings.aws_hedging,
+            # Room for a hedge next to every pooled connection
+            workers=settings.aws_max_pool_connections * 2,
+        )
+
+    def breaker(self, dependency: str) -> CircuitBreaker:
+        with self._lock:
+            if dependency not in self._breakers:
+                self._breakers[dependency] = CircuitBreaker(dependency)
+            return self._breakers[dependency]
+
+    def _submit(self, operation, fn):
+        def timed():
+            started = time.monotonic()
+            result = fn()
+            if operation is not None:
+                self.latencies.add(operation, time.monotonic() - started)
+            return result
+
+        # Each attempt runs in a copy of the request context so its AWS calls
+        # are still accounted to the request (common/metrics.py)
+        return self._executor.submit(contextvars.copy_context().run, timed)
+
+    def call(self, dependency: str, kind: str, fn, hedge: str = None):
+        """
+        Run fn() within the deadline of dependency.kind through the
+        dependency's circuit breaker. `hedge` names an idempotent operation
+        to hedge after its p95 latency.
+        """
+        breaker = self.breaker(dependency)
+        breaker.before_call()
+        deadline = self.deadlines[f"{dependency}.{kind}"]
+        try:
+            result = self._run(fn, deadline, hedge if self.hedging else None)
+        except BaseException as e:
+            breaker.record(is_dependency_failure(e))
+            raise
+        breaker.record(False)
+        return result
+
+    def _run(self, fn, deadline: float, hedge: str = None):
+        end = time.monotonic() + deadline
+        pending = {self._submit(hedge, fn)}
+        hedge_delay = self.latencies.p95(hedge) if hedge else None
+
+        if hedge_delay is not None and hedge_delay < deadline:
+            done, _ = wait(pending, timeout=max(hedge_delay, HEDGE_MIN_DELAY))
+            if not done:
+                metrics.increment("HedgedCalls")
+                pending.add(self._submit(hedge, fn))
+
+        error = None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=max(0, end - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+
+        metrics.increment("DeadlineExceeded")
+        raise DeadlineExceeded(f"AWS call exceeded its {deadline}s deadline")
+
+
+_resilience = None
+_lock = threading.Lock()
+
+
+def get_resilience() -> Resilience:
+    global _resilience
+    with _lock:
+        if _resilience is None:
+            _resilience = Resilience.from_settings(get_settings())
+        return _resilience
+
+
+def guarded(dependency: str, kind: str, hedge: bool = False):
+    """
+    Method decorator running the method through `get_resilience().call`;
+    hedged methods are keyed by their qualified name.
+    """
+
+    def decorator(method):
+        operation = f"{dependency}.{method.__qualname__}" if hedge else None
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            return get_resilience().call(
+                dependency,
+                kind,
+                functools.partial(method, *args, **kwargs),
+                hedge=operation,
+            )
+
+        return wrapper
+
+    return decorator
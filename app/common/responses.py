@@ -0,0 +1,33 @@
+"""
+orjson-backed JSON responses.
+
+`FastJSONResponse` is the app's default response class (see main.create_app),
+so every route that returns a plain dict is rendered by orjson instead of the
+stdlib encoder. Routes on the hot path also return it directly: FastAPI passes
+Response objects through as they are, skipping the `jsonable_encoder` walk
+over a payload the route already built from JSON-ready values.
+"""
+
+from decimal import Decimal
+from typing import Any
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+import orjson
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        # Same as jsonable_encoder: whole Decimals are ints, the rest floats
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    # Pydantic models, sets, ... everything orjson has no native support for
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, Decimal aware"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
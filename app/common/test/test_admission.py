@@ -0,0 +1,187 @@
+import pytest
+from unittest.mock import patch
+from fastapi import FastAPI, Header
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from typing import Optional
+from common.admission import (
+    AdmissionControl,
+    AdmissionMiddleware,
+    LocalRateLimiter,
+    StorageRateLimiter,
+    admitted,
+    parse_rate_limits,
+)
+from storage.memory import MemoryStorage
+
+app = FastAPI()
+
+
+@app.get("/items")
+@admitted("items", lambda args: args["authorization"])
+async def items(authorization: Optional[str] = Header(None)):
+    return {"items": []}
+
+
+@app.get("/sync-items")
+@admitted("items", lambda args: args["authorization"])
+def sync_items(authorization: Optional[str] = Header(None)):
+    return {"items": []}
+
+
+@app.get("/sync-export")
+@admitted("export", lambda args: args["authorization"])
+def sync_export(authorization: Optional[str] = Header(None)):
+    return StreamingResponse(iter([b"row\n"]), media_type="text/plain")
+
+
+@app.get("/export")
+@admitted("export", lambda args: args["authorization"])
+async def export(authorization: Optional[str] = Header(None)):
+    async def rows():
+        yield b"row\n"
+
+    return StreamingResponse(rows(), media_type="text/plain")
+
+
+app.add_middleware(AdmissionMiddleware)
+client = TestClient(app)
+
+
+class LostClient:
+    """Fails every send, like a client gone before the response starts"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        async def lost(message):
+            raise OSError("connection lost")
+
+        await self.app(scope, receive, lost)
+
+
+def use_admission(limits: str = "", concurrency: int = 0):
+    admission = AdmissionControl(
+        parse_rate_limits(limits), LocalRateLimiter(), concurrency
+    )
+    return patch("common.admission._admission", admission)
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_parse_rate_limits():
+    """RATE_LIMITS is parsed into (rate per second, burst) per route"""
+    assert parse_rate_limits("login=1/5, get-summary=0.2/3,transactions=10") == {
+        "login": (1.0, 5),
+        "get-summary": (0.2, 3),
+        "transactions": (10.0, 10),
+    }
+
+
+def test_local_rate_limiter_refills():
+    """A bucket allows `burst` requests, then one per 1/rate seconds"""
+    limiter = LocalRateLimiter()
+
+    assert [limiter.acquire("k", 2, 3, now=0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("k", 2, 3, now=0) == pytest.approx(0.5)
+    assert limiter.acquire("k", 2, 3, now=0.5) == 0
+    assert limiter.acquire("other", 2, 3, now=0.5) == 0
+
+
+def test_local_rate_limiter_bounded():
+    """Least recently used buckets are dropped past max_buckets"""
+    limiter = LocalRateLimiter(max_buckets=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key, 1, 1, now=0)
+
+    assert list(limiter._buckets) == ["b", "c"]
+
+
+def test_storage_rate_limiter_windows():
+    """Shared limiter: `burst` requests per burst/rate second window"""
+    limiter = StorageRateLimiter(MemoryStorage())
+
+    assert [limiter.acquire("k", 1, 2, now=100.5) for _ in range(2)] == [0, 0]
+    assert limiter.acquire("k", 1, 2, now=101) == pytest.approx(1)
+    # Next window
+    assert limiter.acquire("k", 1, 2, now=102) == 0
+
+
+def test_rate_limiter_fails_open():
+    """A failing shared limiter does not reject requests"""
+    admission = AdmissionControl({"items": (1, 1)}, StorageRateLimiter(), 0)
+    with patch.object(StorageRateLimiter, "acquire", side_effect=RuntimeError):
+        admission.check_rate("items", "token")
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_rate_limited_request():
+    """Over the limit the caller gets 429 with Retry-After, others do not"""
+    headers = {"Authorization": "Bearer a"}
+    with use_admission("items=0.5/2"), patch(
+        "common.admission.metrics.increment"
+    ) as increment:
+        statuses = [client.get("/items", headers=headers).status_code for _ in range(3)]
+        rejected = client.get("/items", headers=headers)
+        other = client.get("/items", headers={"Authorization": "Bearer b"})
+
+    assert statuses == [200, 200, 429]
+    assert rejected.headers["retry-after"] == "2"
+    assert other.status_code == 200
+    increment.assert_called_with("RateLimited")
+
+
+def test_concurrency_limit():
+    """With every DynamoDB slot taken requests are rejected, not queued"""
+    with use_admission(concurrency=1) as admission, patch(
+        "common.admission.metrics.increment"
+    ) as increment:
+        admission.acquire_slot()
+        rejected = client.get("/items")
+        admission.release_slot()
+        admitted_response = client.get("/items")
+
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "1"
+    assert admitted_response.status_code == 200
+    increment.assert_called_once_with("ConcurrencyRejected")
+
+
+@pytest.mark.parametrize("path", ["/sync-items", "/sync-export"])
+def test_sync_endpoint_holds_slot(path):
+    """Plain def endpoints are admitted the same way and free their slot"""
+    with use_admission(concurrency=1) as admission:
+        admission.acquire_slot()
+        rejected = client.get(path)
+        admission.release_slot()
+        response = client.get(path)
+        assert admission.concurrency.try_acquire()
+
+    assert rejected.status_code == 429
+    assert response.status_code == 200
+
+
+def test_streaming_response_releases_slot():
+    """The slot of a streaming response is held until its last chunk"""
+    with use_admission(concurrency=1) as admission:
+        response = client.get("/export")
+        assert admission.concurrency.try_acquire()
+
+    assert response.text == "row\n"
+
+
+def test_streaming_response_never_started_releases_slot():
+    """A streaming response whose body is never sent still frees its slot"""
+    lost_app = FastAPI()
+    lost_app.get("/export")(export)
+    lost_app.add_middleware(LostClient)
+    lost_app.add_middleware(AdmissionMiddleware)
+    lost_client = TestClient(lost_app, raise_server_exceptions=False)
+
+    with use_admission(concurrency=1) as admission:
+        lost_client.get("/export")
+        assert admission.concurrency.try_acquire()
@@ -0,0 +1,156 @@
+import base64
+import gzip
+import pytest
+import brotli
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+from mangum import Mangum
+from common.compression import CompressionMiddleware, choose_encoding
+
+LARGE = {"rows": [{"id": f"id{i}", "amount": i * 1.5} for i in range(200)]}
+CHUNKS = [b'{"id":"id%d"}\n' % i * 50 for i in range(3)]
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+
+@app.get("/large")
+async def large():
+    return LARGE
+
+
+@app.get("/small")
+async def small():
+    return {"status": "healthy"}
+
+
+@app.get("/stream")
+async def stream():
+    async def chunks():
+        for chunk in CHUNKS:
+            yield chunk
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@app.get("/binary")
+async def binary():
+    return Response(b"\x89PNG" * 500, media_type="image/png")
+
+
+@app.get("/text")
+async def text():
+    return PlainTextResponse("Resumen ✨ " * 200)
+
+
+client = TestClient(app)
+
+# -------------------------- Unit Tests --------------------------
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0.5, gzip;q=0.8", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding(header, expected):
+    """The highest weighted supported coding wins, ties go to brotli"""
+    assert choose_encoding(header) == expected
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_large_response_compressed(encoding):
+    """Large JSON is compressed with the negotiated coding"""
+    response = client.get("/large", headers={"Accept-Encoding": encoding})
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == LARGE
+
+
+def test_small_response_untouched():
+    """Bodies below the minimum size are not worth compressing"""
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"status": "healthy"}
+
+
+def test_identity_when_not_accepted():
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == LARGE
+
+
+def test_binary_untouched():
+    """Binary media types are not compressed"""
+    response = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.content == b"\x89PNG" * 500
+
+
+def test_text_compressed():
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == "Resumen ✨ " * 200
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_streaming_response_compressed(encoding):
+    """Each chunk is compressed and flushed as it is produced"""
+    with client.stream(
+        "GET", "/stream", headers={"Accept-Encoding": encoding}
+    ) as response:
+        raw = list(response.iter_raw())
+
+    assert response.headers["content-encoding"] == encoding
+    assert "content-length" not in response.headers
+    decompress = gzip.decompress if encoding == "gzip" else brotli.decompress
+    assert decompress(b"".join(raw)) == b"".join(CHUNKS)
+
+
+def test_compressed_through_mangum():
+    """Compressed bodies survive Mangum's base64 handling"""
+    handler = Mangum(app, lifespan="off")
+    event = {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": "/large",
+        "rawQueryString": "",
+        "headers": {"host": "api.local", "accept-encoding": "gzip"},
+        "requestContext": {
+            "http": {
+                "method": "GET",
+                "path": "/large",
+                "sourceIp": "127.0.0.1",
+                "protocol": "HTTP/1.1",
+                "userAgent": "pytest",
+            },
+            "stage": "$default",
+        },
+        "isBase64Encoded": False,
+    }
+
+    response = handler(event, {})
+
+    assert response["headers"]["content-encoding"] == "gzip"
+    if response["isBase64Encoded"]:
+        body = base64.b64decode(response["body"])
+    else:
+        body = response["body"].encode("utf-8")
+    assert gzip.decompress(body).startswith(b'{"rows":[{"id":"id0"')
@@ -0,0 +1,112 @@
+import anyio.to_thread
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from common.config import Settings
+from routes.transactions import transactions
+from storage import get_storage
+import main
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_settings_defaults():
+    """Without env vars every field keeps its default"""
+    settings = Settings.from_env({})
+
+    assert settings == Settings()
+    assert not settings.on_lambda
+
+
+def test_settings_from_env():
+    """Fields are read from upper-cased env vars and converted to their type"""
+    settings = Settings.from_env(
+        {
+            "AWS_REGION": "sa-east-1",
+            "AWS_MAX_POOL_CONNECTIONS": "64",
+            "AWS_READ_TIMEOUT": "2.5",
+            "SERVER_ACCESS_LOG": "true",
+            "STORAGE_BACKEND": "sqlite",
+            "AWS_LAMBDA_FUNCTION_NAME": "lambda_fastapi",
+        }
+    )
+
+    assert settings.aws_region == "sa-east-1"
+    assert settings.aws_max_pool_connections == 64
+    assert settings.aws_read_timeout == 2.5
+    assert settings.server_access_log is True
+    assert settings.storage_backend == "sqlite"
+    assert settings.on_lambda
+
+
+def test_boto_config():
+    """Every AWS client shares the pool size and timeouts"""
+    config = Settings(
+        aws_max_pool_connections=32, aws_connect_timeout=1.0
+    ).boto_config()
+
+    assert config.max_pool_connections == 32
+    assert config.connect_timeout == 1.0
+    assert config.region_name == "us-east-1"
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_lifespan_server_mode():
+    """Server mode starts once and shuts logging down on exit"""
+    app = main.create_app(Settings(server_threads=8))
+
+    with patch("main.shutdown_logging") as shutdown_logging, patch(
+        "main.flush_logging"
+    ) as flush_logging:
+        with TestClient(app) as client:
+            response = client.get("/health")
+            limiter = client.portal.call(anyio.to_thread.current_default_thread_limiter)
+            assert limiter.total_tokens == 8
+
+    assert response.status_code == 200
+    shutdown_logging.assert_called_once()
+    flush_logging.assert_not_called()
+    # Still the open instance the route modules got at import
+    assert get_storage() is transactions.storage
+
+
+def test_lifespan_lambda_mode():
+    """On Lambda shutdown only flushes, the clients outlive the invocation"""
+    app = main.create_app(Settings(aws_lambda_function_name="lambda_fastapi"))
+
+    with patch("main.shutdown_logging") as shutdown_logging, patch(
+        "main.flush_logging"
+    ) as flush_logging:
+        with TestClient(app):
+            pass
+
+    flush_logging.assert_called_once()
+    shutdown_logging.assert_not_called()
+
+
+def test_blocking_requests_overlap():
+    """Endpoints run their storage and AWS calls on the thread pool"""
+
+    def slow_user(login_request):
+        time.sleep(0.3)
+        return None
+
+    app = main.create_app(Settings(server_threads=8))
+    with patch("routes.auth.login.verify_user", side_effect=slow_user):
+        with TestClient(app) as client, ThreadPoolExecutor(2) as executor:
+            started = time.perf_counter()
+            responses = list(
+                executor.map(
+                    lambda email: client.post(
+                        "/login", json={"email": email, "password": "secret"}
+                    ),
+                    ["a@example.com", "b@example.com"],
+                )
+            )
+            elapsed = time.perf_counter() - started
+
+    assert [response.status_code for response in responses] == [401, 401]
+    assert elapsed < 0.55
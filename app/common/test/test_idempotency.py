@@ -0,0 +1,113 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from common.idempotency import (
+    IN_PROGRESS_TTL,
+    IdempotentRequest,
+    InvalidIdempotencyKey,
+)
+from storage.memory import MemoryStorage
+
+token = "valid_test_token"
+payload = b"Date,Transaction,Amount\n2024-01-01,Payment,100.00"
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_no_key_is_a_no_op():
+    """Without the header nothing is read or written"""
+    storage = MagicMock()
+    idempotency = IdempotentRequest(storage, None, "upload-file", token, payload)
+
+    assert idempotency.start() is None
+    idempotency.complete({"status": "success"})
+    idempotency.release()
+
+    assert storage.mock_calls == []
+
+
+@pytest.mark.parametrize("key", ["", "k" * 256])
+def test_invalid_key(key):
+    with pytest.raises(InvalidIdempotencyKey):
+        IdempotentRequest(MemoryStorage(), key, "upload-file", token, payload)
+
+
+def test_completed_request_replayed():
+    """The recorded response comes back with the replay header"""
+    storage = MemoryStorage()
+    first = IdempotentRequest(storage, "k1", "upload-file", token, payload)
+    assert first.start() is None
+    first.complete({"status": "success", "amount": 1.5})
+
+    replay = IdempotentRequest(storage, "k1", "upload-file", token, payload).start()
+
+    assert replay.status_code == 200
+    assert json.loads(replay.body) == {"status": "success", "amount": 1.5}
+    assert replay.headers["idempotent-replayed"] == "true"
+
+
+def test_in_progress_conflict():
+    """A retry while the first request runs gets 409"""
+    storage = MemoryStorage()
+    assert (
+        IdempotentRequest(storage, "k1", "upload-file", token, payload).start() is None
+    )
+
+    response = IdempotentRequest(storage, "k1", "upload-file", token, payload).start()
+
+    assert response.status_code == 409
+    assert response.headers["retry-after"] == "1"
+
+
+def test_in_progress_claim_expires(monkeypatch):
+    """A claim left by a request that died can be taken over"""
+    storage = MemoryStorage()
+    clock = iter([1000, 1000 + IN_PROGRESS_TTL + 1])
+    monkeypatch.setattr("common.idempotency.time.time", lambda: next(clock))
+
+    assert (
+        IdempotentRequest(storage, "k1", "upload-file", token, payload).start() is None
+    )
+    assert (
+        IdempotentRequest(storage, "k1", "upload-file", token, payload).start() is None
+    )
+
+
+def test_different_payload_rejected():
+    """Reusing a key for another request is a client error"""
+    storage = MemoryStorage()
+    first = IdempotentRequest(storage, "k1", "upload-file", token, payload)
+    first.start()
+    first.complete({"status": "success"})
+
+    response = IdempotentRequest(storage, "k1", "upload-file", token, b"other").start()
+
+    assert response.status_code == 422
+
+
+def test_released_key_runs_again():
+    """A failed request releases the key so the retry runs"""
+    storage = MemoryStorage()
+    first = IdempotentRequest(storage, "k1", "upload-file", token, payload)
+    first.start()
+    first.release()
+
+    assert (
+        IdempotentRequest(storage, "k1", "upload-file", token, payload).start() is None
+    )
+
+
+def test_keys_scoped_by_route_and_token():
+    """The same key from another route or session is a different key"""
+    storage = MemoryStorage()
+    first = IdempotentRequest(storage, "k1", "upload-file", token, payload)
+    first.start()
+    first.complete({"status": "success"})
+
+    assert (
+        IdempotentRequest(storage, "k1", "get-summary", token, payload).start() is None
+    )
+    assert (
+        IdempotentRequest(storage, "k1", "upload-file", "other", payload).start()
+        is None
+    )
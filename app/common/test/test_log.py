@@ -0,0 +1,101 @@
+import pytest
+import json
+import logging
+from unittest.mock import MagicMock
+from common import log
+from common.log import HotPathLogger, JsonFormatter, RateLimiter, parse_sampling
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_parse_sampling():
+    """LOG_SAMPLING is parsed into per-key rates"""
+    rates = parse_sampling("calculate_summary.row=0.01, get_user_transactions.row=0")
+    assert rates == {"calculate_summary.row": 0.01, "get_user_transactions.row": 0.0}
+
+
+def test_hot_path_disabled_by_default():
+    """Unlisted hot paths never reach the logger"""
+    logger = MagicMock()
+    hot_path = HotPathLogger(logger, "not.configured")
+
+    hot_path.debug("row %s", 1)
+
+    logger.isEnabledFor.assert_not_called()
+    logger.log.assert_not_called()
+
+
+def test_hot_path_respects_level():
+    """Disabled levels skip sampling and record creation"""
+    logger = MagicMock()
+    logger.isEnabledFor.return_value = False
+    hot_path = HotPathLogger(logger, "key", sample_rate=1.0)
+
+    hot_path.debug("row %s", 1)
+
+    logger.log.assert_not_called()
+
+
+def test_hot_path_rate_limited():
+    """Once the per-key budget is spent the rest is counted, not logged"""
+    logger = MagicMock()
+    logger.isEnabledFor.return_value = True
+    hot_path = HotPathLogger(logger, "key", sample_rate=1.0, max_per_second=5)
+
+    for i in range(50):
+        hot_path.info("row %s", i)
+
+    assert logger.log.call_count == 5
+    assert hot_path.suppressed == 45
+    _, kwargs = logger.log.call_args
+    assert kwargs["extra"]["hot_path"] == "key"
+
+
+def test_rate_limiter_refills():
+    """Tokens come back over time"""
+    limiter = RateLimiter(per_second=1)
+    assert limiter.allow()
+    assert not limiter.allow()
+    limiter._updated -= 1
+    assert limiter.allow()
+
+
+def test_json_formatter_includes_extra():
+    """Extra fields end up as top level JSON keys"""
+    record = logging.makeLogRecord(
+        {
+            "msg": "Found %d transactions",
+            "args": (3,),
+            "levelname": "INFO",
+            "user": "u1",
+        }
+    )
+
+    payload = json.loads(JsonFormatter().format(record))
+
+    assert payload["message"] == "Found 3 transactions"
+    assert payload["user"] == "u1"
+
+
+def test_queue_logging_delivers_records():
+    """Records go through the queue and are written by the listener thread"""
+    root = logging.getLogger()
+    original_handlers = root.handlers[:]
+    original_level = root.level
+    captured = []
+
+    class CaptureHandler(logging.Handler):
+        def emit(self, record):
+            captured.append(record.getMessage())
+
+    root.handlers[:] = [CaptureHandler()]
+    try:
+        log.configure_logging(logging.INFO)
+        logging.getLogger("test").info("hello %s", "queue")
+        assert log.flush_logging(timeout=5)
+    finally:
+        log.shutdown_logging()
+        root.handlers[:] = original_handlers
+        root.setLevel(original_level)
+
+    assert captured == ["hello queue"]
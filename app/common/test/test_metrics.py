@@ -0,0 +1,134 @@
+import pytest
+import boto3
+import json
+from botocore.stub import Stubber
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from common import metrics
+from common.metrics import MetricsMiddleware, instrument_client, percentile
+
+# -------------------------- Test Fixtures --------------------------
+
+
+@pytest.fixture
+def local_sink():
+    sink = metrics.configure("local")
+    yield sink
+    metrics.configure("off")
+
+
+@pytest.fixture
+def dynamodb_client():
+    client = boto3.client(
+        "dynamodb",
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    return instrument_client(client)
+
+
+def build_app(dynamodb_client):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        dynamodb_client.get_item(TableName="items", Key={"id": {"S": item_id}})
+        dynamodb_client.put_item(TableName="items", Item={"id": {"S": item_id}})
+        return {"id": item_id}
+
+    return app
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_percentile_nearest_rank():
+    """Nearest-rank percentiles over a sorted window"""
+    ordered = list(range(1, 101))
+    assert percentile(ordered, 50) == 50
+    assert percentile(ordered, 99) == 99
+    assert percentile([], 99) == 0.0
+
+
+def test_request_records_emf_line(local_sink, dynamodb_client):
+    """Each request produces one EMF record with AWS call and capacity totals"""
+    client = TestClient(build_app(dynamodb_client))
+
+    with Stubber(dynamodb_client) as stubber:
+        stubber.add_response(
+            "get_item",
+            {"Item": {"id": {"S": "a"}}, "ConsumedCapacity": {"CapacityUnits": 0.5}},
+            {
+                "TableName": "items",
+                "Key": {"id": {"S": "a"}},
+                "ReturnConsumedCapacity": "TOTAL",
+            },
+        )
+        stubber.add_response(
+            "put_item",
+            {"ConsumedCapacity": {"TableName": "items", "CapacityUnits": 1.0}},
+        )
+        response = client.get("/items/a")
+
+    assert response.status_code == 200
+    assert len(local_sink.records) == 1
+    record = local_sink.records[0]
+
+    assert record["Route"] == "GET /items/{item_id}"
+    assert record["StatusCode"] == 200
+    assert record["AwsCalls"] == 2
+    assert record["ReadCapacityUnits"] == 0.5
+    assert record["WriteCapacityUnits"] == 1.0
+    assert record["AwsOperations"]["dynamodb.GetItem"]["calls"] == 1
+    assert record["Latency"] >= record["AwsTime"]
+
+    emf = record["_aws"]["CloudWatchMetrics"][0]
+    assert emf["Dimensions"] == [["Route"]]
+    names = {metric["Name"] for metric in emf["Metrics"]}
+    assert {"Latency", "LatencyP99", "AwsCalls", "ReadCapacityUnits"} <= names
+
+
+def test_failed_aws_call_is_counted(local_sink, dynamodb_client):
+    """AWS errors are timed and counted even though the call raises"""
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/fail")
+    async def fail():
+        try:
+            dynamodb_client.get_item(TableName="items", Key={"id": {"S": "a"}})
+        except Exception:
+            pass
+        return {}
+
+    with Stubber(dynamodb_client) as stubber:
+        stubber.add_client_error("get_item", "ProvisionedThroughputExceededException")
+        TestClient(app).get("/fail")
+
+    record = local_sink.records[0]
+    assert record["AwsCalls"] == 1
+    assert record["AwsErrors"] == 1
+
+
+def test_calls_outside_requests_are_ignored(local_sink, dynamodb_client):
+    """Hooks are inert when no request is being served"""
+    with Stubber(dynamodb_client) as stubber:
+        stubber.add_response("get_item", {})
+        dynamodb_client.get_item(TableName="items", Key={"id": {"S": "a"}})
+
+    assert local_sink.records == []
+
+
+def test_local_dump_file(tmp_path, dynamodb_client):
+    """Local mode can append JSON lines to a dump file"""
+    dump_path = tmp_path / "metrics.jsonl"
+    metrics.configure("local", str(dump_path))
+    try:
+        TestClient(build_app(dynamodb_client)).get("/missing")
+    finally:
+        metrics.configure("off")
+
+    lines = dump_path.read_text().splitlines()
+    assert json.loads(lines[0])["Route"] == "GET unmatched"
@@ -0,0 +1,130 @@
+import time
+from unittest.mock import patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from common.config import Settings
+from common.profiling import (
+    LocalProfileSink,
+    ProfilingMiddleware,
+    S3ProfileSink,
+    StackSampler,
+    create_sink,
+)
+from local_aws import FakeS3
+import main
+
+
+def busy_wait(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def profiled_app(sink, **options) -> TestClient:
+    app = FastAPI()
+
+    @app.post("/get-summary")
+    def get_summary():
+        busy_wait(0.05)
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    app.add_middleware(
+        ProfilingMiddleware, sink=sink, routes=["/get-summary"], **options
+    )
+    return TestClient(app)
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_sampler_collapses_stacks():
+    """Busy threads show up as ';'-joined frames rooted at the thread name"""
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    busy_wait(0.05)
+    sampler.stop()
+
+    lines = sampler.collapsed().splitlines()
+    assert sampler.samples > 0
+    busy = [line for line in lines if "busy_wait" in line]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert stack.startswith("MainThread;")
+    assert int(count) > 0
+    # Idle pool workers are left out
+    assert not any(line.split(";")[-1].startswith("get ") for line in lines)
+
+
+def test_create_sink():
+    sink = create_sink("s3://profiles-bucket/api/prod")
+    assert isinstance(sink, S3ProfileSink)
+    assert (sink.bucket, sink.prefix) == ("profiles-bucket", "api/prod")
+    assert isinstance(create_sink("/tmp/profiles"), LocalProfileSink)
+
+
+def test_disabled_by_default():
+    """Without a sink the middleware is not even installed"""
+    assert not ProfilingMiddleware.enabled(Settings())
+    assert not ProfilingMiddleware.enabled(Settings(profile_token="secret"))
+    assert ProfilingMiddleware.enabled(
+        Settings(profile_sink="/tmp/profiles", profile_token="secret")
+    )
+
+    app = main.create_app(Settings())
+    assert ProfilingMiddleware not in [m.cls for m in app.user_middleware]
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_profile_on_header(tmp_path):
+    client = profiled_app(LocalProfileSink(str(tmp_path)), token="secret")
+
+    response = client.post("/get-summary", headers={"X-Profile": "secret"})
+
+    assert response.status_code == 200
+    name = response.headers["X-Profile-Id"]
+    assert name.startswith("get-summary-") and name.endswith(".folded")
+    assert "busy_wait" in (tmp_path / name).read_text()
+
+
+def test_no_profile_without_trigger(tmp_path):
+    """Wrong token, other routes and a zero sample rate are not profiled"""
+    client = profiled_app(LocalProfileSink(str(tmp_path)), token="secret")
+
+    assert "X-Profile-Id" not in client.post("/get-summary").headers
+    assert (
+        "X-Profile-Id"
+        not in client.post("/get-summary", headers={"X-Profile": "guess"}).headers
+    )
+    health = client.get("/health", headers={"X-Profile": "secret"})
+    assert "X-Profile-Id" not in health.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sampled_profile_to_s3():
+    s3 = FakeS3()
+    client = profiled_app(S3ProfileSink("profiles", "api", client=s3), sample_rate=1.0)
+
+    name = client.post("/get-summary").headers["X-Profile-Id"]
+
+    body, _ = s3.objects[("profiles", f"api/{name}")]
+    assert b"busy_wait" in body
+
+
+def test_sink_errors_do_not_fail_request():
+    class BrokenSink:
+        def write(self, name, body):
+            raise OSError("disk full")
+
+    client = profiled_app(BrokenSink(), sample_rate=1.0)
+
+    with patch("common.profiling.logger") as logger:
+        response = client.post("/get-summary")
+
+    assert response.status_code == 200
+    logger.error.assert_called_once()
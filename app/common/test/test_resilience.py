@@ -0,0 +1,217 @@
+import pytest
+import time
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from common.resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    DeadlineExceeded,
+    Resilience,
+    is_dependency_failure,
+    parse_deadlines,
+)
+from local_aws import Faults, FakeDynamoDB, LocalAWS
+from storage.base import AlreadyExists
+from storage.dynamodb import DynamoStorage
+import main
+
+
+@pytest.fixture
+def resilience():
+    resilience = Resilience({"dynamodb.read": 0.2, "dynamodb.write": 0.2})
+    with patch("common.resilience._resilience", resilience):
+        yield resilience
+
+
+@pytest.fixture
+def aws(resilience):
+    aws = LocalAWS(faults=Faults())
+    aws.storage.save_token({"email": "user@example.com", "token": "token-1"})
+    return aws
+
+
+def client_error(code: str, status: int = 400) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "Scan",
+    )
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_parse_deadlines():
+    assert parse_deadlines("dynamodb.read=1.5, ses.send=5") == {
+        "dynamodb.read": 1.5,
+        "ses.send": 5.0,
+    }
+    assert parse_deadlines("") == {}
+
+
+def test_is_dependency_failure():
+    """Throttling and 5xx trip the breaker, request errors do not"""
+    assert is_dependency_failure(DeadlineExceeded("slow"))
+    assert is_dependency_failure(client_error("ThrottlingException"))
+    assert is_dependency_failure(client_error("Whatever", 500))
+    assert not is_dependency_failure(client_error("ConditionalCheckFailedException"))
+    assert not is_dependency_failure(AlreadyExists("user"))
+
+
+def test_circuit_breaker_opens_and_probes():
+    """Opens at the failure ratio, then one probe closes it"""
+    breaker = CircuitBreaker("dynamodb", min_calls=4, cooldown=0.05)
+
+    for failed in (False, True, False, True):
+        breaker.before_call()
+        breaker.record(failed)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen) as error:
+        breaker.before_call()
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "1"
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    # Only one probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("ses", min_calls=1, cooldown=0.05)
+    breaker.record(True)
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.record(True)
+
+    assert breaker.state == "open"
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_deadline_exceeded(aws):
+    """A hung read gives up at its deadline instead of botocore's timeout"""
+    aws.faults.inject("tokens.scan", latency=1.0)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as error:
+        aws.storage.get_token("token-1")
+
+    assert time.monotonic() - started < 0.5
+    assert error.value.status_code == 503
+
+
+def test_hedged_read_beats_slow_call(aws):
+    """Once the p95 is known a slow read is raced by a second one"""
+    aws.storage.set_shard_count("user-1", 4)
+    for _ in range(20):
+        aws.storage.get_shard_count("user-1")
+    aws.faults.inject("movement_shards.get_item", latency=1.0, times=1)
+    calls = aws.faults.calls["movement_shards.get_item"]
+
+    started = time.monotonic()
+    shards = aws.storage.get_shard_count("user-1")
+
+    assert shards == 4
+    assert time.monotonic() - started < 0.5
+    assert aws.faults.calls["movement_shards.get_item"] == calls + 2
+
+
+def test_full_table_scans_are_not_hedged(aws):
+    for _ in range(20):
+        aws.storage.get_token("token-1")
+    aws.faults.inject("tokens.scan", latency=0.1, times=1)
+    calls = aws.faults.calls["tokens.scan"]
+
+    aws.storage.get_token("token-1")
+
+    assert aws.faults.calls["tokens.scan"] == calls + 1
+
+
+def test_scan_deadline_applies_per_page(aws, resilience):
+    """A scan of many pages only has to read each page within the deadline"""
+    resilience.deadlines["dynamodb.scan"] = 0.2
+    storage = DynamoStorage(FakeDynamoDB())
+
+    def scan(**kwargs):
+        time.sleep(0.1)
+        page = kwargs.get("ExclusiveStartKey", {}).get("page", 0)
+        response = {
+            "Items": [
+                {"id": str(page), "UserId": "user-1", "Date": "2024-01-10"},
+            ]
+        }
+        if page < 3:
+            response["LastEvaluatedKey"] = {"page": page + 1}
+        return response
+
+    with patch.object(storage.movements, "scan", scan):
+        movements = storage.get_movements("user-1", "2024-01-01", "2024-01-31")
+
+    assert [movement["id"] for movement in movements] == ["0", "1", "2", "3"]
+
+
+def test_writes_are_not_hedged(aws):
+    for _ in range(20):
+        aws.storage.save_token({"email": "user@example.com", "token": "token-1"})
+    aws.faults.inject("tokens.put_item", latency=0.1, times=1)
+    calls = aws.faults.calls["tokens.put_item"]
+
+    aws.storage.save_token({"email": "user@example.com", "token": "token-1"})
+
+    assert aws.faults.calls["tokens.put_item"] == calls + 1
+
+
+def test_hedging_disabled(aws, resilience):
+    resilience.hedging = False
+    for _ in range(20):
+        aws.storage.get_shard_count("user-1")
+    aws.faults.inject("movement_shards.get_item", latency=0.1, times=1)
+    calls = aws.faults.calls["movement_shards.get_item"]
+
+    aws.storage.get_shard_count("user-1")
+
+    assert aws.faults.calls["movement_shards.get_item"] == calls + 1
+
+
+def test_breaker_fails_fast(aws, resilience):
+    """After repeated 503s DynamoDB is not called until the cooldown ends"""
+    aws.faults.inject("tokens.scan", error="ServiceUnavailable")
+    while resilience.breaker("dynamodb").state == "closed":
+        with pytest.raises(ClientError):
+            aws.storage.get_token("token-1")
+    calls = aws.faults.calls["tokens.scan"]
+
+    with pytest.raises(CircuitOpen):
+        aws.storage.get_token("token-1")
+
+    assert aws.faults.calls["tokens.scan"] == calls
+
+
+def test_request_errors_keep_breaker_closed(aws, resilience):
+    user = {"id": "1", "email": "user@example.com", "password": "x"}
+    aws.storage.create_user(user)
+    for _ in range(10):
+        with pytest.raises(AlreadyExists):
+            aws.storage.create_user(user)
+
+    assert resilience.breaker("dynamodb").state == "closed"
+
+
+def test_open_circuit_answers_503(aws):
+    """Clients get 503 with Retry-After instead of waiting on DynamoDB"""
+    aws.faults.inject("tokens.scan", error="ServiceUnavailable")
+    headers = {"Authorization": "Bearer token-1"}
+    with aws.install(), TestClient(main.create_app()) as client:
+        for _ in range(10):
+            client.get("/transactions", headers=headers)
+        response = client.get("/transactions", headers=headers)
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,37 @@
+import json
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from common.responses import FastJSONResponse, dumps
+
+# -------------------------- Unit Tests --------------------------
+
+
+class Period(BaseModel):
+    start: str
+    end: str
+
+
+def test_dumps_decimal_like_jsonable_encoder():
+    """Decimals render as jsonable_encoder would: whole ones as ints"""
+    content = {"amount": Decimal("-10.50"), "count": Decimal("3"), "zero": Decimal("0")}
+
+    assert json.loads(dumps(content)) == jsonable_encoder(content)
+    assert dumps(content) == b'{"amount":-10.5,"count":3,"zero":0}'
+
+
+def test_dumps_falls_back_to_jsonable_encoder():
+    """Types orjson does not know, like pydantic models, still serialize"""
+    content = {"range": Period(start="2024-01-01", end="2024-01-31")}
+
+    assert json.loads(dumps(content)) == {
+        "range": {"start": "2024-01-01", "end": "2024-01-31"}
+    }
+
+
+def test_fast_json_response():
+    """Renders compact UTF-8 JSON with the JSON media type"""
+    response = FastJSONResponse({"message": "Resumen ✨", "total": 1.5})
+
+    assert response.body == '{"message":"Resumen ✨","total":1.5}'.encode("utf-8")
+    assert response.media_type == "application/json"
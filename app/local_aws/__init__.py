@@ -0,0 +1,123 @@
+"""
+In-process stand-ins for the AWS services the API uses, for benchmarks, load
+tests and local runs without an AWS account.
+
+    with LocalAWS().install() as aws:
+        aws.dynamodb.Table("users").put_item(Item={...})
+        client.post("/login", json={...})
+"""
+
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+import importlib
+import json
+from storage import create_storage
+from storage.dynamodb import DynamoStorage
+from .dynamodb import FakeDynamoDB, FakeTable, evaluate
+from .faults import Fault, Faults, FaultyProxy
+from .processor import FileProcessor
+from .s3 import FakeS3, FakeSES
+from .sqs import FakeSQS
+
+# Module level AWS handles of the API, replaced by install()
+# module -> {attribute: callable(LocalAWS) -> stand-in}
+PATCH_TARGETS = {
+    "routes.auth.dynamo": {
+        "storage": lambda aws: aws.storage,
+    },
+    "routes.get_summary.get_summary": {
+        "storage": lambda aws: aws.storage,
+        "ses_client": lambda aws: aws.ses,
+    },
+    "routes.get_summary.rollups": {
+        "storage": lambda aws: aws.storage,
+    },
+    "routes.upload_file.upload_file": {
+        "s3_client": lambda aws: aws.s3,
+        "storage": lambda aws: aws.storage,
+    },
+    "routes.transactions.transactions": {
+        "storage": lambda aws: aws.storage,
+    },
+}
+
+
+class LocalAWS:
+    """
+    `storage` picks the backend the API runs on: "dynamodb" (DynamoStorage over
+    the in-process FakeDynamoDB, the default), "memory" or "sqlite" (in memory).
+    With `faults` the API reaches DynamoDB, S3 and SES through FaultyProxy.
+    `ingest_queue_url` is the "file-ingest" queue that FileProcessor reads
+    with a batch size; messages received `max_receive_count` times are moved
+    to `dead_letter_queue_url`.
+    """
+
+    def __init__(
+        self,
+        storage: str = "dynamodb",
+        faults: Faults = None,
+        max_receive_count: int = 3,
+        visibility_timeout: float = 30,
+    ):
+        self.dynamodb = FakeDynamoDB()
+        self.s3 = FakeS3()
+        self.ses = FakeSES()
+        self.sqs = FakeSQS()
+        self.dead_letter_queue_url = self.sqs.create_queue(QueueName="file-ingest-dlq")[
+            "QueueUrl"
+        ]
+        dead_letter_arn = self.sqs.get_queue_attributes(
+            QueueUrl=self.dead_letter_queue_url, AttributeNames=["QueueArn"]
+        )["Attributes"]["QueueArn"]
+        self.ingest_queue_url = self.sqs.create_queue(
+            QueueName="file-ingest",
+            Attributes={
+                "VisibilityTimeout": str(visibility_timeout),
+                "RedrivePolicy": json.dumps(
+                    {
+                        "deadLetterTargetArn": dead_letter_arn,
+                        "maxReceiveCount": str(max_receive_count),
+                    }
+                ),
+            },
+        )["QueueUrl"]
+        self.faults = faults
+        if faults is not None:
+            self.s3 = FaultyProxy(self.s3, faults)
+            self.ses = FaultyProxy(self.ses, faults)
+        if storage == "dynamodb":
+            resource = self.dynamodb
+            if faults is not None:
+                resource = FaultyProxy(resource, faults)
+            self.storage = DynamoStorage(resource)
+        elif storage == "sqlite":
+            self.storage = create_storage("sqlite", path=":memory:")
+        else:
+            self.storage = create_storage(storage)
+
+    @contextmanager
+    def install(self):
+        """Point every module level AWS handle of the API at these stand-ins"""
+        with ExitStack() as stack:
+            for module_name, attributes in PATCH_TARGETS.items():
+                module = importlib.import_module(module_name)
+                for attribute, factory in attributes.items():
+                    stack.enter_context(
+                        mock.patch.object(module, attribute, factory(self))
+                    )
+            yield self
+
+
+__all__ = [
+    "FakeDynamoDB",
+    "FakeS3",
+    "FakeSES",
+    "FakeSQS",
+    "FakeTable",
+    "Fault",
+    "Faults",
+    "FaultyProxy",
+    "FileProcessor",
+    "LocalAWS",
+    "evaluate",
+]
@@ -0,0 +1,557 @@
+"""
+In-process DynamoDB stand-in with the subset of the boto3 resource API this
+project uses: Table.put_item/get_item/update_item/delete_item/scan/query/
+batch_writer, resource.batch_get_item and client.transact_write_items.
+Conditions are evaluated from the same boto3.dynamodb.conditions objects the
+application builds.
+
+`resource.meta.client.scan` answers in the low-level client's wire format,
+with string filter expressions made of comparisons and BETWEEN joined by AND.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from types import SimpleNamespace
+import re
+import threading
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+# Key schemas of the tables the application touches: (hash key, range key)
+TABLE_SCHEMAS = {
+    "users": ("id", None),
+    "tokens": ("email", None),
+    "movements": ("id", None),
+    "movement_rollups": ("UserId", "Bucket"),
+    "idempotency_keys": ("key", None),
+    "rate_limits": ("key", None),
+    "file_ingestions": ("file", None),
+    "movement_shards": ("UserId", None),
+}
+INDEX_SCHEMAS = {
+    "movements": {"UserId-Date-index": ("UserId", "Date")},
+}
+
+_ATTRIBUTE_FUNCTION = re.compile(
+    r"^\s*(attribute_exists|attribute_not_exists)\((\w+)\)\s*$"
+)
+_CLAUSE = re.compile(
+    r"([#\w]+)\s+BETWEEN\s+(:\w+)\s+AND\s+(:\w+)|([#\w]+)\s*(<>|<=|>=|=|<|>)\s*(:\w+)",
+    re.IGNORECASE,
+)
+_COMPARISONS = {"=": "eq", "<>": "ne", "<": "lt", "<=": "lte", ">": "gt", ">=": "gte"}
+
+
+def conditional_check_failed(operation: str) -> ClientError:
+    return ClientError(
+        {
+            "Error": {
+                "Code": "ConditionalCheckFailedException",
+                "Message": "The conditional request failed",
+            }
+        },
+        operation,
+    )
+
+
+def evaluate(condition, item: dict) -> bool:
+    """Evaluate a boto3 condition object (Attr/Key based) against an item"""
+    if isinstance(condition, str):
+        match = _ATTRIBUTE_FUNCTION.match(condition)
+        if not match:
+            raise NotImplementedError(f"Unsupported condition: {condition}")
+        exists = match.group(2) in item
+        return exists if match.group(1) == "attribute_exists" else not exists
+
+    expression = condition.get_expression()
+    operator = expression["operator"]
+    values = expression["values"]
+
+    if operator == "AND":
+        return evaluate(values[0], item) and evaluate(values[1], item)
+    if operator == "OR":
+        return evaluate(values[0], item) or evaluate(values[1], item)
+    if operator == "NOT":
+        return not evaluate(values[0], item)
+
+    name = values[0].name
+    if operator == "attribute_exists":
+        return name in item
+    if operator == "attribute_not_exists":
+        return name not in item
+    if name not in item:
+        return False
+
+    value = item[name]
+    if operator == "=":
+        return value == values[1]
+    if operator == "<>":
+        return value != values[1]
+    if operator == "<":
+        return value < values[1]
+    if operator == "<=":
+        return value <= values[1]
+    if operator == ">":
+        return value > values[1]
+    if operator == ">=":
+        return value >= values[1]
+    if operator == "BETWEEN":
+        return values[1] <= value <= values[2]
+    if operator == "begins_with":
+        return value.startswith(values[1])
+    if operator == "IN":
+        return value in values[1]
+    if operator == "contains":
+        return values[1] in value
+    raise NotImplementedError(f"Unsupported operator: {operator}")
+
+
+def parse_expression(expression: str, names: dict, values: dict):
+    """
+    Turn a low-level client filter expression ("#d BETWEEN :a AND :b AND
+    UserId = :u") into the condition object `evaluate` takes
+    """
+    deserializer = TypeDeserializer()
+    conditions = []
+    position = 0
+    for match in _CLAUSE.finditer(expression):
+        separator = expression[position : match.start()].strip()
+        if separator.upper() != ("AND" if conditions else ""):
+            raise NotImplementedError(f"Unsupported expression: {expression}")
+        position = match.end()
+        if match.group(1):
+            name, low, high = match.group(1, 2, 3)
+            attribute = Attr(names.get(name, name))
+            conditions.append(
+                attribute.between(
+                    deserializer.deserialize(values[low]),
+                    deserializer.deserialize(values[high]),
+                )
+            )
+        else:
+            name, operator, value = match.group(4, 5, 6)
+            attribute = Attr(names.get(name, name))
+            conditions.append(
+                getattr(attribute, _COMPARISONS[operator])(
+                    deserializer.deserialize(values[value])
+                )
+            )
+    if not conditions or expression[position:].strip():
+        raise NotImplementedError(f"Unsupported expression: {expression}")
+    return reduce(lambda left, right: left & right, conditions)
+
+
+def _copy(value):
+    # Items only hold scalars (str, Decimal, bool), a shallow copy isolates them
+    return dict(value) if isinstance(value, dict) else value
+
+
+def _check_types(item: dict):
+    for name, value in item.items():
+        if isinstance(value, float):
+            # Same restriction as boto3's TypeSerializer
+            raise TypeError(f"Float types are not supported. Use Decimal ({name})")
+
+
+class _BatchWriter:
+    def __init__(self, table):
+        self._table = table
+
+    def put_item(self, Item):
+        self._table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self._table.delete_item(Key=Key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeTable:
+    def __init__(self, name: str, hash_key: str, range_key: str = None, indexes=None):
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = dict(indexes or {})
+        self._items = {}
+        # (index name, hash value) -> {primary key: item}, sorted lazily on query
+        self._partitions = defaultdict(dict)
+        self._sorted = {}
+        self._lock = threading.RLock()
+
+    # -------------------------- helpers --------------------------
+
+    def _key(self, item: dict) -> tuple:
+        if self.range_key:
+            return item[self.hash_key], item[self.range_key]
+        return (item[self.hash_key],)
+
+    def _key_dict(self, item: dict) -> dict:
+        key = {self.hash_key: item[self.hash_key]}
+        if self.range_key:
+            key[self.range_key] = item[self.range_key]
+        return key
+
+    def _schemas(self):
+        yield None, (self.hash_key, self.range_key)
+        yield from self.indexes.items()
+
+    def _index(self, item: dict, remove: bool = False):
+        for index_name, (hash_key, _) in self._schemas():
+            if hash_key not in item:
+                continue
+            partition_key = (index_name, item[hash_key])
+            if remove:
+                self._partitions[partition_key].pop(self._key(item), None)
+            else:
+                self._partitions[partition_key][self._key(item)] = item
+            self._sorted.pop(partition_key, None)
+
+    def _sorted_partition(self, index_name, hash_value, range_key) -> list:
+        partition_key = (index_name, hash_value)
+        if partition_key not in self._sorted:
+            self._sorted[partition_key] = sorted(
+                self._partitions.get(partition_key, {}).values(),
+                key=lambda item: (
+                    (item.get(range_key, ""), self._key(item))
+                    if range_key
+                    else self._key(item)
+                ),
+            )
+        return self._sorted[partition_key]
+
+    def __len__(self):
+        return len(self._items)
+
+    def all_items(self) -> list:
+        with self._lock:
+            return [_copy(item) for item in self._items.values()]
+
+    # -------------------------- Table API --------------------------
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        _check_types(Item)
+        with self._lock:
+            key = self._key(Item)
+            existing = self._items.get(key)
+            if ConditionExpression is not None and not evaluate(
+                ConditionExpression, existing or {}
+            ):
+                raise conditional_check_failed("PutItem")
+            if existing is not None:
+                self._index(existing, remove=True)
+            stored = _copy(Item)
+            self._items[key] = stored
+            self._index(stored)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_item(self, Key, **kwargs):
+        with self._lock:
+            item = self._items.get(self._key(Key))
+            return {"Item": _copy(item)} if item is not None else {}
+
+    def delete_item(self, Key, ConditionExpression=None, **kwargs):
+        with self._lock:
+            key = self._key(Key)
+            existing = self._items.get(key)
+            if ConditionExpression is not None and not evaluate(
+                ConditionExpression, existing or {}
+            ):
+                raise conditional_check_failed("DeleteItem")
+            if existing is not None:
+                self._index(existing, remove=True)
+                del self._items[key]
+        return {}
+
+    def update_item(
+        self,
+        Key,
+        UpdateExpression,
+        ExpressionAttributeValues=None,
+        ExpressionAttributeNames=None,
+        ConditionExpression=None,
+        ReturnValues="NONE",
+        **kwargs,
+    ):
+        """Supports `SET a = :v, ...` and `ADD a :v, ...` clauses"""
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+        with self._lock:
+            existing = self._items.get(self._key(Key))
+            if ConditionExpression is not None and not evaluate(
+                ConditionExpression, existing or {}
+            ):
+                raise conditional_check_failed("UpdateItem")
+
+            item = _copy(existing) if existing else dict(Key)
+            for clause, body in re.findall(
+                r"(SET|ADD|REMOVE)\s+(.*?)(?=\s+(?:SET|ADD|REMOVE)\s+|$)",
+                UpdateExpression.strip(),
+            ):
+                for assignment in body.split(","):
+                    assignment = assignment.strip()
+                    if clause == "SET":
+                        name, value = (part.strip() for part in assignment.split("="))
+                        item[names.get(name, name)] = _copy(values[value])
+                    elif clause == "ADD":
+                        name, value = assignment.split()
+                        name = names.get(name, name)
+                        item[name] = item.get(name, Decimal("0")) + values[value]
+                    else:
+                        item.pop(names.get(assignment, assignment), None)
+
+            _check_types(item)
+            if existing is not None:
+                self._index(existing, remove=True)
+            self._items[self._key(item)] = item
+            self._index(item)
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": _copy(item)}
+        return {}
+
+    def scan(self, FilterExpression=None, ExclusiveStartKey=None, Limit=None, **kwargs):
+        with self._lock:
+            items = [
+                _copy(item)
+                for item in self._items.values()
+                if FilterExpression is None or evaluate(FilterExpression, item)
+            ]
+        return {"Items": items, "Count": len(items), "ScannedCount": len(self._items)}
+
+    def query(
+        self,
+        KeyConditionExpression,
+        IndexName=None,
+        Limit=None,
+        ExclusiveStartKey=None,
+        ScanIndexForward=True,
+        FilterExpression=None,
+        **kwargs,
+    ):
+        if IndexName is not None:
+            hash_key, range_key = self.indexes[IndexName]
+        else:
+            hash_key, range_key = self.hash_key, self.range_key
+
+        expression = KeyConditionExpression.get_expression()
+        if expression["operator"] == "AND":
+            hash_condition, range_condition = expression["values"]
+        else:
+            hash_condition, range_condition = KeyConditionExpression, None
+        hash_value = hash_condition.get_expression()["values"][1]
+
+        with self._lock:
+            partition = list(self._sorted_partition(IndexName, hash_value, range_key))
+
+        if not ScanIndexForward:
+            partition.reverse()
+        if ExclusiveStartKey:
+            sort_key = [
+                (
+                    (item.get(range_key, ""), self._key(item))
+                    if range_key
+                    else self._key(item)
+                )
+                for item in partition
+            ]
+            start = (
+                (ExclusiveStartKey.get(range_key, ""), self._key(ExclusiveStartKey))
+                if range_key
+                else self._key(ExclusiveStartKey)
+            )
+            if ScanIndexForward:
+                partition = partition[bisect_right(sort_key, start) :]
+            else:
+                partition = [
+                    item for item, key in zip(partition, sort_key) if key < start
+                ]
+
+        items = []
+        last_item = None
+        for item in partition:
+            if range_condition is not None and not evaluate(range_condition, item):
+                continue
+            last_item = item
+            if FilterExpression is None or evaluate(FilterExpression, item):
+                items.append(_copy(item))
+            if Limit and len(items) >= Limit:
+                break
+
+        response = {"Items": items, "Count": len(items)}
+        if Limit and len(items) >= Limit and last_item is not partition[-1]:
+            last_key = self._key_dict(last_item)
+            if IndexName is not None:
+                last_key[hash_key] = last_item[hash_key]
+                last_key[range_key] = last_item[range_key]
+            response["LastEvaluatedKey"] = last_key
+        return response
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return _BatchWriter(self)
+
+
+class FakeDynamoDBClient:
+    """Stand-in for the resource's low-level client, resource.meta.client"""
+
+    def __init__(self, resource: "FakeDynamoDB"):
+        self.resource = resource
+        self._serializer = TypeSerializer()
+        # Transactions run one at a time, plain writes are not held back
+        self._transactions = threading.Lock()
+
+    def scan(
+        self,
+        TableName,
+        FilterExpression=None,
+        ProjectionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        **kwargs,
+    ):
+        names = ExpressionAttributeNames or {}
+        condition = None
+        if FilterExpression is not None:
+            condition = parse_expression(
+                FilterExpression, names, ExpressionAttributeValues or {}
+            )
+        response = self.resource.Table(TableName).scan(FilterExpression=condition)
+        return self._serialize(response, ProjectionExpression, names)
+
+    def query(
+        self,
+        TableName,
+        KeyConditionExpression,
+        ProjectionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        ExclusiveStartKey=None,
+        **kwargs,
+    ):
+        names = ExpressionAttributeNames or {}
+        deserializer = TypeDeserializer()
+        condition = parse_expression(
+            KeyConditionExpression, names, ExpressionAttributeValues or {}
+        )
+        if ExclusiveStartKey is not None:
+            ExclusiveStartKey = {
+                name: deserializer.deserialize(value)
+                for name, value in ExclusiveStartKey.items()
+            }
+        response = self.resource.Table(TableName).query(
+            KeyConditionExpression=condition,
+            ExclusiveStartKey=ExclusiveStartKey,
+            **kwargs,
+        )
+        return self._serialize(response, ProjectionExpression, names)
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        """Update and Delete actions, applied only if every condition holds"""
+        deserializer = TypeDeserializer()
+
+        def plain(values) -> dict:
+            return {
+                name: deserializer.deserialize(value)
+                for name, value in (values or {}).items()
+            }
+
+        with self._transactions:
+            actions, reasons = [], []
+            for action in TransactItems:
+                [(kind, request)] = action.items()
+                table = self.resource.Table(request["TableName"])
+                key = plain(request["Key"])
+                condition = request.get("ConditionExpression")
+                for name, value in request.get("ExpressionAttributeNames", {}).items():
+                    condition = condition and condition.replace(name, value)
+                existing = table.get_item(Key=key).get("Item")
+                failed = condition is not None and not evaluate(
+                    condition, existing or {}
+                )
+                reasons.append({"Code": "ConditionalCheckFailed" if failed else "None"})
+                actions.append((kind, table, key, request))
+            if any(reason["Code"] != "None" for reason in reasons):
+                raise ClientError(
+                    {
+                        "Error": {
+                            "Code": "TransactionCanceledException",
+                            "Message": "Transaction cancelled",
+                        },
+                        "CancellationReasons": reasons,
+                    },
+                    "TransactWriteItems",
+                )
+            for kind, table, key, request in actions:
+                if kind == "Update":
+                    table.update_item(
+                        Key=key,
+                        UpdateExpression=request["UpdateExpression"],
+                        ExpressionAttributeNames=request.get(
+                            "ExpressionAttributeNames"
+                        ),
+                        ExpressionAttributeValues=plain(
+                            request.get("ExpressionAttributeValues")
+                        ),
+                    )
+                elif kind == "Delete":
+                    table.delete_item(Key=key)
+                else:
+                    raise NotImplementedError(f"Unsupported action: {kind}")
+        return {}
+
+    def _serialize(self, response, projection_expression, names) -> dict:
+        projection = None
+        if projection_expression is not None:
+            projection = [
+                names.get(name.strip(), name.strip())
+                for name in projection_expression.split(",")
+            ]
+        response["Items"] = [
+            {
+                name: self._serializer.serialize(value)
+                for name, value in item.items()
+                if projection is None or name in projection
+            }
+            for item in response["Items"]
+        ]
+        if "LastEvaluatedKey" in response:
+            response["LastEvaluatedKey"] = {
+                name: self._serializer.serialize(value)
+                for name, value in response["LastEvaluatedKey"].items()
+            }
+        return response
+
+
+class FakeDynamoDB:
+    """Stand-in for boto3.resource("dynamodb")"""
+
+    def __init__(self):
+        self.tables = {}
+        self.meta = SimpleNamespace(client=FakeDynamoDBClient(self))
+        self._lock = threading.Lock()
+
+    def Table(self, name: str) -> FakeTable:
+        with self._lock:
+            if name not in self.tables:
+                hash_key, range_key = TABLE_SCHEMAS.get(name, ("id", None))
+                self.tables[name] = FakeTable(
+                    name, hash_key, range_key, INDEX_SCHEMAS.get(name)
+                )
+            return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.Table(table_name)
+            responses[table_name] = [
+                response["Item"]
+                for response in (table.get_item(Key=key) for key in request["Keys"])
+                if "Item" in response
+            ]
+        return {"Responses": responses, "UnprocessedKeys": {}}
@@ -0,0 +1,108 @@
+"""
+Fault injection for the in-process stand-ins: slow or failing AWS calls, to
+exercise deadlines, hedging and circuit breakers (common/resilience.py).
+
+    faults = Faults()
+    faults.inject("tokens.scan", latency=0.5, times=1)   # the next tokens scan is slow
+    faults.inject("send_email", error="Throttling")      # every SES send fails
+    aws = LocalAWS(faults=faults)
+
+Operations are stand-in method names, optionally scoped by table name
+("tokens.get_item" before "get_item"). Table batch writers are not wrapped.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+
+
+@dataclass
+class Fault:
+    latency: float = 0.0
+    # ClientError code raised after the latency, None to answer normally
+    error: Optional[str] = None
+    status_code: int = 503
+    # Share of the calls affected
+    rate: float = 1.0
+    # Only the next `times` affected calls, None for all of them
+    times: Optional[int] = None
+
+
+class Faults:
+    def __init__(self, seed: int = 0):
+        self.calls = {}
+        self._faults = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def inject(self, operation: str, **fault):
+        with self._lock:
+            self._faults[operation] = Fault(**fault)
+
+    def clear(self, operation: str = None):
+        with self._lock:
+            if operation is None:
+                self._faults.clear()
+            else:
+                self._faults.pop(operation, None)
+
+    def _pick(self, operation: str, scope: str = None) -> Optional[Fault]:
+        with self._lock:
+            for name in (f"{scope}.{operation}" if scope else None, operation):
+                if name is not None:
+                    self.calls[name] = self.calls.get(name, 0) + 1
+            fault = self._faults.get(f"{scope}.{operation}") or self._faults.get(
+                operation
+            )
+            if fault is None or self._random.random() >= fault.rate:
+                return None
+            if fault.times is not None:
+                if fault.times <= 0:
+                    return None
+                fault.times -= 1
+            return fault
+
+    def apply(self, operation: str, scope: str = None):
+        """Sleep and/or raise as configured for the operation"""
+        fault = self._pick(operation, scope)
+        if fault is None:
+            return
+        if fault.latency:
+            time.sleep(fault.latency)
+        if fault.error:
+            raise ClientError(
+                {
+                    "Error": {"Code": fault.error, "Message": "Injected fault"},
+                    "ResponseMetadata": {"HTTPStatusCode": fault.status_code},
+                },
+                operation,
+            )
+
+
+class FaultyProxy:
+    """Wrap a stand-in so every method call goes through `faults` first"""
+
+    def __init__(self, target, faults: Faults, scope: str = None):
+        self._target = target
+        self._faults = faults
+        self._scope = scope
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+        if name == "Table":
+            return lambda table_name: FaultyProxy(
+                attribute(table_name), self._faults, table_name
+            )
+        if name == "batch_writer":
+            return attribute
+
+        def call(*args, **kwargs):
+            self._faults.apply(name, self._scope)
+            return attribute(*args, **kwargs)
+
+        return call
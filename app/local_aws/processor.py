@@ -0,0 +1,380 @@
+"""
+In-process stand-in for the Go file processor (core/process_file).
+
+`parse_statement` and `movement_id` follow main.go line for line, so ids
+written locally match the ones the Lambda writes for the same file. `FileProcessor` plays the S3 -> Lambda trigger: it
+listens for FakeS3 puts and processes each object on a worker thread, like
+asynchronous Lambda invocations, or, with a `batch_size`, consumes the S3
+notifications from the ingest queue in batches like the SQS event source
+mapping (queue.go).
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from urllib.parse import unquote_plus
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from routes.get_summary.rollups import build_rollups
+from storage.batch import parse_cents
+from .sqs import s3_notification
+
+logger = logging.getLogger()
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# bufio buffer size in parser.go, longer lines are skipped as invalid
+MAX_LINE_LENGTH = 64 * 1024
+
+
+def movement_id(source: str, user_id: str, line: int) -> str:
+    """
+    Id of the movement on `line`, identical to generateUniqueID in main.go:
+    128 bits of sha256 over the file's ETag (or "bucket/key"), the user id and
+    the line number, so the same row always gets the same id and different
+    rows never share one.
+    """
+    data = f"{source}\x00{user_id}\x00{line}"
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+def movement_source(file: str, etag: str) -> str:
+    """The file's ETag without quotes, or "bucket/key" without one (movementSource)"""
+    return etag.strip('"') or file
+
+
+def movement_partition(user_id: str, movement_id: str, shards: int) -> str:
+    """
+    UserId a movement is stored under, like shardPartition in shards.go: the
+    user id, or "UserId#n" with n the 32-bit FNV-1a of the id modulo `shards`
+    """
+    if shards <= 0:
+        return user_id
+    digest = 0x811C9DC5
+    for byte in movement_id.encode("utf-8"):
+        digest = ((digest ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return f"{user_id}#{digest % shards}"
+
+
+def parse_amount(text: str) -> float:
+    # strconv.ParseFloat does not accept digit separators, float() does
+    if "_" in text:
+        raise ValueError(f"invalid syntax: {text!r}")
+    return float(text)
+
+
+def statement_lines(body):
+    """
+    Yield the lines of a binary stream without their "\n", numbered like
+    content.split("\n") (lineReader in parser.go). Lines that do not fit in
+    MAX_LINE_LENGTH bytes are consumed and yielded as None.
+    """
+    while True:
+        line = body.readline(MAX_LINE_LENGTH)
+        if line.endswith(b"\n"):
+            yield line[:-1].decode("utf-8")
+        elif len(line) < MAX_LINE_LENGTH:
+            yield line.decode("utf-8")
+            return
+        else:
+            while line and not line.endswith(b"\n"):
+                line = body.readline(MAX_LINE_LENGTH)
+            yield None
+            if not line:
+                return
+
+
+def parse_statement(content, source: str = ""):
+    """
+    Yield (line number, movement or None, error or None) for every non-blank
+    line of a statement file, with the same validation as the Go processor.
+    `content` is the whole file or the lines from `statement_lines`, `source`
+    what movement ids are derived from (see `movement_source`).
+    """
+    lines = content.split("\n") if isinstance(content, str) else content
+    for line_number, line in enumerate(lines, start=1):
+        if line is None:
+            yield line_number, None, f"line longer than {MAX_LINE_LENGTH} bytes"
+            continue
+        line = line.strip()
+        if not line:
+            continue
+
+        parts = [part.strip() for part in line.split(",")]
+        if len(parts) != 3:
+            yield line_number, None, f"expected 3 parts, got {len(parts)}"
+            continue
+
+        user_id, date_text, amount_text = parts
+        try:
+            if not _DATE.match(date_text):
+                raise ValueError(f"cannot parse {date_text!r} as 2006-01-02")
+            day = date.fromisoformat(date_text)
+        except ValueError as e:
+            yield line_number, None, f"failed to parse date: {e}"
+            continue
+
+        try:
+            amount = parse_amount(amount_text)
+        except ValueError as e:
+            yield line_number, None, f"failed to parse amount: {e}"
+            continue
+
+        movement = {
+            "id": movement_id(source, user_id, line_number),
+            "UserId": user_id,
+            "Date": day.isoformat(),
+            "amount": Decimal(parse_cents(amount)).scaleb(-2),
+            "processed": "Ok",
+        }
+        yield line_number, movement, None
+
+
+@dataclass
+class FileResult:
+    bucket: str
+    key: str
+    lines: int = 0
+    saved: int = 0
+    duplicates: int = 0
+    errors: int = 0
+    rollup_buckets: int = 0
+    queued_at: float = 0.0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    error_lines: list = field(default_factory=list)
+
+
+class FileProcessor:
+    """
+    Processes statement files from FakeS3 into the movements and rollups of
+    the LocalAWS storage, on `workers` background threads.
+
+        processor = FileProcessor(aws, workers=4).start()
+        ...upload files...
+        processor.wait_for(bucket, key)
+        processor.stop()
+
+    With `batch_size`, puts are sent to `aws.ingest_queue_url` as S3
+    notifications and `workers` is the maximum concurrency: each worker
+    receives up to `batch_size` messages and handles them like one
+    invocation. Messages that fail stay in the queue, are received again
+    after the visibility timeout and end up in the dead letter queue.
+
+    With a `shard_threshold` (SHARD_THRESHOLD), a user with more rows than
+    that in one file is promoted to `shard_count` write shards and the rest
+    of its movements are spread over them, like batchWriter.partition.
+    """
+
+    def __init__(
+        self,
+        aws,
+        workers: int = 1,
+        batch_size: int = None,
+        shard_threshold: int = 0,
+        shard_count: int = 8,
+    ):
+        self.aws = aws
+        self.workers = workers
+        self.batch_size = batch_size
+        self.shard_threshold = shard_threshold
+        self.shard_count = shard_count
+        self.results = {}
+        self._queue = queue.Queue()
+        self._queued_at = {}
+        self._stopping = threading.Event()
+        self._threads = []
+        self._done = threading.Condition()
+
+    def start(self) -> "FileProcessor":
+        self.aws.s3.listeners.append(self.on_object_created)
+        self._stopping.clear()
+        target = self._run if self.batch_size is None else self._poll
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=target, name=f"file-processor-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        if self.on_object_created in self.aws.s3.listeners:
+            self.aws.s3.listeners.remove(self.on_object_created)
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def on_object_created(self, bucket: str, key: str):
+        queued_at = time.perf_counter()
+        if self.batch_size is None:
+            self._queue.put((bucket, key, queued_at))
+            return
+        self._queued_at[(bucket, key)] = queued_at
+        head = self.aws.s3.head_object(Bucket=bucket, Key=key)
+        self.aws.sqs.send_message(
+            QueueUrl=self.aws.ingest_queue_url,
+            MessageBody=s3_notification(
+                bucket, key, head["ContentLength"], head["ETag"]
+            ),
+        )
+
+    def wait_for(self, bucket: str, key: str, timeout: float = None) -> FileResult:
+        """Block until the object has been processed, returns its result"""
+        with self._done:
+            if not self._done.wait_for(lambda: (bucket, key) in self.results, timeout):
+                raise TimeoutError(f"{bucket}/{key} was not processed in time")
+            return self.results[(bucket, key)]
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            self._process_and_record(*task)
+
+    def _poll(self):
+        while not self._stopping.is_set():
+            response = self.aws.sqs.receive_message(
+                QueueUrl=self.aws.ingest_queue_url,
+                MaxNumberOfMessages=self.batch_size,
+                WaitTimeSeconds=0.05,
+            )
+            messages = response.get("Messages", [])
+            failed = self.handle_messages(messages)
+            for message in messages:
+                if message["MessageId"] not in failed:
+                    self.aws.sqs.delete_message(
+                        QueueUrl=self.aws.ingest_queue_url,
+                        ReceiptHandle=message["ReceiptHandle"],
+                    )
+
+    def handle_messages(self, messages: list) -> set:
+        """
+        Process the objects of a batch of S3 notifications one after the other
+        and return the ids of the messages to retry, like handleMessages.
+        """
+        failed = set()
+        for message in messages:
+            try:
+                records = json.loads(message["Body"]).get("Records", [])
+            except ValueError as e:
+                logger.error("❌ Invalid message %s: %s", message["MessageId"], e)
+                failed.add(message["MessageId"])
+                continue
+            # The s3:TestEvent has no Records and is dropped
+            for record in records:
+                bucket = record["s3"]["bucket"]["name"]
+                key = unquote_plus(record["s3"]["object"]["key"])
+                queued_at = self._queued_at.get((bucket, key), 0.0)
+                if not self._process_and_record(bucket, key, queued_at):
+                    failed.add(message["MessageId"])
+        return failed
+
+    def _process_and_record(self, bucket: str, key: str, queued_at: float) -> bool:
+        ok = True
+        try:
+            result = self.process(bucket, key)
+        except Exception as e:
+            logger.error("💥 Error processing %s/%s: %s", bucket, key, e)
+            result = FileResult(bucket, key, errors=1)
+            ok = False
+        result.queued_at = queued_at
+        with self._done:
+            self.results[(bucket, key)] = result
+            self._done.notify_all()
+        return ok
+
+    def process(self, bucket: str, key: str) -> FileResult:
+        """
+        Process one object synchronously, like one Lambda invocation. An
+        object already completed with the same ETag is skipped, movements that
+        are already stored are not inserted nor rolled up again, and the final
+        state is saved to the file_ingestions table like processObject does.
+        """
+        result = FileResult(bucket, key, started_at=time.perf_counter())
+        file = f"{bucket}/{key}"
+        response = self.aws.s3.get_object(Bucket=bucket, Key=key)
+        body = response["Body"]
+        state = self.aws.storage.get_ingestion(file)
+        if (
+            state is not None
+            and state["status"] == "completed"
+            and state["etag"] == response["ETag"]
+        ):
+            result.lines = int(state["line"])
+            result.finished_at = time.perf_counter()
+            return result
+
+        def counted(lines):
+            for line in lines:
+                result.lines += 1
+                yield line
+
+        saved = []
+        for line_number, movement, error in parse_statement(
+            counted(statement_lines(body)), movement_source(file, response["ETag"])
+        ):
+            if error is not None:
+                result.errors += 1
+                result.error_lines.append(line_number)
+                continue
+            saved.append(movement)
+        parsed = len(saved)
+        if self.shard_threshold:
+            inserted = self.aws.storage.insert_movements(self._partition(saved))
+            inserted_ids = {movement["id"] for movement in inserted}
+            saved = [movement for movement in saved if movement["id"] in inserted_ids]
+        else:
+            saved = self.aws.storage.insert_movements(saved)
+        result.saved = len(saved)
+        result.duplicates = parsed - len(saved)
+
+        # Rollups are applied once per file, grouped by user
+        rollups = build_rollups(saved)
+        by_user = {}
+        for (user_id, bucket), rollup in rollups.items():
+            by_user.setdefault(user_id, {})[bucket] = rollup
+        for user_id, user_rollups in by_user.items():
+            self.aws.storage.add_to_rollups(user_id, user_rollups)
+        result.rollup_buckets = len(rollups)
+        self.aws.storage.save_ingestion(
+            {
+                "file": file,
+                "status": "completed",
+                "etag": response["ETag"],
+                "offset": response["ContentLength"],
+                "line": result.lines,
+                "written": result.saved,
+                "errors": result.errors,
+                "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        )
+        result.finished_at = time.perf_counter()
+        return result
+
+    def _partition(self, movements: list) -> list:
+        """Copies of the movements with the UserId they are written under"""
+        shards, rows, stored = {}, Counter(), []
+        for movement in movements:
+            user_id = movement["UserId"]
+            if user_id not in shards:
+                shards[user_id] = self.aws.storage.get_shard_count(user_id)
+            if not shards[user_id]:
+                rows[user_id] += 1
+                if rows[user_id] == self.shard_threshold + 1:
+                    shards[user_id] = self.aws.storage.set_shard_count(
+                        user_id, self.shard_count
+                    )
+            partition = movement_partition(user_id, movement["id"], shards[user_id])
+            stored.append({**movement, "UserId": partition})
+        return stored
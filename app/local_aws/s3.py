@@ -0,0 +1,75 @@
+"""In-process S3 and SES stand-ins (boto3 client API subset)"""
+
+import io
+import threading
+import uuid
+import hashlib
+
+
+class FakeBody(io.BytesIO):
+    """StreamingBody look-alike returned by get_object"""
+
+    def iter_lines(self, chunk_size: int = 1024, keepends: bool = False):
+        for line in self.read().splitlines(keepends):
+            yield line
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        # Callables invoked as listener(bucket, key) after every put, like an
+        # S3 event notification
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        body = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        with self._lock:
+            self.objects[(Bucket, Key)] = (body, etag)
+        for listener in list(self.listeners):
+            listener(Bucket, Key)
+        return {"ETag": etag, "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        with self._lock:
+            body, etag = self.objects[(Bucket, Key)]
+        if Range:
+            first, _, last = Range.replace("bytes=", "").partition("-")
+            body = body[int(first) : int(last) + 1 if last else None]
+        return {"Body": FakeBody(body), "ContentLength": len(body), "ETag": etag}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            body, etag = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(body), "ETag": etag}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        """Every matching key in one page, sorted like S3"""
+        with self._lock:
+            contents = [
+                {"Key": key, "ETag": etag, "Size": len(body)}
+                for (bucket, key), (body, etag) in sorted(self.objects.items())
+                if bucket == Bucket and key.startswith(Prefix)
+            ]
+        response = {"KeyCount": len(contents), "IsTruncated": False}
+        if contents:
+            response["Contents"] = contents
+        return response
+
+
+class FakeSES:
+    def __init__(self):
+        self.sent = 0
+        self.last_message = None
+        self._lock = threading.Lock()
+
+    def send_email(self, Source, Destination, Message, **kwargs):
+        with self._lock:
+            self.sent += 1
+            self.last_message = {
+                "Source": Source,
+                "Destination": Destination,
+                "Message": Message,
+            }
+        return {"MessageId": str(uuid.uuid4())}
@@ -0,0 +1,195 @@
+"""
+In-process SQS stand-in (boto3 client API subset) for the file ingest queue.
+
+Standard queues with visibility timeouts, long polling and a RedrivePolicy:
+a message received more than maxReceiveCount times is moved to the dead
+letter queue instead of being delivered again. Timeouts are in seconds and,
+unlike SQS, may be fractions so tests do not have to wait.
+"""
+
+from urllib.parse import quote_plus
+import itertools
+import json
+import threading
+import time
+import uuid
+
+ACCOUNT_ID = "000000000000"
+REGION = "us-east-1"
+
+
+def s3_notification(bucket: str, key: str, size: int, etag: str) -> str:
+    """Body of the message S3 sends to a queue for an ObjectCreated:Put event"""
+    return json.dumps(
+        {
+            "Records": [
+                {
+                    "eventSource": "aws:s3",
+                    "eventName": "ObjectCreated:Put",
+                    "s3": {
+                        "bucket": {"name": bucket},
+                        # Keys are URL encoded, with "+" for spaces
+                        "object": {
+                            "key": quote_plus(key, safe="/"),
+                            "size": size,
+                            "eTag": etag.strip('"'),
+                        },
+                    },
+                }
+            ]
+        }
+    )
+
+
+class _Queue:
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.url = f"https://sqs.{REGION}.amazonaws.com/{ACCOUNT_ID}/{name}"
+        self.arn = f"arn:aws:sqs:{REGION}:{ACCOUNT_ID}:{name}"
+        self.visibility_timeout = float(attributes.get("VisibilityTimeout", 30))
+        redrive = json.loads(attributes.get("RedrivePolicy", "{}"))
+        self.dead_letter_arn = redrive.get("deadLetterTargetArn")
+        self.max_receive_count = int(redrive.get("maxReceiveCount", 0))
+        # Insertion ordered: message id -> message
+        self.messages = {}
+
+
+class FakeSQS:
+    def __init__(self):
+        self._queues = {}
+        self._receipts = itertools.count(1)
+        self._changed = threading.Condition()
+
+    def create_queue(self, QueueName, Attributes=None, **kwargs):
+        with self._changed:
+            queue = _Queue(QueueName, Attributes or {})
+            self._queues.setdefault(queue.url, queue)
+            return {"QueueUrl": queue.url}
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None, **kwargs):
+        now = time.monotonic()
+        with self._changed:
+            queue = self._queue(QueueUrl)
+            visible = sum(m["visible_at"] <= now for m in queue.messages.values())
+            return {
+                "Attributes": {
+                    "QueueArn": queue.arn,
+                    "ApproximateNumberOfMessages": str(visible),
+                    "ApproximateNumberOfMessagesNotVisible": str(
+                        len(queue.messages) - visible
+                    ),
+                }
+            }
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        message_id = str(uuid.uuid4())
+        with self._changed:
+            self._queue(QueueUrl).messages[message_id] = {
+                "id": message_id,
+                "body": MessageBody,
+                "visible_at": 0.0,
+                "receive_count": 0,
+                "receipt": None,
+                "sent_at": time.time(),
+            }
+            self._changed.notify_all()
+        return {"MessageId": message_id}
+
+    def receive_message(
+        self,
+        QueueUrl,
+        MaxNumberOfMessages=1,
+        WaitTimeSeconds=0,
+        VisibilityTimeout=None,
+        **kwargs,
+    ):
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self._changed:
+            queue = self._queue(QueueUrl)
+            timeout = (
+                queue.visibility_timeout
+                if VisibilityTimeout is None
+                else float(VisibilityTimeout)
+            )
+            while True:
+                messages = self._take(queue, MaxNumberOfMessages, timeout)
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0:
+                    break
+                # Wake up for new messages or when the next one becomes visible
+                now = time.monotonic()
+                hidden = [
+                    m["visible_at"]
+                    for m in queue.messages.values()
+                    if m["visible_at"] > now
+                ]
+                wake = min(hidden, default=deadline) - now
+                self._changed.wait(max(0.001, min(remaining, wake)))
+        if not messages:
+            return {}
+        return {"Messages": messages}
+
+    def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+        with self._changed:
+            queue = self._queue(QueueUrl)
+            for message_id, message in list(queue.messages.items()):
+                if message["receipt"] == ReceiptHandle:
+                    del queue.messages[message_id]
+        return {}
+
+    def change_message_visibility(
+        self, QueueUrl, ReceiptHandle, VisibilityTimeout, **kwargs
+    ):
+        with self._changed:
+            for message in self._queue(QueueUrl).messages.values():
+                if message["receipt"] == ReceiptHandle:
+                    message["visible_at"] = time.monotonic() + float(VisibilityTimeout)
+            self._changed.notify_all()
+        return {}
+
+    def _queue(self, url: str) -> _Queue:
+        try:
+            return self._queues[url]
+        except KeyError:
+            raise KeyError(f"AWS.SimpleQueueService.NonExistentQueue: {url}")
+
+    def _take(self, queue: _Queue, limit: int, timeout: float) -> list:
+        now = time.monotonic()
+        taken = []
+        for message_id, message in list(queue.messages.items()):
+            if len(taken) == limit:
+                break
+            if message["visible_at"] > now:
+                continue
+            if queue.max_receive_count and (
+                message["receive_count"] >= queue.max_receive_count
+            ):
+                # Redrive: received too many times without being deleted
+                del queue.messages[message_id]
+                dead_letters = self._by_arn(queue.dead_letter_arn)
+                if dead_letters is not None:
+                    message.update(visible_at=0.0, receive_count=0, receipt=None)
+                    dead_letters.messages[message_id] = message
+                    self._changed.notify_all()
+                continue
+            message["receive_count"] += 1
+            message["visible_at"] = now + timeout
+            message["receipt"] = f"{message_id}#{next(self._receipts)}"
+            taken.append(
+                {
+                    "MessageId": message_id,
+                    "ReceiptHandle": message["receipt"],
+                    "Body": message["body"],
+                    "Attributes": {
+                        "ApproximateReceiveCount": str(message["receive_count"]),
+                        "SentTimestamp": str(int(message["sent_at"] * 1000)),
+                    },
+                }
+            )
+        return taken
+
+    def _by_arn(self, arn: str):
+        for queue in self._queues.values():
+            if queue.arn == arn:
+                return queue
+        return None
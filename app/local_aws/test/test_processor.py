@@ -0,0 +1,164 @@
+import io
+import pytest
+from decimal import Decimal
+from local_aws import FileProcessor, LocalAWS
+from local_aws.processor import (
+    MAX_LINE_LENGTH,
+    movement_id,
+    movement_partition,
+    movement_source,
+    parse_statement,
+    statement_lines,
+)
+
+# -------------------------- Unit Tests --------------------------
+
+
+@pytest.mark.parametrize(
+    "user_id, line, expected",
+    [
+        # Produced by generateUniqueID in core/process_file/main.go
+        ("user-1", 7, "3951aa04651add6e53869afda0f263af"),
+        ("user-10", 1, "102d3a5dbed8e5285c5ecc9ce0ee2401"),
+        ("", 123456, "25d84a1a816bda6b696ffcf39c588302"),
+    ],
+)
+def test_movement_id_matches_go(user_id, line, expected):
+    assert movement_id("5d41402abc4b2a76b9719d911017c592", user_id, line) == expected
+
+
+def test_movement_source():
+    assert movement_source("b/a.csv", '"5d41402abc4b2a76b9719d911017c592"') == (
+        "5d41402abc4b2a76b9719d911017c592"
+    )
+    assert movement_source("b/a.csv", "") == "b/a.csv"
+
+
+def test_movement_partition_matches_go():
+    # Produced by shardPartition in core/process_file/shards.go
+    movement = "3951aa04651add6e53869afda0f263af"
+    assert movement_partition("user-1", movement, 8) == "user-1#4"
+    assert movement_partition("user-1", movement, 0) == "user-1"
+
+
+def test_parse_statement_validates_like_go():
+    content = (
+        "user1,2024-01-10,100.50\n"
+        "\n"
+        "user1,2024-01-10\n"
+        "user1,2024-1-10,5\n"
+        "user1,2024-01-10,1_000\n"
+        " user1 , 2024-01-11 , -5 \n"
+    )
+    rows = list(parse_statement(content))
+
+    assert [(line, error is None) for line, _, error in rows] == [
+        (1, True),
+        (3, False),
+        (4, False),
+        (5, False),
+        (6, True),
+    ]
+    assert rows[-1][1]["UserId"] == "user1"
+    assert rows[-1][1]["amount"] == Decimal("-5.00")
+
+
+@pytest.mark.parametrize("content", ["", "a,b,c", "a,b,c\n", "a,b,c\r\n\nd,e,f\n  \n"])
+def test_statement_lines_numbered_like_split(content):
+    lines = statement_lines(io.BytesIO(content.encode()))
+    assert list(lines) == content.split("\n")
+
+
+def test_statement_lines_skips_long_lines():
+    first, last = "user1,2024-01-10,1", "user1,2024-01-11,2"
+    content = f"{first}\n{'x' * MAX_LINE_LENGTH * 2}\n{last}"
+    lines = list(statement_lines(io.BytesIO(content.encode())))
+
+    assert lines == [first, None, last]
+    assert [line for line, _, error in parse_statement(lines) if error] == [2]
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_processor_ingests_uploaded_objects():
+    aws = LocalAWS()
+    processor = FileProcessor(aws, workers=2).start()
+    try:
+        aws.s3.put_object(
+            Bucket="bucket",
+            Key="statement.csv",
+            Body="user1,2024-01-10,100.50\nuser1,2024-01-20,-50.25\nbad line\n",
+        )
+        result = processor.wait_for("bucket", "statement.csv", timeout=5)
+    finally:
+        processor.stop()
+
+    assert (result.saved, result.errors, result.error_lines) == (2, 1, [3])
+    assert len(aws.dynamodb.Table("movements")) == 2
+    month = aws.dynamodb.Table("movement_rollups").get_item(
+        Key={"UserId": "user1", "Bucket": "2024-01"}
+    )["Item"]
+    assert month["tx_count"] == 2
+    assert month["balance"] == Decimal("50.25")
+
+    state = aws.storage.get_ingestion("bucket/statement.csv")
+    assert (state["status"], state["line"], state["written"], state["errors"]) == (
+        "completed",
+        4,
+        2,
+        1,
+    )
+    # The same object delivered again is not counted twice
+    processor.process("bucket", "statement.csv")
+    month = aws.dynamodb.Table("movement_rollups").get_item(
+        Key={"UserId": "user1", "Bucket": "2024-01"}
+    )["Item"]
+    assert month["tx_count"] == 2
+
+    # The same content under another key is a new file with the same ids
+    aws.s3.put_object(
+        Bucket="bucket",
+        Key="copy.csv",
+        Body="user1,2024-01-10,100.50\nuser1,2024-01-20,-50.25\nbad line\n",
+    )
+    copy = processor.process("bucket", "copy.csv")
+    assert (copy.saved, copy.duplicates) == (0, 2)
+    assert len(aws.dynamodb.Table("movements")) == 2
+    month = aws.dynamodb.Table("movement_rollups").get_item(
+        Key={"UserId": "user1", "Bucket": "2024-01"}
+    )["Item"]
+    assert month["tx_count"] == 2
+
+
+def test_processor_shards_heavy_users():
+    aws = LocalAWS()
+    aws.storage.sharding = True
+    processor = FileProcessor(aws, shard_threshold=10, shard_count=4)
+    rows = [f"heavy,2024-01-{day % 28 + 1:02d},1.00" for day in range(50)]
+    aws.s3.put_object(
+        Bucket="bucket", Key="heavy.csv", Body="\n".join(rows + ["light,2024-01-10,5"])
+    )
+
+    result = processor.process("bucket", "heavy.csv")
+
+    assert result.saved == 51
+    assert aws.storage.get_shard_count("heavy") == 4
+    assert aws.storage.get_shard_count("light") == 0
+    partitions = {
+        item["UserId"] for item in aws.dynamodb.Table("movements").all_items()
+    }
+    assert partitions == {"heavy", "heavy#0", "heavy#1", "heavy#2", "heavy#3", "light"}
+    movements = aws.storage.get_movements("heavy", "2024-01-01", "2024-01-31")
+    assert len(movements) == 50
+    assert {movement["UserId"] for movement in movements} == {"heavy"}
+    month = aws.storage.get_rollups("heavy", ["2024-01"])["2024-01"]
+    assert month["tx_count"] == 50
+
+    # The same rows again are duplicates whatever partition they would go to
+    aws.s3.put_object(
+        Bucket="bucket", Key="copy.csv", Body="\n".join(rows + ["light,2024-01-10,5"])
+    )
+    copy = processor.process("bucket", "copy.csv")
+    assert (copy.saved, copy.duplicates) == (0, 51)
+    assert len(aws.storage.get_movements("heavy", "2024-01-01", "2024-01-31")) == 50
@@ -0,0 +1,103 @@
+import json
+from local_aws import FakeSQS, FileProcessor, LocalAWS
+from local_aws.sqs import s3_notification
+
+# -------------------------- Unit Tests --------------------------
+
+
+def make_queues(max_receive_count=2, visibility_timeout=0.05):
+    sqs = FakeSQS()
+    dead_letters = sqs.create_queue(QueueName="dlq")["QueueUrl"]
+    arn = sqs.get_queue_attributes(QueueUrl=dead_letters)["Attributes"]["QueueArn"]
+    url = sqs.create_queue(
+        QueueName="ingest",
+        Attributes={
+            "VisibilityTimeout": str(visibility_timeout),
+            "RedrivePolicy": json.dumps(
+                {"deadLetterTargetArn": arn, "maxReceiveCount": max_receive_count}
+            ),
+        },
+    )["QueueUrl"]
+    return sqs, url, dead_letters
+
+
+def test_received_messages_are_hidden_until_deleted_or_timed_out():
+    sqs, url, _ = make_queues()
+    for index in range(3):
+        sqs.send_message(QueueUrl=url, MessageBody=str(index))
+
+    batch = sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=2)["Messages"]
+    assert [m["Body"] for m in batch] == ["0", "1"]
+    assert (
+        sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=10)["Messages"][0]["Body"]
+        == "2"
+    )
+    assert sqs.receive_message(QueueUrl=url) == {}
+
+    sqs.delete_message(QueueUrl=url, ReceiptHandle=batch[0]["ReceiptHandle"])
+    # Long polling waits for "1" to become visible again
+    again = sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=10, WaitTimeSeconds=1)
+    assert sorted(m["Body"] for m in again["Messages"]) == ["1", "2"]
+    assert again["Messages"][0]["Attributes"]["ApproximateReceiveCount"] == "2"
+
+
+def test_messages_are_redriven_after_max_receive_count():
+    sqs, url, dead_letters = make_queues(max_receive_count=2)
+    sqs.send_message(QueueUrl=url, MessageBody="poison")
+
+    for _ in range(2):
+        assert sqs.receive_message(QueueUrl=url, WaitTimeSeconds=1)["Messages"]
+    assert sqs.receive_message(QueueUrl=url, WaitTimeSeconds=0.2) == {}
+
+    moved = sqs.receive_message(QueueUrl=dead_letters)["Messages"]
+    assert [m["Body"] for m in moved] == ["poison"]
+
+
+def test_s3_notification_encodes_keys():
+    body = json.loads(s3_notification("bucket", "folder/my file.csv", 10, '"abc"'))
+
+    assert body["Records"][0]["s3"]["object"] == {
+        "key": "folder/my+file.csv",
+        "size": 10,
+        "eTag": "abc",
+    }
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_processor_consumes_the_ingest_queue_in_batches():
+    aws = LocalAWS(max_receive_count=2, visibility_timeout=0.05)
+    processor = FileProcessor(aws, workers=2, batch_size=5).start()
+    try:
+        for index in range(6):
+            aws.s3.put_object(
+                Bucket="bucket",
+                Key=f"folder/statement {index}.csv",
+                Body=f"user{index},2024-01-10,1.50\nuser{index},2024-01-11,2\n",
+            )
+        results = [
+            processor.wait_for("bucket", f"folder/statement {index}.csv", timeout=5)
+            for index in range(6)
+        ]
+        # A notification for an object that does not exist is retried and
+        # then moved to the dead letter queue
+        aws.sqs.send_message(
+            QueueUrl=aws.ingest_queue_url,
+            MessageBody=s3_notification("bucket", "missing.csv", 0, ""),
+        )
+        moved = aws.sqs.receive_message(
+            QueueUrl=aws.dead_letter_queue_url, WaitTimeSeconds=5
+        )
+    finally:
+        processor.stop()
+
+    assert [result.saved for result in results] == [2] * 6
+    assert len(aws.storage.get_movements("user0", "2024-01-01", "2024-01-31")) == 2
+    assert "missing.csv" in moved["Messages"][0]["Body"]
+    assert (
+        aws.sqs.get_queue_attributes(QueueUrl=aws.ingest_queue_url)["Attributes"][
+            "ApproximateNumberOfMessages"
+        ]
+        == "0"
+    )
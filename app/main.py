@@ -1,23 +1,81 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from mangum import Mangum
+import anyio.to_thread
 import logging
+from common.admission import AdmissionMiddleware
+from common.compression import CompressionMiddleware
+from common.config import Settings, get_settings
+from common.log import configure_logging, flush_logging, shutdown_logging
+from common.metrics import MetricsMiddleware
+from common.profiling import ProfilingMiddleware, create_sink
+from common.responses import FastJSONResponse
 from routes.auth import health_check, login, register
 from routes.upload_file import upload_file
 from routes.get_summary import get_summary
+from routes.transactions import transactions
+from storage import get_storage
 
-# Configurar el logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
+def build_lifespan(settings: Settings):
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Idempotent: Mangum runs startup and shutdown on every Lambda
+        # invocation, the server runs them once per worker process
+        configure_logging(logging.getLevelName(settings.log_level.upper()))
+        storage = get_storage()
+        # Sync endpoints run in this thread pool (FastAPI's default is 40)
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = settings.server_threads
+        yield {"settings": settings, "storage": storage}
+        if settings.on_lambda:
+            # Lambda freezes the process after returning, write queued logs
+            # but keep the listener and the clients for the next invocation
+            flush_logging()
+        else:
+            # The storage stays open, route modules keep the process-wide
+            # instance they got at import for the life of the process
+            shutdown_logging()
 
-def init_lambda():
-    app = FastAPI()
+    return lifespan
+
+
+def create_app(settings: Settings = None) -> FastAPI:
+    """The API, shared by the Lambda handler and the server (server.py)"""
+    settings = settings or get_settings()
+    app = FastAPI(
+        lifespan=build_lifespan(settings), default_response_class=FastJSONResponse
+    )
+    # Innermost, frees the DynamoDB slots of streaming responses
+    app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=settings.compression_minimum_size
+    )
+    if ProfilingMiddleware.enabled(settings):
+        # Not even installed when off, requests skip it entirely
+        app.add_middleware(
+            ProfilingMiddleware,
+            sink=create_sink(settings.profile_sink),
+            routes=[route.strip() for route in settings.profile_routes.split(",")],
+            token=settings.profile_token,
+            sample_rate=settings.profile_sample_rate,
+            interval=settings.profile_interval,
+        )
+    # Added last so it runs first and the latency includes compression
+    app.add_middleware(MetricsMiddleware)
     app.include_router(login.router)
     app.include_router(register.router)
     app.include_router(health_check.router)
     app.include_router(upload_file.router)
     app.include_router(get_summary.router)
+    app.include_router(transactions.router)
     return app
 
 
-handler = Mangum(init_lambda())
+def init_lambda():
+    return create_app()
+
+
+# Mangum logs every lifespan step of every invocation at INFO
+logging.getLogger("mangum.lifespan").setLevel(logging.WARNING)
+handler = Mangum(init_lambda(), lifespan="auto")
@@ -1,23 +1,20 @@
 import uuid
-import boto3
 from datetime import datetime
 
 from .models import UserCreate, User, LoginRequest
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Attr
 from passlib.apps import custom_app_context as pwd_context
+from storage import AlreadyExists, get_storage
 
-# Configure dynamodb
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-table = dynamodb.Table("users")
-token_table = dynamodb.Table("tokens")
+# Configure storage (DynamoDB unless STORAGE_BACKEND says otherwise)
+storage = get_storage()
 import logging
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-async def create_user(user: UserCreate):
+def create_user(user: UserCreate):
     logger.info("🔐 Starting user creation process...")
     try:
         logger.info("💾 Attempting to save new user to database...")
@@ -31,74 +28,70 @@ async def create_user(user: UserCreate):
             "updated_at": timestamp,
         }
 
-        table.put_item(
-            Item=user_dict, ConditionExpression="attribute_not_exists(email)"
-        )
-        logger.info(f"✅ User successfully created with email: {user.email}")
+        storage.create_user(user_dict)
+        logger.info("✅ User successfully created with email: %s", user.email)
         return user_dict
 
+    except AlreadyExists:
+        logger.warning("⚠️ Registration failed: Email %s already exists", user.email)
+        raise ValueError("Email already exists")
     except ClientError as e:
-        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            logger.warning(f"⚠️ Registration failed: Email {user.email} already exists")
-            raise ValueError("Email already exists")
-        logger.error(f"❌ Database error during user creation: {str(e)}")
+        logger.error("❌ Database error during user creation: %s", e)
         raise
 
 
 def get_user_by_email(email: str):
     try:
-        logger.info(f"🔍 Searching for user with email: {email}")
-        # Use a scan because the index have cost. (not for production)
-        response = table.scan(FilterExpression=Attr("email").eq(email))
-        logger.debug(f"📊 Database response: {response}")
-
-        if response["Items"]:
-            logger.info(f"✅ User found: {email}")
-            return response["Items"][0]
+        logger.info("🔍 Searching for user with email: %s", email)
+        user = storage.get_user_by_email(email)
+
+        if user:
+            logger.info("✅ User found: %s", email)
+            return user
         else:
-            logger.warning(f"⚠️ No user found with email: {email}")
+            logger.warning("⚠️ No user found with email: %s", email)
             return None
 
     except ClientError as e:
-        logger.error(f"❌ Database error while fetching user: {str(e)}")
+        logger.error("❌ Database error while fetching user: %s", e)
         raise
 
 
 def verify_user(login_request: LoginRequest):
-    logger.info(f"🔐 Attempting to verify user: {login_request.email}")
+    logger.info("🔐 Attempting to verify user: %s", login_request.email)
     user = get_user_by_email(login_request.email)
 
     if not user:
         logger.warning(
-            f"⚠️ Authentication failed: User not found - {login_request.email}"
+            "⚠️ Authentication failed: User not found - %s", login_request.email
         )
         return None
 
     logger.debug("🔑 Verifying password hash...")
     if pwd_context.verify(login_request.password, user["password"]):
-        logger.info(f"✅ User successfully authenticated: {login_request.email}")
+        logger.info("✅ User successfully authenticated: %s", login_request.email)
         return user
 
     logger.warning(
-        f"⚠️ Authentication failed: Invalid password for user {login_request.email}"
+        "⚠️ Authentication failed: Invalid password for user %s", login_request.email
     )
     return None
 
 
 def save_token(email: str, token: str, expiration: datetime):
     try:
-        logger.info(f"🎟️ Saving authentication token for user: {email}")
-        token_table.put_item(
-            Item={
+        logger.info("🎟️ Saving authentication token for user: %s", email)
+        storage.save_token(
+            {
                 "email": email,
                 "token": token,
                 "expiration": expiration.isoformat(),
                 "created_at": datetime.utcnow().isoformat(),
             }
         )
-        logger.info(f"✅ Token successfully saved for user: {email}")
-        logger.debug(f"📅 Token expiration set to: {expiration.isoformat()}")
+        logger.info("✅ Token successfully saved for user: %s", email)
+        logger.debug("📅 Token expiration set to: %s", expiration.isoformat())
 
     except Exception as e:
-        logger.error(f"❌ Failed to save authentication token: {str(e)}")
+        logger.error("❌ Failed to save authentication token: %s", e)
         raise
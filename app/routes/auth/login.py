@@ -6,6 +6,7 @@ from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from .dynamo import verify_user, save_token
+from common.admission import admitted
 import logging
 
 logger = logging.getLogger()
@@ -26,7 +27,7 @@ def create_access_token(data: dict):
     logger.info("🔑 Starting access token creation...")
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    logger.info(f"⏰ Token expiration set to: {expire}")
+    logger.info("⏰ Token expiration set to: %s", expire)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     logger.info("✅ Token created successfully")
@@ -34,7 +35,8 @@ def create_access_token(data: dict):
 
 
 @router.post("/login", tags=["Users"])
-async def login(login_request: LoginRequest):
+@admitted("login", lambda args: args["login_request"].email)
+def login(login_request: LoginRequest):
     logger.info("🚀 Initiating login process...")
     try:
         logger.info("🔍 Verifying user credentials...")
@@ -53,8 +55,8 @@ async def login(login_request: LoginRequest):
         return {"access_token": str(access_token), "token_type": "bearer"}
 
     except HTTPException as http_ex:
-        logger.error(f"🚫 Login failed: {http_ex.detail}")
+        logger.error("🚫 Login failed: %s", http_ex.detail)
         raise http_ex  # Re-raise HTTP exceptions
     except Exception as e:
-        logger.error(f"💥 Login process failed: {str(e)}")
+        logger.error("💥 Login process failed: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -3,6 +3,7 @@ from .models import UserCreate
 from passlib.apps import custom_app_context as pwd_context
 from fastapi.responses import JSONResponse
 from .dynamo import create_user, get_user_by_email
+from common.admission import admitted
 import logging
 
 logger = logging.getLogger()
@@ -12,14 +13,15 @@ router = APIRouter()
 
 # -------------------------- REGISTER  --------------------------
 @router.post("/register", tags=["Users"])
-async def register(user: UserCreate):
+@admitted("register", lambda args: args["user"].email)
+def register(user: UserCreate):
     logger.info("🚀 Starting new user registration process...")
     try:
-        logger.info(f"🔍 Checking if user exists: {user.email}")
+        logger.info("🔍 Checking if user exists: %s", user.email)
         existing_user = get_user_by_email(user.email)
 
         if existing_user:
-            logger.warning(f"❌ User already exists: {user.email}")
+            logger.warning("❌ User already exists: %s", user.email)
             return {"message": "User already exist"}
 
         logger.info("🔐 Hashing password...")
@@ -27,7 +29,7 @@ async def register(user: UserCreate):
 
         logger.info("💾 Saving user to database...")
         user.password = hashed_password
-        user_dict = await create_user(user)
+        user_dict = create_user(user)
 
         logger.info("✅ User registration successful")
         return {
@@ -38,12 +40,12 @@ async def register(user: UserCreate):
         }
 
     except HTTPException as http_ex:
-        logger.error(f"🚫 HTTP Exception: {http_ex.detail}")
+        logger.error("🚫 HTTP Exception: %s", http_ex.detail)
         return JSONResponse(
             status_code=http_ex.status_code, content={"detail": http_ex.detail}
         )
     except Exception as e:
-        logger.error(f"💥 Unexpected error: {str(e)}")
+        logger.error("💥 Unexpected error: %s", e)
         return JSONResponse(
             status_code=500, content={"detail": "An unexpected error occurred"}
         )
@@ -1,42 +1,69 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import Literal, Optional
 import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import boto3.dynamodb.conditions as conditions
 import logging
+from common.admission import admitted
+from common.config import get_settings
+from common.idempotency import IdempotentRequest, InvalidIdempotencyKey
+from common.log import HotPathLogger
+from common.responses import FastJSONResponse
+from common.metrics import instrument_client
+from common.resilience import DependencyUnavailable, get_resilience
+from storage import TransactionBatch, get_storage
+from .rollups import plan_periods, summarize_range
 
 router = APIRouter()
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
+# Per-row logs are off unless sampled in with LOG_SAMPLING
+transaction_row_logger = HotPathLogger(logger, "get_user_transactions.row")
+summary_row_logger = HotPathLogger(logger, "calculate_summary.row")
 
 # AWS Configuration
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-movements_table = dynamodb.Table("movements")
-users_table = dynamodb.Table("users")
-token_table = dynamodb.Table("tokens")
-ses_client = boto3.client("ses", region_name="us-east-1")
+storage = get_storage()
+ses_client = instrument_client(
+    boto3.client(
+        "ses",
+        region_name=get_settings().aws_region,
+        config=get_settings().boto_config(),
+    )
+)
 
 
 # Define request model
 class SummaryRequest(BaseModel):
     access_token: str
+    # Optional range; when any of these is set the summary is served from rollups
+    start: Optional[date] = None
+    end: Optional[date] = None
+    granularity: Optional[Literal["day", "week", "month", "year"]] = None
+
+    def is_ranged(self) -> bool:
+        return any(
+            value is not None for value in (self.start, self.end, self.granularity)
+        )
+
+    def resolve_range(self) -> tuple:
+        end = self.end or datetime.now().date()
+        start = self.start or end - timedelta(days=30)
+        return start, end, self.granularity or "month"
 
 
 def verify_token(token: str) -> dict:
     try:
         logger.info("🔑 Verifying access token...")
-        response = token_table.scan(FilterExpression=Attr("token").eq(token))
+        token_data = storage.get_token(token)
 
-        if not response["Items"]:
+        if not token_data:
             logger.warning("❌ Token not found in database")
             return None
 
-        token_data = response["Items"][0]
         expiration = datetime.fromisoformat(token_data["expiration"])
 
         if expiration < datetime.utcnow():
@@ -46,8 +73,11 @@ def verify_token(token: str) -> dict:
         logger.info("✅ Token successfully verified")
         return token_data
 
+    except DependencyUnavailable:
+        # Not an invalid token, the client should retry
+        raise
     except Exception as e:
-        logger.error(f"💥 Error while verifying token: {str(e)}")
+        logger.error("💥 Error while verifying token: %s", e)
         return None
 
 
@@ -56,55 +86,62 @@ def get_user_id_from_email(email: str) -> str:
     Get UserId from account table using email
     """
     try:
-        logger.info(f"🔍 Looking up UserId for email: {email}")
-        response = users_table.scan(FilterExpression=Attr("email").eq(email))
+        logger.info("🔍 Looking up UserId for email: %s", email)
+        user = storage.get_user_by_email(email)
 
-        if not response["Items"]:
-            logger.warning(f"❌ No account found for email: {email}")
+        if not user:
+            logger.warning("❌ No account found for email: %s", email)
             raise HTTPException(status_code=404, detail="Account not found")
 
-        user_id = response["Items"][0]["id"]
-        logger.info(f"✅ Found UserId: {user_id}")
+        user_id = user["id"]
+        logger.info("✅ Found UserId: %s", user_id)
         return user_id
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
-        logger.error(f"💥 Error retrieving UserId: {str(e)}")
+        logger.error("💥 Error retrieving UserId: %s", e)
         raise HTTPException(status_code=500, detail="Error retrieving user account")
 
 
-def get_user_transactions(user_id: str) -> list:
-    logger.info(f"📊 Retrieving transactions for user: {user_id}")
+def get_user_transactions(user_id: str) -> TransactionBatch:
+    logger.info("📊 Retrieving transactions for user: %s", user_id)
     end_date = datetime.now()
     start_date = end_date - timedelta(days=30)
 
     try:
         logger.info(
-            f"🗓️ Date range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+            "🗓️ Date range: %s to %s",
+            start_date.strftime("%Y-%m-%d"),
+            end_date.strftime("%Y-%m-%d"),
         )
-        response = movements_table.scan(
-            FilterExpression=Attr("UserId").eq(user_id)
-            & Attr("Date").between(
-                start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
-            )
+        transactions = storage.get_movement_batch(
+            user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
         )
+        logger.info("📝 Found %d transactions", len(transactions))
 
-        transactions = response["Items"]
-        logger.info(f"📝 Found {len(transactions)} transactions")
-
-        # Log transaction dates for verification
-        for trans in transactions:
-            logger.info(f"Transaction date: {trans['Date']}, amount: {trans['amount']}")
+        # Sampled per-row logs for verification
+        if transaction_row_logger.enabled_for(logging.INFO):
+            for _, day, amount in transactions.rows():
+                transaction_row_logger.info(
+                    "Transaction date: %s, amount: %s", day, amount
+                )
 
         return transactions
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
-        logger.error(f"💥 Error retrieving transactions: {str(e)}")
+        logger.error("💥 Error retrieving transactions: %s", e)
         raise HTTPException(status_code=500, detail="Error retrieving transactions")
 
 
-def calculate_summary(transactions: list) -> dict:
+def calculate_summary(transactions) -> dict:
+    """Summary of a TransactionBatch (or of movement dicts, converted first)"""
     logger.info("🧮 Calculating transaction summary...")
-    if not transactions:
+    if not isinstance(transactions, TransactionBatch):
+        transactions = TransactionBatch.from_items(transactions)
+    if not len(transactions):
         logger.info("ℹ️ No transactions to process")
         return {
             "total_balance": 0,
@@ -114,40 +151,40 @@ def calculate_summary(transactions: list) -> dict:
             "transaction_count": 0,  # Added for verification
         }
 
-    total_balance = Decimal("0")
-    transactions_by_month = {}
-    debit_amounts = []
-    credit_amounts = []
-
-    for trans in transactions:
-        amount = Decimal(str(trans["amount"]))
-        total_balance += amount
-
-        # Log each transaction for verification
-        logger.info(f"Processing transaction: Date={trans['Date']}, Amount={amount}")
-
-        date = datetime.strptime(trans["Date"], "%Y-%m-%d")
-        month = date.strftime("%B")
-        transactions_by_month[month] = transactions_by_month.get(month, 0) + 1
+    # Sampled per-row log for verification
+    if summary_row_logger.enabled_for(logging.INFO):
+        for _, day, amount in transactions.rows():
+            summary_row_logger.info(
+                "Processing transaction: Date=%s, Amount=%s", day, amount
+            )
 
-        if amount < 0:
-            debit_amounts.append(amount)
-        else:
-            credit_amounts.append(amount)
+    # Integer cents, exact like the Decimal sums they replace
+    cents = transactions.cents
+    total_cents = sum(cents)
+    debit_cents = [amount for amount in cents if amount < 0]
+    debit_total = sum(debit_cents)
+    credit_count = len(cents) - len(debit_cents)
+    credit_total = total_cents - debit_total
+    # Year-month keys so the same month of different years stays apart
+    transactions_by_month = transactions.month_counts()
 
-    avg_debit = sum(debit_amounts) / len(debit_amounts) if debit_amounts else 0
-    avg_credit = sum(credit_amounts) / len(credit_amounts) if credit_amounts else 0
+    # One division of exact integers, rounded once to float
+    avg_debit = debit_total / (len(debit_cents) * 100) if debit_cents else 0
+    avg_credit = credit_total / (credit_count * 100) if credit_count else 0
 
     # Log summary calculations for verification
-    logger.info(f"💰 Total balance calculated: {float(total_balance)}")
-    logger.info(f"📈 Average credits: {float(avg_credit)}")
-    logger.info(f"📉 Average debits: {float(avg_debit)}")
-    logger.info(f"📅 Transactions by month: {transactions_by_month}")
-    logger.info(f"🔢 Number of transactions: {len(transactions)}")
+    logger.info(
+        "💰 Summary: balance=%s credits_avg=%s debits_avg=%s transactions=%d months=%s",
+        Decimal(total_cents).scaleb(-2),
+        avg_credit,
+        avg_debit,
+        len(transactions),
+        transactions_by_month,
+    )
 
     return {
-        "total_balance": float(total_balance),
-        "transactions_by_month": dict(transactions_by_month),
+        "total_balance": total_cents / 100,
+        "transactions_by_month": transactions_by_month,
         "avg_debit": float(avg_debit),
         "avg_credit": float(avg_credit),
         "transaction_count": len(transactions),  # Added for verification
@@ -159,10 +196,19 @@ def calculate_summary(transactions: list) -> dict:
 
 
 def send_summary_email(email: str, summary: dict):
-    logger.info(f"📧 Preparing email for: {email}")
+    logger.info("📧 Preparing email for: %s", email)
     subject = "Your Monthly Transaction Summary"
 
-    # Read the logo image file and encode it
+    # Ranged summaries group by the requested granularity instead of month
+    if "transactions_by_period" in summary:
+        period_counts = summary["transactions_by_period"]
+    else:
+        period_counts = summary["transactions_by_month"]
+    period_name = summary.get("granularity", "month").capitalize()
+    if "granularity" in summary:
+        activity = f"{summary['date_range']['start']} to {summary['date_range']['end']} Activity"
+    else:
+        activity = "Last 30 Days Activity"
 
     body_html = f"""
     <html>
@@ -245,7 +291,7 @@ def send_summary_email(email: str, summary: dict):
                 <div class="header">
                     <img src="https://es.m.wikipedia.org/wiki/Archivo:Stori_Logo_2023.svg" alt="Stori Logo" class="logo">
                     <h1>Transaction Summary</h1>
-                    <p>Last 30 Days Activity</p>
+                    <p>{activity}</p>
                 </div>
                 
                 <div class="summary-box">
@@ -255,13 +301,13 @@ def send_summary_email(email: str, summary: dict):
                         ${summary['total_balance']:.2f}
                     </div>
                     
-                    <h3>Transactions by Month</h3>
+                    <h3>Transactions by {period_name}</h3>
                     <ul class="transactions-list">
                         {" ".join([f'''
                         <li class="transaction-item">
-                            <strong>{month}:</strong> {count} transactions
+                            <strong>{period}:</strong> {count} transactions
                         </li>
-                        ''' for month, count in summary['transactions_by_month'].items()])}
+                        ''' for period, count in period_counts.items()])}
                     </ul>
                     
                     <div class="averages">
@@ -286,22 +332,30 @@ def send_summary_email(email: str, summary: dict):
     """
 
     try:
-        response = ses_client.send_email(
-            Source="agustindaguzan@gmail.com",
-            Destination={"ToAddresses": [email]},
-            Message={
-                "Subject": {"Data": subject},
-                "Body": {"Html": {"Data": body_html}},
-            },
+        # Never hedged, a duplicate would send the email twice
+        response = get_resilience().call(
+            "ses",
+            "send",
+            lambda: ses_client.send_email(
+                Source="agustindaguzan@gmail.com",
+                Destination={"ToAddresses": [email]},
+                Message={
+                    "Subject": {"Data": subject},
+                    "Body": {"Html": {"Data": body_html}},
+                },
+            ),
         )
-        logger.info(f"✉️ Email sent successfully: {response['MessageId']}")
+        logger.info("✉️ Email sent successfully: %s", response["MessageId"])
+    except DependencyUnavailable:
+        raise
     except Exception as e:
-        logger.error(f"💥 Error sending email: {str(e)}")
+        logger.error("💥 Error sending email: %s", e)
         raise HTTPException(status_code=500, detail="Error sending summary email")
 
 
 @router.post("/get-summary", tags=["Transactions"])
-async def get_summary(request: SummaryRequest):
+@admitted("get-summary", lambda args: args["request"].access_token)
+def get_summary(request: SummaryRequest, idempotency_key: Optional[str] = Header(None)):
     logger.info("🚀 Starting get-summary process")
 
     # Verify token from request body
@@ -315,34 +369,73 @@ async def get_summary(request: SummaryRequest):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if request.is_ranged():
+        start, end, granularity = request.resolve_range()
+        try:
+            periods = plan_periods(start, end, granularity)
+        except ValueError as e:
+            logger.warning("🚫 Invalid date range requested: %s", e)
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # A retry with the same Idempotency-Key replays the first summary instead
+    # of sending the email again
+    try:
+        idempotency = IdempotentRequest(
+            storage,
+            idempotency_key,
+            "get-summary",
+            request.access_token,
+            request.model_dump_json(exclude={"access_token"}).encode("utf-8"),
+        )
+    except InvalidIdempotencyKey as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    replay = idempotency.start()
+    if replay is not None:
+        return replay
+
     try:
         # Get user email from token data
         user_email = token_data["email"]
-        logger.info(f"👤 Processing request for user: {user_email}")
+        logger.info("👤 Processing request for user: %s", user_email)
 
         # Get UserId from account table using email
         logger.info("🔍 Getting UserId from account...")
         user_id = get_user_id_from_email(user_email)
 
-        # Get user's transactions using UserId
-        logger.info("📊 Retrieving transactions...")
-        transactions = get_user_transactions(user_id)
+        if request.is_ranged():
+            # Served from precomputed rollup buckets, no movement scan
+            logger.info("📦 Generating summary from rollups...")
+            summary = summarize_range(user_id, start, end, granularity, periods)
+        else:
+            # Get user's transactions using UserId
+            logger.info("📊 Retrieving transactions...")
+            transactions = get_user_transactions(user_id)
 
-        # Calculate summary
-        logger.info("📋 Generating summary...")
-        summary = calculate_summary(transactions)
+            # Calculate summary
+            logger.info("📋 Generating summary...")
+            summary = calculate_summary(transactions)
 
         # Send email
         logger.info("📤 Sending summary email...")
         send_summary_email(user_email, summary)
 
         logger.info("✨ Process completed successfully")
-        return {
+        result = {
             "status": "success",
             "message": "Summary generated and sent successfully",
             "summary": summary,
         }
 
+    except DependencyUnavailable as e:
+        # An email sent past its deadline may still go out, the claim is kept
+        # until IN_PROGRESS_TTL so a retry does not send it again
+        logger.error("🔌 Dependency unavailable: %s", e.detail)
+        raise
     except Exception as e:
-        logger.error(f"💥 Error processing summary request: {str(e)}")
+        idempotency.release()
+        logger.error("💥 Error processing summary request: %s", e)
         raise HTTPException(status_code=500, detail="Error processing summary request")
+
+    idempotency.complete(result)
+    # The summary only holds str, int and float, no jsonable_encoder pass
+    return FastJSONResponse(result)
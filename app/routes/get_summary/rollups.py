@@ -0,0 +1,241 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+import logging
+from storage import ROLLUP_FIELDS, get_storage
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Storage Configuration
+storage = get_storage()
+
+# Rollup items are keyed by (UserId, Bucket). Buckets exist at three
+# resolutions that share the date prefix format: "2024", "2024-01" and
+# "2024-01-15". The file processor ADDs every saved movement to its day,
+# month and year bucket.
+GRANULARITIES = ("day", "week", "month", "year")
+MAX_PERIODS = 1000
+
+
+def year_key(day: date) -> str:
+    return day.strftime("%Y")
+
+
+def month_key(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def day_key(day: date) -> str:
+    return day.strftime("%Y-%m-%d")
+
+
+def bucket_keys(day: date) -> tuple:
+    """Return the (year, month, day) bucket keys a movement on `day` belongs to"""
+    return year_key(day), month_key(day), day_key(day)
+
+
+def _next_month(day: date) -> date:
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+def cover_range(start: date, end: date) -> list:
+    """
+    Return the smallest list of bucket keys whose union is exactly [start, end].
+    Whole years use the year bucket, whole months the month bucket and only the
+    ragged edges fall back to day buckets, so a multi-year range costs
+    O(years + 24 + 62) keys instead of one read per day or transaction.
+    """
+    keys = []
+    day = start
+    while day <= end:
+        if day.month == 1 and day.day == 1 and date(day.year, 12, 31) <= end:
+            keys.append(year_key(day))
+            day = date(day.year + 1, 1, 1)
+        elif day.day == 1 and _next_month(day) - timedelta(days=1) <= end:
+            keys.append(month_key(day))
+            day = _next_month(day)
+        else:
+            keys.append(day_key(day))
+            day += timedelta(days=1)
+    return keys
+
+
+def iter_periods(start: date, end: date, granularity: str) -> list:
+    """
+    Split [start, end] into (label, period_start, period_end) tuples for the
+    requested granularity. The first and last periods are clipped to the range.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+
+    periods = []
+    day = start
+    while day <= end:
+        if granularity == "day":
+            label, period_end = day_key(day), day
+        elif granularity == "week":
+            iso_year, iso_week, iso_weekday = day.isocalendar()
+            label = f"{iso_year}-W{iso_week:02d}"
+            period_end = day + timedelta(days=7 - iso_weekday)
+        elif granularity == "month":
+            label, period_end = month_key(day), _next_month(day) - timedelta(days=1)
+        else:
+            label, period_end = year_key(day), date(day.year, 12, 31)
+
+        period_end = min(period_end, end)
+        periods.append((label, day, period_end))
+        day = period_end + timedelta(days=1)
+    return periods
+
+
+def plan_periods(start: date, end: date, granularity: str) -> list:
+    """
+    iter_periods for a requested range, raising ValueError when the range is
+    reversed or produces more than MAX_PERIODS periods.
+    """
+    if start > end:
+        raise ValueError("start must not be after end")
+    periods = iter_periods(start, end, granularity)
+    if len(periods) > MAX_PERIODS:
+        raise ValueError(
+            f"Range produces {len(periods)} periods, the maximum is {MAX_PERIODS}"
+        )
+    return periods
+
+
+def empty_rollup() -> dict:
+    return {field: Decimal("0") for field in ROLLUP_FIELDS}
+
+
+def add_to_rollup(rollup: dict, amount: Decimal):
+    rollup["tx_count"] += 1
+    rollup["balance"] += amount
+    if amount < 0:
+        rollup["debit_count"] += 1
+        rollup["debit_total"] += amount
+    else:
+        rollup["credit_count"] += 1
+        rollup["credit_total"] += amount
+
+
+def merge_rollup(target: dict, other: dict):
+    for field in ROLLUP_FIELDS:
+        target[field] += Decimal(str(other.get(field, 0)))
+
+
+def build_rollups(transactions: list) -> dict:
+    """
+    Build {(UserId, Bucket): rollup} from raw movements, mirroring what the file
+    processor accumulates at ingest time. Used to rebuild the rollups table
+    (rebuild_rollups).
+    """
+    rollups = {}
+    for trans in transactions:
+        amount = Decimal(str(trans["amount"]))
+        day = date.fromisoformat(trans["Date"])
+        for key in bucket_keys(day):
+            rollup = rollups.setdefault((trans["UserId"], key), empty_rollup())
+            add_to_rollup(rollup, amount)
+    return rollups
+
+
+def rebuild_rollups(user_id: str) -> int:
+    """
+    Recompute a user's buckets from every stored movement, hot and cold, and
+    add the difference to the stored rollups. Movements saved before the
+    rollups existed are otherwise missing from ranged summaries. Run it while
+    none of the user's files is being ingested: a row saved in between is
+    subtracted again. Returns the number of buckets that changed.
+    """
+    movements = storage.get_movements(user_id, "0000-01-01", "9999-12-31")
+    rebuilt = {
+        bucket: rollup for (_, bucket), rollup in build_rollups(movements).items()
+    }
+    stored = storage.get_rollups(user_id, list(rebuilt))
+    deltas = {}
+    for bucket, rollup in rebuilt.items():
+        current = stored.get(bucket, {})
+        delta = {
+            field: rollup[field] - Decimal(str(current.get(field, 0)))
+            for field in ROLLUP_FIELDS
+        }
+        if any(delta.values()):
+            deltas[bucket] = delta
+    if deltas:
+        storage.add_to_rollups(user_id, deltas)
+    logger.info("🔁 Rebuilt %d rollup buckets for user: %s", len(deltas), user_id)
+    return len(deltas)
+
+
+def fetch_rollups(user_id: str, keys: list) -> dict:
+    """Batch-read rollup buckets for a user. Missing buckets are simply absent."""
+    unique_keys = list(dict.fromkeys(keys))
+    logger.info("📦 Fetching %d rollup buckets for user: %s", len(unique_keys), user_id)
+    return storage.get_rollups(user_id, unique_keys)
+
+
+def _average(total: Decimal, count: Decimal) -> float:
+    return float(total / count) if count else 0
+
+
+def summarize_range(
+    user_id: str,
+    start: date,
+    end: date,
+    granularity: str,
+    periods: Optional[list] = None,
+) -> dict:
+    """
+    Build a summary for [start, end] grouped by `granularity` using only the
+    precomputed rollup buckets, never the individual movements. `periods` is
+    plan_periods(start, end, granularity) when the caller already has it.
+    """
+    logger.info("🗓️ Summarizing %s to %s by %s", start, end, granularity)
+    if periods is None:
+        periods = plan_periods(start, end, granularity)
+
+    covers = [
+        cover_range(period_start, period_end) for _, period_start, period_end in periods
+    ]
+    rollups = fetch_rollups(user_id, [key for cover in covers for key in cover])
+
+    totals = empty_rollup()
+    period_summaries = []
+    for (label, period_start, period_end), cover in zip(periods, covers):
+        period_rollup = empty_rollup()
+        for key in cover:
+            if key in rollups:
+                merge_rollup(period_rollup, rollups[key])
+        merge_rollup(totals, period_rollup)
+        period_summaries.append(
+            {
+                "period": label,
+                "start": period_start.isoformat(),
+                "end": period_end.isoformat(),
+                "transaction_count": int(period_rollup["tx_count"]),
+                "balance": float(period_rollup["balance"]),
+                "avg_debit": _average(
+                    period_rollup["debit_total"], period_rollup["debit_count"]
+                ),
+                "avg_credit": _average(
+                    period_rollup["credit_total"], period_rollup["credit_count"]
+                ),
+            }
+        )
+
+    logger.info("🔢 Number of transactions in range: %d", totals["tx_count"])
+    return {
+        "total_balance": float(totals["balance"]),
+        "transactions_by_period": {
+            period["period"]: period["transaction_count"] for period in period_summaries
+        },
+        "avg_debit": _average(totals["debit_total"], totals["debit_count"]),
+        "avg_credit": _average(totals["credit_total"], totals["credit_count"]),
+        "transaction_count": int(totals["tx_count"]),
+        "granularity": granularity,
+        "periods": period_summaries,
+        "date_range": {"start": start.isoformat(), "end": end.isoformat()},
+    }
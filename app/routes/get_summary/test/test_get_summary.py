@@ -4,6 +4,7 @@ from unittest.mock import patch, MagicMock
 from fastapi import FastAPI, HTTPException
 from datetime import datetime, timedelta
 from decimal import Decimal
+from common.resilience import DeadlineExceeded
 from routes.get_summary.get_summary import (
     router,
     verify_token,
@@ -12,7 +13,7 @@ from routes.get_summary.get_summary import (
     calculate_summary,
     send_summary_email,
 )
-
+from storage.memory import MemoryStorage
 
 # Setup test app
 app = FastAPI()
@@ -80,7 +81,7 @@ async def test_get_summary_success(
 
 def test_verify_token_valid():
     """Test token verification with valid token"""
-    with patch("routes.get_summary.get_summary.token_table") as mock_table:
+    with patch("routes.get_summary.get_summary.storage.tokens") as mock_table:
         # Configure mock
         mock_table.scan.return_value = {
             "Items": [
@@ -102,7 +103,7 @@ def test_verify_token_valid():
 
 def test_verify_token_expired():
     """Test token verification with expired token"""
-    with patch("routes.get_summary.get_summary.token_table") as mock_table:
+    with patch("routes.get_summary.get_summary.storage.tokens") as mock_table:
         # Configure mock with expired token
         mock_table.scan.return_value = {
             "Items": [
@@ -121,7 +122,7 @@ def test_verify_token_expired():
 
 def test_get_user_id_from_email_success():
     """Test successful user ID retrieval"""
-    with patch("routes.get_summary.get_summary.users_table") as mock_table:
+    with patch("routes.get_summary.get_summary.storage.users") as mock_table:
         # Configure mock
         mock_table.scan.return_value = {
             "Items": [{"id": mock_user_id, "email": mock_email}]
@@ -134,14 +135,57 @@ def test_get_user_id_from_email_success():
 
 def test_get_user_transactions_success():
     """Test successful transaction retrieval"""
-    with patch("routes.get_summary.get_summary.movements_table") as mock_table:
-        # Configure mock
-        mock_table.scan.return_value = {"Items": mock_transactions}
+    with patch("routes.get_summary.get_summary.storage.client") as mock_client:
+        # Configure mock, the low-level client answers in wire format
+        mock_client.scan.return_value = {
+            "Items": [
+                {
+                    "UserId": {"S": trans["UserId"]},
+                    "Date": {"S": trans["Date"]},
+                    "amount": {"N": str(trans["amount"])},
+                }
+                for trans in mock_transactions
+            ]
+        }
 
         # Get transactions
         result = get_user_transactions(mock_user_id)
         assert len(result) == len(mock_transactions)
-        assert result == mock_transactions
+        assert [(day, float(amount)) for _, day, amount in result.rows()] == [
+            (trans["Date"], trans["amount"]) for trans in mock_transactions
+        ]
+
+
+def test_get_user_transactions_reads_every_shard():
+    """A sharded user's partitions are queried on the index and merged"""
+    from routes.get_summary.get_summary import storage
+
+    def query(**kwargs):
+        key = kwargs["ExpressionAttributeValues"][":user_id"]["S"]
+        shard = ["user123", "user123#0", "user123#1"].index(key)
+        return {
+            "Items": [
+                {"Date": {"S": trans["Date"]}, "amount": {"N": str(trans["amount"])}}
+                for trans in mock_transactions[shard : shard + 1]
+            ]
+        }
+
+    with patch.object(storage, "sharding", True), patch.object(
+        storage, "shards"
+    ) as mock_shards, patch.object(storage, "client") as mock_client:
+        mock_shards.get_item.return_value = {
+            "Item": {"UserId": mock_user_id, "shards": Decimal(2)}
+        }
+        mock_client.query.side_effect = query
+
+        result = get_user_transactions(mock_user_id)
+
+    assert mock_client.query.call_count == 3
+    mock_client.scan.assert_not_called()
+    assert result.user_ids == [mock_user_id]
+    assert sorted((day, float(amount)) for _, day, amount in result.rows()) == sorted(
+        (trans["Date"], trans["amount"]) for trans in mock_transactions
+    )
 
 
 def test_calculate_summary_success():
@@ -159,6 +203,19 @@ def test_calculate_summary_success():
     assert result["avg_credit"] == 87.75  # (100.50 + 75.00) / 2
 
 
+def test_calculate_summary_sampled_rows_log_at_info(monkeypatch, caplog):
+    """LOG_SAMPLING alone turns the per-row logs on at the default LOG_LEVEL"""
+    from routes.get_summary import get_summary
+
+    monkeypatch.setattr(get_summary.summary_row_logger, "sample_rate", 1.0)
+    with caplog.at_level("INFO"):
+        calculate_summary(mock_transactions)
+
+    rows = [record for record in caplog.records if hasattr(record, "hot_path")]
+    assert len(rows) == len(mock_transactions)
+    assert {record.levelname for record in rows} == {"INFO"}
+
+
 @pytest.mark.asyncio
 @patch("routes.get_summary.get_summary.ses_client")
 async def test_send_summary_email_success(mock_ses):
@@ -227,13 +284,72 @@ async def test_get_summary_no_transactions(
     mock_send_email.assert_called_once()
 
 
+@patch("routes.get_summary.get_summary.verify_token")
+@patch("routes.get_summary.get_summary.get_user_id_from_email")
+@patch("routes.get_summary.get_summary.get_user_transactions")
+@patch("routes.get_summary.get_summary.send_summary_email")
+def test_get_summary_idempotent_retry(
+    mock_send_email,
+    mock_get_transactions,
+    mock_get_user_id,
+    mock_verify_token,
+):
+    """A retry with the same Idempotency-Key does not send the email again"""
+    mock_verify_token.return_value = {"email": mock_email}
+    mock_get_user_id.return_value = mock_user_id
+    mock_get_transactions.return_value = mock_transactions
+    headers = {"Idempotency-Key": "summary-1"}
+
+    with patch("routes.get_summary.get_summary.storage", MemoryStorage()):
+        responses = [
+            client.post(
+                "/get-summary", json={"access_token": mock_token}, headers=headers
+            )
+            for _ in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[1].json() == responses[0].json()
+    assert responses[1].headers["idempotent-replayed"] == "true"
+    mock_send_email.assert_called_once()
+
+
+@patch("routes.get_summary.get_summary.verify_token")
+@patch("routes.get_summary.get_summary.get_user_id_from_email")
+@patch("routes.get_summary.get_summary.get_user_transactions")
+@patch("routes.get_summary.get_summary.send_summary_email")
+def test_get_summary_deadline_keeps_idempotency_claim(
+    mock_send_email,
+    mock_get_transactions,
+    mock_get_user_id,
+    mock_verify_token,
+):
+    """An email that may still go out after its deadline is not sent again"""
+    mock_verify_token.return_value = {"email": mock_email}
+    mock_get_user_id.return_value = mock_user_id
+    mock_get_transactions.return_value = mock_transactions
+    mock_send_email.side_effect = DeadlineExceeded("too slow")
+    headers = {"Idempotency-Key": "summary-2"}
+
+    with patch("routes.get_summary.get_summary.storage", MemoryStorage()):
+        responses = [
+            client.post(
+                "/get-summary", json={"access_token": mock_token}, headers=headers
+            )
+            for _ in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [503, 409]
+    mock_send_email.assert_called_once()
+
+
 # -------------------------- Integration Tests --------------------------
 
 
 @pytest.mark.integration
-@patch("routes.get_summary.get_summary.token_table")
-@patch("routes.get_summary.get_summary.users_table")
-@patch("routes.get_summary.get_summary.movements_table")
+@patch("routes.get_summary.get_summary.storage.tokens")
+@patch("routes.get_summary.get_summary.storage.users")
+@patch("routes.get_summary.get_summary.storage.movements")
 @patch("routes.get_summary.get_summary.ses_client")
 async def test_get_summary_full_flow(
     mock_ses,
@@ -277,10 +393,12 @@ async def test_get_summary_full_flow(
 @pytest.fixture
 def mock_aws_services():
     """Fixture for AWS services"""
-    with patch("routes.get_summary.get_summary.token_table") as mock_token_table, patch(
-        "routes.get_summary.get_summary.users_table"
+    with patch(
+        "routes.get_summary.get_summary.storage.tokens"
+    ) as mock_token_table, patch(
+        "routes.get_summary.get_summary.storage.users"
     ) as mock_users_table, patch(
-        "routes.get_summary.get_summary.movements_table"
+        "routes.get_summary.get_summary.storage.movements"
     ) as mock_movements_table, patch(
         "routes.get_summary.get_summary.ses_client"
     ) as mock_ses:
@@ -0,0 +1,257 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from fastapi import FastAPI
+from datetime import date
+from decimal import Decimal
+from routes.get_summary.get_summary import (
+    router,
+    calculate_summary,
+    send_summary_email,
+)
+from routes.get_summary import rollups
+from routes.get_summary.rollups import (
+    build_rollups,
+    cover_range,
+    iter_periods,
+    rebuild_rollups,
+    summarize_range,
+)
+from storage import ROLLUPS_TABLE_NAME
+from storage.memory import MemoryStorage
+
+# Setup test app
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+# Test data
+mock_user_id = "user123"
+
+mock_transactions = [
+    {"UserId": mock_user_id, "Date": "2024-01-10", "amount": Decimal("100.50")},
+    {"UserId": mock_user_id, "Date": "2024-01-20", "amount": Decimal("-50.25")},
+    {"UserId": mock_user_id, "Date": "2024-03-05", "amount": Decimal("75.00")},
+    {"UserId": mock_user_id, "Date": "2025-01-15", "amount": Decimal("-20.00")},
+]
+
+# -------------------------- Helper Functions --------------------------
+
+
+def fake_batch_get_item(rollups: dict):
+    """Serve BatchGetItem requests from a {(UserId, Bucket): rollup} dict"""
+
+    def batch_get_item(RequestItems):
+        keys = RequestItems[ROLLUPS_TABLE_NAME]["Keys"]
+        items = []
+        for key in keys:
+            rollup = rollups.get((key["UserId"], key["Bucket"]))
+            if rollup is not None:
+                items.append({**key, **rollup})
+        return {"Responses": {ROLLUPS_TABLE_NAME: items}, "UnprocessedKeys": {}}
+
+    return batch_get_item
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_cover_range_uses_coarsest_buckets():
+    """Whole years and months collapse into a single bucket each"""
+    keys = cover_range(date(2023, 12, 30), date(2025, 2, 2))
+
+    assert keys == [
+        "2023-12-30",
+        "2023-12-31",
+        "2024",
+        "2025-01",
+        "2025-02-01",
+        "2025-02-02",
+    ]
+
+
+def test_cover_range_single_day():
+    """A one day range is a single day bucket"""
+    assert cover_range(date(2024, 2, 29), date(2024, 2, 29)) == ["2024-02-29"]
+
+
+def test_iter_periods_week_is_clipped():
+    """ISO weeks are clipped to the requested range"""
+    periods = iter_periods(date(2024, 1, 3), date(2024, 1, 16), "week")
+
+    assert periods == [
+        ("2024-W01", date(2024, 1, 3), date(2024, 1, 7)),
+        ("2024-W02", date(2024, 1, 8), date(2024, 1, 14)),
+        ("2024-W03", date(2024, 1, 15), date(2024, 1, 16)),
+    ]
+
+
+def test_iter_periods_invalid_granularity():
+    """Unknown granularities are rejected"""
+    with pytest.raises(ValueError):
+        iter_periods(date(2024, 1, 1), date(2024, 1, 2), "hour")
+
+
+def test_summarize_range_by_month():
+    """Monthly summary only reads rollup buckets"""
+    rollups = build_rollups(mock_transactions)
+
+    with patch("routes.get_summary.rollups.storage.resource") as mock_dynamodb:
+        mock_dynamodb.batch_get_item.side_effect = fake_batch_get_item(rollups)
+        result = summarize_range(
+            mock_user_id, date(2024, 1, 1), date(2024, 12, 31), "month"
+        )
+
+    assert result["transaction_count"] == 3
+    assert result["total_balance"] == 125.25
+    assert result["avg_debit"] == -50.25
+    assert result["avg_credit"] == 87.75
+    assert result["transactions_by_period"]["2024-01"] == 2
+    assert result["transactions_by_period"]["2024-02"] == 0
+    assert result["transactions_by_period"]["2024-03"] == 1
+    assert len(result["periods"]) == 12
+
+    # A full year is served from twelve month buckets in a single batch read
+    mock_dynamodb.batch_get_item.assert_called_once()
+
+
+def test_summarize_range_multi_year_reads_year_buckets():
+    """Years do not merge and a full year costs one bucket read"""
+    rollups = build_rollups(mock_transactions)
+
+    with patch("routes.get_summary.rollups.storage.resource") as mock_dynamodb:
+        mock_dynamodb.batch_get_item.side_effect = fake_batch_get_item(rollups)
+        result = summarize_range(
+            mock_user_id, date(2024, 1, 1), date(2025, 12, 31), "year"
+        )
+
+    assert result["transactions_by_period"] == {"2024": 3, "2025": 1}
+    assert result["total_balance"] == 105.25
+    _, kwargs = mock_dynamodb.batch_get_item.call_args
+    requested = kwargs["RequestItems"][ROLLUPS_TABLE_NAME]["Keys"]
+    assert [key["Bucket"] for key in requested] == ["2024", "2025"]
+
+
+def test_rebuild_rollups_counts_movements_stored_before_rollups(monkeypatch):
+    """Buckets are set to what the stored movements add up to"""
+    storage = MemoryStorage()
+    monkeypatch.setattr(rollups, "storage", storage)
+    storage.put_movements(
+        {**movement, "id": f"m{index}"}
+        for index, movement in enumerate(mock_transactions)
+    )
+    # Only the last movement was counted when it was saved
+    storage.add_to_rollups(
+        mock_user_id,
+        {
+            bucket: rollup
+            for (_, bucket), rollup in build_rollups(mock_transactions[3:]).items()
+        },
+    )
+
+    assert rebuild_rollups(mock_user_id) == 6
+    assert rebuild_rollups(mock_user_id) == 0
+    result = summarize_range(mock_user_id, date(2024, 1, 1), date(2025, 12, 31), "year")
+    assert result["transactions_by_period"] == {"2024": 3, "2025": 1}
+    assert result["total_balance"] == 105.25
+
+
+def test_calculate_summary_keeps_years_apart():
+    """Same month name in different years are separate buckets"""
+    result = calculate_summary(mock_transactions)
+
+    assert result["transactions_by_month"] == {"2024-01": 2, "2024-03": 1, "2025-01": 1}
+
+
+# -------------------------- Endpoint Tests --------------------------
+
+
+@pytest.mark.asyncio
+@patch("routes.get_summary.get_summary.verify_token")
+@patch("routes.get_summary.get_summary.get_user_id_from_email")
+@patch("routes.get_summary.get_summary.get_user_transactions")
+@patch("routes.get_summary.get_summary.summarize_range")
+@patch("routes.get_summary.get_summary.send_summary_email")
+async def test_get_summary_with_range(
+    mock_send_email,
+    mock_summarize_range,
+    mock_get_transactions,
+    mock_get_user_id,
+    mock_verify_token,
+):
+    """Ranged requests are served from rollups instead of movements"""
+    mock_verify_token.return_value = {"email": "test@example.com"}
+    mock_get_user_id.return_value = mock_user_id
+    mock_summarize_range.return_value = {"transaction_count": 3}
+
+    response = client.post(
+        "/get-summary",
+        json={
+            "access_token": "token",
+            "start": "2024-01-01",
+            "end": "2024-12-31",
+            "granularity": "week",
+        },
+    )
+
+    assert response.status_code == 200
+    # The periods validated by the endpoint are passed on, not computed again
+    mock_summarize_range.assert_called_once_with(
+        mock_user_id,
+        date(2024, 1, 1),
+        date(2024, 12, 31),
+        "week",
+        iter_periods(date(2024, 1, 1), date(2024, 12, 31), "week"),
+    )
+    mock_get_transactions.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("routes.get_summary.get_summary.verify_token")
+async def test_get_summary_invalid_range(mock_verify_token):
+    """start after end is a client error"""
+    mock_verify_token.return_value = {"email": "test@example.com"}
+
+    response = client.post(
+        "/get-summary",
+        json={"access_token": "token", "start": "2024-02-01", "end": "2024-01-01"},
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+@patch("routes.get_summary.get_summary.verify_token")
+async def test_get_summary_too_many_periods(mock_verify_token):
+    """Day granularity over many years is rejected"""
+    mock_verify_token.return_value = {"email": "test@example.com"}
+
+    response = client.post(
+        "/get-summary",
+        json={
+            "access_token": "token",
+            "start": "2000-01-01",
+            "end": "2024-01-01",
+            "granularity": "day",
+        },
+    )
+
+    assert response.status_code == 400
+
+
+@patch("routes.get_summary.get_summary.ses_client")
+def test_send_summary_email_ranged_summary(mock_ses):
+    summary = {
+        "total_balance": 10.0,
+        "transactions_by_period": {"2024-W01": 2},
+        "avg_debit": -5.0,
+        "avg_credit": 10.0,
+        "granularity": "week",
+        "date_range": {"start": "2024-01-01", "end": "2024-01-07"},
+    }
+    mock_ses.send_email.return_value = {"MessageId": "id"}
+
+    send_summary_email("test@example.com", summary)
+
+    html = mock_ses.send_email.call_args.kwargs["Message"]["Body"]["Html"]["Data"]
+    assert "2024-W01" in html
@@ -0,0 +1,165 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from fastapi import FastAPI
+from decimal import Decimal
+import json
+from routes.transactions.transactions import (
+    router,
+    encode_cursor,
+    decode_cursor,
+    InvalidCursor,
+)
+
+# Setup test app
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+# Test data
+mock_user_id = "user123"
+auth_headers = {"Authorization": "Bearer valid_test_token"}
+
+mock_movements = [
+    {
+        "id": f"id{i}",
+        "UserId": mock_user_id,
+        "Date": f"2024-01-{i + 1:02d}",
+        "amount": Decimal("10.50") * (1 if i % 2 else -1),
+        "processed": "Ok",
+    }
+    for i in range(5)
+]
+
+# -------------------------- Helper Functions --------------------------
+
+
+def fake_query(items: list):
+    """Page through `items` the way DynamoDB Query honours Limit/ExclusiveStartKey"""
+
+    def query(**kwargs):
+        start = 0
+        if "ExclusiveStartKey" in kwargs:
+            last_id = kwargs["ExclusiveStartKey"]["id"]
+            start = [item["id"] for item in items].index(last_id) + 1
+        page = items[start : start + kwargs["Limit"]]
+        response = {"Items": page}
+        if start + kwargs["Limit"] < len(items):
+            last = page[-1]
+            response["LastEvaluatedKey"] = {
+                "id": last["id"],
+                "UserId": last["UserId"],
+                "Date": last["Date"],
+            }
+        return response
+
+    return query
+
+
+@pytest.fixture
+def authenticated():
+    with patch("routes.transactions.transactions.verify_token") as mock_verify, patch(
+        "routes.transactions.transactions.get_user_id_from_email"
+    ) as mock_user_id_lookup:
+        mock_verify.return_value = {"email": "test@example.com"}
+        mock_user_id_lookup.return_value = mock_user_id
+        yield mock_verify
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_cursor_round_trip():
+    """Cursors decode back to the same start key"""
+    key = {"id": "id2", "UserId": mock_user_id, "Date": "2024-01-03"}
+    assert decode_cursor(encode_cursor(key), mock_user_id) == key
+
+
+def test_cursor_of_other_user_rejected():
+    """A cursor cannot be replayed against another user's listing"""
+    cursor = encode_cursor({"id": "x", "UserId": "someone-else", "Date": "2024-01-01"})
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, mock_user_id)
+
+
+def test_malformed_cursor_rejected():
+    """Garbage cursors are rejected"""
+    with pytest.raises(InvalidCursor):
+        decode_cursor("%%%not-base64", mock_user_id)
+
+
+# -------------------------- Endpoint Tests --------------------------
+
+
+def test_list_transactions_pages_with_cursor(authenticated):
+    """Following next_cursor walks every movement exactly once"""
+    with patch("routes.transactions.transactions.storage.movements") as mock_table:
+        mock_table.query.side_effect = fake_query(mock_movements)
+
+        seen = []
+        params = {"limit": 2}
+        while True:
+            response = client.get("/transactions", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            body = response.json()
+            seen.extend(row["id"] for row in body["transactions"])
+            if not body["next_cursor"]:
+                break
+            params["cursor"] = body["next_cursor"]
+
+    assert seen == [movement["id"] for movement in mock_movements]
+    _, kwargs = mock_table.query.call_args
+    assert kwargs["IndexName"] == "UserId-Date-index"
+
+
+def test_list_transactions_requires_token():
+    """Requests without a bearer token are rejected"""
+    response = client.get("/transactions")
+    assert response.status_code == 401
+
+
+def test_list_transactions_invalid_token():
+    """Unknown tokens are rejected"""
+    with patch("routes.transactions.transactions.verify_token") as mock_verify:
+        mock_verify.return_value = None
+        response = client.get("/transactions", headers=auth_headers)
+    assert response.status_code == 401
+
+
+def test_list_transactions_bad_cursor(authenticated):
+    """Invalid cursors are a client error"""
+    response = client.get(
+        "/transactions", params={"cursor": "bogus"}, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_export_ndjson_streams_all_pages(authenticated):
+    """NDJSON export yields one JSON document per movement"""
+    with patch(
+        "routes.transactions.transactions.storage.movements"
+    ) as mock_table, patch("routes.transactions.transactions.EXPORT_PAGE_SIZE", 2):
+        mock_table.query.side_effect = fake_query(mock_movements)
+        response = client.get("/transactions/export", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [m["id"] for m in mock_movements]
+    assert rows[1]["amount"] == 10.5
+    assert mock_table.query.call_count == 3
+
+
+def test_export_csv(authenticated):
+    """CSV export has a header and one row per movement"""
+    with patch("routes.transactions.transactions.storage.movements") as mock_table:
+        mock_table.query.side_effect = fake_query(mock_movements)
+        response = client.get(
+            "/transactions/export", params={"format": "csv"}, headers=auth_headers
+        )
+
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0] == "id,Date,amount,processed"
+    assert lines[1] == "id0,2024-01-01,-10.50,Ok"
+    assert len(lines) == len(mock_movements) + 1
@@ -0,0 +1,189 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import date
+from typing import Literal, Optional
+import base64
+import binascii
+import csv
+import io
+import json
+import logging
+from common.admission import admitted
+from common.resilience import DependencyUnavailable
+from common.responses import FastJSONResponse, dumps
+from storage import get_storage
+from routes.get_summary.get_summary import verify_token, get_user_id_from_email
+
+router = APIRouter()
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Storage Configuration
+storage = get_storage()
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE = 1000
+EXPORT_FIELDS = ("id", "Date", "amount", "processed")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_evaluated_key: Optional[dict]) -> Optional[str]:
+    """Turn a storage page key (DynamoDB LastEvaluatedKey) into an opaque url-safe cursor"""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, user_id: str) -> dict:
+    """Inverse of encode_cursor. Cursors only resume the owner's own listing."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        start_key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+
+    if not isinstance(start_key, dict) or start_key.get("UserId") != user_id:
+        raise InvalidCursor("Cursor does not belong to this user")
+    return start_key
+
+
+def iter_transaction_pages(
+    user_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    start_key: Optional[dict] = None,
+    ascending: bool = True,
+):
+    """
+    Yield (items, last_evaluated_key) pages of one user's movements ordered by
+    Date, straight from the UserId/Date index. Nothing is buffered beyond the
+    current page, so callers can stop after the first page or stream them all.
+    The user's cold files are listed once for all the pages.
+    """
+    start = start.isoformat() if start else None
+    end = end.isoformat() if end else None
+
+    with storage.cold_listing(user_id):
+        while True:
+            items, start_key = storage.query_movements(
+                user_id, start, end, page_size, start_key, ascending
+            )
+            yield items, start_key
+            if not start_key:
+                return
+
+
+def serialize_transaction(item: dict) -> dict:
+    return {
+        "id": item["id"],
+        "Date": item["Date"],
+        "amount": float(item["amount"]),
+        "processed": item.get("processed"),
+    }
+
+
+def authenticate(authorization: Optional[str]) -> str:
+    """Resolve the UserId for a `Bearer <token>` Authorization header"""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(
+            status_code=401,
+            detail="Missing bearer token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    token_data = verify_token(authorization[len("bearer ") :].strip())
+    if not token_data:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return get_user_id_from_email(token_data["email"])
+
+
+def _ndjson_rows(pages):
+    for items, _ in pages:
+        if not items:
+            continue
+        yield b"".join(dumps(serialize_transaction(item)) + b"\n" for item in items)
+
+
+def _csv_rows(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for items, _ in pages:
+        for item in items:
+            writer.writerow([item.get(field, "") for field in EXPORT_FIELDS])
+        # The header goes out with the first page, even when it is empty
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@router.get("/transactions", tags=["Transactions"])
+@admitted("transactions", lambda args: args["authorization"])
+def list_transactions(
+    authorization: Optional[str] = Header(None),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "asc",
+):
+    logger.info("🚀 Starting transactions listing")
+    user_id = authenticate(authorization)
+
+    try:
+        start_key = decode_cursor(cursor, user_id) if cursor else None
+    except InvalidCursor as e:
+        logger.warning("🚫 Invalid cursor: %s", e)
+        return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+    try:
+        pages = iter_transaction_pages(
+            user_id, start, end, limit, start_key, ascending=order == "asc"
+        )
+        items, last_key = next(pages)
+        logger.info("📝 Returning %s transactions", len(items))
+        return FastJSONResponse(
+            {
+                "transactions": [serialize_transaction(item) for item in items],
+                "next_cursor": encode_cursor(last_key),
+            }
+        )
+
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        logger.error("💥 Error listing transactions: %s", e)
+        raise HTTPException(status_code=500, detail="Error retrieving transactions")
+
+
+@router.get("/transactions/export", tags=["Transactions"])
+@admitted("transactions-export", lambda args: args["authorization"])
+def export_transactions(
+    authorization: Optional[str] = Header(None),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    logger.info("🚀 Starting %s transactions export", format)
+    user_id = authenticate(authorization)
+
+    # Rows are written as each DynamoDB page arrives, memory stays at one page
+    pages = iter_transaction_pages(user_id, start, end, EXPORT_PAGE_SIZE)
+    if format == "csv":
+        return StreamingResponse(
+            _csv_rows(pages),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="transactions.csv"'},
+        )
+    return StreamingResponse(_ndjson_rows(pages), media_type="application/x-ndjson")
@@ -5,7 +5,9 @@ from fastapi import FastAPI, UploadFile
 from datetime import datetime, timedelta
 import io
 from botocore.exceptions import ClientError
+from common.resilience import DeadlineExceeded
 from routes.upload_file.upload_file import router
+from storage.memory import MemoryStorage
 
 # Setup test app
 app = FastAPI()
@@ -17,6 +19,7 @@ valid_token = "valid_test_token"
 expired_token = "expired_test_token"
 test_file_content = f"{valid_token}\nDate,Transaction,Amount\n2024-01-01,Payment,100.00"
 test_file_name = "test_transactions.csv"
+test_owner = "test@example.com"
 
 # -------------------------- Helper Functions --------------------------
 
@@ -31,7 +34,7 @@ def create_test_file(content: str = test_file_content):
 
 def test_verify_token_valid():
     """Test token verification with valid token"""
-    with patch("routes.upload_file.upload_file.token_table") as mock_table:
+    with patch("routes.upload_file.upload_file.storage.tokens") as mock_table:
         # Configure mock for valid token
         mock_table.scan.return_value = {
             "Items": [
@@ -50,7 +53,7 @@ def test_verify_token_valid():
 
 def test_verify_token_expired():
     """Test token verification with expired token"""
-    with patch("routes.upload_file.upload_file.token_table") as mock_table:
+    with patch("routes.upload_file.upload_file.storage.tokens") as mock_table:
         # Configure mock for expired token
         mock_table.scan.return_value = {
             "Items": [
@@ -69,7 +72,7 @@ def test_verify_token_expired():
 
 def test_verify_token_not_found():
     """Test token verification with non-existent token"""
-    with patch("routes.upload_file.upload_file.token_table") as mock_table:
+    with patch("routes.upload_file.upload_file.storage.tokens") as mock_table:
         # Configure mock for non-existent token
         mock_table.scan.return_value = {"Items": []}
 
@@ -80,12 +83,13 @@ def test_verify_token_not_found():
 
 
 @pytest.mark.asyncio
-@patch("routes.upload_file.upload_file.verify_token")
+@pytest.mark.usefixtures("memory_storage")
+@patch("routes.upload_file.upload_file.token_owner")
 @patch("routes.upload_file.upload_file.s3_client")
 async def test_upload_file_success(mock_s3, mock_verify_token):
     """Test successful file upload"""
     # Configure mocks
-    mock_verify_token.return_value = True
+    mock_verify_token.return_value = test_owner
     mock_s3.put_object.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
 
     # Create test file
@@ -105,12 +109,12 @@ async def test_upload_file_success(mock_s3, mock_verify_token):
 
 
 @pytest.mark.asyncio
-@patch("routes.upload_file.upload_file.verify_token")
+@patch("routes.upload_file.upload_file.token_owner")
 @patch("routes.upload_file.upload_file.s3_client")
-async def test_upload_file_with_folder(mock_s3, mock_verify_token):
+async def test_upload_file_with_folder(mock_s3, mock_verify_token, memory_storage):
     """Test file upload with folder specification"""
     # Configure mocks
-    mock_verify_token.return_value = True
+    mock_verify_token.return_value = test_owner
     mock_s3.put_object.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
 
     # Create test file
@@ -124,6 +128,109 @@ async def test_upload_file_with_folder(mock_s3, mock_verify_token):
     # Verify response
     assert response.status_code == 200
     assert response.json()["s3_path"] == f"{test_folder}/{test_file_name}"
+    upload = memory_storage.get_ingestion(
+        f"stori-challenge-bucket/{test_folder}/{test_file_name}#owner"
+    )
+    assert upload["owner"] == test_owner
+
+
+@patch("routes.upload_file.upload_file.token_owner")
+@patch("routes.upload_file.upload_file.s3_client")
+def test_upload_file_idempotent_retry(mock_s3, mock_verify_token):
+    """A retry with the same Idempotency-Key does not upload again"""
+    mock_verify_token.return_value = test_owner
+    headers = {"Idempotency-Key": "upload-1"}
+
+    with patch("routes.upload_file.upload_file.storage", MemoryStorage()):
+        responses = [
+            client.post(
+                "/upload-file",
+                files={"file": (test_file_name, create_test_file(), "text/csv")},
+                headers=headers,
+            )
+            for _ in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[1].json() == responses[0].json()
+    assert responses[1].headers["idempotent-replayed"] == "true"
+    mock_s3.put_object.assert_called_once()
+
+
+@patch("routes.upload_file.upload_file.token_owner")
+@patch("routes.upload_file.upload_file.s3_client")
+def test_upload_file_deadline_keeps_idempotency_claim(mock_s3, mock_verify_token):
+    """A put that may still land after its deadline is not retried right away"""
+    mock_verify_token.return_value = test_owner
+    headers = {"Idempotency-Key": "upload-2"}
+    resilience = MagicMock()
+    resilience.call.side_effect = DeadlineExceeded("too slow")
+
+    with patch("routes.upload_file.upload_file.storage", MemoryStorage()), patch(
+        "routes.upload_file.upload_file.get_resilience", return_value=resilience
+    ):
+        responses = [
+            client.post(
+                "/upload-file",
+                files={"file": (test_file_name, create_test_file(), "text/csv")},
+                headers=headers,
+            )
+            for _ in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [503, 409]
+    resilience.call.assert_called_once()
+
+
+@patch("routes.upload_file.upload_file.token_owner")
+def test_upload_status(mock_verify_token):
+    """The processor's checkpoint is reported to the uploader, pending until it starts"""
+    mock_verify_token.return_value = test_owner
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    storage = MemoryStorage()
+    for s3_path, owner in [
+        ("folder/a.csv", test_owner),
+        ("b.csv", test_owner),
+        ("c.csv", "other@example.com"),
+    ]:
+        storage.save_ingestion(
+            {"file": f"stori-challenge-bucket/{s3_path}#owner", "owner": owner}
+        )
+    storage.save_ingestion(
+        {"file": "stori-challenge-bucket/c.csv", "status": "completed", "line": 3}
+    )
+    storage.save_ingestion(
+        {
+            "file": "stori-challenge-bucket/folder/a.csv",
+            "status": "processing",
+            "line": 10000,
+            "written": 9990,
+            "errors": 10,
+            "updated_at": "2024-01-01T00:00:00Z",
+        }
+    )
+
+    with patch("routes.upload_file.upload_file.storage", storage):
+        processing = client.get(
+            "/upload-file/status?s3_path=folder/a.csv", headers=headers
+        )
+        pending = client.get("/upload-file/status?s3_path=b.csv", headers=headers)
+        unauthorized = client.get("/upload-file/status?s3_path=b.csv")
+        # Another user's file and a file nobody uploaded look the same
+        others = client.get("/upload-file/status?s3_path=c.csv", headers=headers)
+        unknown = client.get("/upload-file/status?s3_path=d.csv", headers=headers)
+
+    assert processing.json() == {
+        "s3_path": "folder/a.csv",
+        "status": "processing",
+        "lines": 10000,
+        "successful": 9990,
+        "errors": 10,
+        "updated_at": "2024-01-01T00:00:00Z",
+    }
+    assert pending.json() == {"s3_path": "b.csv", "status": "pending"}
+    assert unauthorized.status_code == 401
+    assert [others.status_code, unknown.status_code] == [404, 404]
 
 
 @pytest.mark.asyncio
@@ -142,11 +249,11 @@ async def test_upload_empty_file():
 
 
 @pytest.mark.asyncio
-@patch("routes.upload_file.upload_file.verify_token")
+@patch("routes.upload_file.upload_file.token_owner")
 async def test_upload_file_invalid_token(mock_verify_token):
     """Test file upload with invalid token"""
     # Configure mock
-    mock_verify_token.return_value = False
+    mock_verify_token.return_value = None
 
     # Create test file
     test_file = create_test_file()
@@ -161,12 +268,13 @@ async def test_upload_file_invalid_token(mock_verify_token):
 
 
 @pytest.mark.asyncio
-@patch("routes.upload_file.upload_file.verify_token")
+@pytest.mark.usefixtures("memory_storage")
+@patch("routes.upload_file.upload_file.token_owner")
 @patch("routes.upload_file.upload_file.s3_client")
 async def test_upload_file_s3_error(mock_s3, mock_verify_token):
     """Test file upload with S3 error"""
     # Configure mocks
-    mock_verify_token.return_value = True
+    mock_verify_token.return_value = test_owner
     mock_s3.put_object.side_effect = ClientError(
         {"Error": {"Code": "InternalError", "Message": "S3 Internal Error"}},
         "PutObject",
@@ -188,7 +296,7 @@ async def test_upload_file_s3_error(mock_s3, mock_verify_token):
 
 
 @pytest.mark.integration
-@patch("routes.upload_file.upload_file.token_table")
+@patch("routes.upload_file.upload_file.storage.tokens")
 @patch("routes.upload_file.upload_file.s3_client")
 async def test_upload_file_full_flow(mock_s3, mock_token_table):
     """Test complete file upload flow"""
@@ -225,6 +333,13 @@ async def test_upload_file_full_flow(mock_s3, mock_token_table):
 # -------------------------- Test Fixtures --------------------------
 
 
+@pytest.fixture
+def memory_storage():
+    """Storage for the ownership records uploads save"""
+    with patch("routes.upload_file.upload_file.storage", MemoryStorage()) as storage:
+        yield storage
+
+
 @pytest.fixture
 def mock_s3_client():
     """Fixture for S3 client"""
@@ -236,6 +351,6 @@ def mock_s3_client():
 @pytest.fixture
 def mock_token_validator():
     """Fixture for token validation"""
-    with patch("routes.upload_file.upload_file.verify_token") as mock_verify:
-        mock_verify.return_value = True
+    with patch("routes.upload_file.upload_file.token_owner") as mock_verify:
+        mock_verify.return_value = test_owner
         yield mock_verify
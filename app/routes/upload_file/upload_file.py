@@ -1,51 +1,77 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Header, HTTPException
 import boto3
 from botocore.exceptions import ClientError
 import logging
 from typing import Optional
 from datetime import datetime
-from boto3.dynamodb.conditions import Attr
+from common.config import get_settings
+from common.idempotency import IdempotentRequest, InvalidIdempotencyKey
+from common.metrics import instrument_client
+from common.resilience import DependencyUnavailable, get_resilience
+from storage import get_storage
 
 router = APIRouter()
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # S3 Configuration
-s3_client = boto3.client("s3")
+s3_client = instrument_client(boto3.client("s3", config=get_settings().boto_config()))
 BUCKET_NAME = "stori-challenge-bucket"
 
-# DynamoDB Configuration
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-token_table = dynamodb.Table("tokens")
+# Storage Configuration
+storage = get_storage()
 
 
-def verify_token(token: str) -> bool:
+def _token_data(token: str) -> Optional[dict]:
     try:
-        response = token_table.scan(FilterExpression=Attr("token").eq(token))
+        token_data = storage.get_token(token)
 
-        if not response["Items"]:
+        if not token_data:
             logger.info("Token not found in database")
-            return False
+            return None
 
-        token_data = response["Items"][0]
         expiration = datetime.fromisoformat(token_data["expiration"])
 
         if expiration < datetime.utcnow():
             logger.info("Token has expired")
-            return False
+            return None
 
-        return True
+        return token_data
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
-        logger.error(f"Error verifying token: {str(e)}")
-        return False
+        logger.error("Error verifying token: %s", e)
+        return None
+
+
+def verify_token(token: str) -> bool:
+    return _token_data(token) is not None
+
+
+def token_owner(token: str) -> Optional[str]:
+    """Email of the user a valid token belongs to, None if it is not valid"""
+    token_data = _token_data(token)
+    return token_data["email"] if token_data else None
+
+
+def owner_key(s3_path: str) -> str:
+    """
+    file_ingestions key of the record naming who uploaded s3_path. It is kept
+    apart from the processor's record, which replaces the whole item.
+    """
+    return f"{BUCKET_NAME}/{s3_path}#owner"
 
 
 @router.post("/upload-file", tags=["File Upload"])
-async def upload_file(file: UploadFile = File(...), folder: Optional[str] = None):
+def upload_file(
+    file: UploadFile = File(...),
+    folder: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
+):
     try:
         # Read the first line (token)
-        content = await file.read()
+        content = file.file.read()
         content_str = content.decode("utf-8")
 
         # Split content into lines
@@ -56,38 +82,119 @@ async def upload_file(file: UploadFile = File(...), folder: Optional[str] = None
         token = lines[0].strip()
 
         # Verify token
-        if not verify_token(token):
+        owner = token_owner(token)
+        if owner is None:
             raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-        # Remove the token line and join the rest of the content
-        file_content = "\n".join(lines[1:]).encode("utf-8")
-
-        # Construct S3 path
-        s3_path = file.filename
-        if folder:
-            s3_path = f"{folder}/{file.filename}"
-
-        # Upload modified content to S3
-        s3_client.put_object(Bucket=BUCKET_NAME, Key=s3_path, Body=file_content)
+        # A retry with the same Idempotency-Key replays the first upload
+        try:
+            idempotency = IdempotentRequest(
+                storage,
+                idempotency_key,
+                "upload-file",
+                token,
+                f"{folder}/{file.filename}\n".encode("utf-8") + content,
+            )
+        except InvalidIdempotencyKey as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        replay = idempotency.start()
+        if replay is not None:
+            return replay
+
+        try:
+            # Remove the token line and join the rest of the content
+            file_content = "\n".join(lines[1:]).encode("utf-8")
+
+            # Construct S3 path
+            s3_path = file.filename
+            if folder:
+                s3_path = f"{folder}/{file.filename}"
+
+            # Only the uploader can read the file's ingestion status
+            storage.save_ingestion({"file": owner_key(s3_path), "owner": owner})
+
+            # Upload modified content to S3
+            get_resilience().call(
+                "s3",
+                "write",
+                lambda: s3_client.put_object(
+                    Bucket=BUCKET_NAME, Key=s3_path, Body=file_content
+                ),
+            )
+        except DependencyUnavailable:
+            # A put past its deadline keeps running and may still land, the
+            # claim answers retries with 409 until IN_PROGRESS_TTL instead
+            raise
+        except Exception:
+            idempotency.release()
+            raise
 
         logger.info(
-            f"File {file.filename} successfully uploaded to {BUCKET_NAME}/{s3_path}"
+            "File %s successfully uploaded to %s/%s",
+            file.filename,
+            BUCKET_NAME,
+            s3_path,
         )
 
-        return {
+        result = {
             "status": "success",
             "message": "File uploaded successfully",
             "file_name": file.filename,
             "s3_path": s3_path,
         }
+        idempotency.complete(result)
+        return result
 
     except HTTPException as e:
         raise e
     except ClientError as e:
-        logger.error(f"Error uploading file to S3: {str(e)}")
+        logger.error("Error uploading file to S3: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
     finally:
-        await file.close()
+        file.file.close()
+
+
+def serialize_ingestion(s3_path: str, record: Optional[dict]) -> dict:
+    if record is None:
+        # The processor has not picked the file up yet
+        return {"s3_path": s3_path, "status": "pending"}
+    return {
+        "s3_path": s3_path,
+        "status": record["status"],
+        "lines": int(record.get("line", 0)),
+        "successful": int(record.get("written", 0)),
+        "errors": int(record.get("errors", 0)),
+        "updated_at": record.get("updated_at"),
+    }
+
+
+@router.get("/upload-file/status", tags=["File Upload"])
+def upload_status(s3_path: str, authorization: Optional[str] = Header(None)):
+    """
+    Ingestion progress of a file the token's user uploaded, as checkpointed by
+    the processor. Files uploaded by someone else are not found.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(
+            status_code=401,
+            detail="Missing bearer token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    owner = token_owner(authorization[len("bearer ") :].strip())
+    if owner is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    try:
+        upload = storage.get_ingestion(owner_key(s3_path))
+        if upload is None or upload["owner"] != owner:
+            raise HTTPException(status_code=404, detail="File not found")
+        record = storage.get_ingestion(f"{BUCKET_NAME}/{s3_path}")
+    except (DependencyUnavailable, HTTPException):
+        raise
+    except Exception as e:
+        logger.error("Error reading ingestion status: %s", e)
+        raise HTTPException(status_code=500, detail="Error retrieving file status")
+    return serialize_ingestion(s3_path, record)
@@ -0,0 +1,34 @@
+"""
+Long-lived server mode: the same app as the Lambda handler, run by uvicorn.
+
+    python server.py            # SERVER_HOST, SERVER_PORT, SERVER_WORKERS, ...
+
+Each worker process builds the app with `main.create_app` and runs the
+lifespan once, so AWS client pools, the storage backend and the log listener
+live as long as the worker instead of one Lambda invocation. To run under
+gunicorn's process manager instead:
+
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8000 'main:create_app()'
+"""
+
+import uvicorn
+from common.config import get_settings
+
+
+def run():
+    settings = get_settings()
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=settings.server_host,
+        port=settings.server_port,
+        workers=settings.server_workers,
+        lifespan="on",
+        # Logging is configured by the app lifespan (common/log.py)
+        log_config=None,
+        access_log=settings.server_access_log,
+    )
+
+
+if __name__ == "__main__":
+    run()
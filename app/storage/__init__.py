@@ -0,0 +1,107 @@
+"""
+Pluggable storage for users, tokens, movements and rollups.
+
+The backend is chosen with STORAGE_BACKEND:
+
+- dynamodb: the AWS tables (default)
+- memory: process-local dicts, for tests and load tests
+- sqlite: a local SQLite file at STORAGE_SQLITE_PATH, for single-node deployments
+
+Route modules keep the process-wide instance from `get_storage()` in a
+module-level `storage`, the same way they used to keep their `Table` objects,
+so the app never closes it. `close_storage()` is for scripts and tests that
+are done with it.
+"""
+
+import threading
+from common.config import get_settings
+from .base import (
+    IDEMPOTENCY_TABLE_NAME,
+    INGESTIONS_TABLE_NAME,
+    MOVEMENTS_BY_DATE_INDEX,
+    MOVEMENTS_TABLE_NAME,
+    RATE_LIMITS_TABLE_NAME,
+    ROLLUP_FIELDS,
+    ROLLUPS_TABLE_NAME,
+    SHARDS_TABLE_NAME,
+    TOKENS_TABLE_NAME,
+    USERS_TABLE_NAME,
+    AlreadyExists,
+    Storage,
+    shard_keys,
+)
+from .batch import TransactionBatch
+
+BACKENDS = ("dynamodb", "memory", "sqlite")
+
+_storage = None
+_lock = threading.Lock()
+
+
+def create_storage(backend: str = None, **options) -> Storage:
+    """Build a new backend; options go to its constructor"""
+    settings = get_settings()
+    backend = backend or settings.storage_backend
+    if backend == "dynamodb":
+        from .dynamodb import DynamoStorage
+
+        storage = DynamoStorage(**options)
+    elif backend == "memory":
+        from .memory import MemoryStorage
+
+        storage = MemoryStorage(**options)
+    elif backend == "sqlite":
+        from .sqlite import SQLiteStorage
+
+        options.setdefault("path", settings.storage_sqlite_path)
+        storage = SQLiteStorage(**options)
+    else:
+        raise ValueError(
+            f"Unknown storage backend: {backend} (expected one of {BACKENDS})"
+        )
+    storage.sharding = settings.movement_sharding
+    if settings.cold_bucket and settings.cold_after_days:
+        from .cold import ColdStore
+
+        storage.cold = ColdStore.from_settings(settings)
+    return storage
+
+
+def get_storage() -> Storage:
+    """The process-wide backend selected by STORAGE_BACKEND"""
+    global _storage
+    with _lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+
+def close_storage():
+    """Close the process-wide backend, the next `get_storage()` opens a new one"""
+    global _storage
+    with _lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
+
+
+__all__ = [
+    "AlreadyExists",
+    "BACKENDS",
+    "IDEMPOTENCY_TABLE_NAME",
+    "INGESTIONS_TABLE_NAME",
+    "MOVEMENTS_BY_DATE_INDEX",
+    "MOVEMENTS_TABLE_NAME",
+    "RATE_LIMITS_TABLE_NAME",
+    "ROLLUP_FIELDS",
+    "ROLLUPS_TABLE_NAME",
+    "SHARDS_TABLE_NAME",
+    "Storage",
+    "TOKENS_TABLE_NAME",
+    "TransactionBatch",
+    "USERS_TABLE_NAME",
+    "close_storage",
+    "create_storage",
+    "get_storage",
+    "shard_keys",
+]
@@ -0,0 +1,370 @@
+"""
+Storage interface for the API's data: users, tokens, movements and rollups.
+
+Items keep the DynamoDB shapes the routes already use (amounts and rollup
+fields are Decimal, dates are "YYYY-MM-DD" strings), so every backend is a
+drop-in replacement for the others. Movement pages are ordered by Date, ties
+in each backend's own order, and resumed from an opaque `start_key` dict that
+always carries "UserId".
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Iterable, Optional
+import contextvars
+import heapq
+from .batch import TransactionBatch
+
+USERS_TABLE_NAME = "users"
+TOKENS_TABLE_NAME = "tokens"
+MOVEMENTS_TABLE_NAME = "movements"
+ROLLUPS_TABLE_NAME = "movement_rollups"
+# Hash key "key", DynamoDB TTL on "expires_at"
+IDEMPOTENCY_TABLE_NAME = "idempotency_keys"
+# Hash key "key", DynamoDB TTL on "expires_at"
+RATE_LIMITS_TABLE_NAME = "rate_limits"
+# Hash key "file" ("bucket/key"), written by the file processor
+INGESTIONS_TABLE_NAME = "file_ingestions"
+# Hash key "UserId", "shards" is how many write shards the file processor
+# spreads the user's new movements over, see `shard_keys`
+SHARDS_TABLE_NAME = "movement_shards"
+# GSI with UserId as partition key and Date as sort key
+MOVEMENTS_BY_DATE_INDEX = "UserId-Date-index"
+
+# Rollup items are keyed by (UserId, Bucket), see routes/get_summary/rollups.py
+ROLLUP_FIELDS = (
+    "tx_count",
+    "balance",
+    "credit_count",
+    "credit_total",
+    "debit_count",
+    "debit_total",
+)
+
+MIN_DATE = "0000-01-01"
+MAX_DATE = "9999-12-31"
+
+
+class AlreadyExists(ValueError):
+    """Raised when creating an item whose unique attribute is taken"""
+
+
+def shard_keys(user_id: str, shards: int) -> list:
+    """
+    UserId values a user's movements are stored under: the user id itself,
+    where every movement written before the user was sharded stays, and
+    "UserId#0" to "UserId#<shards - 1>".
+    """
+    return [user_id] + [f"{user_id}#{shard}" for shard in range(shards)]
+
+
+def scatter(fn, keys: list) -> list:
+    """fn(key) for every key on its own thread, results in the order of keys"""
+    if len(keys) == 1:
+        return [fn(keys[0])]
+    with ThreadPoolExecutor(max_workers=len(keys)) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, fn, key) for key in keys
+        ]
+        return [future.result() for future in futures]
+
+
+class Storage(ABC):
+    name = "base"
+    # MOVEMENT_SHARDING, set by create_storage. Off, reads never look at the
+    # shard map and a user's movements are one partition.
+    sharding = False
+    # storage.cold.ColdStore when COLD_BUCKET and COLD_AFTER_DAYS are set
+    cold = None
+
+    # -------------------------- users --------------------------
+
+    @abstractmethod
+    def create_user(self, user: dict):
+        """Insert a new user, raises AlreadyExists if the email is taken"""
+
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        pass
+
+    # -------------------------- tokens --------------------------
+
+    @abstractmethod
+    def save_token(self, token: dict):
+        """Store the session token of token["email"], replacing the previous one"""
+
+    @abstractmethod
+    def get_token(self, token: str) -> Optional[dict]:
+        pass
+
+    # -------------------------- movements --------------------------
+
+    @abstractmethod
+    def put_movements(self, movements: Iterable[dict]):
+        """Insert or replace movements by id"""
+
+    @abstractmethod
+    def insert_movements(self, movements: Iterable[dict]) -> list:
+        """
+        Insert the movements whose id is not stored yet and return them. Ids
+        already present are left untouched, so re-processing a file does not
+        count its movements twice.
+        """
+
+    @abstractmethod
+    def taken_movement_ids(self, ids: list) -> set:
+        """The ids in `ids` that are stored, as movements or archive markers"""
+
+    @abstractmethod
+    def query_partition(
+        self,
+        user_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None,
+        ascending: bool = True,
+    ) -> tuple:
+        """
+        One page of the movements stored with UserId == user_id, a user or
+        one of its `shard_keys`, with start <= Date <= end, ordered by Date.
+        Returns (items, last_key); last_key is None on the last page.
+        """
+
+    def movement_keys(self, user_id: str) -> list:
+        """Partitions to read for a user's movements, see `shard_keys`"""
+        if not self.sharding:
+            return [user_id]
+        return shard_keys(user_id, self.get_shard_count(user_id))
+
+    def query_movements(
+        self,
+        user_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None,
+        ascending: bool = True,
+    ) -> tuple:
+        """
+        One page of a user's movements with start <= Date <= end, ordered by
+        Date. Returns (items, last_key); last_key is None on the last page.
+        """
+        keys = self.movement_keys(user_id)
+        if self.cold is not None and self.cold.covers(start):
+            # None stands for the user's cold files
+            keys.append(None)
+        if len(keys) == 1 and not (start_key and "partitions" in start_key):
+            return self.query_partition(
+                user_id, start, end, limit, start_key, ascending
+            )
+
+        # The cursor keeps every unfinished partition's own key, [key, None]
+        # while it has not started; a partition missing from it is finished
+        if start_key and "partitions" in start_key:
+            cursors = [
+                (key, cursor) for key, cursor in start_key["partitions"] if key in keys
+            ]
+        else:
+            # A single partition key, resumed by every partition
+            cursors = [
+                (key, {**start_key, "UserId": key or user_id} if start_key else None)
+                for key in keys
+            ]
+
+        def page(entry):
+            key, cursor = entry
+            if key is None:
+                return self.cold.query(user_id, start, end, limit, cursor, ascending)
+            return self.query_partition(key, start, end, limit, cursor, ascending)
+
+        # Pages are merged by Date only, the one order the UserId-Date index
+        # guarantees. Each partition keeps its own order within a Date, so the
+        # rows taken from it are a prefix its key resumes after, and ties
+        # across partitions go in partition order. Dates are only complete up
+        # to the last one a partition with more has read.
+        pages = scatter(page, cursors) if cursors else []
+        dates = [
+            partition_last["Date"] for _, partition_last in pages if partition_last
+        ]
+        bound = (min(dates) if ascending else max(dates)) if dates else None
+        merged = heapq.merge(
+            *(
+                [(index, item) for item in partition_items]
+                for index, (partition_items, _) in enumerate(pages)
+            ),
+            key=lambda entry: entry[1]["Date"],
+            reverse=not ascending,
+        )
+
+        items, seen, taken = [], set(), [0] * len(pages)
+        for index, item in merged:
+            if limit and len(items) == limit:
+                break
+            if bound is not None and (
+                item["Date"] > bound if ascending else item["Date"] < bound
+            ):
+                break
+            taken[index] += 1
+            # A movement still hot while its cold file is written is read twice
+            if item["id"] in seen:
+                continue
+            seen.add(item["id"])
+            items.append(item)
+
+        partitions = []
+        for (key, cursor), (partition_items, partition_last), count in zip(
+            cursors, pages, taken
+        ):
+            if count == len(partition_items):
+                if partition_last is None:
+                    continue
+                cursor = partition_last
+            elif count:
+                last = partition_items[count - 1]
+                cursor = {
+                    "id": last["id"],
+                    "UserId": key or user_id,
+                    "Date": last["Date"],
+                }
+            partitions.append([key, cursor])
+        for item in items:
+            item["UserId"] = user_id
+
+        last_key = None
+        if partitions:
+            last_key = {"UserId": user_id, "partitions": partitions}
+        return items, last_key
+
+    def get_movements(self, user_id: str, start: str, end: str) -> list:
+        """Every movement of a user with start <= Date <= end"""
+
+        def partition(key):
+            if key is None:
+                return self.cold.read(user_id, start, end)
+            movements = []
+            start_key = None
+            while True:
+                items, start_key = self.query_partition(
+                    key, start, end, start_key=start_key
+                )
+                movements.extend(items)
+                if not start_key:
+                    return movements
+
+        keys = self.movement_keys(user_id)
+        if self.cold is not None and self.cold.covers(start):
+            keys.append(None)
+        movements = {}
+        for items in scatter(partition, keys):
+            for movement in items:
+                movements.setdefault(movement["id"], movement)
+        for movement in movements.values():
+            movement["UserId"] = user_id
+        return list(movements.values())
+
+    def get_movement_batch(
+        self, user_id: str, start: str, end: str
+    ) -> TransactionBatch:
+        """get_movements as a columnar TransactionBatch"""
+        return TransactionBatch.from_items(self.get_movements(user_id, start, end))
+
+    # -------------------------- shard map --------------------------
+
+    @abstractmethod
+    def get_shard_count(self, user_id: str) -> int:
+        """Write shards of a user, 0 when the user is not sharded"""
+
+    @abstractmethod
+    def set_shard_count(self, user_id: str, shards: int) -> int:
+        """
+        Raise a user's shard count to `shards` and return the stored count.
+        It never goes down: movements already written to a shard must stay
+        readable.
+        """
+
+    # -------------------------- cold tier --------------------------
+
+    def cold_listing(self, user_id: str):
+        """
+        Context in which the user's cold files are listed once, for reads
+        made of many query_movements pages
+        """
+        if self.cold is None:
+            return nullcontext()
+        return self.cold.listed(user_id)
+
+    @abstractmethod
+    def scan_movements(self, before: str, start_key: Optional[dict] = None) -> tuple:
+        """
+        One page of every user's movements with Date < before, in any order,
+        for storage.cold.compact. Returns (items, last_key) like query_partition.
+        """
+
+    @abstractmethod
+    def archive_movements(self, ids: list):
+        """
+        Replace movements with id-only markers once they are in the cold tier:
+        reads skip them, insert_movements still treats their ids as taken.
+        """
+
+    # -------------------------- rollups --------------------------
+
+    @abstractmethod
+    def get_rollups(self, user_id: str, buckets: list) -> dict:
+        """{bucket: rollup item} for the buckets that exist"""
+
+    @abstractmethod
+    def add_to_rollups(self, user_id: str, rollups: dict):
+        """Atomically add {bucket: {field: Decimal}} deltas to the stored rollups"""
+
+    # -------------------------- idempotency keys --------------------------
+
+    @abstractmethod
+    def claim_idempotency_key(self, record: dict, now: int) -> Optional[dict]:
+        """
+        Insert record (with "key" and "expires_at", epoch seconds) unless a
+        record with the same key that expires after `now` exists. Returns None
+        when the key was claimed, otherwise the live record.
+        """
+
+    @abstractmethod
+    def save_idempotency_record(self, record: dict):
+        """Replace the record of record["key"]"""
+
+    @abstractmethod
+    def delete_idempotency_key(self, key: str):
+        pass
+
+    # -------------------------- file ingestions --------------------------
+
+    @abstractmethod
+    def get_ingestion(self, file: str) -> Optional[dict]:
+        """Processing state of the uploaded object "bucket/key", if any"""
+
+    @abstractmethod
+    def save_ingestion(self, record: dict):
+        """Replace the state of record["file"]"""
+
+    @abstractmethod
+    def apply_pending_rollups(self, file: str) -> bool:
+        """
+        Add the "rollups" of the record saved under `file`, rollup items with
+        UserId, Bucket and ROLLUP_FIELDS deltas, and delete the record in one
+        atomic step. Returns False when there is no record, e.g. it was
+        already applied.
+        """
+
+    # -------------------------- rate limits --------------------------
+
+    @abstractmethod
+    def consume_quota(self, key: str, limit: int, expires_at: int) -> bool:
+        """
+        Atomically count one request against `key` unless `limit` requests
+        were already counted. Returns whether this one was counted. The
+        counter may be dropped after `expires_at` (epoch seconds).
+        """
+
+    def close(self):
+        pass
@@ -0,0 +1,110 @@
+"""
+Columnar movement batches for in-memory processing.
+
+A `TransactionBatch` keeps one user's movements in three typed arrays instead
+of a dict of Decimal and str per row: amounts as int64 cents, dates as uint32
+day ordinals (`date.toordinal()`) and users as indexes into a list of
+interned ids. Rows cost 16 bytes instead of about 1 KB of dicts and boxed
+values, and sums and counts are plain integer arithmetic.
+
+`from_wire` builds a batch straight from the low-level DynamoDB client's
+response items ({"amount": {"N": "12.50"}, ...}), skipping the resource
+layer's TypeDeserializer and its Decimal per number. `from_items` converts the
+storage backends' usual dict rows.
+"""
+
+from array import array
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, Iterator
+
+
+def parse_cents(text) -> int:
+    """Parse "-12.5" (or a Decimal or float amount) into -1250"""
+    # Exact on the decimal digits, sub-cent digits round half away from zero
+    # like amountCents in core/process_file ("1.005" is 101, "-0.125" is -13)
+    return int(Decimal(str(text)).scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+
+class TransactionBatch:
+    __slots__ = ("user_ids", "users", "days", "cents", "_user_index", "_day_index")
+
+    def __init__(self):
+        self.user_ids = []
+        self.users = array("I")
+        self.days = array("I")
+        self.cents = array("q")
+        self._user_index = {}
+        # "YYYY-MM-DD" -> ordinal, a user's rows share few distinct dates
+        self._day_index = {}
+
+    def __len__(self) -> int:
+        return len(self.cents)
+
+    def _intern(self, user_id: str) -> int:
+        user = self._user_index[user_id] = len(self.user_ids)
+        self.user_ids.append(user_id)
+        return user
+
+    def _ordinal(self, day: str) -> int:
+        ordinal = self._day_index[day] = date.fromisoformat(day).toordinal()
+        return ordinal
+
+    def append(self, user_id: str, day: str, cents: int):
+        user = self._user_index.get(user_id)
+        ordinal = self._day_index.get(day)
+        self.users.append(self._intern(user_id) if user is None else user)
+        self.days.append(self._ordinal(day) if ordinal is None else ordinal)
+        self.cents.append(cents)
+
+    def extend_wire(self, items: Iterable[dict], user_id: str = None):
+        """
+        Append low-level client items with UserId, Date and amount, or only
+        Date and amount when they all belong to `user_id`
+        """
+        # append() inlined, this loop runs once per scanned movement
+        user_index, day_index = self._user_index, self._day_index
+        users, days, cents = self.users.append, self.days.append, self.cents.append
+        owner = user_id
+        for item in items:
+            user_id = owner or item["UserId"]["S"]
+            day = item["Date"]["S"]
+            user = user_index.get(user_id)
+            ordinal = day_index.get(day)
+            users(self._intern(user_id) if user is None else user)
+            days(self._ordinal(day) if ordinal is None else ordinal)
+            cents(parse_cents(item["amount"]["N"]))
+
+    @classmethod
+    def from_wire(cls, items: Iterable[dict]) -> "TransactionBatch":
+        batch = cls()
+        batch.extend_wire(items)
+        return batch
+
+    @classmethod
+    def from_items(cls, items: Iterable[dict]) -> "TransactionBatch":
+        """From storage rows, amounts as Decimal, float or str"""
+        batch = cls()
+        for item in items:
+            batch.append(item["UserId"], item["Date"], parse_cents(item["amount"]))
+        return batch
+
+    def rows(self) -> Iterator[tuple]:
+        """(user_id, "YYYY-MM-DD", Decimal amount) per movement, for logs and tests"""
+        for user, day, cents in zip(self.users, self.days, self.cents):
+            yield (
+                self.user_ids[user],
+                date.fromordinal(day).isoformat(),
+                Decimal(cents).scaleb(-2),
+            )
+
+    def month_counts(self) -> dict:
+        """Movements per "YYYY-MM", in order of first appearance"""
+        counts = {}
+        for day in self.days:
+            counts[day] = counts.get(day, 0) + 1
+        months = {}
+        for day, count in counts.items():
+            month = date.fromordinal(day).strftime("%Y-%m")
+            months[month] = months.get(month, 0) + count
+        return months
@@ -0,0 +1,410 @@
+"""
+Cold tier for old movements: zstd compressed Arrow IPC files in S3, one per
+user and month. Each file is decompressed once into a local cache and read
+memory-mapped from there without copying.
+
+`compact` moves the movements dated before the cold boundary (today minus
+COLD_AFTER_DAYS) to s3://COLD_BUCKET/movements/<UserId>/<YYYY-MM>.arrow and
+leaves an id-only marker in the movements table (`archive_movements`), so a
+re-ingested statement still finds its ids taken. Storage reads whose range
+starts before the boundary add the rows of the files that overlap it, see
+Storage.query_movements. Rollups are not touched: they already count every
+movement, hot or cold.
+
+    cd app && python -m storage.cold
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import groupby
+from typing import Optional
+import argparse
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import pyarrow as pa
+import pyarrow.compute as pc
+from common.resilience import guarded
+from .base import MAX_DATE, MIN_DATE, Storage
+from .batch import parse_cents
+
+logger = logging.getLogger()
+
+PREFIX = "movements"
+# Amounts as integer cents, like TransactionBatch, so sums are exact
+SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("Date", pa.date32()),
+        ("cents", pa.int64()),
+        ("processed", pa.string()),
+    ]
+)
+_WRITE_OPTIONS = pa.ipc.IpcWriteOptions(compression="zstd")
+# Movements compact holds before spilling them to its local files
+COMPACT_BATCH = 100_000
+
+
+def _day(text: str) -> date:
+    # MIN_DATE's year 0 is not a valid date
+    return date.fromisoformat(max(text, "0001-01-01"))
+
+
+def _position(item: dict) -> tuple:
+    return item["Date"], item["id"]
+
+
+@dataclass
+class CompactionResult:
+    movements: int = 0
+    files: int = 0
+
+
+class ColdStore:
+    def __init__(self, s3, bucket: str, cache_dir: str, after_days: int):
+        self.s3 = s3
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.after_days = after_days
+        # user_id -> [open listed() blocks, months or None]
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "ColdStore":
+        import boto3
+        from common.metrics import instrument_client
+
+        s3 = instrument_client(boto3.client("s3", config=settings.boto_config()))
+        return cls(
+            s3, settings.cold_bucket, settings.cold_cache_dir, settings.cold_after_days
+        )
+
+    def boundary(self) -> str:
+        """Movements dated before this day may be in the cold tier"""
+        return (date.today() - timedelta(days=self.after_days)).isoformat()
+
+    def covers(self, start: Optional[str]) -> bool:
+        return (start or MIN_DATE) < self.boundary()
+
+    def key(self, user_id: str, month: str) -> str:
+        return f"{PREFIX}/{user_id}/{month}.arrow"
+
+    # -------------------------- reads --------------------------
+
+    @contextmanager
+    def listed(self, user_id: str):
+        """
+        Within the block the user's files are listed once, for reads and
+        exports made of many pages
+        """
+        with self._lock:
+            listing = self._listings.setdefault(user_id, [0, None])
+            listing[0] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                listing[0] -= 1
+                if not listing[0]:
+                    del self._listings[user_id]
+
+    def months(self, user_id: str) -> dict:
+        """{"YYYY-MM": ETag} of the user's files"""
+        listing = self._listings.get(user_id)
+        if listing is None:
+            return self._list(user_id)
+        if listing[1] is None:
+            listing[1] = self._list(user_id)
+        return listing[1]
+
+    @guarded("s3", "read")
+    def _list(self, user_id: str) -> dict:
+        prefix = f"{PREFIX}/{user_id}/"
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix}
+        months = {}
+        while True:
+            response = self.s3.list_objects_v2(**kwargs)
+            for entry in response.get("Contents", []):
+                name = entry["Key"][len(prefix) :]
+                if name.endswith(".arrow"):
+                    months[name[: -len(".arrow")]] = entry["ETag"].strip('"')
+            if not response.get("IsTruncated"):
+                return months
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    @guarded("s3", "read")
+    def _download(self, key: str, path: str):
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        table = pa.ipc.open_file(pa.BufferReader(body)).read_all()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.part"
+        # Cached uncompressed, so reading the mapped file copies nothing
+        with pa.OSFile(partial, "wb") as sink:
+            with pa.ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(partial, path)
+
+    def open(self, user_id: str, month: str, etag: str) -> pa.Table:
+        """
+        The month's table, memory-mapped from the cache. Cached files are
+        named after the object's ETag, so a rewritten month is downloaded again.
+        """
+        key = self.key(user_id, month)
+        path = os.path.join(self.cache_dir, f"{key}.{etag}")
+        if not os.path.exists(path):
+            self._download(key, path)
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def read(self, user_id: str, start: str = None, end: str = None) -> list:
+        """The user's cold movements with start <= Date <= end, as storage items"""
+        start, end = start or MIN_DATE, end or MAX_DATE
+        items = []
+        for month, etag in sorted(self.months(user_id).items()):
+            if not start[:7] <= month <= end[:7]:
+                continue
+            table = self.open(user_id, month, etag)
+            days = table["Date"]
+            table = table.filter(
+                pc.and_(
+                    pc.greater_equal(days, pa.scalar(_day(start), pa.date32())),
+                    pc.less_equal(days, pa.scalar(_day(end), pa.date32())),
+                )
+            )
+            items.extend(self._items(user_id, table))
+        return items
+
+    @staticmethod
+    def _items(user_id: str, table: pa.Table) -> list:
+        items = []
+        for movement_id, day, cents, processed in zip(
+            *(table[name].to_pylist() for name in SCHEMA.names)
+        ):
+            item = {
+                "id": movement_id,
+                "UserId": user_id,
+                "Date": day.isoformat(),
+                "amount": Decimal(cents).scaleb(-2),
+            }
+            if processed is not None:
+                item["processed"] = processed
+            items.append(item)
+        return items
+
+    def query(
+        self,
+        user_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None,
+        ascending: bool = True,
+    ) -> tuple:
+        """
+        One page of the user's cold movements, like Storage.query_partition.
+        Files are sorted by (Date, id), so a page slices the months after the
+        cursor and only converts the rows it returns.
+        """
+        start, end = start or MIN_DATE, end or MAX_DATE
+        if start_key:
+            if ascending:
+                start = max(start, start_key["Date"])
+            else:
+                end = min(end, start_key["Date"])
+        months = sorted(self.months(user_id).items(), reverse=not ascending)
+        items = []
+        for month, etag in months:
+            if not start[:7] <= month <= end[:7]:
+                continue
+            table = self._window(
+                self.open(user_id, month, etag), start, end, start_key, ascending
+            )
+            if limit:
+                # One more row than the page tells whether there is another
+                wanted = limit + 1 - len(items)
+                if ascending:
+                    table = table.slice(0, wanted)
+                else:
+                    table = table.slice(max(table.num_rows - wanted, 0))
+            rows = self._items(user_id, table)
+            items.extend(rows if ascending else reversed(rows))
+            if limit and len(items) > limit:
+                items = items[:limit]
+                last = items[-1]
+                return items, {
+                    "id": last["id"],
+                    "UserId": user_id,
+                    "Date": last["Date"],
+                }
+        return items, None
+
+    @staticmethod
+    def _window(
+        table: pa.Table,
+        start: str,
+        end: str,
+        start_key: Optional[dict],
+        ascending: bool,
+    ) -> pa.Table:
+        """The rows with start <= Date <= end past the cursor, in file order"""
+        days = table["Date"]
+        mask = pc.and_(
+            pc.greater_equal(days, pa.scalar(_day(start), pa.date32())),
+            pc.less_equal(days, pa.scalar(_day(end), pa.date32())),
+        )
+        if start_key:
+            day = pa.scalar(_day(start_key["Date"]), pa.date32())
+            after = pc.greater if ascending else pc.less
+            mask = pc.and_(
+                mask,
+                pc.or_(
+                    after(days, day),
+                    pc.and_(pc.equal(days, day), after(table["id"], start_key["id"])),
+                ),
+            )
+        return table.filter(mask)
+
+    # -------------------------- writes --------------------------
+
+    @guarded("s3", "write")
+    def _upload(self, key: str, body: bytes):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+
+    def write_months(self, user_id: str, months: dict) -> int:
+        """
+        Merge {"YYYY-MM": [movement]} into the user's files by id and upload
+        them. Returns how many files were written.
+        """
+        existing = self.months(user_id)
+        for month, movements in months.items():
+            self.write_month(user_id, month, movements, existing.get(month))
+        return len(months)
+
+    def write_month(
+        self, user_id: str, month: str, movements: list, etag: Optional[str]
+    ):
+        """Merge movements by id into the month's file, `etag` when it exists"""
+        rows = {}
+        if etag is not None:
+            for item in self._items(user_id, self.open(user_id, month, etag)):
+                rows[item["id"]] = item
+        for movement in movements:
+            rows[movement["id"]] = movement
+        ordered = sorted(rows.values(), key=_position)
+        table = pa.table(
+            {
+                "id": [item["id"] for item in ordered],
+                "Date": [date.fromisoformat(item["Date"]) for item in ordered],
+                "cents": [parse_cents(item["amount"]) for item in ordered],
+                "processed": [item.get("processed") for item in ordered],
+            },
+            schema=SCHEMA,
+        )
+        sink = io.BytesIO()
+        with pa.ipc.new_file(sink, SCHEMA, options=_WRITE_OPTIONS) as writer:
+            writer.write_table(table)
+        self._upload(self.key(user_id, month), sink.getvalue())
+
+
+def compact(
+    storage: Storage,
+    cold: ColdStore,
+    before: str = None,
+    batch_size: int = COMPACT_BATCH,
+) -> CompactionResult:
+    """
+    Move every movement dated before `before` (default the cold boundary)
+    to the cold tier. The scan spills the rows to one local file per user and
+    month whenever `batch_size` are held, then each month is merged, uploaded
+    and archived once. Files are written before the rows are archived: if the
+    job dies in between, reads drop the duplicates by id and the next run
+    merges the same rows into the same files.
+    """
+    before = before or cold.boundary()
+    if before > cold.boundary():
+        raise ValueError(f"{before} is after the cold boundary {cold.boundary()}")
+
+    result = CompactionResult()
+    spilled = {}
+    with tempfile.TemporaryDirectory(prefix="compact-") as directory:
+        held, pending, start_key = 0, defaultdict(list), None
+        while True:
+            items, start_key = storage.scan_movements(before, start_key)
+            for movement in items:
+                # Rows of a sharded user are stored under "UserId#n"
+                owner = movement["UserId"].split("#", 1)[0]
+                pending[owner, movement["Date"][:7]].append(movement)
+            held += len(items)
+            if held >= batch_size or not start_key:
+                _spill(directory, spilled, pending)
+                held, pending = 0, defaultdict(list)
+            if not start_key:
+                break
+        for user_id, keys in groupby(sorted(spilled), key=lambda key: key[0]):
+            months = [(month, spilled[user_id, month]) for _, month in keys]
+            _archive(storage, cold, user_id, months, result)
+    return result
+
+
+def _spill(directory: str, spilled: dict, pending: dict):
+    """Append {(user_id, month): [movement]} to their files in `directory`"""
+    for key, movements in pending.items():
+        if key not in spilled:
+            spilled[key] = os.path.join(directory, f"{len(spilled)}.jsonl")
+        with open(spilled[key], "a", encoding="utf-8") as file:
+            for movement in movements:
+                file.write(json.dumps(movement, default=str) + "\n")
+
+
+def _archive(
+    storage: Storage,
+    cold: ColdStore,
+    user_id: str,
+    months: list,
+    result: CompactionResult,
+):
+    """Write the user's spilled (month, path) files to the cold tier, then archive"""
+    existing = cold.months(user_id)
+    archived = 0
+    for month, path in months:
+        with open(path, encoding="utf-8") as file:
+            movements = [json.loads(line) for line in file]
+        cold.write_month(user_id, month, movements, existing.get(month))
+        storage.archive_movements([movement["id"] for movement in movements])
+        archived += len(movements)
+    result.files += len(months)
+    result.movements += archived
+    logger.info(
+        "🧊 Compacted %d movements of %s into %d files",
+        archived,
+        user_id,
+        len(months),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--before", help="YYYY-MM-DD, defaults to today minus COLD_AFTER_DAYS"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from storage import get_storage
+
+    storage = get_storage()
+    if storage.cold is None:
+        parser.error("set COLD_BUCKET and COLD_AFTER_DAYS")
+    result = compact(storage, storage.cold, args.before)
+    print(f"{result.movements} movements compacted into {result.files} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""DynamoDB backend, the production storage (boto3 resource API)"""
+
+from decimal import Decimal
+from typing import Iterable, Optional
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from common.config import get_settings
+from common.metrics import instrument_client
+from common.resilience import guarded
+from .base import (
+    IDEMPOTENCY_TABLE_NAME,
+    INGESTIONS_TABLE_NAME,
+    MOVEMENTS_BY_DATE_INDEX,
+    MOVEMENTS_TABLE_NAME,
+    RATE_LIMITS_TABLE_NAME,
+    ROLLUP_FIELDS,
+    ROLLUPS_TABLE_NAME,
+    SHARDS_TABLE_NAME,
+    TOKENS_TABLE_NAME,
+    USERS_TABLE_NAME,
+    AlreadyExists,
+    Storage,
+    scatter,
+)
+from .batch import TransactionBatch
+
+BATCH_GET_LIMIT = 100  # DynamoDB BatchGetItem max keys per request
+
+# ADD every rollup field, e.g. "ADD #tx_count :tx_count, #balance :balance, ..."
+_ROLLUP_UPDATE = "ADD " + ", ".join(f"#{field} :{field}" for field in ROLLUP_FIELDS)
+_ROLLUP_NAMES = {f"#{field}": field for field in ROLLUP_FIELDS}
+
+
+class DynamoStorage(Storage):
+    """
+    Every method runs through common.resilience: a deadline per kind of call,
+    hedged lookups and the "dynamodb" circuit breaker.
+    """
+
+    name = "dynamodb"
+
+    def __init__(self, resource=None):
+        if resource is None:
+            settings = get_settings()
+            resource = boto3.resource(
+                "dynamodb",
+                region_name=settings.aws_region,
+                config=settings.boto_config(),
+            )
+            instrument_client(resource.meta.client)
+        self.resource = resource
+        # Low-level client for bulk reads that skip the resource's deserializer
+        self.client = resource.meta.client
+        self.users = resource.Table(USERS_TABLE_NAME)
+        self.tokens = resource.Table(TOKENS_TABLE_NAME)
+        self.movements = resource.Table(MOVEMENTS_TABLE_NAME)
+        self.rollups = resource.Table(ROLLUPS_TABLE_NAME)
+        self.idempotency = resource.Table(IDEMPOTENCY_TABLE_NAME)
+        self.rate_limits = resource.Table(RATE_LIMITS_TABLE_NAME)
+        self.ingestions = resource.Table(INGESTIONS_TABLE_NAME)
+        self.shards = resource.Table(SHARDS_TABLE_NAME)
+
+    # -------------------------- users --------------------------
+
+    @guarded("dynamodb", "write")
+    def create_user(self, user: dict):
+        try:
+            self.users.put_item(
+                Item=user, ConditionExpression="attribute_not_exists(email)"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise AlreadyExists(f"Email {user['email']} already exists")
+            raise
+
+    # Full-table scans are not hedged, a second scan doubles the read cost
+    @guarded("dynamodb", "read")
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        # Use a scan because the index have cost. (not for production)
+        response = self.users.scan(FilterExpression=Attr("email").eq(email))
+        return response["Items"][0] if response["Items"] else None
+
+    # -------------------------- tokens --------------------------
+
+    @guarded("dynamodb", "write")
+    def save_token(self, token: dict):
+        self.tokens.put_item(Item=token)
+
+    @guarded("dynamodb", "read")
+    def get_token(self, token: str) -> Optional[dict]:
+        response = self.tokens.scan(FilterExpression=Attr("token").eq(token))
+        return response["Items"][0] if response["Items"] else None
+
+    # -------------------------- movements --------------------------
+
+    @guarded("dynamodb", "bulk")
+    def put_movements(self, movements: Iterable[dict]):
+        with self.movements.batch_writer() as batch:
+            for movement in movements:
+                batch.put_item(Item=movement)
+
+    @guarded("dynamodb", "bulk")
+    def insert_movements(self, movements: Iterable[dict]) -> list:
+        # One conditional put per movement, like the Lambda's transactions
+        inserted = []
+        for movement in movements:
+            try:
+                self.movements.put_item(
+                    Item=movement, ConditionExpression="attribute_not_exists(id)"
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                    continue
+                raise
+            inserted.append(movement)
+        return inserted
+
+    @guarded("dynamodb", "read")
+    def taken_movement_ids(self, ids: list) -> set:
+        taken = set()
+        for i in range(0, len(ids), BATCH_GET_LIMIT):
+            request = {
+                MOVEMENTS_TABLE_NAME: {
+                    "Keys": [
+                        {"id": movement_id}
+                        for movement_id in ids[i : i + BATCH_GET_LIMIT]
+                    ],
+                    "ProjectionExpression": "id",
+                }
+            }
+            while request:
+                response = self.resource.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(MOVEMENTS_TABLE_NAME, []):
+                    taken.add(item["id"])
+                request = response.get("UnprocessedKeys") or None
+        return taken
+
+    @guarded("dynamodb", "read", hedge=True)
+    def query_partition(
+        self,
+        user_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None,
+        ascending: bool = True,
+    ) -> tuple:
+        key_condition = Key("UserId").eq(user_id)
+        if start and end:
+            key_condition &= Key("Date").between(start, end)
+        elif start:
+            key_condition &= Key("Date").gte(start)
+        elif end:
+            key_condition &= Key("Date").lte(end)
+
+        query_kwargs = {
+            "IndexName": MOVEMENTS_BY_DATE_INDEX,
+            "KeyConditionExpression": key_condition,
+            "ScanIndexForward": ascending,
+        }
+        if limit:
+            query_kwargs["Limit"] = limit
+        if start_key:
+            query_kwargs["ExclusiveStartKey"] = start_key
+        response = self.movements.query(**query_kwargs)
+        return response["Items"], response.get("LastEvaluatedKey")
+
+    def _cold_range(self, start: str) -> bool:
+        return self.cold is not None and self.cold.covers(start)
+
+    def get_movements(self, user_id: str, start: str, end: str) -> list:
+        if not self.sharding and not self._cold_range(start):
+            return self._scan_movements(user_id, start, end)
+        # With sharding or cold files the partitions are queried on the index
+        return super().get_movements(user_id, start, end)
+
+    @guarded("dynamodb", "scan")
+    def _page(self, read, **kwargs) -> dict:
+        """One page of a scan or query, every page gets its own deadline"""
+        return read(**kwargs)
+
+    def _scan_movements(self, user_id: str, start: str, end: str) -> list:
+        scan_kwargs = {
+            "FilterExpression": Attr("UserId").eq(user_id)
+            & Attr("Date").between(start, end)
+        }
+        movements = []
+        while True:
+            response = self._page(self.movements.scan, **scan_kwargs)
+            movements.extend(response["Items"])
+            if not response.get("LastEvaluatedKey"):
+                return movements
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_movement_batch(
+        self, user_id: str, start: str, end: str
+    ) -> TransactionBatch:
+        if self._cold_range(start):
+            # Historical range: merged with the cold files by id
+            return TransactionBatch.from_items(self.get_movements(user_id, start, end))
+        if not self.sharding:
+            return self._scan_movement_batch(user_id, start, end)
+        return self._query_movement_batch(
+            user_id, self.movement_keys(user_id), start, end
+        )
+
+    def _scan_movement_batch(
+        self, user_id: str, start: str, end: str
+    ) -> TransactionBatch:
+        # Same scan as get_movements, read as wire JSON with only the fields
+        # the batch keeps
+        scan_kwargs = {
+            "TableName": MOVEMENTS_TABLE_NAME,
+            "FilterExpression": "UserId = :user_id AND #date BETWEEN :start AND :end",
+            "ProjectionExpression": "UserId, #date, amount",
+            "ExpressionAttributeNames": {"#date": "Date"},
+            "ExpressionAttributeValues": {
+                ":user_id": {"S": user_id},
+                ":start": {"S": start},
+                ":end": {"S": end},
+            },
+        }
+        batch = TransactionBatch()
+        while True:
+            response = self._page(self.client.scan, **scan_kwargs)
+            batch.extend_wire(response["Items"])
+            if not response.get("LastEvaluatedKey"):
+                return batch
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def _query_movement_batch(
+        self, user_id: str, keys: list, start: str, end: str
+    ) -> TransactionBatch:
+        # Every partition is read from the UserId/Date index at the same time,
+        # as wire JSON without UserId: the rows belong to user_id whatever
+        # shard they are in
+        def partition(key):
+            query_kwargs = {
+                "TableName": MOVEMENTS_TABLE_NAME,
+                "IndexName": MOVEMENTS_BY_DATE_INDEX,
+                "KeyConditionExpression": "UserId = :user_id AND #date BETWEEN :start AND :end",
+                "ProjectionExpression": "#date, amount",
+                "ExpressionAttributeNames": {"#date": "Date"},
+                "ExpressionAttributeValues": {
+                    ":user_id": {"S": key},
+                    ":start": {"S": start},
+                    ":end": {"S": end},
+                },
+            }
+            items = []
+            while True:
+                response = self._page(self.client.query, **query_kwargs)
+                items.extend(response["Items"])
+                if not response.get("LastEvaluatedKey"):
+                    return items
+                query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        batch = TransactionBatch()
+        for items in scatter(partition, keys):
+            batch.extend_wire(items, user_id=user_id)
+        return batch
+
+    # -------------------------- cold tier --------------------------
+
+    @guarded("dynamodb", "scan")
+    def scan_movements(self, before: str, start_key: Optional[dict] = None) -> tuple:
+        scan_kwargs = {"FilterExpression": Attr("Date").lt(before)}
+        if start_key:
+            scan_kwargs["ExclusiveStartKey"] = start_key
+        response = self.movements.scan(**scan_kwargs)
+        return response["Items"], response.get("LastEvaluatedKey")
+
+    @guarded("dynamodb", "bulk")
+    def archive_movements(self, ids: list):
+        # Without UserId and Date the marker drops out of the UserId-Date
+        # index, its id still fails the processor's attribute_not_exists(id)
+        with self.movements.batch_writer() as batch:
+            for movement_id in ids:
+                batch.put_item(Item={"id": movement_id, "archived": True})
+
+    # -------------------------- shard map --------------------------
+
+    @guarded("dynamodb", "read", hedge=True)
+    def get_shard_count(self, user_id: str) -> int:
+        response = self.shards.get_item(Key={"UserId": user_id})
+        return int(response.get("Item", {}).get("shards", 0))
+
+    @guarded("dynamodb", "write")
+    def set_shard_count(self, user_id: str, shards: int) -> int:
+        try:
+            self.shards.update_item(
+                Key={"UserId": user_id},
+                UpdateExpression="SET shards = :shards",
+                ConditionExpression=Attr("shards").not_exists()
+                | Attr("shards").lt(shards),
+                ExpressionAttributeValues={":shards": shards},
+            )
+            return shards
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+        # Someone else already set as many shards or more
+        response = self.shards.get_item(Key={"UserId": user_id}, ConsistentRead=True)
+        return int(response["Item"]["shards"])
+
+    # -------------------------- rollups --------------------------
+
+    @guarded("dynamodb", "read", hedge=True)
+    def get_rollups(self, user_id: str, buckets: list) -> dict:
+        unique_buckets = list(dict.fromkeys(buckets))
+        rollups = {}
+        for i in range(0, len(unique_buckets), BATCH_GET_LIMIT):
+            request = {
+                ROLLUPS_TABLE_NAME: {
+                    "Keys": [
+                        {"UserId": user_id, "Bucket": bucket}
+                        for bucket in unique_buckets[i : i + BATCH_GET_LIMIT]
+                    ]
+                }
+            }
+            while request:
+                response = self.resource.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(ROLLUPS_TABLE_NAME, []):
+                    rollups[item["Bucket"]] = item
+                request = response.get("UnprocessedKeys") or None
+        return rollups
+
+    @guarded("dynamodb", "bulk")
+    def add_to_rollups(self, user_id: str, rollups: dict):
+        # One ADD per bucket, same update the file processor issues
+        for bucket, rollup in rollups.items():
+            self.rollups.update_item(
+                Key={"UserId": user_id, "Bucket": bucket},
+                UpdateExpression=_ROLLUP_UPDATE,
+                ExpressionAttributeNames=_ROLLUP_NAMES,
+                ExpressionAttributeValues={
+                    f":{field}": rollup[field] for field in ROLLUP_FIELDS
+                },
+            )
+
+    # -------------------------- idempotency keys --------------------------
+
+    @guarded("dynamodb", "write")
+    def claim_idempotency_key(self, record: dict, now: int) -> Optional[dict]:
+        while True:
+            try:
+                # Expired records may linger until DynamoDB's TTL sweep
+                self.idempotency.put_item(
+                    Item=record,
+                    ConditionExpression=Attr("key").not_exists()
+                    | Attr("expires_at").lte(now),
+                )
+                return None
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+            response = self.idempotency.get_item(
+                Key={"key": record["key"]}, ConsistentRead=True
+            )
+            if "Item" in response:
+                return response["Item"]
+            # Deleted in between, try to claim it again
+
+    @guarded("dynamodb", "write")
+    def save_idempotency_record(self, record: dict):
+        self.idempotency.put_item(Item=record)
+
+    @guarded("dynamodb", "write")
+    def delete_idempotency_key(self, key: str):
+        self.idempotency.delete_item(Key={"key": key})
+
+    # -------------------------- file ingestions --------------------------
+
+    @guarded("dynamodb", "read", hedge=True)
+    def get_ingestion(self, file: str) -> Optional[dict]:
+        response = self.ingestions.get_item(Key={"file": file})
+        return response.get("Item")
+
+    @guarded("dynamodb", "write")
+    def save_ingestion(self, record: dict):
+        self.ingestions.put_item(Item=record)
+
+    @guarded("dynamodb", "write")
+    def apply_pending_rollups(self, file: str) -> bool:
+        response = self.ingestions.get_item(Key={"file": file}, ConsistentRead=True)
+        if "Item" not in response:
+            return False
+        serialize = TypeSerializer().serialize
+        # Up to 99 ADDs and the delete, the 100 actions a transaction allows
+        actions = [
+            {
+                "Update": {
+                    "TableName": ROLLUPS_TABLE_NAME,
+                    "Key": {
+                        "UserId": serialize(rollup["UserId"]),
+                        "Bucket": serialize(rollup["Bucket"]),
+                    },
+                    "UpdateExpression": _ROLLUP_UPDATE,
+                    "ExpressionAttributeNames": _ROLLUP_NAMES,
+                    "ExpressionAttributeValues": {
+                        f":{field}": serialize(Decimal(str(rollup[field])))
+                        for field in ROLLUP_FIELDS
+                    },
+                }
+            }
+            for rollup in response["Item"]["rollups"]
+        ]
+        actions.append(
+            {
+                "Delete": {
+                    "TableName": INGESTIONS_TABLE_NAME,
+                    "Key": {"file": serialize(file)},
+                    "ConditionExpression": "attribute_exists(#file)",
+                    "ExpressionAttributeNames": {"#file": "file"},
+                }
+            }
+        )
+        try:
+            self.client.transact_write_items(TransactItems=actions)
+        except ClientError as e:
+            reasons = e.response.get("CancellationReasons") or [{}]
+            # Another run applied and deleted it after our read
+            if reasons[-1].get("Code") == "ConditionalCheckFailed":
+                return False
+            raise
+        return True
+
+    # -------------------------- rate limits --------------------------
+
+    @guarded("dynamodb", "write")
+    def consume_quota(self, key: str, limit: int, expires_at: int) -> bool:
+        try:
+            self.rate_limits.update_item(
+                Key={"key": key},
+                UpdateExpression="ADD #count :one SET expires_at = :expires_at",
+                ConditionExpression=Attr("count").not_exists()
+                | Attr("count").lt(limit),
+                ExpressionAttributeNames={"#count": "count"},
+                ExpressionAttributeValues={":one": 1, ":expires_at": expires_at},
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
@@ -0,0 +1,241 @@
+"""In-memory backend for tests, load tests and single-process local runs"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable, Optional
+import threading
+import time
+from .base import MAX_DATE, MIN_DATE, ROLLUP_FIELDS, AlreadyExists, Storage
+
+
+def _copy(item: Optional[dict]) -> Optional[dict]:
+    return dict(item) if item is not None else None
+
+
+class MemoryStorage(Storage):
+    """
+    Dicts plus one (Date, id) sorted index per user, so user and token lookups
+    are O(1) and movement pages are O(log n + page size).
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._users = {}  # email -> user
+        self._tokens = {}  # email -> token item
+        self._tokens_by_value = {}  # token -> email
+        self._movements = {}  # id -> movement
+        self._movements_by_user = defaultdict(list)  # UserId -> [(Date, id)]
+        self._rollups = {}  # (UserId, Bucket) -> rollup
+        self._idempotency = {}  # key -> record
+        self._quotas = {}  # key -> (count, expires_at)
+        self._ingestions = {}  # file -> record
+        self._shards = {}  # UserId -> shard count
+        self._lock = threading.RLock()
+
+    # -------------------------- users --------------------------
+
+    def create_user(self, user: dict):
+        with self._lock:
+            if user["email"] in self._users:
+                raise AlreadyExists(f"Email {user['email']} already exists")
+            self._users[user["email"]] = dict(user)
+
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        with self._lock:
+            return _copy(self._users.get(email))
+
+    # -------------------------- tokens --------------------------
+
+    def save_token(self, token: dict):
+        with self._lock:
+            previous = self._tokens.get(token["email"])
+            if previous is not None:
+                self._tokens_by_value.pop(previous["token"], None)
+            self._tokens[token["email"]] = dict(token)
+            self._tokens_by_value[token["token"]] = token["email"]
+
+    def get_token(self, token: str) -> Optional[dict]:
+        with self._lock:
+            email = self._tokens_by_value.get(token)
+            return _copy(self._tokens.get(email)) if email is not None else None
+
+    # -------------------------- movements --------------------------
+
+    def put_movements(self, movements: Iterable[dict]):
+        with self._lock:
+            for movement in movements:
+                previous = self._movements.get(movement["id"])
+                if previous is not None and "UserId" in previous:
+                    index = self._movements_by_user[previous["UserId"]]
+                    del index[bisect_left(index, (previous["Date"], previous["id"]))]
+                self._movements[movement["id"]] = dict(movement)
+                insort(
+                    self._movements_by_user[movement["UserId"]],
+                    (movement["Date"], movement["id"]),
+                )
+
+    def insert_movements(self, movements: Iterable[dict]) -> list:
+        inserted = []
+        with self._lock:
+            for movement in movements:
+                if movement["id"] in self._movements:
+                    continue
+                self._movements[movement["id"]] = dict(movement)
+                insort(
+                    self._movements_by_user[movement["UserId"]],
+                    (movement["Date"], movement["id"]),
+                )
+                inserted.append(movement)
+        return inserted
+
+    def taken_movement_ids(self, ids: list) -> set:
+        with self._lock:
+            return {
+                movement_id for movement_id in ids if movement_id in self._movements
+            }
+
+    def query_partition(
+        self,
+        user_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None,
+        ascending: bool = True,
+    ) -> tuple:
+        with self._lock:
+            index = self._movements_by_user.get(user_id, [])
+            low = bisect_left(index, (start or MIN_DATE, ""))
+            # "\uffff" sorts after every id, so `end` itself is included
+            high = bisect_right(index, (end or MAX_DATE, "\uffff"))
+            if start_key:
+                position = (start_key["Date"], start_key["id"])
+                if ascending:
+                    low = max(low, bisect_right(index, position))
+                else:
+                    high = min(high, bisect_left(index, position))
+
+            if ascending:
+                stop = min(high, low + limit) if limit else high
+                keys = index[low:stop]
+                more = stop < high
+            else:
+                stop = max(low, high - limit) if limit else low
+                keys = index[stop:high][::-1]
+                more = stop > low
+            items = [dict(self._movements[movement_id]) for _, movement_id in keys]
+
+        last_key = None
+        if more and items:
+            last = items[-1]
+            last_key = {"id": last["id"], "UserId": user_id, "Date": last["Date"]}
+        return items, last_key
+
+    def get_movements(self, user_id: str, start: str, end: str) -> list:
+        return self.query_movements(user_id, start, end)[0]
+
+    # -------------------------- cold tier --------------------------
+
+    def scan_movements(self, before: str, start_key: Optional[dict] = None) -> tuple:
+        with self._lock:
+            items = [
+                dict(movement)
+                for movement in self._movements.values()
+                if "Date" in movement and movement["Date"] < before
+            ]
+        return items, None
+
+    def archive_movements(self, ids: list):
+        with self._lock:
+            for movement_id in ids:
+                movement = self._movements.get(movement_id)
+                if movement is None or "UserId" not in movement:
+                    continue
+                index = self._movements_by_user[movement["UserId"]]
+                del index[bisect_left(index, (movement["Date"], movement_id))]
+                self._movements[movement_id] = {"id": movement_id}
+
+    # -------------------------- shard map --------------------------
+
+    def get_shard_count(self, user_id: str) -> int:
+        with self._lock:
+            return self._shards.get(user_id, 0)
+
+    def set_shard_count(self, user_id: str, shards: int) -> int:
+        with self._lock:
+            self._shards[user_id] = max(shards, self._shards.get(user_id, 0))
+            return self._shards[user_id]
+
+    # -------------------------- rollups --------------------------
+
+    def get_rollups(self, user_id: str, buckets: list) -> dict:
+        with self._lock:
+            return {
+                bucket: dict(self._rollups[(user_id, bucket)])
+                for bucket in buckets
+                if (user_id, bucket) in self._rollups
+            }
+
+    def add_to_rollups(self, user_id: str, rollups: dict):
+        with self._lock:
+            for bucket, delta in rollups.items():
+                stored = self._rollups.setdefault(
+                    (user_id, bucket), {"UserId": user_id, "Bucket": bucket}
+                )
+                for field in ROLLUP_FIELDS:
+                    stored[field] = stored.get(field, Decimal("0")) + delta[field]
+
+    # -------------------------- idempotency keys --------------------------
+
+    def claim_idempotency_key(self, record: dict, now: int) -> Optional[dict]:
+        with self._lock:
+            existing = self._idempotency.get(record["key"])
+            if existing is not None and existing["expires_at"] > now:
+                return dict(existing)
+            self._idempotency[record["key"]] = dict(record)
+            return None
+
+    def save_idempotency_record(self, record: dict):
+        with self._lock:
+            self._idempotency[record["key"]] = dict(record)
+
+    def delete_idempotency_key(self, key: str):
+        with self._lock:
+            self._idempotency.pop(key, None)
+
+    # -------------------------- file ingestions --------------------------
+
+    def get_ingestion(self, file: str) -> Optional[dict]:
+        with self._lock:
+            return _copy(self._ingestions.get(file))
+
+    def save_ingestion(self, record: dict):
+        with self._lock:
+            self._ingestions[record["file"]] = dict(record)
+
+    def apply_pending_rollups(self, file: str) -> bool:
+        with self._lock:
+            record = self._ingestions.pop(file, None)
+            if record is None:
+                return False
+            for rollup in record["rollups"]:
+                self.add_to_rollups(rollup["UserId"], {rollup["Bucket"]: rollup})
+            return True
+
+    # -------------------------- rate limits --------------------------
+
+    def consume_quota(self, key: str, limit: int, expires_at: int) -> bool:
+        with self._lock:
+            count, _ = self._quotas.get(key, (0, expires_at))
+            if count >= limit:
+                return False
+            self._quotas[key] = (count + 1, expires_at)
+            if len(self._quotas) > 10_000:
+                # Windows only move forward, drop the ones that are over
+                now = time.time()
+                self._quotas = {
+                    key: quota for key, quota in self._quotas.items() if quota[1] > now
+                }
+            return True
@@ -0,0 +1,424 @@
+"""
+SQLite backend for single-node deployments and local load tests.
+
+Lookups are indexed like the DynamoDB access patterns they replace: users by
+email, tokens by value and movements by (UserId, Date, id). Decimal amounts are
+stored as TEXT so they round-trip exactly. One connection is shared between
+threads behind a lock; the database runs in WAL mode when file-backed.
+"""
+
+from decimal import Decimal
+from typing import Iterable, Optional
+import json
+import sqlite3
+import threading
+import time
+from .base import MAX_DATE, MIN_DATE, ROLLUP_FIELDS, AlreadyExists, Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    email TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_token ON tokens (token);
+CREATE TABLE IF NOT EXISTS movements (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    processed TEXT
+);
+CREATE INDEX IF NOT EXISTS movements_user_date ON movements (user_id, date, id);
+CREATE TABLE IF NOT EXISTS rollups (
+    user_id TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (user_id, bucket)
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    expires_at INTEGER NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_ingestions (
+    file TEXT PRIMARY KEY,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archived_movements (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS movement_shards (
+    user_id TEXT PRIMARY KEY,
+    shards INTEGER NOT NULL
+);
+"""
+
+
+def _dump(item: dict) -> str:
+    return json.dumps(item, default=str, separators=(",", ":"))
+
+
+def _movement(row) -> dict:
+    movement_id, user_id, day, amount, processed = row
+    movement = {
+        "id": movement_id,
+        "UserId": user_id,
+        "Date": day,
+        "amount": Decimal(amount),
+    }
+    if processed is not None:
+        movement["processed"] = processed
+    return movement
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.RLock()
+        with self._lock:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+
+    def _execute(self, sql: str, parameters=()) -> list:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # -------------------------- users --------------------------
+
+    def create_user(self, user: dict):
+        try:
+            self._execute(
+                "INSERT INTO users (id, email, item) VALUES (?, ?, ?)",
+                (user["id"], user["email"], _dump(user)),
+            )
+        except sqlite3.IntegrityError:
+            raise AlreadyExists(f"Email {user['email']} already exists")
+
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        rows = self._execute("SELECT item FROM users WHERE email = ?", (email,))
+        return json.loads(rows[0][0]) if rows else None
+
+    # -------------------------- tokens --------------------------
+
+    def save_token(self, token: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO tokens (email, token, item) VALUES (?, ?, ?)",
+            (token["email"], token["token"], _dump(token)),
+        )
+
+    def get_token(self, token: str) -> Optional[dict]:
+        rows = self._execute("SELECT item FROM tokens WHERE token = ?", (token,))
+        return json.loads(rows[0][0]) if rows else None
+
+    # -------------------------- movements --------------------------
+
+    def put_movements(self, movements: Iterable[dict]):
+        rows = [
+            (
+                movement["id"],
+                movement["UserId"],
+                movement["Date"],
+                str(movement["amount"]),
+                movement.get("processed"),
+            )
+            for movement in movements
+        ]
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO movements "
+                    "(id, user_id, date, amount, processed) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def insert_movements(self, movements: Iterable[dict]) -> list:
+        inserted = []
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                for movement in movements:
+                    # Ids moved to the cold tier stay taken
+                    cursor = self._connection.execute(
+                        "INSERT OR IGNORE INTO movements "
+                        "(id, user_id, date, amount, processed) SELECT ?, ?, ?, ?, ? "
+                        "WHERE NOT EXISTS (SELECT 1 FROM archived_movements WHERE id = ?)",
+                        (
+                            movement["id"],
+                            movement["UserId"],
+                            movement["Date"],
+                            str(movement["amount"]),
+                            movement.get("processed"),
+                            movement["id"],
+                        ),
+                    )
+                    if cursor.rowcount:
+                        inserted.append(movement)
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        return inserted
+
+    def taken_movement_ids(self, ids: list) -> set:
+        taken = set()
+        # Every id is bound twice, well under SQLite's 999 variables
+        for start in range(0, len(ids), 400):
+            chunk = ids[start : start + 400]
+            marks = ", ".join("?" * len(chunk))
+            rows = self._execute(
+                f"SELECT id FROM movements WHERE id IN ({marks}) "
+                f"UNION SELECT id FROM archived_movements WHERE id IN ({marks})",
+                (*chunk, *chunk),
+            )
+            taken.update(row[0] for row in rows)
+        return taken
+
+    def query_partition(
+        self,
+        user_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None,
+        ascending: bool = True,
+    ) -> tuple:
+        sql = (
+            "SELECT id, user_id, date, amount, processed FROM movements "
+            "WHERE user_id = ? AND date BETWEEN ? AND ?"
+        )
+        parameters = [user_id, start or MIN_DATE, end or MAX_DATE]
+        if start_key:
+            sql += (
+                " AND (date, id) > (?, ?)" if ascending else " AND (date, id) < (?, ?)"
+            )
+            parameters += [start_key["Date"], start_key["id"]]
+        sql += " ORDER BY date, id" if ascending else " ORDER BY date DESC, id DESC"
+        if limit:
+            # One extra row tells whether there is a next page
+            sql += " LIMIT ?"
+            parameters.append(limit + 1)
+
+        rows = self._execute(sql, parameters)
+        more = bool(limit) and len(rows) > limit
+        items = [_movement(row) for row in rows[:limit]]
+
+        last_key = None
+        if more:
+            last = items[-1]
+            last_key = {"id": last["id"], "UserId": user_id, "Date": last["Date"]}
+        return items, last_key
+
+    def get_movements(self, user_id: str, start: str, end: str) -> list:
+        return self.query_movements(user_id, start, end)[0]
+
+    # -------------------------- cold tier --------------------------
+
+    def scan_movements(self, before: str, start_key: Optional[dict] = None) -> tuple:
+        rows = self._execute(
+            "SELECT id, user_id, date, amount, processed FROM movements WHERE date < ?",
+            (before,),
+        )
+        return [_movement(row) for row in rows], None
+
+    def archive_movements(self, ids: list):
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                for movement_id in ids:
+                    self._connection.execute(
+                        "INSERT OR IGNORE INTO archived_movements (id) VALUES (?)",
+                        (movement_id,),
+                    )
+                    self._connection.execute(
+                        "DELETE FROM movements WHERE id = ?", (movement_id,)
+                    )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    # -------------------------- shard map --------------------------
+
+    def get_shard_count(self, user_id: str) -> int:
+        rows = self._execute(
+            "SELECT shards FROM movement_shards WHERE user_id = ?", (user_id,)
+        )
+        return rows[0][0] if rows else 0
+
+    def set_shard_count(self, user_id: str, shards: int) -> int:
+        with self._lock:
+            self._execute(
+                "INSERT INTO movement_shards (user_id, shards) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET shards = excluded.shards "
+                "WHERE excluded.shards > shards",
+                (user_id, shards),
+            )
+            return self.get_shard_count(user_id)
+
+    # -------------------------- rollups --------------------------
+
+    def get_rollups(self, user_id: str, buckets: list) -> dict:
+        rollups = {}
+        unique_buckets = list(dict.fromkeys(buckets))
+        # Stay below SQLite's default limit of 999 bound parameters
+        for i in range(0, len(unique_buckets), 900):
+            chunk = unique_buckets[i : i + 900]
+            rows = self._execute(
+                "SELECT bucket, item FROM rollups WHERE user_id = ? "
+                f"AND bucket IN ({', '.join('?' * len(chunk))})",
+                [user_id, *chunk],
+            )
+            for bucket, item in rows:
+                rollups[bucket] = self._load_rollup(item)
+        return rollups
+
+    @staticmethod
+    def _load_rollup(item: str) -> dict:
+        rollup = json.loads(item)
+        for field in ROLLUP_FIELDS:
+            rollup[field] = Decimal(rollup[field])
+        return rollup
+
+    def add_to_rollups(self, user_id: str, rollups: dict):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._add_to_rollups(user_id, rollups)
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def _add_to_rollups(self, user_id: str, rollups: dict):
+        stored = self.get_rollups(user_id, list(rollups))
+        for bucket, delta in rollups.items():
+            rollup = stored.get(bucket) or {
+                "UserId": user_id,
+                "Bucket": bucket,
+                **{field: Decimal("0") for field in ROLLUP_FIELDS},
+            }
+            for field in ROLLUP_FIELDS:
+                # Pending records come back from JSON with string amounts
+                rollup[field] += Decimal(str(delta[field]))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO rollups (user_id, bucket, item) "
+                "VALUES (?, ?, ?)",
+                (user_id, bucket, _dump(rollup)),
+            )
+
+    # -------------------------- idempotency keys --------------------------
+
+    def claim_idempotency_key(self, record: dict, now: int) -> Optional[dict]:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT item FROM idempotency_keys "
+                    "WHERE key = ? AND expires_at > ?",
+                    (record["key"], now),
+                ).fetchall()
+                if not rows:
+                    self._put_idempotency_record(record)
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        return json.loads(rows[0][0]) if rows else None
+
+    def _put_idempotency_record(self, record: dict):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO idempotency_keys (key, expires_at, item) "
+            "VALUES (?, ?, ?)",
+            (record["key"], record["expires_at"], _dump(record)),
+        )
+
+    def save_idempotency_record(self, record: dict):
+        with self._lock:
+            self._put_idempotency_record(record)
+
+    def delete_idempotency_key(self, key: str):
+        self._execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+    # -------------------------- file ingestions --------------------------
+
+    def get_ingestion(self, file: str) -> Optional[dict]:
+        rows = self._execute("SELECT item FROM file_ingestions WHERE file = ?", (file,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def save_ingestion(self, record: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO file_ingestions (file, item) VALUES (?, ?)",
+            (record["file"], _dump(record)),
+        )
+
+    def apply_pending_rollups(self, file: str) -> bool:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT item FROM file_ingestions WHERE file = ?", (file,)
+                ).fetchall()
+                if rows:
+                    for rollup in json.loads(rows[0][0])["rollups"]:
+                        self._add_to_rollups(
+                            rollup["UserId"], {rollup["Bucket"]: rollup}
+                        )
+                    self._connection.execute(
+                        "DELETE FROM file_ingestions WHERE file = ?", (file,)
+                    )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        return bool(rows)
+
+    # -------------------------- rate limits --------------------------
+
+    def consume_quota(self, key: str, limit: int, expires_at: int) -> bool:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Upsert that only counts while under the limit
+                counted = self._connection.execute(
+                    "INSERT INTO rate_limits (key, count, expires_at) "
+                    "VALUES (?, 1, ?) ON CONFLICT (key) DO UPDATE "
+                    "SET count = count + 1 WHERE count < ?",
+                    (key, expires_at, limit),
+                ).rowcount
+                # Each new window is a new key, drop the finished ones
+                self._connection.execute(
+                    "DELETE FROM rate_limits WHERE expires_at < ?",
+                    (int(time.time()),),
+                )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        return counted == 1
@@ -0,0 +1,68 @@
+import pytest
+from decimal import Decimal
+from storage.batch import TransactionBatch, parse_cents
+
+# -------------------------- Unit Tests --------------------------
+
+
+# Same cases as TestAmountCentsRoundsHalfAwayFromZero in
+# core/process_file/rowcost_test.go, both sides round cents the same way
+@pytest.mark.parametrize(
+    "text, cents",
+    [
+        ("12.50", 1250),
+        ("12.5", 1250),
+        ("-0.05", -5),
+        ("-7", -700),
+        ("+60.5", 6050),
+        ("1E+2", 10000),
+        ("0.125", 13),
+        ("-0.125", -13),
+        ("1.005", 101),
+        ("-2.675", -268),
+        ("0.124", 12),
+        ("0.0049", 0),
+    ],
+)
+def test_parse_cents(text, cents):
+    assert parse_cents(text) == cents
+    # Floats round on their shortest repr, like FormatFloat(-1) in Go
+    assert parse_cents(float(text)) == cents
+
+
+def test_from_wire_interns_users_and_days():
+    batch = TransactionBatch.from_wire(
+        [
+            {"UserId": {"S": "u1"}, "Date": {"S": "2024-01-31"}, "amount": {"N": "10"}},
+            {
+                "UserId": {"S": "u1"},
+                "Date": {"S": "2024-02-01"},
+                "amount": {"N": "-2.5"},
+            },
+            {
+                "UserId": {"S": "u2"},
+                "Date": {"S": "2024-01-31"},
+                "amount": {"N": "0.01"},
+            },
+        ]
+    )
+
+    assert len(batch) == 3
+    assert batch.user_ids == ["u1", "u2"]
+    assert list(batch.users) == [0, 0, 1]
+    assert list(batch.cents) == [1000, -250, 1]
+    assert batch.month_counts() == {"2024-01": 2, "2024-02": 1}
+
+
+def test_from_items_round_trips():
+    items = [
+        {"UserId": "u1", "Date": "2023-12-15", "amount": Decimal("150.75")},
+        {"UserId": "u1", "Date": "2023-12-20", "amount": -45.5},
+    ]
+
+    batch = TransactionBatch.from_items(items)
+
+    assert list(batch.rows()) == [
+        ("u1", "2023-12-15", Decimal("150.75")),
+        ("u1", "2023-12-20", Decimal("-45.50")),
+    ]
@@ -0,0 +1,280 @@
+import pyarrow as pa
+import pytest
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from local_aws import FakeDynamoDB, FakeS3
+from routes.get_summary.rollups import build_rollups
+from storage import create_storage
+from storage.base import MAX_DATE, MIN_DATE
+from storage.cold import ColdStore, compact
+from storage.dynamodb import DynamoStorage
+
+AFTER_DAYS = 90
+USERS = ["user-a", "user-b"]
+
+
+@pytest.fixture(params=["dynamodb", "memory", "sqlite"])
+def storage(request):
+    if request.param == "dynamodb":
+        backend = DynamoStorage(FakeDynamoDB())
+    elif request.param == "sqlite":
+        backend = create_storage("sqlite", path=":memory:")
+    else:
+        backend = create_storage(request.param)
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def cold(tmp_path):
+    return ColdStore(FakeS3(), "cold-bucket", str(tmp_path), AFTER_DAYS)
+
+
+def history(rows: int = 600) -> list:
+    """Movements over the last ~14 months, amounts with cents"""
+    generator = random.Random(7)
+    today = date.today()
+    return [
+        {
+            "id": f"m{index:04d}",
+            "UserId": USERS[index % len(USERS)],
+            "Date": (today - timedelta(days=generator.randrange(1, 420))).isoformat(),
+            "amount": Decimal(generator.randrange(-50000, 50000)).scaleb(-2),
+            "processed": "Ok",
+        }
+        for index in range(rows)
+    ]
+
+
+def monthly_sums(movements) -> dict:
+    sums = defaultdict(Decimal)
+    for movement in movements:
+        sums[movement["Date"][:7]] += Decimal(movement["amount"])
+    return dict(sums)
+
+
+def all_pages(storage, user_id: str, **kwargs) -> list:
+    ids, start_key = [], None
+    while True:
+        items, start_key = storage.query_movements(
+            user_id, start_key=start_key, **kwargs
+        )
+        ids.extend(item["id"] for item in items)
+        if not start_key:
+            return ids
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_cold_files_round_trip(cold):
+    movements = [
+        {"id": "b", "UserId": "u", "Date": "2024-01-20", "amount": Decimal("-0.05")},
+        {"id": "a", "UserId": "u", "Date": "2024-01-10", "amount": Decimal("100.50")},
+    ]
+    assert cold.write_months("u", {"2024-01": movements}) == 1
+
+    assert cold.months("u").keys() == {"2024-01"}
+    assert cold.read("u", "2024-01-15", "2024-01-31") == [movements[0]]
+    items, last_key = cold.query("u", limit=1)
+    assert [item["id"] for item in items] == ["a"]
+    assert cold.query("u", limit=1, start_key=last_key)[0] == [movements[0]]
+
+    # The cached copy is uncompressed, mapping it allocates nothing
+    cold.open("u", "2024-01", cold.months("u")["2024-01"])
+    allocated = pa.total_allocated_bytes()
+    table = cold.open("u", "2024-01", cold.months("u")["2024-01"])
+    assert table.num_rows == 2 and pa.total_allocated_bytes() == allocated
+
+    # A second write merges by id and replaces the cached copy
+    late = {"id": "c", "UserId": "u", "Date": "2024-01-31", "amount": Decimal("1")}
+    cold.write_months("u", {"2024-01": [movements[0], late]})
+    assert [item["id"] for item in cold.read("u")] == ["a", "b", "c"]
+
+
+def test_cold_pages_only_convert_the_rows_they_return(cold, monkeypatch):
+    movements = history(120)
+    for month in {movement["Date"][:7] for movement in movements}:
+        cold.write_months(
+            "u",
+            {
+                month: [
+                    movement for movement in movements if movement["Date"][:7] == month
+                ]
+            },
+        )
+    converted = []
+    items_of = ColdStore._items
+
+    def count(user_id, table):
+        converted.append(table.num_rows)
+        return items_of(user_id, table)
+
+    monkeypatch.setattr(ColdStore, "_items", staticmethod(count))
+    expected = sorted(
+        movements, key=lambda movement: (movement["Date"], movement["id"])
+    )
+    start, end = expected[10]["Date"], expected[-10]["Date"]
+    in_range = [
+        movement["id"] for movement in expected if start <= movement["Date"] <= end
+    ]
+
+    for ascending in (True, False):
+        ids, start_key = [], None
+        while True:
+            converted.clear()
+            items, start_key = cold.query(
+                "u", start, end, 7, start_key=start_key, ascending=ascending
+            )
+            assert sum(converted) <= 8
+            ids.extend(item["id"] for item in items)
+            if not start_key:
+                break
+        assert ids == (in_range if ascending else in_range[::-1])
+
+
+def test_recent_ranges_do_not_read_the_cold_tier(cold):
+    recent = (date.today() - timedelta(days=30)).isoformat()
+    old = (date.today() - timedelta(days=AFTER_DAYS + 1)).isoformat()
+
+    assert not cold.covers(recent)
+    assert cold.covers(old)
+    assert cold.covers(None)
+
+
+# -------------------------- Contract Tests --------------------------
+
+
+def test_compaction_reconciles(storage, cold):
+    """Sums, pages and rollups are the same before and after compaction"""
+    movements = history()
+    storage.insert_movements(movements)
+    rollups = build_rollups(movements)
+    for (user_id, bucket), rollup in rollups.items():
+        storage.add_to_rollups(user_id, {bucket: rollup})
+    before = {
+        user_id: (
+            monthly_sums(storage.get_movements(user_id, MIN_DATE, MAX_DATE)),
+            all_pages(storage, user_id, limit=25),
+            all_pages(storage, user_id, limit=40, ascending=False),
+        )
+        for user_id in USERS
+    }
+
+    result = compact(storage, cold)
+
+    boundary = cold.boundary()
+    old = [movement for movement in movements if movement["Date"] < boundary]
+    assert result.movements == len(old) > 0
+    assert storage.scan_movements(boundary) == ([], None)
+    storage.cold = cold
+    for user_id in USERS:
+        sums, ascending, descending = before[user_id]
+        movements_after = storage.get_movements(user_id, MIN_DATE, MAX_DATE)
+        assert len(movements_after) == sum(
+            movement["UserId"] == user_id for movement in movements
+        )
+        assert monthly_sums(movements_after) == sums
+        batch = storage.get_movement_batch(user_id, MIN_DATE, MAX_DATE)
+        assert sum(batch.month_counts().values()) == len(movements_after)
+        assert (
+            monthly_sums(
+                {"Date": day, "amount": amount} for _, day, amount in batch.rows()
+            )
+            == sums
+        )
+        assert all_pages(storage, user_id, limit=25) == ascending
+        assert all_pages(storage, user_id, limit=40, ascending=False) == descending
+        # The rollups still count the compacted movements
+        months = storage.get_rollups(user_id, list(sums))
+        assert {month: rollup["balance"] for month, rollup in months.items()} == sums
+
+    # Compacted ids are still taken for a re-ingested statement
+    assert storage.insert_movements([old[0]]) == []
+    assert compact(storage, cold).movements == 0
+
+
+def test_compaction_merges_late_movements(storage, cold):
+    day = (date.today() - timedelta(days=AFTER_DAYS + 40)).isoformat()
+    first = {"id": "m1", "UserId": "u", "Date": day, "amount": Decimal("10.00")}
+    late = {"id": "m2", "UserId": "u#3", "Date": day, "amount": Decimal("-2.50")}
+    storage.insert_movements([first])
+    compact(storage, cold)
+    storage.insert_movements([late])
+
+    assert compact(storage, cold).movements == 1
+
+    storage.cold = cold
+    movements = storage.get_movements("u", MIN_DATE, MAX_DATE)
+    assert sorted((m["id"], m["UserId"], m["amount"]) for m in movements) == [
+        ("m1", "u", Decimal("10.00")),
+        ("m2", "u", Decimal("-2.50")),
+    ]
+
+
+def test_compaction_writes_each_month_once(storage, cold, monkeypatch):
+    movements = history()
+    storage.insert_movements(movements)
+    boundary = cold.boundary()
+    old = [movement for movement in movements if movement["Date"] < boundary]
+    # Pages of 50 rows over what was stored when the scan started
+    pages = []
+
+    def scan_movements(before, start_key=None):
+        if start_key is None:
+            pages.append([movement for movement in old if movement["Date"] < before])
+        offset = start_key["offset"] if start_key else 0
+        rows = pages[-1][offset : offset + 50]
+        more = offset + 50 < len(pages[-1])
+        return rows, {"offset": offset + 50} if more else None
+
+    uploaded = []
+    upload = cold._upload
+
+    def record(key, body):
+        uploaded.append(key)
+        return upload(key, body)
+
+    monkeypatch.setattr(storage, "scan_movements", scan_movements)
+    monkeypatch.setattr(cold, "_upload", record)
+
+    # Every batch of 120 rows touches most months, each is still written once
+    result = compact(storage, cold, batch_size=120)
+
+    assert result.movements == len(old) > 150
+    months = {(movement["UserId"], movement["Date"][:7]) for movement in old}
+    assert sorted(uploaded) == sorted(cold.key(*month) for month in months)
+    assert result.files == len(months)
+    storage.cold = cold
+    for user_id in USERS:
+        assert sorted(all_pages(storage, user_id, limit=30)) == sorted(
+            movement["id"] for movement in movements if movement["UserId"] == user_id
+        )
+
+
+def test_paged_reads_list_the_cold_files_once(storage, cold, monkeypatch):
+    movements = history()
+    storage.insert_movements(movements)
+    compact(storage, cold)
+    storage.cold = cold
+    listed = []
+    list_months = cold._list
+
+    def count(user_id):
+        listed.append(user_id)
+        return list_months(user_id)
+
+    monkeypatch.setattr(cold, "_list", count)
+
+    with storage.cold_listing("user-a"):
+        ids = all_pages(storage, "user-a", limit=30)
+
+    assert listed == ["user-a"] and not cold._listings
+    assert sorted(ids) == sorted(
+        movement["id"] for movement in movements if movement["UserId"] == "user-a"
+    )
+    # Outside of it every page lists again
+    all_pages(storage, "user-a", limit=30)
+    assert len(listed) > 2
@@ -0,0 +1,366 @@
+import pytest
+from decimal import Decimal
+from local_aws import FakeDynamoDB
+from storage import AlreadyExists, create_storage
+from storage.dynamodb import DynamoStorage
+
+# Test data
+mock_user_id = "user123"
+
+mock_movements = [
+    {
+        "id": "m1",
+        "UserId": mock_user_id,
+        "Date": "2024-01-10",
+        "amount": Decimal("100.50"),
+    },
+    {
+        "id": "m2",
+        "UserId": mock_user_id,
+        "Date": "2024-01-20",
+        "amount": Decimal("-50.25"),
+    },
+    {
+        "id": "m3",
+        "UserId": mock_user_id,
+        "Date": "2024-01-20",
+        "amount": Decimal("5.00"),
+    },
+    {
+        "id": "m4",
+        "UserId": mock_user_id,
+        "Date": "2024-03-05",
+        "amount": Decimal("75.00"),
+    },
+    {"id": "m5", "UserId": "other", "Date": "2024-01-15", "amount": Decimal("1.00")},
+]
+
+
+@pytest.fixture(params=["dynamodb", "memory", "sqlite"])
+def storage(request):
+    if request.param == "dynamodb":
+        backend = DynamoStorage(FakeDynamoDB())
+    elif request.param == "sqlite":
+        backend = create_storage("sqlite", path=":memory:")
+    else:
+        backend = create_storage(request.param)
+    yield backend
+    backend.close()
+
+
+def all_pages(storage, **kwargs) -> list:
+    ids, start_key = [], None
+    while True:
+        items, start_key = storage.query_movements(
+            mock_user_id, start_key=start_key, **kwargs
+        )
+        ids.extend(item["id"] for item in items)
+        if not start_key:
+            return ids
+
+
+# -------------------------- Contract Tests --------------------------
+
+
+def test_users(storage):
+    user = {"id": "u1", "email": "test@example.com", "name": "Test", "password": "h"}
+    storage.create_user(user)
+
+    assert storage.get_user_by_email("test@example.com") == user
+    assert storage.get_user_by_email("missing@example.com") is None
+
+
+def test_tokens_are_replaced_per_email(storage):
+    storage.save_token({"email": "a@example.com", "token": "t1", "expiration": "x"})
+    storage.save_token({"email": "a@example.com", "token": "t2", "expiration": "y"})
+
+    assert storage.get_token("t2")["expiration"] == "y"
+    assert storage.get_token("unknown") is None
+
+
+def test_query_movements_pages_in_date_order(storage):
+    storage.put_movements(mock_movements)
+
+    assert all_pages(storage, limit=2) == ["m1", "m2", "m3", "m4"]
+    assert all_pages(storage, limit=3, ascending=False) == ["m4", "m3", "m2", "m1"]
+    assert all_pages(storage, start="2024-01-20", end="2024-01-31") == ["m2", "m3"]
+
+
+def test_query_movements_keys_carry_user_id(storage):
+    storage.put_movements(mock_movements)
+    _, start_key = storage.query_movements(mock_user_id, limit=1)
+
+    assert start_key["UserId"] == mock_user_id
+
+
+def test_get_movements_filters_user_and_dates(storage):
+    storage.put_movements(mock_movements)
+    # Replacing by id must not duplicate the movement
+    storage.put_movements([{**mock_movements[0], "amount": Decimal("1.10")}])
+
+    movements = storage.get_movements(mock_user_id, "2024-01-01", "2024-01-31")
+
+    assert sorted(m["id"] for m in movements) == ["m1", "m2", "m3"]
+    amounts = {m["id"]: m["amount"] for m in movements}
+    assert amounts["m1"] == Decimal("1.10")
+
+
+def test_insert_movements_skips_existing_ids(storage):
+    storage.put_movements(mock_movements[:2])
+
+    inserted = storage.insert_movements(
+        [{**mock_movements[0], "amount": Decimal("1.10")}, *mock_movements[2:]]
+    )
+
+    assert [m["id"] for m in inserted] == [m["id"] for m in mock_movements[2:]]
+    movements = storage.get_movements(mock_user_id, "2024-01-01", "2024-01-31")
+    assert sorted(m["id"] for m in movements) == ["m1", "m2", "m3"]
+    assert {m["id"]: m["amount"] for m in movements}["m1"] == mock_movements[0][
+        "amount"
+    ]
+
+
+def test_taken_movement_ids(storage):
+    storage.put_movements(mock_movements[:3])
+    storage.archive_movements(["m1"])
+
+    assert storage.taken_movement_ids(["m1", "m2", "m4", "m9"]) == {"m1", "m2"}
+
+
+def test_get_movement_batch(storage):
+    """The columnar batch holds the same movements as get_movements"""
+    storage.put_movements(mock_movements)
+
+    batch = storage.get_movement_batch(mock_user_id, "2024-01-01", "2024-01-31")
+
+    assert sorted(batch.rows()) == [
+        (mock_user_id, "2024-01-10", Decimal("100.50")),
+        (mock_user_id, "2024-01-20", Decimal("-50.25")),
+        (mock_user_id, "2024-01-20", Decimal("5.00")),
+    ]
+    assert batch.user_ids == [mock_user_id]
+
+
+def test_shard_count_only_grows(storage):
+    assert storage.get_shard_count(mock_user_id) == 0
+
+    assert storage.set_shard_count(mock_user_id, 4) == 4
+    assert storage.set_shard_count(mock_user_id, 2) == 4
+
+    assert storage.get_shard_count(mock_user_id) == 4
+    assert storage.get_shard_count("other") == 0
+
+
+def test_sharded_movements_are_read_from_every_shard(storage):
+    """Movements spread over UserId and UserId#n read like one partition"""
+    storage.sharding = True
+    storage.set_shard_count(mock_user_id, 2)
+    partitions = [mock_user_id, f"{mock_user_id}#1", f"{mock_user_id}#0"]
+    storage.put_movements(
+        (
+            {**movement, "UserId": partitions[index % 3]}
+            if movement["UserId"] == mock_user_id
+            else movement
+        )
+        for index, movement in enumerate(mock_movements)
+    )
+
+    # m2 and m3 share a Date, ties come in partition order rather than by id
+    ascending = all_pages(storage, limit=1)
+    assert (ascending[0], sorted(ascending[1:3]), ascending[3]) == (
+        "m1",
+        ["m2", "m3"],
+        "m4",
+    )
+    descending = all_pages(storage, limit=3, ascending=False)
+    assert (descending[0], sorted(descending[1:3]), descending[3]) == (
+        "m4",
+        ["m2", "m3"],
+        "m1",
+    )
+    assert sorted(all_pages(storage, start="2024-01-20", end="2024-01-31")) == [
+        "m2",
+        "m3",
+    ]
+    items, start_key = storage.query_movements(mock_user_id, limit=2)
+    assert {item["UserId"] for item in items} == {start_key["UserId"]} == {mock_user_id}
+
+    movements = storage.get_movements(mock_user_id, "2024-01-01", "2024-01-31")
+    assert sorted((m["id"], m["UserId"]) for m in movements) == [
+        ("m1", mock_user_id),
+        ("m2", mock_user_id),
+        ("m3", mock_user_id),
+    ]
+    batch = storage.get_movement_batch(mock_user_id, "2024-01-01", "2024-01-31")
+    assert batch.user_ids == [mock_user_id]
+    assert sorted(day for _, day, _ in batch.rows()) == [
+        "2024-01-10",
+        "2024-01-20",
+        "2024-01-20",
+    ]
+
+
+def test_sharded_pages_resume_every_partition_from_its_own_key(storage, monkeypatch):
+    """No movement is skipped or repeated whatever order a partition gives ties"""
+    storage.sharding = True
+    storage.set_shard_count(mock_user_id, 2)
+    partitions = [mock_user_id, f"{mock_user_id}#0", f"{mock_user_id}#1"]
+    storage.put_movements(
+        {
+            "id": f"t{index:02d}",
+            "UserId": partitions[index % 3],
+            "Date": f"2024-01-{index % 4 + 10}",
+            "amount": Decimal("1.00"),
+        }
+        for index in range(24)
+    )
+    original = storage.query_partition
+
+    def native(key, start=None, end=None, limit=None, start_key=None, ascending=True):
+        # Ties in descending id order, and every first page empty with a key
+        items, cursor = [], None
+        while True:
+            page, cursor = original(key, start, end, start_key=cursor)
+            items.extend(page)
+            if not cursor:
+                break
+        items.sort(key=lambda item: item["id"], reverse=True)
+        items.sort(key=lambda item: item["Date"], reverse=not ascending)
+        if start_key is None:
+            date = "2024-01-10" if ascending else "2024-01-13"
+            return [], {"id": "", "UserId": key, "Date": date}
+        ids = [item["id"] for item in items]
+        if start_key["id"] in ids:
+            items = items[ids.index(start_key["id"]) + 1 :]
+        page = items[:limit] if limit else items
+        last_key = None
+        if limit and len(items) > limit:
+            last_key = {"id": page[-1]["id"], "UserId": key, "Date": page[-1]["Date"]}
+        return page, last_key
+
+    monkeypatch.setattr(storage, "query_partition", native)
+    expected = sorted(f"t{index:02d}" for index in range(24))
+    for limit in (1, 2, 5, 7):
+        for ascending in (True, False):
+            ids = all_pages(storage, limit=limit, ascending=ascending)
+            assert sorted(ids) == expected
+            dates = [f"2024-01-{int(id[1:]) % 4 + 10}" for id in ids]
+            assert dates == sorted(dates, reverse=not ascending)
+
+
+def test_rollups_accumulate(storage):
+    delta = {
+        "tx_count": Decimal("2"),
+        "balance": Decimal("50.25"),
+        "credit_count": Decimal("1"),
+        "credit_total": Decimal("100.50"),
+        "debit_count": Decimal("1"),
+        "debit_total": Decimal("-50.25"),
+    }
+    storage.add_to_rollups(mock_user_id, {"2024-01": delta, "2024": delta})
+    storage.add_to_rollups(mock_user_id, {"2024-01": delta})
+
+    rollups = storage.get_rollups(mock_user_id, ["2024", "2024-01", "2025"])
+
+    assert set(rollups) == {"2024", "2024-01"}
+    assert rollups["2024-01"]["tx_count"] == 4
+    assert rollups["2024-01"]["balance"] == Decimal("100.50")
+    assert rollups["2024"]["debit_total"] == Decimal("-50.25")
+
+
+def test_idempotency_key_claim(storage):
+    """A live key is claimed once, expired or deleted keys can be claimed again"""
+    record = {"key": "k1", "fingerprint": "f", "status": "in_progress"}
+
+    assert storage.claim_idempotency_key({**record, "expires_at": 160}, now=100) is None
+    existing = storage.claim_idempotency_key({**record, "expires_at": 170}, now=110)
+    assert existing["expires_at"] == 160
+
+    storage.save_idempotency_record(
+        {**record, "status": "completed", "body": "{}", "expires_at": 1000}
+    )
+    existing = storage.claim_idempotency_key({**record, "expires_at": 260}, now=200)
+    assert existing["status"] == "completed"
+
+    # Expired
+    assert (
+        storage.claim_idempotency_key({**record, "expires_at": 1060}, now=1000) is None
+    )
+
+    storage.delete_idempotency_key("k1")
+    assert (
+        storage.claim_idempotency_key({**record, "expires_at": 1070}, now=1010) is None
+    )
+
+
+def test_ingestions(storage):
+    """The processor's state per file is replaced as it advances"""
+    record = {"file": "bucket/a.csv", "status": "processing", "line": 100}
+
+    assert storage.get_ingestion("bucket/a.csv") is None
+    storage.save_ingestion(record)
+    storage.save_ingestion({**record, "status": "completed", "line": 250})
+
+    assert storage.get_ingestion("bucket/a.csv") == {
+        **record,
+        "status": "completed",
+        "line": 250,
+    }
+    assert storage.get_ingestion("bucket/b.csv") is None
+
+
+def test_pending_rollups_are_applied_once(storage):
+    delta = {
+        "tx_count": Decimal("1"),
+        "balance": Decimal("-2.50"),
+        "credit_count": Decimal("0"),
+        "credit_total": Decimal("0"),
+        "debit_count": Decimal("1"),
+        "debit_total": Decimal("-2.50"),
+    }
+    storage.add_to_rollups(mock_user_id, {"2024": delta})
+    storage.save_ingestion(
+        {
+            "file": "a.csv#backfill#0",
+            "rollups": [
+                {"UserId": mock_user_id, "Bucket": "2024", **delta},
+                {"UserId": "other", "Bucket": "2024-01", **delta},
+            ],
+        }
+    )
+
+    assert storage.apply_pending_rollups("a.csv#backfill#0") is True
+    assert storage.apply_pending_rollups("a.csv#backfill#0") is False
+
+    assert storage.get_ingestion("a.csv#backfill#0") is None
+    assert storage.get_rollups(mock_user_id, ["2024"])["2024"]["balance"] == Decimal(
+        "-5.00"
+    )
+    assert storage.get_rollups("other", ["2024-01"])["2024-01"]["tx_count"] == 1
+
+
+def test_consume_quota(storage):
+    """Counts up to the limit per key"""
+    assert [storage.consume_quota("k#1", 2, 2000000000) for _ in range(3)] == [
+        True,
+        True,
+        False,
+    ]
+    assert storage.consume_quota("k#2", 2, 2000000000)
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_create_user_duplicate_email(backend):
+    """Backends with an email index reject duplicates"""
+    storage = create_storage(
+        backend, **({"path": ":memory:"} if backend == "sqlite" else {})
+    )
+    storage.create_user({"id": "u1", "email": "a@example.com"})
+
+    with pytest.raises(AlreadyExists):
+        storage.create_user({"id": "u2", "email": "a@example.com"})
+
+
+def test_create_storage_unknown_backend():
+    with pytest.raises(ValueError):
+        create_storage("cassandra")
@@ -0,0 +1,388 @@
+"""
+Offline bulk load of historical statements, without /upload-file and the S3
+triggered processor.
+
+Reads every .csv file under a local directory or an s3://bucket/prefix and
+parses it with the processor's rules (local_aws.processor follows
+core/process_file line for line). The movements are inserted by `--workers`
+parallel writers in batches of `--batch-size`. Ids are the ones the processor
+gives the same object: S3 objects use their ETag, and local files the MD5 of
+their content, the ETag of a plain S3 PUT of the file. /upload-file drops the
+token line and rejoins the lines with "\n", so an upload can get other ids.
+
+Rollups count the movements a file adds. A first read finds the ids not
+stored yet, and their rollups are saved to file_ingestions as pending records
+before anything is inserted. The second read checks each batch's ids again,
+skips the ones taken since, and writes the rest with BatchWriteItem
+(Storage.put_movements, which resends unprocessed items) instead of one
+conditional put per row. Each pending record is then added and deleted in one
+step (Storage.apply_pending_rollups), so a run stopped anywhere resumes
+without losing or repeating rollups. Each finished file is recorded in
+file_ingestions, so later runs and the processor skip it. Users that already
+have shards (MOVEMENT_SHARDING) are spread over them like the processor does.
+
+    cd app && python -m tools.backfill s3://stori-challenge-bucket/history/ --workers 32
+    cd app && python -m tools.backfill ./statements --storage sqlite
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+import argparse
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from local_aws.processor import (
+    movement_partition,
+    movement_source,
+    parse_statement,
+    statement_lines,
+)
+from routes.get_summary.rollups import build_rollups, empty_rollup, merge_rollup
+
+# S3 objects up to this size are downloaded to memory, larger ones spill to disk
+SPOOL_BYTES = 64 * 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+# Buckets per pending rollups record, its 99 ADDs and delete are one DynamoDB
+# transaction
+PENDING_BUCKETS = 99
+
+
+def pending_rollups_key(file: str, index: int) -> str:
+    return f"{file}#backfill#{index}"
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@dataclass
+class Statement:
+    # Key of its file_ingestions record: "bucket/key" or the local path
+    file: str
+    # Quoted like S3 ETags
+    etag: str
+    open: Callable = field(repr=False)
+
+
+@dataclass
+class Progress:
+    files: int = 0
+    total_files: int = 0
+    skipped_files: int = 0
+    lines: int = 0
+    saved: int = 0
+    duplicates: int = 0
+    errors: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started_at
+        return (self.saved + self.duplicates) / elapsed if elapsed else 0.0
+
+    def report(self) -> str:
+        return (
+            f"{self.files}/{self.total_files} files ({self.skipped_files} skipped), "
+            f"{self.lines} lines, {self.saved} saved, {self.duplicates} duplicates, "
+            f"{self.errors} errors, {self.rows_per_second:,.0f} rows/s"
+        )
+
+
+def local_statements(directory: str) -> list:
+    """The .csv files under `directory`, with the ETag S3 gives a PUT of each"""
+    statements = []
+    for path in sorted(Path(directory).rglob("*.csv")):
+        digest = hashlib.md5()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(CHUNK_BYTES), b""):
+                digest.update(chunk)
+        statements.append(
+            Statement(
+                str(path), f'"{digest.hexdigest()}"', lambda path=path: open(path, "rb")
+            )
+        )
+    return statements
+
+
+def s3_statements(s3, url: str) -> list:
+    """The .csv objects under s3://bucket/prefix"""
+    bucket, _, prefix = url[len("s3://") :].partition("/")
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    statements = []
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for entry in response.get("Contents", []):
+            if entry["Key"].endswith(".csv"):
+                statements.append(
+                    Statement(
+                        f"{bucket}/{entry['Key']}",
+                        entry["ETag"],
+                        lambda key=entry["Key"]: _download(s3, bucket, key),
+                    )
+                )
+        if not response.get("IsTruncated"):
+            return statements
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def _download(s3, bucket: str, key: str):
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    for chunk in iter(lambda: body.read(CHUNK_BYTES), b""):
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+class Backfill:
+    """
+    Loads statements into `storage` one file after the other. The file being
+    parsed feeds up to `workers` concurrent put_movements batches, and at
+    most twice that many batches are in memory.
+    """
+
+    def __init__(self, storage, workers: int = 16, batch_size: int = 500):
+        self.storage = storage
+        self.workers = workers
+        self.batch_size = batch_size
+        self.progress = Progress()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._shards = {}
+
+    def run(self, statements: list, report_every: float = 0) -> Progress:
+        self.progress = Progress(total_files=len(statements))
+        done = threading.Event()
+        reporter = None
+        if report_every:
+            reporter = threading.Thread(
+                target=self._report, args=(done, report_every), daemon=True
+            )
+            reporter.start()
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="backfill"
+            ) as executor:
+                for statement in statements:
+                    self._load(executor, statement)
+        finally:
+            done.set()
+            if reporter is not None:
+                reporter.join()
+        return self.progress
+
+    def _report(self, done: threading.Event, interval: float):
+        while not done.wait(interval):
+            print(f"⏳ {self.progress.report()}", flush=True)
+
+    def _load(self, executor, statement: Statement):
+        state = self.storage.get_ingestion(statement.file)
+        if (
+            state is not None
+            and state["status"] == "completed"
+            and state["etag"] == statement.etag
+        ):
+            with self._lock:
+                self.progress.files += 1
+                self.progress.skipped_files += 1
+            return
+
+        source = movement_source(statement.file, statement.etag)
+        with statement.open() as stream:
+            if (
+                state is not None
+                and state["status"] == "backfilling"
+                and state["etag"] == statement.etag
+            ):
+                # A run stopped after saving the rollups, which already count
+                # the rows it inserted and that now look taken
+                records, written = int(state["rollup_records"]), int(state["written"])
+            else:
+                records, written = self._save_rollups(
+                    executor, statement, stream, source
+                )
+                stream.seek(0)
+            futures, lines, errors = self._map_batches(
+                executor, stream, source, self._write
+            )
+            for future in futures:
+                future.result()
+            offset = stream.tell()
+
+        for future in [
+            executor.submit(
+                self.storage.apply_pending_rollups,
+                pending_rollups_key(statement.file, index),
+            )
+            for index in range(records)
+        ]:
+            future.result()
+
+        with self._lock:
+            self.progress.files += 1
+            self.progress.lines += lines
+            self.progress.errors += errors
+        self.storage.save_ingestion(
+            {
+                "file": statement.file,
+                "status": "completed",
+                "etag": statement.etag,
+                "offset": offset,
+                "line": lines,
+                "written": written,
+                "errors": errors,
+                "updated_at": _timestamp(),
+            }
+        )
+
+    def _save_rollups(self, executor, statement: Statement, stream, source) -> tuple:
+        """
+        Save the rollups of the file's movements whose id is not taken as
+        pending records and mark the file "backfilling". Returns (records,
+        movements counted).
+        """
+        futures, _, _ = self._map_batches(executor, stream, source, self._new_rollups)
+        written, rollups = 0, {}
+        for future in futures:
+            count, batch_rollups = future.result()
+            written += count
+            for key, rollup in batch_rollups.items():
+                merge_rollup(rollups.setdefault(key, empty_rollup()), rollup)
+
+        items = [
+            {"UserId": user_id, "Bucket": bucket, **rollup}
+            for (user_id, bucket), rollup in sorted(rollups.items())
+        ]
+        records = [
+            items[start : start + PENDING_BUCKETS]
+            for start in range(0, len(items), PENDING_BUCKETS)
+        ]
+        for future in [
+            executor.submit(
+                self.storage.save_ingestion,
+                {
+                    "file": pending_rollups_key(statement.file, index),
+                    "rollups": record,
+                },
+            )
+            for index, record in enumerate(records)
+        ]:
+            future.result()
+        self.storage.save_ingestion(
+            {
+                "file": statement.file,
+                "status": "backfilling",
+                "etag": statement.etag,
+                "rollup_records": len(records),
+                "written": written,
+                "updated_at": _timestamp(),
+            }
+        )
+        return len(records), written
+
+    def _map_batches(self, executor, stream, source: str, work) -> tuple:
+        """
+        work(batch) for the file's valid movements in batches of batch_size.
+        Returns (futures, lines, errors).
+        """
+        lines = errors = 0
+        futures, batch = [], []
+        for line_number, movement, error in parse_statement(
+            statement_lines(stream), source
+        ):
+            lines = line_number
+            if error is not None:
+                errors += 1
+                continue
+            batch.append(movement)
+            if len(batch) == self.batch_size:
+                futures.append(self._submit(executor, work, batch))
+                batch = []
+        if batch:
+            futures.append(self._submit(executor, work, batch))
+        return futures, lines, errors
+
+    def _submit(self, executor, work, batch: list):
+        self._slots.acquire()
+        future = executor.submit(work, batch)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _new_rollups(self, batch: list) -> tuple:
+        """(count, rollups) of the movements in batch whose id is not taken"""
+        taken = self.storage.taken_movement_ids([movement["id"] for movement in batch])
+        new = [movement for movement in batch if movement["id"] not in taken]
+        return len(new), build_rollups(new)
+
+    def _partition(self, batch: list) -> list:
+        """Copies of the movements under the UserId they are written to"""
+        stored = []
+        for movement in batch:
+            user_id = movement["UserId"]
+            if user_id not in self._shards:
+                self._shards[user_id] = self.storage.get_shard_count(user_id)
+            partition = movement_partition(
+                user_id, movement["id"], self._shards[user_id]
+            )
+            stored.append({**movement, "UserId": partition})
+        return stored
+
+    def _write(self, batch: list) -> list:
+        """
+        Insert the movements of a batch whose id is not stored yet and return
+        them. The ids are checked again right before writing, so rows taken
+        since the first read, or inserted by a stopped run, are skipped and
+        the rest go in batch writes instead of one conditional put per row.
+        """
+        taken = self.storage.taken_movement_ids([movement["id"] for movement in batch])
+        inserted = [movement for movement in batch if movement["id"] not in taken]
+        if inserted:
+            self.storage.put_movements(
+                self._partition(inserted) if self.storage.sharding else inserted
+            )
+        with self._lock:
+            self.progress.saved += len(inserted)
+            self.progress.duplicates += len(taken)
+        return inserted
+
+
+def main():
+    from storage import BACKENDS, create_storage
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", help="local directory or s3://bucket/prefix")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent batches")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per batch")
+    parser.add_argument("--storage", choices=BACKENDS, help="default STORAGE_BACKEND")
+    parser.add_argument(
+        "--progress", type=float, default=5.0, help="seconds between reports"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    if args.source.startswith("s3://"):
+        import boto3
+        from common.config import get_settings
+
+        s3 = boto3.client("s3", config=get_settings().boto_config())
+        statements = s3_statements(s3, args.source)
+    else:
+        statements = local_statements(args.source)
+    storage = create_storage(args.storage)
+    print(f"📂 {len(statements)} statements, {args.workers} writers")
+    try:
+        progress = Backfill(storage, args.workers, args.batch_size).run(
+            statements, args.progress
+        )
+    finally:
+        storage.close()
+    print(f"✅ {progress.report()}")
+
+
+if __name__ == "__main__":
+    main()
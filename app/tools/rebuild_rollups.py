@@ -0,0 +1,31 @@
+"""
+Recompute the rollup buckets of users from their stored movements.
+
+Ranged /get-summary requests only read movement_rollups. Movements saved
+before the rollups existed, or by a writer that skipped them, are missing from
+those summaries until their users are rebuilt. Each user's buckets are set to
+what build_rollups gives for all of the user's movements, hot and cold, by
+adding the difference. Pause the user's uploads while it runs: a file ingested
+in between has its rows counted by the processor and subtracted again here.
+
+    cd app && python -m tools.rebuild_rollups user1 user2
+"""
+
+import argparse
+import logging
+
+
+def main():
+    from routes.get_summary.rollups import rebuild_rollups
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("users", nargs="+", help="UserIds to rebuild")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    for user_id in args.users:
+        print(f"✅ {user_id}: {rebuild_rollups(user_id)} buckets changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+from decimal import Decimal
+import pytest
+from local_aws import FileProcessor, LocalAWS
+from tools import backfill
+from local_aws.processor import movement_source, parse_statement, statement_lines
+from tools.backfill import Backfill, local_statements, s3_statements
+
+STATEMENT = "user1,2024-01-10,100.50\nuser1,2024-01-20,-50.25\nbad line\n"
+
+
+def write_statements(directory, files: int = 3, rows: int = 40) -> list:
+    bodies = []
+    for index in range(files):
+        body = "\n".join(
+            f"user{row % 4},2024-{index + 1:02d}-{row % 28 + 1:02d},{row}.25"
+            for row in range(rows)
+        )
+        (directory / f"statement-{index}.csv").write_text(body + "\nbad line\n")
+        bodies.append(body)
+    (directory / "notes.txt").write_text("not a statement")
+    return bodies
+
+
+# -------------------------- Unit Tests --------------------------
+
+
+def test_local_statements_use_the_etag_of_a_put(tmp_path):
+    (tmp_path / "a.csv").write_text(STATEMENT)
+    aws = LocalAWS()
+    uploaded = aws.s3.put_object(Bucket="bucket", Key="a.csv", Body=STATEMENT)
+
+    [statement] = local_statements(str(tmp_path))
+
+    assert statement.etag == uploaded["ETag"]
+    with statement.open() as stream:
+        assert stream.read() == STATEMENT.encode()
+
+
+# -------------------------- Integration Tests --------------------------
+
+
+def test_backfill_matches_the_processor(tmp_path):
+    write_statements(tmp_path)
+    aws = LocalAWS()
+
+    progress = Backfill(aws.storage, workers=4, batch_size=7).run(
+        local_statements(str(tmp_path))
+    )
+
+    assert (progress.files, progress.saved, progress.errors) == (3, 120, 3)
+    january = aws.storage.get_rollups("user1", ["2024-01"])["2024-01"]
+    assert january["tx_count"] == 10
+    assert january["balance"] == sum(Decimal(f"{row}.25") for row in range(1, 40, 4))
+    state = aws.storage.get_ingestion(str(tmp_path / "statement-0.csv"))
+    assert (state["status"], state["line"], state["written"]) == ("completed", 41, 40)
+
+    # The same bytes put to S3 later get the same ids, nothing is added twice
+    processor = FileProcessor(aws)
+    body = (tmp_path / "statement-0.csv").read_bytes()
+    aws.s3.put_object(Bucket="bucket", Key="upload.csv", Body=body)
+    result = processor.process("bucket", "upload.csv")
+    assert (result.saved, result.duplicates) == (0, 40)
+    assert aws.storage.get_rollups("user1", ["2024-01"])["2024-01"] == january
+
+
+def test_backfill_resumes_from_s3(tmp_path):
+    aws = LocalAWS()
+    for index, body in enumerate(write_statements(tmp_path, files=2)):
+        aws.s3.put_object(Bucket="history", Key=f"2024/{index}.csv", Body=body)
+    aws.s3.put_object(Bucket="history", Key="other/skip.csv", Body=STATEMENT)
+    statements = s3_statements(aws.s3, "s3://history/2024/")
+    assert [statement.file for statement in statements] == [
+        "history/2024/0.csv",
+        "history/2024/1.csv",
+    ]
+    Backfill(aws.storage).run(statements[:1])
+
+    progress = Backfill(aws.storage, workers=2).run(statements)
+
+    assert (progress.skipped_files, progress.saved, progress.duplicates) == (1, 40, 0)
+    assert len(aws.dynamodb.Table("movements")) == 80
+    february = aws.storage.get_rollups("user0", ["2024-02"])["2024-02"]
+    assert february["tx_count"] == 10
+
+
+def test_backfill_spreads_sharded_users(tmp_path):
+    write_statements(tmp_path, files=1)
+    aws = LocalAWS()
+    aws.storage.sharding = True
+    aws.storage.set_shard_count("user1", 4)
+
+    Backfill(aws.storage, batch_size=5).run(local_statements(str(tmp_path)))
+
+    partitions = {
+        item["UserId"] for item in aws.dynamodb.Table("movements").all_items()
+    }
+    assert "user1" not in partitions and "user0" in partitions
+    assert len(aws.storage.get_movements("user1", "2024-01-01", "2024-01-31")) == 10
+    assert aws.storage.get_rollups("user1", ["2024-01"])["2024-01"]["tx_count"] == 10
+
+
+def all_rollups(storage) -> dict:
+    buckets = ["2024", "2024-01", "2024-02", "2024-03"]
+    buckets += [
+        f"2024-{month:02d}-{day:02d}" for month in (1, 2, 3) for day in range(1, 29)
+    ]
+    return {
+        user_id: storage.get_rollups(user_id, buckets)
+        for user_id in ("user0", "user1", "user2", "user3")
+    }
+
+
+@pytest.mark.parametrize(
+    "method, call",
+    [("put_movements", 5), ("apply_pending_rollups", 2)],
+)
+def test_backfill_resumes_without_losing_or_repeating_rollups(
+    tmp_path, monkeypatch, method, call
+):
+    write_statements(tmp_path, files=2)
+    monkeypatch.setattr(backfill, "PENDING_BUCKETS", 10)
+    expected = LocalAWS()
+    Backfill(expected.storage, workers=1, batch_size=7).run(
+        local_statements(str(tmp_path))
+    )
+    aws = LocalAWS()
+    # The run stops at the given call, after some rows or rollups are stored
+    calls = []
+    original = getattr(aws.storage, method)
+
+    def crash(*args):
+        calls.append(args)
+        if len(calls) == call:
+            raise RuntimeError("stopped")
+        return original(*args)
+
+    monkeypatch.setattr(aws.storage, method, crash)
+    with pytest.raises(RuntimeError):
+        Backfill(aws.storage, workers=1, batch_size=7).run(
+            local_statements(str(tmp_path))
+        )
+    monkeypatch.setattr(aws.storage, method, original)
+
+    progress = Backfill(aws.storage, workers=2, batch_size=7).run(
+        local_statements(str(tmp_path))
+    )
+
+    assert progress.files == 2
+    assert len(aws.dynamodb.Table("movements")) == 80
+    assert all_rollups(aws.storage) == all_rollups(expected.storage)
+    state = aws.storage.get_ingestion(str(tmp_path / "statement-0.csv"))
+    assert (state["status"], state["written"]) == ("completed", 40)
+
+
+def test_backfill_counts_a_copied_file_once(tmp_path):
+    write_statements(tmp_path, files=1)
+    (tmp_path / "copy.csv").write_bytes((tmp_path / "statement-0.csv").read_bytes())
+    aws = LocalAWS()
+
+    progress = Backfill(aws.storage, batch_size=7).run(local_statements(str(tmp_path)))
+
+    assert (progress.saved, progress.duplicates) == (40, 40)
+    assert aws.storage.get_rollups("user1", ["2024-01"])["2024-01"]["tx_count"] == 10
+    assert aws.storage.get_ingestion(str(tmp_path / "statement-0.csv"))["written"] == 0
+
+
+def test_backfill_batch_writes_and_skips_ids_taken_between_reads(tmp_path, monkeypatch):
+    write_statements(tmp_path, files=1)
+    aws = LocalAWS()
+    [statement] = local_statements(str(tmp_path))
+    with statement.open() as stream:
+        first = next(
+            movement
+            for _, movement, error in parse_statement(
+                statement_lines(stream),
+                movement_source(statement.file, statement.etag),
+            )
+            if error is None
+        )
+    # Another writer stores a row of the file after the rollups are saved
+    save_rollups = Backfill._save_rollups
+
+    def then_taken(self, *args):
+        result = save_rollups(self, *args)
+        aws.storage.put_movements([{**first, "processed": "elsewhere"}])
+        return result
+
+    monkeypatch.setattr(Backfill, "_save_rollups", then_taken)
+    monkeypatch.setattr(aws.storage, "insert_movements", pytest.fail)
+
+    progress = Backfill(aws.storage, batch_size=7).run([statement])
+
+    assert (progress.saved, progress.duplicates) == (39, 1)
+    assert len(aws.dynamodb.Table("movements")) == 40
+    stored = aws.dynamodb.Table("movements").get_item(Key={"id": first["id"]})
+    assert stored["Item"]["processed"] == "elsewhere"
@@ -0,0 +1,78 @@
+package main
+
+import (
+	"math"
+	"sync"
+)
+
+// Filtro de Bloom de ids de movimientos que este contenedor ya escribió o
+// encontró escritos. No da falsos negativos: un id que no está seguro no se
+// vio. Un positivo puede ser falso, por eso solo decide qué ids se consultan
+// con BatchGetItem antes de escribir, nunca qué filas se descartan.
+type bloomFilter struct {
+    mu       sync.Mutex
+    bits     []uint64
+    size     uint64
+    hashes   int
+    count    int
+    capacity int
+}
+
+// Filtro para `capacity` ids con la tasa de falsos positivos dada. Pasada
+// esa cantidad se vacía, así la tasa no crece en un contenedor de vida larga.
+func newBloomFilter(capacity int, falsePositiveRate float64) *bloomFilter {
+    if capacity < 1 {
+        capacity = 1
+    }
+    size := uint64(math.Ceil(-float64(capacity) * math.Log(falsePositiveRate) / (math.Ln2 * math.Ln2)))
+    size = (size + 63) / 64 * 64
+    hashes := int(math.Round(float64(size) / float64(capacity) * math.Ln2))
+    if hashes < 1 {
+        hashes = 1
+    }
+    return &bloomFilter{bits: make([]uint64, size/64), size: size, hashes: hashes, capacity: capacity}
+}
+
+// Dos hashes FNV-1a de 64 bits combinados como h1 + i*h2 (Kirsch-Mitzenmacher)
+func bloomHashes(id string) (uint64, uint64) {
+    h1 := uint64(14695981039346656037)
+    for i := 0; i < len(id); i++ {
+        h1 ^= uint64(id[i])
+        h1 *= 1099511628211
+    }
+    h2 := h1 ^ (h1 >> 29) ^ 0x9e3779b97f4a7c15
+    h2 *= 0xbf58476d1ce4e5b9
+    return h1, h2 | 1
+}
+
+func (b *bloomFilter) Add(ids ...string) {
+    b.mu.Lock()
+    defer b.mu.Unlock()
+    if b.count+len(ids) > b.capacity {
+        for i := range b.bits {
+            b.bits[i] = 0
+        }
+        b.count = 0
+    }
+    for _, id := range ids {
+        h1, h2 := bloomHashes(id)
+        for i := 0; i < b.hashes; i++ {
+            bit := (h1 + uint64(i)*h2) % b.size
+            b.bits[bit/64] |= 1 << (bit % 64)
+        }
+        b.count++
+    }
+}
+
+func (b *bloomFilter) MayContain(id string) bool {
+    h1, h2 := bloomHashes(id)
+    b.mu.Lock()
+    defer b.mu.Unlock()
+    for i := 0; i < b.hashes; i++ {
+        bit := (h1 + uint64(i)*h2) % b.size
+        if b.bits[bit/64]&(1<<(bit%64)) == 0 {
+            return false
+        }
+    }
+    return true
+}
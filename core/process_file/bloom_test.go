@@ -0,0 +1,39 @@
+package main
+
+import (
+	"fmt"
+	"testing"
+)
+
+// Sin falsos negativos y con una tasa de falsos positivos cercana a la pedida
+func TestBloomFilter(t *testing.T) {
+    filter := newBloomFilter(10000, 0.01)
+    for i := 0; i < 10000; i += 1000 {
+        ids := make([]string, 0, 1000)
+        for j := i; j < i+1000; j++ {
+            ids = append(ids, generateUniqueID("etag", []byte("user-1"), j))
+        }
+        filter.Add(ids...)
+    }
+    for i := 0; i < 10000; i++ {
+        if !filter.MayContain(generateUniqueID("etag", []byte("user-1"), i)) {
+            t.Fatalf("line %d not found", i)
+        }
+    }
+
+    positives := 0
+    for i := 0; i < 100000; i++ {
+        if filter.MayContain(fmt.Sprintf("tx-%d", i)) {
+            positives++
+        }
+    }
+    if rate := float64(positives) / 100000; rate > 0.02 {
+        t.Fatalf("false positive rate %.4f", rate)
+    }
+
+    // Pasada la capacidad se vacía
+    filter.Add("overflow")
+    if filter.MayContain(generateUniqueID("etag", []byte("user-1"), 1)) && filter.MayContain(generateUniqueID("etag", []byte("user-1"), 2)) {
+        t.Fatalf("filter was not cleared")
+    }
+}
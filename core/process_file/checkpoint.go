@@ -0,0 +1,181 @@
+package main
+
+import (
+	"context"
+	"log"
+	"strconv"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+// Estado de ingesta de cada archivo, con clave "file" = "bucket/key". La API
+// lo expone en GET /upload-file/status.
+const ingestionsTableName = "file_ingestions"
+
+const (
+    ingestionProcessing = "processing"
+    ingestionCompleted  = "completed"
+)
+
+// Cada CHECKPOINT_LINES líneas se espera a que se escriba lo encolado y se
+// guarda hasta dónde se llegó; 0 desactiva los checkpoints intermedios
+var checkpointLines = envInt("CHECKPOINT_LINES", 10000)
+
+type ingestion struct {
+    File    string
+    Status  string
+    ETag    string
+    // Byte y línea hasta los que todo quedó escrito
+    Offset  int64
+    Line    int
+    Written int
+    Errors  int
+    // Rollups pendientes del tramo que terminó en RollupLine (rollups.go)
+    RollupLine   int
+    RollupChunks int
+}
+
+func loadIngestion(ctx context.Context, client dynamoAPI, file string) (*ingestion, error) {
+    tableName := ingestionsTableName
+    consistent := true
+    output, err := client.GetItem(ctx, &dynamodb.GetItemInput{
+        TableName:      &tableName,
+        Key:            map[string]types.AttributeValue{"file": &types.AttributeValueMemberS{Value: file}},
+        ConsistentRead: &consistent,
+    })
+    if err != nil || output == nil || output.Item == nil {
+        return nil, err
+    }
+    item := output.Item
+    return &ingestion{
+        File:    file,
+        Status:  stringAttribute(item, "status"),
+        ETag:    stringAttribute(item, "etag"),
+        Offset:  int64(numberAttribute(item, "offset")),
+        Line:    numberAttribute(item, "line"),
+        Written: numberAttribute(item, "written"),
+        Errors:  numberAttribute(item, "errors"),
+        RollupLine:   numberAttribute(item, "rollup_line"),
+        RollupChunks: numberAttribute(item, "rollup_chunks"),
+    }, nil
+}
+
+func saveIngestion(ctx context.Context, client dynamoAPI, state *ingestion) error {
+    tableName := ingestionsTableName
+    _, err := client.PutItem(ctx, &dynamodb.PutItemInput{
+        TableName: &tableName,
+        Item: map[string]types.AttributeValue{
+            "file":       &types.AttributeValueMemberS{Value: state.File},
+            "status":     &types.AttributeValueMemberS{Value: state.Status},
+            "etag":       &types.AttributeValueMemberS{Value: state.ETag},
+            "offset":     &types.AttributeValueMemberN{Value: strconv.FormatInt(state.Offset, 10)},
+            "line":       &types.AttributeValueMemberN{Value: strconv.Itoa(state.Line)},
+            "written":    &types.AttributeValueMemberN{Value: strconv.Itoa(state.Written)},
+            "errors":     &types.AttributeValueMemberN{Value: strconv.Itoa(state.Errors)},
+            "rollup_line":   &types.AttributeValueMemberN{Value: strconv.Itoa(state.RollupLine)},
+            "rollup_chunks": &types.AttributeValueMemberN{Value: strconv.Itoa(state.RollupChunks)},
+            "updated_at": &types.AttributeValueMemberS{Value: time.Now().UTC().Format(time.RFC3339)},
+        },
+    })
+    return err
+}
+
+func stringAttribute(item map[string]types.AttributeValue, name string) string {
+    if value, ok := item[name].(*types.AttributeValueMemberS); ok {
+        return value.Value
+    }
+    return ""
+}
+
+func numberAttribute(item map[string]types.AttributeValue, name string) int {
+    if value, ok := item[name].(*types.AttributeValueMemberN); ok {
+        number, _ := strconv.Atoi(value.Value)
+        return number
+    }
+    return 0
+}
+
+// Guarda checkpoints de un archivo leído de corrido. Cada checkpoint espera
+// a que DynamoDB confirme lo encolado, guarda los rollups de esas filas como
+// pendientes junto con la posición y después los aplica (ver rollups.go): al
+// retomar no se pierde ni se repite nada, muera la Lambda donde muera.
+type checkpointer struct {
+    ctx      context.Context
+    client   dynamoAPI
+    writer   *batchWriter
+    state    *ingestion
+    // Escritos y errores que ya traía el estado al empezar esta invocación
+    base     ingestion
+    lastLine int
+    // Rollups de lo escrito desde el último checkpoint guardado
+    rollups  map[rollupKey]*rollupDelta
+    // Ítems de rollups pendientes que no se pudieron guardar o aplicar
+    rollupErrors int
+}
+
+func newCheckpointer(ctx context.Context, client dynamoAPI, writer *batchWriter, state *ingestion) *checkpointer {
+    return &checkpointer{ctx: ctx, client: client, writer: writer, state: state, base: *state, lastLine: state.Line, rollups: make(map[rollupKey]*rollupDelta)}
+}
+
+// Se llama después de procesar cada línea
+func (c *checkpointer) afterLine(reader *lineReader, lineErrors int) {
+    if checkpointLines > 0 && reader.line-c.lastLine >= checkpointLines {
+        c.save(reader, lineErrors, ingestionProcessing)
+    }
+}
+
+// Guarda la posición del reader. Si algo falla el estado no avanza y sus
+// rollups se suman a los del próximo checkpoint; devuelve si se guardó.
+// Después de una fila que el writer dio por fallida no se guarda ninguno más:
+// el reintento sigue desde antes de ella.
+func (c *checkpointer) save(reader *lineReader, lineErrors int, status string) bool {
+    c.writer.Flush()
+    mergeRollups(c.rollups, c.writer.TakeRollups())
+    c.lastLine = reader.line
+    if c.writer.failed > 0 {
+        log.Printf("⚠️ %d movements could not be written, keeping the checkpoint at line %d", c.writer.failed, c.state.Line)
+        return false
+    }
+    // Los pendientes del checkpoint anterior se aplican antes de reemplazarlos
+    if !c.applyPending() {
+        return false
+    }
+    chunks, err := saveRollupChunks(c.ctx, c.client, c.state.File, reader.line, c.rollups)
+    if err != nil {
+        log.Printf("❌ ERROR: Failed to save the rollups of line %d: %v", reader.line, err)
+        c.rollupErrors++
+        return false
+    }
+
+    state := *c.state
+    state.Status = status
+    state.Offset = reader.offset
+    state.Line = reader.line
+    state.Written = c.base.Written + c.writer.written
+    state.Errors = c.base.Errors + lineErrors
+    state.RollupLine = reader.line
+    state.RollupChunks = chunks
+    if err := saveIngestion(c.ctx, c.client, &state); err != nil {
+        log.Printf("❌ ERROR: Failed to save checkpoint at line %d: %v", reader.line, err)
+        return false
+    }
+    *c.state = state
+    c.rollups = make(map[rollupKey]*rollupDelta)
+    log.Printf("💾 Checkpoint saved at line %d (byte %d)", reader.line, reader.offset)
+    c.applyPending()
+    return true
+}
+
+func (c *checkpointer) applyPending() bool {
+    if c.state.RollupChunks == 0 {
+        return true
+    }
+    if errs := applyRollupChunks(c.ctx, c.client, c.state.File, c.state.RollupLine, c.state.RollupChunks); errs > 0 {
+        c.rollupErrors += errs
+        return false
+    }
+    c.state.RollupChunks = 0
+    return true
+}
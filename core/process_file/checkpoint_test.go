@@ -0,0 +1,132 @@
+package main
+
+import (
+	"context"
+	"reflect"
+	"testing"
+
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+func ingestionStatus(fake *fakeDynamo, file string) string {
+    return stringAttribute(fake.ingestions[file], "status")
+}
+
+// Una lectura que se corta a mitad de archivo deja un checkpoint; el
+// reintento sigue desde ahí y termina con los mismos movimientos, rollups y
+// totales que una sola pasada
+func TestResumeFromCheckpoint(t *testing.T) {
+    previous := checkpointLines
+    checkpointLines = 50
+    defer func() { checkpointLines = previous }()
+
+    content := []byte(rangesStatement())
+    clean := newFakeDynamo(0)
+    cleanStats := processObject(context.Background(), &fakeS3{objects: map[string][]byte{"statement.csv": content}}, clean, "bucket", "statement.csv")
+
+    storage := &fakeS3{objects: map[string][]byte{"statement.csv": content}, failAfter: len(content) / 2}
+    fake := newFakeDynamo(0)
+    processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+    if status := ingestionStatus(fake, "bucket/statement.csv"); status != ingestionProcessing {
+        t.Fatalf("status after a failed read: %q", status)
+    }
+    line := numberAttribute(fake.ingestions["bucket/statement.csv"], "line")
+    if line == 0 || len(fake.items) == 0 || len(fake.items) >= len(clean.items) {
+        t.Fatalf("checkpoint at line %d with %d of %d items", line, len(fake.items), len(clean.items))
+    }
+
+    storage.failAfter = 0
+    stats := processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+    if len(storage.ranges) != 1 {
+        t.Fatalf("expected one ranged read to resume, got %v", storage.ranges)
+    }
+    if stats.lines != cleanStats.lines || stats.written != cleanStats.written || stats.errors != cleanStats.errors {
+        t.Fatalf("resumed stats %+v, single pass %+v", stats, cleanStats)
+    }
+    if !reflect.DeepEqual(fake.items, clean.items) || !reflect.DeepEqual(fake.rollups, clean.rollups) {
+        t.Fatalf("resumed run wrote %d items and %d rollups, single pass %d and %d", len(fake.items), len(fake.rollups), len(clean.items), len(clean.rollups))
+    }
+    if status := ingestionStatus(fake, "bucket/statement.csv"); status != ingestionCompleted {
+        t.Fatalf("status after resuming: %q", status)
+    }
+
+    // Una entrega repetida del mismo evento no vuelve a sumar rollups
+    processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+    if !reflect.DeepEqual(fake.rollups, clean.rollups) {
+        t.Fatalf("completed file was processed again")
+    }
+
+    // Un archivo nuevo con la misma key se procesa desde el principio
+    storage.objects["statement.csv"] = []byte("user-1,2024-05-01,10\n")
+    stats = processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+    if stats.written != 1 || stats.lines != 2 {
+        t.Fatalf("new upload stats %+v", stats)
+    }
+    if _, ok := fake.ingestions["bucket/statement.csv"]["etag"].(*types.AttributeValueMemberS); !ok {
+        t.Fatalf("ingestion state has no etag")
+    }
+}
+
+// Una invocación que escribe las filas y muere antes de guardar el checkpoint
+// no deja rollups; el reintento encuentra las filas marcadas con su archivo y
+// las cuenta, leyendo de corrido o por rangos
+func TestRollupsOfRowsWrittenBeforeACrash(t *testing.T) {
+    content := []byte(rangesStatement())
+    for _, splitBytes := range []int64{1 << 40, 0} {
+        var clean, fake *fakeDynamo
+        var cleanStats, stats fileStats
+        withRanges(splitBytes, 1000, 4, func() {
+            clean = newFakeDynamo(0)
+            cleanStats = processObject(context.Background(), &fakeS3{objects: map[string][]byte{"statement.csv": content}}, clean, "bucket", "statement.csv")
+
+            fake = newFakeDynamo(0)
+            fake.failIngestions = true
+            storage := &fakeS3{objects: map[string][]byte{"statement.csv": content}}
+            if crashed := processObject(context.Background(), storage, fake, "bucket", "statement.csv"); !crashed.incomplete {
+                t.Fatalf("split %d: a run that could not save its state is complete", splitBytes)
+            }
+            if len(fake.items) != len(clean.items) || len(fake.rollups) != 0 {
+                t.Fatalf("split %d: crashed run wrote %d items and %d rollups", splitBytes, len(fake.items), len(fake.rollups))
+            }
+
+            fake.failIngestions = false
+            stats = processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+        })
+        if stats.written != cleanStats.written || stats.duplicates != 0 || stats.incomplete {
+            t.Fatalf("split %d: retry stats %+v, single pass %+v", splitBytes, stats, cleanStats)
+        }
+        if !reflect.DeepEqual(fake.rollups, clean.rollups) {
+            t.Fatalf("split %d: retry rollups differ from a single pass", splitBytes)
+        }
+    }
+}
+
+// Rollups guardados como pendientes que no se pudieron aplicar se aplican en
+// la próxima invocación, una sola vez
+func TestPendingRollupsAreAppliedOnce(t *testing.T) {
+    content := []byte(rangesStatement())
+    clean := newFakeDynamo(0)
+    processObject(context.Background(), &fakeS3{objects: map[string][]byte{"statement.csv": content}}, clean, "bucket", "statement.csv")
+
+    storage := &fakeS3{objects: map[string][]byte{"statement.csv": content}}
+    fake := newFakeDynamo(0)
+    fake.failRollups = true
+    stats := processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+    if stats.rollupErrors == 0 || len(fake.rollups) != 0 {
+        t.Fatalf("stats %+v with %d rollups", stats, len(fake.rollups))
+    }
+    if chunks := numberAttribute(fake.ingestions["bucket/statement.csv"], "rollup_chunks"); chunks == 0 {
+        t.Fatalf("no pending rollups recorded")
+    }
+
+    fake.failRollups = false
+    for i := 0; i < 2; i++ {
+        processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+        if !reflect.DeepEqual(fake.rollups, clean.rollups) {
+            t.Fatalf("run %d: rollups differ from a single pass", i)
+        }
+    }
+    if len(fake.ingestions) != 1 {
+        t.Fatalf("%d items left in file_ingestions", len(fake.ingestions))
+    }
+}
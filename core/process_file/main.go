@@ -1,17 +1,24 @@
 package main
 
 import (
+	"bytes"
 	"context"
 	"crypto/sha256"
+	"encoding/hex"
+	"encoding/json"
 	"fmt"
 	"io"
 	"log"
+	"math"
+	"os"
 	"strconv"
 	"strings"
+	"sync"
 	"time"
 
 	"github.com/aws/aws-lambda-go/events"
 	"github.com/aws/aws-lambda-go/lambda"
+	"github.com/aws/aws-sdk-go-v2/aws"
 	"github.com/aws/aws-sdk-go-v2/config"
 	"github.com/aws/aws-sdk-go-v2/service/dynamodb"
 	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
@@ -24,139 +31,502 @@ type Transaction struct {
     Date      time.Time `json:"date"`
     Amount    float64   `json:"amount"`
     Processed string    `json:"processed"`
+    // UserId con el que se guarda: UserID o uno de sus shards (shards.go)
+    Partition string    `json:"-"`
 }
 
-// Genera un ID único usando los datos de la transacción
-func generateUniqueID( userID, date string, amount float64, lineNumber int) string {
-    // Combina todos los datos incluyendo el número de línea para asegurar unicidad
-    data := fmt.Sprintf("%s-%s-%s-%.2f-%d", userID, date, amount, lineNumber)
-    // Genera un hash de los datos
-    hash := sha256.Sum256([]byte(data))
-    // Retorna los primeros 16 caracteres del hash en hexadecimal
-    return fmt.Sprintf("%x", hash)[:16]
+// Acumulado de movimientos para un bucket (día, mes o año) de un usuario.
+// Los montos se guardan en centavos para no arrastrar errores de float64.
+type rollupDelta struct {
+    Count       int64
+    Balance     int64
+    CreditCount int64
+    CreditTotal int64
+    DebitCount  int64
+    DebitTotal  int64
 }
 
-func handleRequest(ctx context.Context, s3Event events.S3Event) error {
-    log.Printf("🚀 Lambda function started. Number of records to process: %d", len(s3Event.Records))
-    
-    cfg, err := config.LoadDefaultConfig(ctx)
+type rollupKey struct {
+    UserID string
+    Bucket string
+}
+
+const rollupsTableName = "movement_rollups"
+
+// Suma un movimiento a sus buckets de año ("2024"), mes ("2024-01") y día ("2024-01-15")
+func addToRollups(rollups map[rollupKey]*rollupDelta, userID string, date time.Time, amount float64) {
+    cents := amountCents(amount)
+    // Un solo string para el día; el año y el mes son prefijos suyos
+    var buffer [10]byte
+    day := string(date.AppendFormat(buffer[:0], "2006-01-02"))
+    for _, bucket := range [3]string{day[:4], day[:7], day} {
+        key := rollupKey{UserID: userID, Bucket: bucket}
+        delta, ok := rollups[key]
+        if !ok {
+            delta = &rollupDelta{}
+            rollups[key] = delta
+        }
+        delta.Count++
+        delta.Balance += cents
+        if cents < 0 {
+            delta.DebitCount++
+            delta.DebitTotal += cents
+        } else {
+            delta.CreditCount++
+            delta.CreditTotal += cents
+        }
+    }
+}
+
+// Centavos de un monto, redondeando a la mitad lejos del cero sobre sus
+// dígitos decimales como parse_cents en app/storage/batch.py: "1.005" da 101
+// aunque 1.005 * 100 sea 100.49999... en float64. Los dígitos son los de
+// FormatFloat(-1), el decimal más corto que vuelve al mismo float64, que para
+// los montos de un archivo es el texto leído.
+func amountCents(amount float64) int64 {
+    var buffer [32]byte
+    digits := strconv.AppendFloat(buffer[:0], math.Abs(amount), 'f', -1, 64)
+    var cents int64
+    decimals := -1
+    for _, c := range digits {
+        if c == '.' {
+            decimals = 0
+            continue
+        }
+        if decimals == 2 {
+            if c >= '5' {
+                cents++
+            }
+            break
+        }
+        cents = cents*10 + int64(c-'0')
+        if decimals >= 0 {
+            decimals++
+        }
+    }
+    if decimals < 0 {
+        decimals = 0
+    }
+    for ; decimals < 2; decimals++ {
+        cents *= 10
+    }
+    if amount < 0 {
+        return -cents
+    }
+    return cents
+}
+
+// Convierte centavos a un número decimal de DynamoDB ("-45.50")
+func formatCents(cents int64) string {
+    sign := ""
+    if cents < 0 {
+        sign = "-"
+        cents = -cents
+    }
+    return fmt.Sprintf("%s%d.%02d", sign, cents/100, cents%100)
+}
+
+// ADD atómico de un bucket en la tabla de rollups, una escritura por bucket
+// en lugar de una por movimiento (ver rollups.go)
+func rollupUpdate(key rollupKey, delta *rollupDelta) *types.Update {
+    tableName := rollupsTableName
+    return &types.Update{
+        TableName: &tableName,
+        Key: map[string]types.AttributeValue{
+            "UserId": &types.AttributeValueMemberS{Value: key.UserID},
+            "Bucket": &types.AttributeValueMemberS{Value: key.Bucket},
+        },
+        UpdateExpression: aws.String("ADD #count :count, #balance :balance, #credit_count :credit_count, #credit_total :credit_total, #debit_count :debit_count, #debit_total :debit_total"),
+        ExpressionAttributeNames: map[string]string{
+            "#count":        "tx_count",
+            "#balance":      "balance",
+            "#credit_count": "credit_count",
+            "#credit_total": "credit_total",
+            "#debit_count":  "debit_count",
+            "#debit_total":  "debit_total",
+        },
+        ExpressionAttributeValues: map[string]types.AttributeValue{
+            ":count":        &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.Count, 10)},
+            ":balance":      &types.AttributeValueMemberN{Value: formatCents(delta.Balance)},
+            ":credit_count": &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.CreditCount, 10)},
+            ":credit_total": &types.AttributeValueMemberN{Value: formatCents(delta.CreditTotal)},
+            ":debit_count":  &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.DebitCount, 10)},
+            ":debit_total":  &types.AttributeValueMemberN{Value: formatCents(delta.DebitTotal)},
+        },
+    }
+}
+
+// Límite de errores por línea que se loguean por archivo; el resto solo se cuenta.
+// LOG_LINE_DETAILS=true vuelve a loguear cada línea (solo para depurar).
+var (
+    maxLoggedLineErrors = envInt("LOG_LINE_ERRORS", 20)
+    logLineDetails      = os.Getenv("LOG_LINE_DETAILS") == "true"
+)
+
+func envInt(name string, fallback int) int {
+    value, err := strconv.Atoi(os.Getenv(name))
     if err != nil {
-        log.Printf("❌ ERROR: Failed to load SDK config: %v", err)
-        return fmt.Errorf("unable to load SDK config: %v", err)
+        return fallback
     }
+    return value
+}
 
-    s3Client := s3.NewFromConfig(cfg)
-    dynamoClient := dynamodb.NewFromConfig(cfg)
+// Loguea los primeros errores de línea de un archivo y cuenta los suprimidos,
+// así un archivo con millones de líneas malas no genera millones de logs
+// Seguro entre goroutines: los workers del batchWriter también loguean acá.
+type lineErrorLogger struct {
+    mu         sync.Mutex
+    logged     int
+    suppressed int
+}
 
-    for i, record := range s3Event.Records {
-        log.Printf("📁 Processing S3 record %d of %d", i+1, len(s3Event.Records))
-        
-        bucket := record.S3.Bucket.Name
-        key := record.S3.Object.Key
+func (l *lineErrorLogger) Printf(format string, args ...interface{}) {
+    l.mu.Lock()
+    defer l.mu.Unlock()
+    if l.logged >= maxLoggedLineErrors {
+        l.suppressed++
+        return
+    }
+    l.logged++
+    log.Printf(format, args...)
+}
 
-        result, err := s3Client.GetObject(ctx, &s3.GetObjectInput{
+// Genera el id de un movimiento a partir de su origen: el archivo (su ETag,
+// o "bucket/key" si S3 no devolvió ETag), el usuario y el número de línea.
+// El mismo movimiento del mismo archivo siempre da el mismo id, lo lea la
+// lectura secuencial, un rango o un reintento desde un checkpoint, y dos
+// movimientos distintos no comparten id: los 128 bits del hash hacen
+// despreciable una colisión incluso con miles de millones de filas. El id
+// anterior (fecha, monto y línea, 64 bits) era igual para la misma fila en
+// archivos distintos.
+func generateUniqueID(source string, userID []byte, lineNumber int) string {
+    var buffer [128]byte
+    data := append(buffer[:0], source...)
+    data = append(data, 0)
+    data = append(data, userID...)
+    data = append(data, 0)
+    data = strconv.AppendInt(data, int64(lineNumber), 10)
+    hash := sha256.Sum256(data)
+    var id [32]byte
+    hex.Encode(id[:], hash[:16])
+    return string(id[:])
+}
+
+// Origen de los ids de un archivo: su ETag sin comillas
+func movementSource(file, etag string) string {
+    if etag = strings.Trim(etag, "\""); etag != "" {
+        return etag
+    }
+    return file
+}
+
+// Subconjunto del cliente de S3 que usa el procesador
+type s3API interface {
+    GetObject(ctx context.Context, params *s3.GetObjectInput, optFns ...func(*s3.Options)) (*s3.GetObjectOutput, error)
+}
+
+// Resultado de procesar un archivo, para el log final y los tests
+type fileStats struct {
+    lines        int
+    written      int
+    duplicates   int
+    errors       int
+    rollupErrors int
+    // El archivo no se pudo leer o escribir entero, o quedaron rollups sin
+    // aplicar: hay que reintentarlo (el mensaje de SQS vuelve a la cola)
+    incomplete   bool
+}
+
+// Procesa un archivo de movimientos: lo lee de corrido o, si es grande, por
+// rangos de bytes en paralelo, escribe los movimientos y aplica los rollups.
+// Si una invocación anterior dejó un checkpoint para la misma versión del
+// objeto, retoma desde ahí; si ya lo completó, no lo vuelve a procesar.
+func processObject(ctx context.Context, s3Client s3API, dynamoClient dynamoAPI, bucket, key string) fileStats {
+    stats := fileStats{}
+    file := bucket + "/" + key
+    state, err := loadIngestion(ctx, dynamoClient, file)
+    if err != nil {
+        log.Printf("⚠️ Could not load the ingestion state of %s, starting from the beginning: %v", file, err)
+    }
+    // Rollups que una invocación anterior guardó y no llegó a aplicar; hay
+    // que aplicarlos antes de guardar otros
+    if state != nil && state.RollupChunks > 0 {
+        if errs := applyRollupChunks(ctx, dynamoClient, file, state.RollupLine, state.RollupChunks); errs > 0 {
+            stats.rollupErrors = errs
+            stats.incomplete = true
+            return stats
+        }
+        state.RollupChunks = 0
+    }
+
+    result, err := s3Client.GetObject(ctx, &s3.GetObjectInput{
+        Bucket: &bucket,
+        Key:    &key,
+    })
+    if err != nil {
+        log.Printf("❌ ERROR: Failed to get object from S3: %v", err)
+        stats.errors++
+        stats.incomplete = true
+        return stats
+    }
+
+    // Un ETag distinto es un archivo nuevo subido con la misma key
+    etag := ""
+    if result.ETag != nil {
+        etag = *result.ETag
+    }
+    if state == nil || state.ETag != etag {
+        state = &ingestion{File: file, ETag: etag}
+    }
+    source := movementSource(file, etag)
+    if state.Status == ingestionCompleted {
+        result.Body.Close()
+        log.Printf("⏭️ %s was already processed (%d lines), skipping", file, state.Line)
+        return fileStats{lines: state.Line, written: state.Written, errors: state.Errors}
+    }
+    if state.Offset > 0 {
+        result.Body.Close()
+        log.Printf("↩️ Resuming %s from line %d (byte %d)", file, state.Line, state.Offset)
+        byteRange := fmt.Sprintf("bytes=%d-", state.Offset)
+        result, err = s3Client.GetObject(ctx, &s3.GetObjectInput{
             Bucket: &bucket,
             Key:    &key,
+            Range:  &byteRange,
         })
         if err != nil {
             log.Printf("❌ ERROR: Failed to get object from S3: %v", err)
-            continue
+            stats.errors++
+            stats.incomplete = true
+            return stats
         }
+    }
+
+    lineErrors := &lineErrorLogger{}
+    // Los PutItem de a uno pasan a lotes de 25 escritos en paralelo
+    writer := newBatchWriter(ctx, dynamoClient, "movements", file, writeWorkers, lineErrors)
 
-        content, err := io.ReadAll(result.Body)
+    if size := contentLength(result); state.Offset == 0 && rangeWorkers > 1 && size >= rangeSplitBytes {
+        // Los rangos no guardan checkpoints intermedios, solo el estado final
         result.Body.Close()
+        log.Printf("✂️ Splitting %d bytes into ranges of %d bytes across %d workers", size, rangeSizeBytes, rangeWorkers)
+        var readFailed bool
+        stats.lines, stats.errors, readFailed = processRanges(ctx, s3Client, bucket, key, size, source, writer, lineErrors)
+        rollups := writer.Close()
+        stats.written = writer.written
+        stats.duplicates = writer.duplicates
+        stats.errors += writer.failed
 
-        if err != nil {
-            log.Printf("❌ ERROR: Failed to read file contents: %v", err)
-            continue
+        // Si un rango no se pudo leer o hay filas que no se pudieron escribir,
+        // el archivo se vuelve a procesar entero: las filas ya escritas se
+        // reconocen por su "file" y sus rollups se cuentan en el reintento,
+        // así que ahora no se guardan
+        state.Status = ingestionCompleted
+        state.Offset = size
+        if readFailed || writer.failed > 0 {
+            stats.incomplete = true
+        } else if chunks, err := saveRollupChunks(ctx, dynamoClient, file, stats.lines, rollups); err != nil {
+            log.Printf("❌ ERROR: Failed to save the rollups of %s: %v", file, err)
+            stats.rollupErrors++
+            stats.incomplete = true
+        } else {
+            state.RollupLine = stats.lines
+            state.RollupChunks = chunks
+        }
+        if stats.incomplete {
+            state.Status = ingestionProcessing
+            state.Offset = 0
+        }
+        state.Line = stats.lines
+        state.Written = stats.written
+        state.Errors = stats.errors
+        if err := saveIngestion(ctx, dynamoClient, state); err != nil {
+            log.Printf("❌ ERROR: Failed to save the ingestion state of %s: %v", file, err)
+            stats.incomplete = true
+        } else if state.RollupChunks > 0 {
+            log.Printf("📦 Updating %d rollup buckets", len(rollups))
+            stats.rollupErrors = applyRollupChunks(ctx, dynamoClient, file, state.RollupLine, state.RollupChunks)
+            stats.incomplete = stats.rollupErrors > 0
         }
+    } else {
+        // Las filas se parsean a medida que llegan de S3 y pasan directo al
+        // writer, que frena la lectura cuando sus workers están ocupados: la
+        // memoria no depende del tamaño del archivo
+        reader := newLineReader(result.Body)
+        reader.line = state.Line
+        reader.offset = state.Offset
+        checkpoint := newCheckpointer(ctx, dynamoClient, writer, state)
+        _, lineErrorCount, readErr := processLines(reader, source, writer, lineErrors, checkpoint)
+        result.Body.Close()
 
-        lines := strings.Split(string(content), "\n")
-        log.Printf("📊 Total number of lines found: %d", len(lines))
+        // Si la lectura se cortó, el estado queda en "processing" en la última
+        // línea leída entera y el reintento sigue desde ahí
+        status := ingestionCompleted
+        if readErr != nil {
+            log.Printf("❌ ERROR: Failed to read file contents after line %d: %v", reader.line, readErr)
+            status = ingestionProcessing
+        }
+        saved := checkpoint.save(reader, lineErrorCount, status)
+        writer.Close()
+        stats = fileStats{lines: state.Line, written: state.Written, duplicates: writer.duplicates, errors: state.Errors, rollupErrors: checkpoint.rollupErrors, incomplete: readErr != nil || !saved || checkpoint.rollupErrors > 0}
+    }
 
-        lineCount := 0
-        successCount := 0
-        errorCount := 0
+    log.Printf("🏁 File processing completed!")
+    log.Printf("📊 Final Statistics:")
+    log.Printf("   - Total Lines Processed: %d", stats.lines)
+    log.Printf("   - Successful Transactions: %d", stats.written)
+    log.Printf("   - Duplicates Skipped: %d", stats.duplicates)
+    log.Printf("   - Errors: %d", stats.errors)
+    log.Printf("   - Throughput: %.0f rows/s", writer.Throughput())
+    log.Printf("   - Rollup Errors: %d", stats.rollupErrors)
+    if lineErrors.suppressed > 0 {
+        log.Printf("   - Line Error Logs Suppressed: %d", lineErrors.suppressed)
+    }
+    return stats
+}
 
-        for _, line := range lines {
-            lineCount++
-            line = strings.TrimSpace(line)
-            
-            if line == "" {
-                continue
-            }
+// Valida cada línea del reader y encola sus movimientos en el writer, con
+// ids derivados de source.
+// Devuelve el número de la última línea leída, cuántas tenían errores y el
+// error de lectura si el archivo no se pudo leer hasta el final. checkpoint
+// puede ser nil.
+func processLines(reader *lineReader, source string, writer *batchWriter, lineErrors *lineErrorLogger, checkpoint *checkpointer) (int, int, error) {
+    lineCount := 0
+    errorCount := 0
 
+    for {
+        // Todas las líneas hasta reader.line ya se procesaron
+        if checkpoint != nil {
+            checkpoint.afterLine(reader, errorCount)
+        }
+        rawLine, lineNumber, err := reader.Next()
+        if err == io.EOF {
+            break
+        }
+        lineCount = lineNumber
+        if err == errLineTooLong {
+            lineErrors.Printf("❌ ERROR: Invalid line format at line %d: %v", lineCount, err)
+            errorCount++
+            continue
+        }
+        if err != nil {
+            return reader.line, errorCount, err
+        }
+
+        line := bytes.TrimSpace(rawLine)
+        if len(line) == 0 {
+            continue
+        }
+
+        if logLineDetails {
             log.Printf("📝 Processing line %d: %s", lineCount, line)
+        }
 
-            parts := strings.Split(line, ",")
-            for i := range parts {
-                parts[i] = strings.TrimSpace(parts[i])
-            }
+        userID, dateText, amountText, parts := splitFields(line)
+        if parts != 3 {
+            lineErrors.Printf("❌ ERROR: Invalid line format at line %d: expected 3 parts, got %d", lineCount, parts)
+            errorCount++
+            continue
+        }
 
-            if len(parts) != 3 {
-                log.Printf("❌ ERROR: Invalid line format at line %d: expected 3 parts, got %d", lineCount, len(parts))
-                errorCount++
-                continue
-            }
+        date, err := parseDate(dateText)
+        if err != nil {
+            lineErrors.Printf("❌ ERROR: Failed to parse date at line %d: %v", lineCount, err)
+            errorCount++
+            continue
+        }
 
-            date, err := time.Parse("2006-01-02", parts[1])
-            if err != nil {
-                log.Printf("❌ ERROR: Failed to parse date at line %d: %v", lineCount, err)
-                errorCount++
-                continue
-            }
+        amount, err := parseAmount(amountText)
+        if err != nil {
+            lineErrors.Printf("❌ ERROR: Failed to parse amount at line %d: %v", lineCount, err)
+            errorCount++
+            continue
+        }
 
-            amount, err := strconv.ParseFloat(parts[2], 64)
-            if err != nil {
-                log.Printf("❌ ERROR: Failed to parse amount at line %d: %v", lineCount, err)
-                errorCount++
-                continue
-            }
+        // Generar un ID único para cada transacción
+        uniqueID := generateUniqueID(source, userID, lineCount)
 
-            // Generar un ID único para cada transacción
-            uniqueID := generateUniqueID(parts[1], parts[2], amount, lineCount)
+        writer.Put(Transaction{
+            ID:        uniqueID, // Usar el ID único generado
+            UserID:    string(userID),
+            Date:      date,
+            Amount:    amount,
+            Processed: "Ok",
+        })
+        if logLineDetails {
+            log.Printf("✅ Queued transaction - ID: %s", uniqueID)
+        }
+    }
 
-            log.Printf("🔑 Generated unique ID for line %d: %s", lineCount, uniqueID)
+    return lineCount, errorCount, nil
+}
 
-            transaction := Transaction{
-                ID:        uniqueID, // Usar el ID único generado
-                UserID:    parts[0],
-                Date:      date,
-                Amount:    amount,
-                Processed: "Ok",
-            }
+// Los clientes se crean en la primera invocación y se reusan mientras viva
+// el contenedor, con sus conexiones abiertas y credenciales cacheadas
+var (
+    clientsMu    sync.Mutex
+    s3Client     *s3.Client
+    dynamoClient *dynamodb.Client
+)
 
-            tableName := "movements"
-            log.Printf("💾 Saving transaction with ID: %s", uniqueID)
-
-            _, err = dynamoClient.PutItem(ctx, &dynamodb.PutItemInput{
-                TableName: &tableName,
-                Item: map[string]types.AttributeValue{
-                    "id":        &types.AttributeValueMemberS{Value: transaction.ID},
-                    "UserId":    &types.AttributeValueMemberS{Value: transaction.UserID},
-                    "Date":      &types.AttributeValueMemberS{Value: transaction.Date.Format("2006-01-02")},
-                    "amount":    &types.AttributeValueMemberN{Value: fmt.Sprintf("%.2f", transaction.Amount)},
-                    "processed": &types.AttributeValueMemberS{Value: transaction.Processed},
-                },
-            })
-            if err != nil {
-                log.Printf("❌ ERROR: Failed to save transaction %s to DynamoDB: %v", uniqueID, err)
-                errorCount++
-                continue
-            }
+func awsClients(ctx context.Context) (*s3.Client, *dynamodb.Client, error) {
+    clientsMu.Lock()
+    defer clientsMu.Unlock()
+    if s3Client == nil {
+        // Si falla no se guarda nada y la próxima invocación lo vuelve a intentar
+        cfg, err := config.LoadDefaultConfig(ctx)
+        if err != nil {
+            return nil, nil, err
+        }
+        s3Client = s3.NewFromConfig(cfg)
+        dynamoClient = dynamodb.NewFromConfig(cfg)
+    }
+    return s3Client, dynamoClient, nil
+}
 
-            successCount++
-            log.Printf("✅ Successfully saved transaction - ID: %s", uniqueID)
+// La Lambda recibe lotes de la cola de ingesta (eventSource "aws:sqs") o,
+// sin la cola, los eventos de S3 directamente
+func handleRequest(ctx context.Context, payload json.RawMessage) (*events.SQSEventResponse, error) {
+    var probe struct {
+        Records []struct {
+            EventSource string `json:"eventSource"`
+        } `json:"Records"`
+    }
+    if err := json.Unmarshal(payload, &probe); err != nil {
+        return nil, fmt.Errorf("invalid event: %v", err)
+    }
+    log.Printf("🚀 Lambda function started. Number of records to process: %d", len(probe.Records))
+
+    s3Client, dynamoClient, err := awsClients(ctx)
+    if err != nil {
+        log.Printf("❌ ERROR: Failed to load SDK config: %v", err)
+        return nil, fmt.Errorf("unable to load SDK config: %v", err)
+    }
+
+    if len(probe.Records) > 0 && probe.Records[0].EventSource == "aws:sqs" {
+        var sqsEvent events.SQSEvent
+        if err := json.Unmarshal(payload, &sqsEvent); err != nil {
+            return nil, fmt.Errorf("invalid SQS event: %v", err)
         }
+        response := handleMessages(ctx, s3Client, dynamoClient, sqsEvent)
+        log.Printf("📬 %d of %d messages will be retried", len(response.BatchItemFailures), len(sqsEvent.Records))
+        return &response, nil
+    }
 
-        log.Printf("🏁 File processing completed!")
-        log.Printf("📊 Final Statistics:")
-        log.Printf("   - Total Lines Processed: %d", lineCount)
-        log.Printf("   - Successful Transactions: %d", successCount)
-        log.Printf("   - Errors: %d", errorCount)
+    var s3Event events.S3Event
+    if err := json.Unmarshal(payload, &s3Event); err != nil {
+        return nil, fmt.Errorf("invalid S3 event: %v", err)
+    }
+    for i, record := range s3Event.Records {
+        log.Printf("📁 Processing S3 record %d of %d", i+1, len(s3Event.Records))
+        key, err := objectKey(record)
+        if err != nil {
+            log.Printf("❌ ERROR: Invalid object key %q: %v", record.S3.Object.Key, err)
+            continue
+        }
+        processObject(ctx, s3Client, dynamoClient, record.S3.Bucket.Name, key)
     }
 
-    return nil
+    return nil, nil
 }
 
 func main() {
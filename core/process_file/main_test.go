@@ -0,0 +1,444 @@
+package main
+
+import (
+	"context"
+	"fmt"
+	"reflect"
+	"strconv"
+	"sync"
+	"testing"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/aws"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+	"github.com/aws/smithy-go"
+)
+
+// DynamoDB en memoria: cada llamada tarda `latency` (el round-trip) y puede
+// cancelar transacciones por throttling
+type fakeDynamo struct {
+    mu          sync.Mutex
+    latency     time.Duration
+    items       map[string]map[string]types.AttributeValue
+    calls       int
+    // Llamadas a BatchGetItem, BatchWriteItem y TransactWriteItems
+    gets        int
+    batchWrites int
+    transacts   int
+    // Veces que cada id todavía vuelve en UnprocessedItems o cancela su
+    // transacción por throttling
+    unprocessed map[string]int
+    // BatchWriteItem y TransactWriteItems que todavía se rechazan enteros por
+    // throughput
+    throttled   int
+    // Estado de ingesta por archivo y tx_count de cada rollup ("user/bucket")
+    ingestions  map[string]map[string]types.AttributeValue
+    rollups     map[string]int64
+    // movement_shards: shards por UserId
+    shards      map[string]int
+    // Fallan los PutItem a file_ingestions, las transacciones con rollups y
+    // los BatchGetItem
+    failIngestions bool
+    failRollups    bool
+    failGets       bool
+}
+
+func newFakeDynamo(latency time.Duration) *fakeDynamo {
+    return &fakeDynamo{
+        latency:     latency,
+        items:       make(map[string]map[string]types.AttributeValue),
+        unprocessed: make(map[string]int),
+        ingestions:  make(map[string]map[string]types.AttributeValue),
+        rollups:     make(map[string]int64),
+        shards:      make(map[string]int),
+    }
+}
+
+func (f *fakeDynamo) roundTrip() {
+    f.mu.Lock()
+    f.calls++
+    f.mu.Unlock()
+    if f.latency > 0 {
+        time.Sleep(f.latency)
+    }
+}
+
+func (f *fakeDynamo) PutItem(ctx context.Context, params *dynamodb.PutItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.PutItemOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    if *params.TableName == ingestionsTableName {
+        if f.failIngestions {
+            return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "PutItem", Err: fmt.Errorf("service unavailable")}
+        }
+        f.ingestions[params.Item["file"].(*types.AttributeValueMemberS).Value] = params.Item
+        return &dynamodb.PutItemOutput{}, nil
+    }
+    f.items[params.Item["id"].(*types.AttributeValueMemberS).Value] = params.Item
+    return &dynamodb.PutItemOutput{}, nil
+}
+
+func (f *fakeDynamo) GetItem(ctx context.Context, params *dynamodb.GetItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.GetItemOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    if *params.TableName == shardsTableName {
+        return &dynamodb.GetItemOutput{Item: f.shardItem(params.Key["UserId"].(*types.AttributeValueMemberS).Value)}, nil
+    }
+    return &dynamodb.GetItemOutput{Item: f.ingestions[params.Key["file"].(*types.AttributeValueMemberS).Value]}, nil
+}
+
+func (f *fakeDynamo) shardItem(userID string) map[string]types.AttributeValue {
+    shards, ok := f.shards[userID]
+    if !ok {
+        return nil
+    }
+    return map[string]types.AttributeValue{
+        "UserId": &types.AttributeValueMemberS{Value: userID},
+        "shards": &types.AttributeValueMemberN{Value: strconv.Itoa(shards)},
+    }
+}
+
+// Solo la tabla movement_shards, de una página
+func (f *fakeDynamo) Scan(ctx context.Context, params *dynamodb.ScanInput, optFns ...func(*dynamodb.Options)) (*dynamodb.ScanOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    output := &dynamodb.ScanOutput{}
+    for userID := range f.shards {
+        output.Items = append(output.Items, f.shardItem(userID))
+    }
+    return output, nil
+}
+
+// Transacción todo o nada: si algún Put tiene su id todavía en
+// `unprocessed` (throttling) o choca con la condición attribute_not_exists,
+// o si el ítem que borra un Delete condicionado ya no existe, no se escribe
+// nada y se devuelven los motivos ítem por ítem
+func (f *fakeDynamo) TransactWriteItems(ctx context.Context, params *dynamodb.TransactWriteItemsInput, optFns ...func(*dynamodb.Options)) (*dynamodb.TransactWriteItemsOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    f.transacts++
+    if len(params.TransactItems) > 100 {
+        return nil, fmt.Errorf("too many items: %d", len(params.TransactItems))
+    }
+    if f.throttled > 0 {
+        f.throttled--
+        return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "TransactWriteItems", Err: &types.ProvisionedThroughputExceededException{Message: aws.String("Rate exceeded")}}
+    }
+    reasons := make([]types.CancellationReason, len(params.TransactItems))
+    canceled := false
+    for i, item := range params.TransactItems {
+        code := "None"
+        switch {
+        case item.Put != nil:
+            id := item.Put.Item["id"].(*types.AttributeValueMemberS).Value
+            if f.unprocessed[id] > 0 {
+                f.unprocessed[id]--
+                code = "ThrottlingError"
+            } else if existing, exists := f.items[id]; exists && aws.ToString(item.Put.ConditionExpression) == movementCondition {
+                code = "ConditionalCheckFailed"
+                if item.Put.ReturnValuesOnConditionCheckFailure == types.ReturnValuesOnConditionCheckFailureAllOld {
+                    reasons[i].Item = existing
+                }
+            }
+        case item.Update != nil:
+            if f.failRollups {
+                return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "TransactWriteItems", Err: fmt.Errorf("service unavailable")}
+            }
+        case item.Delete != nil:
+            if _, exists := f.ingestions[item.Delete.Key["file"].(*types.AttributeValueMemberS).Value]; !exists && item.Delete.ConditionExpression != nil {
+                code = "ConditionalCheckFailed"
+            }
+        }
+        reasons[i].Code = aws.String(code)
+        canceled = canceled || code != "None"
+    }
+    if canceled {
+        return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "TransactWriteItems", Err: &types.TransactionCanceledException{Message: aws.String("Transaction cancelled"), CancellationReasons: reasons}}
+    }
+    for _, item := range params.TransactItems {
+        switch {
+        case item.Put != nil:
+            f.items[item.Put.Item["id"].(*types.AttributeValueMemberS).Value] = item.Put.Item
+        case item.Update != nil:
+            f.addRollup(item.Update.Key, item.Update.ExpressionAttributeValues)
+        case item.Delete != nil:
+            delete(f.ingestions, item.Delete.Key["file"].(*types.AttributeValueMemberS).Value)
+        }
+    }
+    return &dynamodb.TransactWriteItemsOutput{}, nil
+}
+
+// Escribe cada Put sin condición, salvo los ids que siguen en `unprocessed`,
+// que vuelven en UnprocessedItems
+func (f *fakeDynamo) BatchWriteItem(ctx context.Context, params *dynamodb.BatchWriteItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.BatchWriteItemOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    f.batchWrites++
+    if f.throttled > 0 {
+        f.throttled--
+        return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "BatchWriteItem", Err: &types.ProvisionedThroughputExceededException{Message: aws.String("Rate exceeded")}}
+    }
+    unprocessed := make(map[string][]types.WriteRequest)
+    for table, requests := range params.RequestItems {
+        if len(requests) > batchWriteLimit {
+            return nil, fmt.Errorf("too many items: %d", len(requests))
+        }
+        for _, request := range requests {
+            id := request.PutRequest.Item["id"].(*types.AttributeValueMemberS).Value
+            if f.unprocessed[id] > 0 {
+                f.unprocessed[id]--
+                unprocessed[table] = append(unprocessed[table], request)
+                continue
+            }
+            f.items[id] = request.PutRequest.Item
+        }
+    }
+    return &dynamodb.BatchWriteItemOutput{UnprocessedItems: unprocessed}, nil
+}
+
+func (f *fakeDynamo) BatchGetItem(ctx context.Context, params *dynamodb.BatchGetItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.BatchGetItemOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    f.gets++
+    if f.failGets {
+        return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "BatchGetItem", Err: fmt.Errorf("service unavailable")}
+    }
+    responses := make(map[string][]map[string]types.AttributeValue)
+    for table, request := range params.RequestItems {
+        for _, key := range request.Keys {
+            id := key["id"].(*types.AttributeValueMemberS).Value
+            if item, exists := f.items[id]; exists {
+                found := map[string]types.AttributeValue{"id": key["id"]}
+                if file, ok := item["file"]; ok {
+                    found["file"] = file
+                }
+                responses[table] = append(responses[table], found)
+            }
+        }
+    }
+    return &dynamodb.BatchGetItemOutput{Responses: responses}, nil
+}
+
+func (f *fakeDynamo) UpdateItem(ctx context.Context, params *dynamodb.UpdateItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.UpdateItemOutput, error) {
+    f.roundTrip()
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    if *params.TableName == shardsTableName {
+        // SET shards = :shards con la condición de que solo suba
+        userID := params.Key["UserId"].(*types.AttributeValueMemberS).Value
+        shards, _ := strconv.Atoi(params.ExpressionAttributeValues[":shards"].(*types.AttributeValueMemberN).Value)
+        if current, ok := f.shards[userID]; ok && current >= shards {
+            return nil, &smithy.OperationError{ServiceID: "DynamoDB", OperationName: "UpdateItem", Err: &types.ConditionalCheckFailedException{Message: aws.String("The conditional request failed")}}
+        }
+        f.shards[userID] = shards
+        return &dynamodb.UpdateItemOutput{}, nil
+    }
+    f.addRollup(params.Key, params.ExpressionAttributeValues)
+    return &dynamodb.UpdateItemOutput{}, nil
+}
+
+// ADD de un rollup: solo se lleva tx_count
+func (f *fakeDynamo) addRollup(key, values map[string]types.AttributeValue) {
+    bucket := key["UserId"].(*types.AttributeValueMemberS).Value + "/" + key["Bucket"].(*types.AttributeValueMemberS).Value
+    count, _ := strconv.ParseInt(values[":count"].(*types.AttributeValueMemberN).Value, 10, 64)
+    f.rollups[bucket] += count
+}
+
+func testTransactions(count int) []Transaction {
+    day := time.Date(2024, 1, 1, 0, 0, 0, 0, time.UTC)
+    transactions := make([]Transaction, count)
+    for i := range transactions {
+        transactions[i] = Transaction{
+            ID:        fmt.Sprintf("tx-%d", i),
+            UserID:    "user-1",
+            Date:      day.AddDate(0, 0, i%60),
+            Amount:    float64(i%200-100) + 0.25,
+            Processed: "Ok",
+        }
+    }
+    return transactions
+}
+
+func writeAll(client dynamoAPI, transactions []Transaction) *batchWriter {
+    writer := newBatchWriter(context.Background(), client, "movements", "", writeWorkers, &lineErrorLogger{})
+    for _, transaction := range transactions {
+        writer.Put(transaction)
+    }
+    writer.Close()
+    return writer
+}
+
+func rollupCount(rollups map[rollupKey]*rollupDelta, bucket string) int64 {
+    if delta, ok := rollups[rollupKey{UserID: "user-1", Bucket: bucket}]; ok {
+        return delta.Count
+    }
+    return 0
+}
+
+func TestBatchWriterRetriesThrottledItems(t *testing.T) {
+    retryBaseDelay = time.Millisecond
+    fake := newFakeDynamo(0)
+    for i := 0; i < 100; i += 7 {
+        fake.unprocessed[fmt.Sprintf("tx-%d", i)] = 2
+    }
+
+    writer := writeAll(fake, testTransactions(100))
+
+    if len(fake.items) != 100 || writer.written != 100 || writer.failed != 0 {
+        t.Fatalf("stored %d, written %d, failed %d", len(fake.items), writer.written, writer.failed)
+    }
+    if got := rollupCount(writer.rollups, "2024"); got != 100 {
+        t.Fatalf("year rollup counted %d movements", got)
+    }
+}
+
+// El SDK devuelve el throttling de toda la transacción envuelto en un
+// *smithy.OperationError
+func TestBatchWriterRetriesThrottledRequests(t *testing.T) {
+    retryBaseDelay = time.Millisecond
+    fake := newFakeDynamo(0)
+    fake.throttled = 3
+
+    writer := writeAll(fake, testTransactions(100))
+
+    if len(fake.items) != 100 || writer.written != 100 || writer.failed != 0 {
+        t.Fatalf("stored %d, written %d, failed %d", len(fake.items), writer.written, writer.failed)
+    }
+}
+
+func TestBatchWriterGivesUpAfterRetries(t *testing.T) {
+    retryBaseDelay = time.Millisecond
+    fake := newFakeDynamo(0)
+    fake.unprocessed["tx-0"] = batchWriteRetries + 1
+
+    writer := writeAll(fake, testTransactions(30))
+
+    if writer.written != 29 || writer.failed != 1 {
+        t.Fatalf("written %d, failed %d", writer.written, writer.failed)
+    }
+    // El movimiento no escrito no entra en los rollups
+    if got := rollupCount(writer.rollups, "2024"); got != 29 {
+        t.Fatalf("year rollup counted %d movements", got)
+    }
+}
+
+// Los movimientos que ya están en la tabla no se escriben de nuevo ni entran
+// en los rollups, los haya visto este contenedor o no
+func TestBatchWriterSkipsExistingMovements(t *testing.T) {
+    fake := newFakeDynamo(0)
+    transactions := testTransactions(60)
+    writeAll(fake, transactions[:40])
+
+    // Con el filtro vacío los duplicados los detecta la lectura previa
+    seenIDs = newBloomFilter(1000, 0.01)
+    writer := writeAll(fake, transactions)
+    if writer.written != 20 || writer.duplicates != 40 || writer.failed != 0 || len(fake.items) != 60 {
+        t.Fatalf("written %d, duplicates %d, failed %d, stored %d", writer.written, writer.duplicates, writer.failed, len(fake.items))
+    }
+    if got := rollupCount(writer.rollups, "2024"); got != 20 {
+        t.Fatalf("year rollup counted %d movements", got)
+    }
+
+    // Con el filtro lleno se consultan antes y no hay transacciones canceladas
+    calls, gets := fake.calls, fake.gets
+    writer = writeAll(fake, transactions)
+    if writer.written != 0 || writer.duplicates != 60 || len(writer.rollups) != 0 {
+        t.Fatalf("written %d, duplicates %d, rollups %d", writer.written, writer.duplicates, len(writer.rollups))
+    }
+    if fake.gets-gets != 3 || fake.calls-calls != 3 {
+        t.Fatalf("%d calls (%d BatchGetItem) for 3 batches of duplicates", fake.calls-calls, fake.gets-gets)
+    }
+}
+
+// Las filas que la lectura confirma nuevas van en BatchWriteItem; solo las
+// que no puede descartar (marcadas por el filtro o sin lectura) pagan una
+// transacción condicionada
+func TestBatchWriterUsesTransactionsOnlyForUnclearedRows(t *testing.T) {
+    transactions := testTransactions(100)
+    seenIDs = newBloomFilter(1000, 0.01)
+    fake := newFakeDynamo(0)
+    writer := writeAll(fake, transactions[:50])
+    if writer.written != 50 || fake.batchWrites != 2 || fake.transacts != 0 {
+        t.Fatalf("written %d with %d BatchWriteItem, %d TransactWriteItems", writer.written, fake.batchWrites, fake.transacts)
+    }
+
+    // Ids que el filtro marca pero que no están en la tabla
+    fake = newFakeDynamo(0)
+    writer = writeAll(fake, transactions[:50])
+    if writer.written != 50 || fake.batchWrites != 0 || fake.transacts != 2 {
+        t.Fatalf("written %d with %d BatchWriteItem, %d TransactWriteItems", writer.written, fake.batchWrites, fake.transacts)
+    }
+
+    // Sin lectura tampoco se sabe si existen
+    fake.failGets = true
+    writer = writeAll(fake, transactions)
+    if writer.written != 50 || writer.duplicates != 50 || fake.batchWrites != 0 || len(fake.items) != 100 {
+        t.Fatalf("written %d, duplicates %d, %d BatchWriteItem", writer.written, writer.duplicates, fake.batchWrites)
+    }
+    if got := rollupCount(writer.rollups, "2024"); got != 50 {
+        t.Fatalf("year rollup counted %d movements", got)
+    }
+}
+
+// Volver a subir el mismo archivo con otra key no duplica movimientos ni
+// rollups
+func TestReingestedFileIsNotCountedTwice(t *testing.T) {
+    content := statementFile(300)
+    storage := &fakeS3{objects: map[string][]byte{"a.csv": content, "b.csv": content}}
+    fake := newFakeDynamo(0)
+
+    first := processObject(context.Background(), storage, fake, "bucket", "a.csv")
+    rollups := make(map[string]int64)
+    for key, count := range fake.rollups {
+        rollups[key] = count
+    }
+    second := processObject(context.Background(), storage, fake, "bucket", "b.csv")
+
+    if first.written != 300 || second.written != 0 || second.duplicates != 300 || len(fake.items) != 300 {
+        t.Fatalf("first %+v, second %+v, stored %d", first, second, len(fake.items))
+    }
+    if !reflect.DeepEqual(fake.rollups, rollups) {
+        t.Fatalf("rollups changed on re-ingest")
+    }
+}
+
+// 500 movimientos con 500µs de round-trip: un PutItem por línea (lo que hacía
+// handleRequest) contra lotes de 25 en WRITE_WORKERS workers, con
+// movimientos nuevos y con un archivo que ya se había cargado
+func BenchmarkWriteMovements(b *testing.B) {
+    transactions := testTransactions(500)
+
+    b.Run("serial-putitem", func(b *testing.B) {
+        fake := newFakeDynamo(500 * time.Microsecond)
+        for i := 0; i < b.N; i++ {
+            for _, transaction := range transactions {
+                tableName := "movements"
+                fake.PutItem(context.Background(), &dynamodb.PutItemInput{TableName: &tableName, Item: transactionItem(transaction)})
+            }
+        }
+        b.ReportMetric(float64(len(transactions)*b.N)/b.Elapsed().Seconds(), "rows/s")
+    })
+
+    b.Run("batch-writer", func(b *testing.B) {
+        for i := 0; i < b.N; i++ {
+            writeAll(newFakeDynamo(500*time.Microsecond), transactions)
+        }
+        b.ReportMetric(float64(len(transactions)*b.N)/b.Elapsed().Seconds(), "rows/s")
+    })
+
+    b.Run("batch-writer-reingest", func(b *testing.B) {
+        fake := newFakeDynamo(500 * time.Microsecond)
+        writeAll(fake, transactions)
+        b.ResetTimer()
+        for i := 0; i < b.N; i++ {
+            writeAll(fake, transactions)
+        }
+        b.ReportMetric(float64(len(transactions)*b.N)/b.Elapsed().Seconds(), "rows/s")
+    })
+}
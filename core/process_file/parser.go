@@ -0,0 +1,172 @@
+package main
+
+import (
+	"bufio"
+	"bytes"
+	"fmt"
+	"io"
+	"strconv"
+	"time"
+)
+
+// Tamaño del buffer de lectura y largo máximo de una línea válida
+const (
+    readBufferSize = 64 * 1024
+    maxLineLength  = readBufferSize
+)
+
+// Lee el objeto de S3 línea por línea a medida que llegan los bytes de
+// GetObject, sin copiar el archivo entero en memoria. Las líneas y su
+// numeración son las mismas que daba strings.Split(content, "\n"), incluida
+// la última (vacía si el archivo termina en "\n"). offset cuenta los bytes
+// consumidos, para retomar el archivo desde un checkpoint.
+type lineReader struct {
+    reader *bufio.Reader
+    line   int
+    offset int64
+    done   bool
+}
+
+func newLineReader(body io.Reader) *lineReader {
+    return &lineReader{reader: bufio.NewReaderSize(body, readBufferSize)}
+}
+
+// Devuelve la próxima línea sin el "\n" y su número. El slice apunta al
+// buffer del reader y solo es válido hasta la siguiente llamada. Una línea
+// más larga que maxLineLength se descarta entera y devuelve errLineTooLong.
+func (r *lineReader) Next() ([]byte, int, error) {
+    if r.done {
+        return nil, r.line, io.EOF
+    }
+    start := r.offset
+    r.line++
+    line, err := r.reader.ReadSlice('\n')
+    r.offset += int64(len(line))
+    switch err {
+    case nil:
+        return line[:len(line)-1], r.line, nil
+    case io.EOF:
+        r.done = true
+        return line, r.line, nil
+    case bufio.ErrBufferFull:
+        for err == bufio.ErrBufferFull {
+            line, err = r.reader.ReadSlice('\n')
+            r.offset += int64(len(line))
+        }
+        if err == io.EOF {
+            r.done = true
+        } else if err != nil {
+            return nil, r.line, r.failed(start, err)
+        }
+        return nil, r.line, errLineTooLong
+    default:
+        return nil, r.line, r.failed(start, err)
+    }
+}
+
+// Si la lectura falla a mitad de línea, line y offset quedan en la última
+// línea completa, que es desde donde hay que retomar
+func (r *lineReader) failed(start int64, err error) error {
+    r.done = true
+    r.line--
+    r.offset = start
+    return err
+}
+
+var errLineTooLong = fmt.Errorf("line longer than %d bytes", maxLineLength)
+
+// Separa "user,date,amount" en sus tres campos sin espacios alrededor.
+// Devuelve la cantidad de campos que tenía la línea si no eran tres.
+func splitFields(line []byte) (userID, date, amount []byte, parts int) {
+    first := bytes.IndexByte(line, ',')
+    if first < 0 {
+        return nil, nil, nil, 1
+    }
+    second := bytes.IndexByte(line[first+1:], ',')
+    if second < 0 {
+        return nil, nil, nil, 2
+    }
+    second += first + 1
+    if extra := bytes.Count(line[second+1:], []byte{','}); extra > 0 {
+        return nil, nil, nil, 3 + extra
+    }
+    return bytes.TrimSpace(line[:first]), bytes.TrimSpace(line[first+1 : second]), bytes.TrimSpace(line[second+1:]), 3
+}
+
+// Igual que time.Parse("2006-01-02", ...) pero sin pasar por string en el
+// caso normal; cualquier cosa rara va a time.Parse, que da el mismo error
+func parseDate(text []byte) (time.Time, error) {
+    if len(text) == 10 && text[4] == '-' && text[7] == '-' {
+        year, okYear := digits(text[0:4])
+        month, okMonth := digits(text[5:7])
+        day, okDay := digits(text[8:10])
+        if okYear && okMonth && okDay && month >= 1 && month <= 12 && day >= 1 && day <= daysIn(month, year) {
+            return time.Date(year, time.Month(month), day, 0, 0, 0, 0, time.UTC), nil
+        }
+    }
+    return time.Parse("2006-01-02", string(text))
+}
+
+func digits(text []byte) (int, bool) {
+    value := 0
+    for _, c := range text {
+        if c < '0' || c > '9' {
+            return 0, false
+        }
+        value = value*10 + int(c-'0')
+    }
+    return value, true
+}
+
+var monthDays = [13]int{0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31}
+
+func daysIn(month, year int) int {
+    if month == 2 && year%4 == 0 && (year%100 != 0 || year%400 == 0) {
+        return 29
+    }
+    return monthDays[month]
+}
+
+var exactPowersOfTen = [...]float64{1, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12, 1e13, 1e14, 1e15}
+
+// Igual que strconv.ParseFloat(..., 64). Los montos comunes ("-45.50") con
+// hasta 15 dígitos se calculan como entero / 10^decimales, que con ambos
+// exactos en float64 da el mismo redondeo que ParseFloat; el resto va a
+// ParseFloat.
+func parseAmount(text []byte) (float64, error) {
+    i := 0
+    negative := false
+    if len(text) > 0 && (text[0] == '-' || text[0] == '+') {
+        negative = text[0] == '-'
+        i++
+    }
+    var mantissa uint64
+    count, decimals := 0, 0
+    dot := false
+    for ; i < len(text); i++ {
+        c := text[i]
+        switch {
+        case c >= '0' && c <= '9':
+            mantissa = mantissa*10 + uint64(c-'0')
+            count++
+            if dot {
+                decimals++
+            }
+        case c == '.' && !dot:
+            dot = true
+        default:
+            count = 16
+        }
+        if count > 15 {
+            break
+        }
+    }
+    if count == 0 || count > 15 {
+        return strconv.ParseFloat(string(text), 64)
+    }
+    value := float64(mantissa) / exactPowersOfTen[decimals]
+    if negative {
+        value = -value
+    }
+    return value, nil
+}
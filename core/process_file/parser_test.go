@@ -0,0 +1,108 @@
+package main
+
+import (
+	"bytes"
+	"fmt"
+	"io"
+	"strings"
+	"testing"
+)
+
+// Mismas líneas y números que strings.Split(content, "\n")
+func TestLineReaderMatchesSplit(t *testing.T) {
+    for _, content := range []string{
+        "",
+        "a,2024-01-01,1",
+        "a,2024-01-01,1\n",
+        "a,2024-01-01,1\r\n\nb,2024-01-02,-2.5\n  \n",
+    } {
+        expected := strings.Split(content, "\n")
+        reader := newLineReader(strings.NewReader(content))
+        var got []string
+        for {
+            line, number, err := reader.Next()
+            if err == io.EOF {
+                break
+            }
+            if err != nil {
+                t.Fatalf("%q: %v", content, err)
+            }
+            if number != len(got)+1 {
+                t.Fatalf("%q: line %d numbered %d", content, len(got)+1, number)
+            }
+            got = append(got, string(line))
+        }
+        if fmt.Sprint(got) != fmt.Sprint(expected) {
+            t.Fatalf("%q: got %q, expected %q", content, got, expected)
+        }
+    }
+}
+
+func TestLineReaderSkipsLongLines(t *testing.T) {
+    content := "a,2024-01-01,1\n" + strings.Repeat("x", maxLineLength*2) + "\nb,2024-01-02,2"
+    reader := newLineReader(strings.NewReader(content))
+
+    first, _, _ := reader.Next()
+    if string(first) != "a,2024-01-01,1" {
+        t.Fatalf("first line %q", first)
+    }
+    if _, number, err := reader.Next(); err != errLineTooLong || number != 2 {
+        t.Fatalf("long line: %v at %d", err, number)
+    }
+    if last, number, _ := reader.Next(); string(last) != "b,2024-01-02,2" || number != 3 {
+        t.Fatalf("last line %q at %d", last, number)
+    }
+}
+
+func TestSplitFields(t *testing.T) {
+    userID, date, amount, parts := splitFields([]byte(" u1 , 2024-01-01 ,-3.5 "))
+    if parts != 3 || string(userID) != "u1" || string(date) != "2024-01-01" || string(amount) != "-3.5" {
+        t.Fatalf("got %q %q %q (%d parts)", userID, date, amount, parts)
+    }
+    for line, expected := range map[string]int{"a": 1, "a,b": 2, "a,b,c,d": 4, ",,,,": 5} {
+        if _, _, _, parts := splitFields([]byte(line)); parts != expected {
+            t.Fatalf("%q: %d parts, expected %d", line, parts, expected)
+        }
+    }
+}
+
+func statementFile(rows int) []byte {
+    var buffer bytes.Buffer
+    for i := 0; i < rows; i++ {
+        fmt.Fprintf(&buffer, "user-%d,2024-01-%02d,%d.%02d\n", i%50, i%28+1, i%1000-500, i%100)
+    }
+    return buffer.Bytes()
+}
+
+// 100k filas: leer todo + strings.Split (lo que hacía handleRequest) contra
+// lineReader + splitFields; comparar B/op
+func BenchmarkParseStatement(b *testing.B) {
+    content := statementFile(100_000)
+
+    b.Run("readall-split", func(b *testing.B) {
+        b.ReportAllocs()
+        for i := 0; i < b.N; i++ {
+            data, _ := io.ReadAll(bytes.NewReader(content))
+            for _, line := range strings.Split(string(data), "\n") {
+                parts := strings.Split(strings.TrimSpace(line), ",")
+                for j := range parts {
+                    parts[j] = strings.TrimSpace(parts[j])
+                }
+            }
+        }
+    })
+
+    b.Run("streaming", func(b *testing.B) {
+        b.ReportAllocs()
+        for i := 0; i < b.N; i++ {
+            reader := newLineReader(bytes.NewReader(content))
+            for {
+                line, _, err := reader.Next()
+                if err != nil {
+                    break
+                }
+                splitFields(bytes.TrimSpace(line))
+            }
+        }
+    })
+}
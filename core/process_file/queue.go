@@ -0,0 +1,87 @@
+package main
+
+import (
+	"context"
+	"encoding/json"
+	"log"
+	"net/url"
+	"time"
+
+	"github.com/aws/aws-lambda-go/events"
+)
+
+// Con la cola de ingesta las notificaciones de S3 llegan por SQS en lotes.
+// El tamaño del lote, la concurrencia máxima y el redrive a la DLQ se
+// configuran en la cola y en su event source mapping (ver el README): el
+// ritmo de escritura en "movements" depende de esos valores y no de cuántos
+// archivos se suben a la vez.
+
+// Procesa los archivos de un lote de mensajes, uno después del otro para que
+// la invocación no use más de WRITE_WORKERS escrituras en paralelo. Devuelve
+// los mensajes que hay que reintentar: SQS los vuelve a entregar cuando vence
+// su visibility timeout y, pasado el maxReceiveCount, los mueve a la DLQ.
+// Reintentar es seguro porque los checkpoints y las escrituras condicionadas
+// no cuentan dos veces lo ya escrito.
+func handleMessages(ctx context.Context, s3Client s3API, dynamoClient dynamoAPI, event events.SQSEvent) events.SQSEventResponse {
+    response := events.SQSEventResponse{}
+    for i, message := range event.Records {
+        if !timeForAnotherFile(ctx) {
+            // Sin tiempo para el resto del lote: vuelven a la cola
+            for _, pending := range event.Records[i:] {
+                response.BatchItemFailures = append(response.BatchItemFailures, events.SQSBatchItemFailure{ItemIdentifier: pending.MessageId})
+            }
+            log.Printf("⏱️ Deadline reached, returning %d messages to the queue", len(event.Records)-i)
+            break
+        }
+        log.Printf("📨 Processing message %d of %d (%s)", i+1, len(event.Records), message.MessageId)
+        if !processMessage(ctx, s3Client, dynamoClient, message) {
+            response.BatchItemFailures = append(response.BatchItemFailures, events.SQSBatchItemFailure{ItemIdentifier: message.MessageId})
+        }
+    }
+    return response
+}
+
+// Margen que necesita un archivo antes del deadline de la invocación. Con
+// menos tiempo el mensaje vuelve a la cola en lugar de cortarse a la mitad
+// cuando el runtime mata la función.
+var fileSafetyMargin = time.Duration(envInt("FILE_SAFETY_SECONDS", 60)) * time.Second
+
+func timeForAnotherFile(ctx context.Context) bool {
+    if ctx.Err() != nil {
+        return false
+    }
+    deadline, ok := ctx.Deadline()
+    return !ok || time.Until(deadline) >= fileSafetyMargin
+}
+
+// Las keys de los eventos de S3 llegan codificadas como en una URL ("+" por
+// espacio). Los dos caminos, la cola y el evento directo, las decodifican acá
+// para que un objeto tenga siempre el mismo registro en file_ingestions.
+func objectKey(record events.S3EventRecord) (string, error) {
+    return url.QueryUnescape(record.S3.Object.Key)
+}
+
+// Procesa los objetos de una notificación de S3. Devuelve false si hay que
+// reintentar el mensaje.
+func processMessage(ctx context.Context, s3Client s3API, dynamoClient dynamoAPI, message events.SQSMessage) bool {
+    var notification events.S3Event
+    if err := json.Unmarshal([]byte(message.Body), &notification); err != nil {
+        log.Printf("❌ ERROR: Invalid message body in %s: %v", message.MessageId, err)
+        return false
+    }
+    // El s3:TestEvent que manda S3 al configurar la notificación no trae
+    // Records y se descarta
+    ok := true
+    for _, record := range notification.Records {
+        key, err := objectKey(record)
+        if err != nil {
+            log.Printf("❌ ERROR: Invalid object key %q in %s: %v", record.S3.Object.Key, message.MessageId, err)
+            ok = false
+            continue
+        }
+        if stats := processObject(ctx, s3Client, dynamoClient, record.S3.Bucket.Name, key); stats.incomplete {
+            ok = false
+        }
+    }
+    return ok
+}
@@ -0,0 +1,118 @@
+package main
+
+import (
+	"context"
+	"crypto/sha256"
+	"encoding/json"
+	"fmt"
+	"reflect"
+	"testing"
+	"time"
+
+	"github.com/aws/aws-lambda-go/events"
+)
+
+func s3Notification(bucket, key string) string {
+    return `{"Records":[{"eventSource":"aws:s3","eventName":"ObjectCreated:Put","s3":{"bucket":{"name":"` + bucket + `"},"object":{"key":"` + key + `"}}}]}`
+}
+
+// Los mensajes que no se pudieron procesar vuelven como BatchItemFailures;
+// los procesados y el s3:TestEvent se confirman
+func TestHandleMessagesReportsFailures(t *testing.T) {
+    storage := &fakeS3{objects: map[string][]byte{
+        "folder/my statement.csv": statementFile(50),
+        "other.csv":               statementFile(10),
+    }}
+    fake := newFakeDynamo(0)
+    event := events.SQSEvent{Records: []events.SQSMessage{
+        {MessageId: "ok", Body: s3Notification("bucket", "folder/my+statement.csv")},
+        {MessageId: "missing", Body: s3Notification("bucket", "missing.csv")},
+        {MessageId: "invalid", Body: "not json"},
+        {MessageId: "test-event", Body: `{"Service":"Amazon S3","Event":"s3:TestEvent","Bucket":"bucket"}`},
+        {MessageId: "other", Body: s3Notification("bucket", "other.csv")},
+    }}
+
+    response := handleMessages(context.Background(), storage, fake, event)
+
+    var failed []string
+    for _, failure := range response.BatchItemFailures {
+        failed = append(failed, failure.ItemIdentifier)
+    }
+    if !reflect.DeepEqual(failed, []string{"missing", "invalid"}) {
+        t.Fatalf("failed messages %v", failed)
+    }
+    if len(fake.items) != 60 {
+        t.Fatalf("stored %d movements", len(fake.items))
+    }
+}
+
+// Con el deadline vencido el resto del lote vuelve a la cola sin procesarse
+func TestHandleMessagesReturnsBatchOnDeadline(t *testing.T) {
+    storage := &fakeS3{objects: map[string][]byte{"a.csv": statementFile(10)}}
+    ctx, cancel := context.WithCancel(context.Background())
+    cancel()
+    event := events.SQSEvent{Records: []events.SQSMessage{
+        {MessageId: "a", Body: s3Notification("bucket", "a.csv")},
+        {MessageId: "b", Body: s3Notification("bucket", "a.csv")},
+    }}
+
+    response := handleMessages(ctx, storage, newFakeDynamo(0), event)
+
+    if len(response.BatchItemFailures) != 2 || storage.gets != 0 {
+        t.Fatalf("%d failures, %d GetObject calls", len(response.BatchItemFailures), storage.gets)
+    }
+}
+
+// Sin tiempo para procesar un archivo antes del deadline el lote vuelve a
+// la cola, antes de que el runtime corte la función
+func TestHandleMessagesReturnsBatchNearDeadline(t *testing.T) {
+    storage := &fakeS3{objects: map[string][]byte{"a.csv": statementFile(10)}}
+    ctx, cancel := context.WithTimeout(context.Background(), fileSafetyMargin/2)
+    defer cancel()
+    event := events.SQSEvent{Records: []events.SQSMessage{
+        {MessageId: "a", Body: s3Notification("bucket", "a.csv")},
+    }}
+
+    response := handleMessages(ctx, storage, newFakeDynamo(0), event)
+
+    if len(response.BatchItemFailures) != 1 || storage.gets != 0 {
+        t.Fatalf("%d failures, %d GetObject calls", len(response.BatchItemFailures), storage.gets)
+    }
+}
+
+// La cola y el evento directo de S3 decodifican la key igual
+func TestObjectKeyUnescapes(t *testing.T) {
+    var event events.S3Event
+    if err := json.Unmarshal([]byte(s3Notification("bucket", "folder/my+statement%2B1.csv")), &event); err != nil {
+        t.Fatal(err)
+    }
+    if key, err := objectKey(event.Records[0]); err != nil || key != "folder/my statement+1.csv" {
+        t.Fatalf("key %q, error %v", key, err)
+    }
+}
+
+// Un archivo con movimientos que no se pudieron escribir no se confirma: el
+// mensaje vuelve a la cola y el reintento escribe lo que faltaba y sus rollups
+func TestHandleMessagesRetriesFailedWrites(t *testing.T) {
+    retryBaseDelay = time.Millisecond
+    content := statementFile(100)
+    storage := &fakeS3{objects: map[string][]byte{"a.csv": content}}
+    fake := newFakeDynamo(0)
+    source := movementSource("bucket/a.csv", fmt.Sprintf("\"%x\"", sha256.Sum256(content)))
+    fake.unprocessed[generateUniqueID(source, []byte("user-10"), 11)] = batchWriteRetries + 1
+    event := events.SQSEvent{Records: []events.SQSMessage{{MessageId: "a", Body: s3Notification("bucket", "a.csv")}}}
+
+    if response := handleMessages(context.Background(), storage, fake, event); len(response.BatchItemFailures) != 1 {
+        t.Fatalf("%d failures after a lost write", len(response.BatchItemFailures))
+    }
+    if status := ingestionStatus(fake, "bucket/a.csv"); status == ingestionCompleted {
+        t.Fatalf("file with a lost write is %q", status)
+    }
+
+    if response := handleMessages(context.Background(), storage, fake, event); len(response.BatchItemFailures) != 0 {
+        t.Fatalf("%d failures on the retry", len(response.BatchItemFailures))
+    }
+    if len(fake.items) != 100 || fake.rollups["user-10/2024"] != 2 || fake.rollups["user-0/2024"] != 2 {
+        t.Fatalf("stored %d movements, rollups %v", len(fake.items), fake.rollups["user-10/2024"])
+    }
+}
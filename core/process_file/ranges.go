@@ -0,0 +1,178 @@
+package main
+
+import (
+	"bufio"
+	"bytes"
+	"context"
+	"fmt"
+	"io"
+	"log"
+	"sync"
+
+	"github.com/aws/aws-sdk-go-v2/service/s3"
+)
+
+// Los archivos de RANGE_SPLIT_BYTES o más se leen en rangos de
+// RANGE_SIZE_BYTES con RANGE_WORKERS GetObject en paralelo; RANGE_WORKERS=1
+// vuelve a la lectura secuencial
+var (
+    rangeSplitBytes = int64(envInt("RANGE_SPLIT_BYTES", 32*1024*1024))
+    rangeSizeBytes  = int64(envInt("RANGE_SIZE_BYTES", 8*1024*1024))
+    rangeWorkers    = envInt("RANGE_WORKERS", 4)
+)
+
+func contentLength(result *s3.GetObjectOutput) int64 {
+    if result.ContentLength == nil {
+        return -1
+    }
+    return *result.ContentLength
+}
+
+// Un rango [start, end) del archivo. Es dueño de las líneas que empiezan
+// dentro de él, aunque terminen en el rango siguiente.
+type byteRange struct {
+    index      int
+    start, end int64
+}
+
+// Procesa el archivo por rangos en paralelo. Cada rango cuenta los comienzos
+// de línea que contiene y le pasa al siguiente el número de su primera
+// línea, así los números (y los ids de generateUniqueID) son los mismos que
+// en la lectura secuencial. Contar es mucho más rápido que validar, por lo
+// que los rangos se parsean en paralelo aunque la numeración vaya en cadena.
+// Devuelve la cantidad de líneas del archivo, cuántas tenían errores y si
+// algún rango no se pudo leer.
+func processRanges(ctx context.Context, s3Client s3API, bucket, key string, size int64, source string, writer *batchWriter, lineErrors *lineErrorLogger) (int, int, bool) {
+    count := int((size + rangeSizeBytes - 1) / rangeSizeBytes)
+    // firstLines[i] recibe el número de la primera línea del rango i, o -1
+    // si un rango anterior no se pudo leer
+    firstLines := make([]chan int, count+1)
+    for i := range firstLines {
+        firstLines[i] = make(chan int, 1)
+    }
+    firstLines[0] <- 1
+
+    ranges := make(chan byteRange)
+    var mu sync.Mutex
+    var wg sync.WaitGroup
+    newlines, errorCount, readFailed := 0, 0, false
+
+    for w := 0; w < rangeWorkers && w < count; w++ {
+        wg.Add(1)
+        go func() {
+            defer wg.Done()
+            for r := range ranges {
+                rangeNewlines, rangeErrors, rangeFailed := processRange(ctx, s3Client, bucket, key, size, source, r, firstLines, writer, lineErrors)
+                mu.Lock()
+                newlines += rangeNewlines
+                errorCount += rangeErrors
+                readFailed = readFailed || rangeFailed
+                mu.Unlock()
+            }
+        }()
+    }
+    // Los rangos se reparten en orden: el anterior a cada rango ya lo tomó
+    // algún worker, así la cadena de números de línea no se traba
+    for i := 0; i < count; i++ {
+        start := int64(i) * rangeSizeBytes
+        end := start + rangeSizeBytes
+        if end > size {
+            end = size
+        }
+        ranges <- byteRange{index: i, start: start, end: end}
+    }
+    close(ranges)
+    wg.Wait()
+
+    // Igual que strings.Split: una línea más que la cantidad de "\n"
+    return newlines + 1, errorCount, readFailed
+}
+
+// Lee un rango y procesa sus líneas. Devuelve la cantidad de "\n" dentro del
+// rango, de errores y si la lectura falló.
+func processRange(ctx context.Context, s3Client s3API, bucket, key string, size int64, source string, r byteRange, firstLines []chan int, writer *batchWriter, lineErrors *lineErrorLogger) (int, int, bool) {
+    // Se pide también el byte anterior al rango para saber si el rango
+    // empieza justo en un comienzo de línea
+    from := r.start
+    if from > 0 {
+        from--
+    }
+    data, err := getRange(ctx, s3Client, bucket, key, fmt.Sprintf("bytes=%d-%d", from, r.end-1))
+    if err != nil {
+        log.Printf("❌ ERROR: Failed to read bytes %d-%d: %v", r.start, r.end-1, err)
+        firstLines[r.index+1] <- -1
+        <-firstLines[r.index]
+        return 0, 1, true
+    }
+
+    // Comienzos de línea en [start, end): después de cada "\n" en
+    // [from, end-1), más la posición 0 del archivo
+    starts := bytes.Count(data[:len(data)-1], []byte{'\n'})
+    owned := data
+    if r.start == 0 {
+        starts++
+    } else if i := bytes.IndexByte(data, '\n'); i >= 0 {
+        owned = data[i+1:]
+    } else {
+        owned = nil
+    }
+
+    firstLine := <-firstLines[r.index]
+    if firstLine < 0 {
+        firstLines[r.index+1] <- -1
+    } else {
+        firstLines[r.index+1] <- firstLine + starts
+    }
+    newlines := bytes.Count(data[r.start-from:], []byte{'\n'})
+    if firstLine < 0 || len(owned) == 0 {
+        return newlines, 0, false
+    }
+
+    // La última línea del rango sigue en el siguiente: se completa con un
+    // GetObject abierto que se corta en el primer "\n" (o a los 64KB, y
+    // entonces la línea es demasiado larga igual que en la lectura secuencial)
+    if r.end < size && owned[len(owned)-1] != '\n' {
+        tail, err := getLineTail(ctx, s3Client, bucket, key, r.end)
+        if err != nil {
+            log.Printf("❌ ERROR: Failed to read the line crossing byte %d: %v", r.end, err)
+            return newlines, 1, true
+        }
+        owned = append(owned, tail...)
+    }
+
+    reader := newLineReader(bytes.NewReader(owned))
+    reader.line = firstLine - 1
+    _, errorCount, _ := processLines(reader, source, writer, lineErrors, nil)
+    return newlines, errorCount, false
+}
+
+func getRange(ctx context.Context, s3Client s3API, bucket, key, byteRange string) ([]byte, error) {
+    result, err := s3Client.GetObject(ctx, &s3.GetObjectInput{
+        Bucket: &bucket,
+        Key:    &key,
+        Range:  &byteRange,
+    })
+    if err != nil {
+        return nil, err
+    }
+    defer result.Body.Close()
+    return io.ReadAll(result.Body)
+}
+
+func getLineTail(ctx context.Context, s3Client s3API, bucket, key string, offset int64) ([]byte, error) {
+    byteRange := fmt.Sprintf("bytes=%d-", offset)
+    result, err := s3Client.GetObject(ctx, &s3.GetObjectInput{
+        Bucket: &bucket,
+        Key:    &key,
+        Range:  &byteRange,
+    })
+    if err != nil {
+        return nil, err
+    }
+    defer result.Body.Close()
+    tail, err := bufio.NewReaderSize(result.Body, readBufferSize).ReadSlice('\n')
+    if err != nil && err != io.EOF && err != bufio.ErrBufferFull {
+        return nil, err
+    }
+    return tail, nil
+}
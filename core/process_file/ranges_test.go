@@ -0,0 +1,169 @@
+package main
+
+import (
+	"bytes"
+	"context"
+	"crypto/sha256"
+	"fmt"
+	"io"
+	"reflect"
+	"strings"
+	"sync"
+	"testing"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/service/s3"
+)
+
+// S3 en memoria con soporte de Range ("bytes=a-b" y "bytes=a-"). Con
+// bandwidth > 0 cada respuesta se entrega a esa velocidad en bytes/s, como
+// una conexión a S3.
+type fakeS3 struct {
+    mu        sync.Mutex
+    objects   map[string][]byte
+    gets      int
+    bandwidth int64
+    // Si es > 0, leer el objeto entero falla después de esa cantidad de bytes
+    failAfter int
+    ranges    []string
+}
+
+type failingReader struct {
+    reader io.Reader
+    left   int
+}
+
+func (r *failingReader) Read(p []byte) (int, error) {
+    if r.left <= 0 {
+        return 0, fmt.Errorf("connection reset")
+    }
+    if len(p) > r.left {
+        p = p[:r.left]
+    }
+    n, err := r.reader.Read(p)
+    r.left -= n
+    return n, err
+}
+
+type throttledReader struct {
+    reader    io.Reader
+    bandwidth int64
+}
+
+func (r *throttledReader) Read(p []byte) (int, error) {
+    n, err := r.reader.Read(p)
+    time.Sleep(time.Duration(int64(n) * int64(time.Second) / r.bandwidth))
+    return n, err
+}
+
+func (f *fakeS3) GetObject(ctx context.Context, params *s3.GetObjectInput, optFns ...func(*s3.Options)) (*s3.GetObjectOutput, error) {
+    f.mu.Lock()
+    f.gets++
+    if params.Range != nil {
+        f.ranges = append(f.ranges, *params.Range)
+    }
+    f.mu.Unlock()
+    data, ok := f.objects[*params.Key]
+    if !ok {
+        return nil, fmt.Errorf("NoSuchKey: %s", *params.Key)
+    }
+    etag := fmt.Sprintf("\"%x\"", sha256.Sum256(data))
+    size := int64(len(data))
+    if params.Range != nil {
+        var start, end int64
+        if n, _ := fmt.Sscanf(*params.Range, "bytes=%d-%d", &start, &end); n < 2 {
+            end = size - 1
+        }
+        if end >= size {
+            end = size - 1
+        }
+        data = data[start : end+1]
+    }
+    length := int64(len(data))
+    var body io.Reader = bytes.NewReader(data)
+    if f.bandwidth > 0 {
+        body = &throttledReader{reader: body, bandwidth: f.bandwidth}
+    }
+    if f.failAfter > 0 && params.Range == nil {
+        body = &failingReader{reader: body, left: f.failAfter}
+    }
+    return &s3.GetObjectOutput{Body: io.NopCloser(body), ContentLength: &length, ETag: &etag}, nil
+}
+
+func withRanges(splitBytes, sizeBytes int64, workers int, run func()) {
+    previous := []int64{rangeSplitBytes, rangeSizeBytes, int64(rangeWorkers)}
+    rangeSplitBytes, rangeSizeBytes, rangeWorkers = splitBytes, sizeBytes, workers
+    defer func() {
+        rangeSplitBytes, rangeSizeBytes, rangeWorkers = previous[0], previous[1], int(previous[2])
+    }()
+    run()
+}
+
+func rangesStatement() string {
+    var builder strings.Builder
+    for i := 0; i < 400; i++ {
+        switch {
+        case i == 123:
+            builder.WriteString(strings.Repeat("x", maxLineLength+10) + "\n")
+        case i%37 == 0:
+            builder.WriteString("\n")
+        case i%41 == 0:
+            builder.WriteString("bad line\n")
+        case i%2 == 0:
+            fmt.Fprintf(&builder, " user-%d , 2024-02-%02d , %d.50\r\n", i%7, i%28+1, i-200)
+        default:
+            fmt.Fprintf(&builder, "user-%d,2024-01-%02d,%d\n", i%7, i%28+1, i)
+        }
+    }
+    // Última línea sin "\n"
+    builder.WriteString("user-1,2024-03-01,9.99")
+    return builder.String()
+}
+
+func processWithRanges(t *testing.T, content string, splitBytes, sizeBytes int64, workers int) (*fakeDynamo, fileStats) {
+    storage := &fakeS3{objects: map[string][]byte{"statement.csv": []byte(content)}}
+    fake := newFakeDynamo(0)
+    var stats fileStats
+    withRanges(splitBytes, sizeBytes, workers, func() {
+        stats = processObject(context.Background(), storage, fake, "bucket", "statement.csv")
+    })
+    return fake, stats
+}
+
+// Los rangos, corten donde corten, escriben los mismos ids y movimientos que
+// la lectura secuencial
+func TestRangesMatchSequentialProcessing(t *testing.T) {
+    content := rangesStatement()
+    sequential, sequentialStats := processWithRanges(t, content, 1<<40, rangeSizeBytes, 4)
+    if sequentialStats.written == 0 || sequentialStats.errors == 0 {
+        t.Fatalf("unexpected sequential stats %+v", sequentialStats)
+    }
+
+    for _, size := range []int64{64, 1000, 4096, int64(len(content)) - 1} {
+        ranged, stats := processWithRanges(t, content, 0, size, 4)
+        if stats != sequentialStats {
+            t.Fatalf("ranges of %d bytes: stats %+v, sequential %+v", size, stats, sequentialStats)
+        }
+        if !reflect.DeepEqual(ranged.items, sequential.items) {
+            t.Fatalf("ranges of %d bytes: %d items differ from sequential %d", size, len(ranged.items), len(sequential.items))
+        }
+    }
+}
+
+// Lectura secuencial contra rangos de 512KB en 4 workers para 100k filas
+// (2.6MB) con 2MB/s por conexión a S3
+func BenchmarkProcessLargeFile(b *testing.B) {
+    content := statementFile(100_000)
+    storage := &fakeS3{objects: map[string][]byte{"statement.csv": content}, bandwidth: 2 * 1024 * 1024}
+
+    for _, workers := range []int{1, 4} {
+        b.Run(fmt.Sprintf("workers-%d", workers), func(b *testing.B) {
+            withRanges(0, 512*1024, workers, func() {
+                for i := 0; i < b.N; i++ {
+                    processObject(context.Background(), storage, newFakeDynamo(0), "bucket", "statement.csv")
+                }
+            })
+            b.ReportMetric(float64(100_000*b.N)/b.Elapsed().Seconds(), "rows/s")
+        })
+    }
+}
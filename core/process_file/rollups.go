@@ -0,0 +1,180 @@
+package main
+
+import (
+	"context"
+	"errors"
+	"log"
+	"sort"
+	"strconv"
+
+	"github.com/aws/aws-sdk-go-v2/aws"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+// Los rollups de un tramo del archivo (lo escrito desde el checkpoint
+// anterior, o el archivo entero si se leyó por rangos) se aplican en dos
+// pasos, así una Lambda que muere a mitad no los pierde ni los suma dos veces:
+//
+//  1. Se guardan en file_ingestions como ítems "bucket/key#rollups#<línea>#<n>"
+//     de hasta rollupChunkBuckets buckets, y recién después avanza el estado
+//     del archivo, con rollup_line y rollup_chunks en el mismo PutItem.
+//  2. Cada ítem se aplica con un TransactWriteItems que suma sus buckets y lo
+//     borra, condicionado a que todavía exista.
+//
+// Si la Lambda muere antes del paso 1, el reintento vuelve a escribir el
+// tramo y encuentra sus filas con el mismo "file": las cuenta como escritas
+// y no como duplicados. Si muere después, la próxima invocación aplica los
+// ítems que queden antes de seguir.
+
+// 99 ADD más el Delete del ítem: el máximo de 100 acciones por transacción
+const rollupChunkBuckets = 99
+
+func rollupChunkKey(file string, line, chunk int) string {
+    return file + "#rollups#" + strconv.Itoa(line) + "#" + strconv.Itoa(chunk)
+}
+
+// Suma los rollups de from a into
+func mergeRollups(into, from map[rollupKey]*rollupDelta) {
+    for key, delta := range from {
+        total, ok := into[key]
+        if !ok {
+            total = &rollupDelta{}
+            into[key] = total
+        }
+        total.Count += delta.Count
+        total.Balance += delta.Balance
+        total.CreditCount += delta.CreditCount
+        total.CreditTotal += delta.CreditTotal
+        total.DebitCount += delta.DebitCount
+        total.DebitTotal += delta.DebitTotal
+    }
+}
+
+// Guarda los rollups del tramo que termina en line como ítems pendientes y
+// devuelve cuántos escribió
+func saveRollupChunks(ctx context.Context, client dynamoAPI, file string, line int, rollups map[rollupKey]*rollupDelta) (int, error) {
+    keys := make([]rollupKey, 0, len(rollups))
+    for key := range rollups {
+        keys = append(keys, key)
+    }
+    sort.Slice(keys, func(i, j int) bool {
+        if keys[i].UserID != keys[j].UserID {
+            return keys[i].UserID < keys[j].UserID
+        }
+        return keys[i].Bucket < keys[j].Bucket
+    })
+
+    tableName := ingestionsTableName
+    chunks := 0
+    for start := 0; start < len(keys); start += rollupChunkBuckets {
+        end := start + rollupChunkBuckets
+        if end > len(keys) {
+            end = len(keys)
+        }
+        buckets := make([]types.AttributeValue, 0, end-start)
+        for _, key := range keys[start:end] {
+            delta := rollups[key]
+            buckets = append(buckets, &types.AttributeValueMemberM{Value: map[string]types.AttributeValue{
+                "UserId":       &types.AttributeValueMemberS{Value: key.UserID},
+                "Bucket":       &types.AttributeValueMemberS{Value: key.Bucket},
+                "tx_count":     &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.Count, 10)},
+                "balance":      &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.Balance, 10)},
+                "credit_count": &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.CreditCount, 10)},
+                "credit_total": &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.CreditTotal, 10)},
+                "debit_count":  &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.DebitCount, 10)},
+                "debit_total":  &types.AttributeValueMemberN{Value: strconv.FormatInt(delta.DebitTotal, 10)},
+            }})
+        }
+        _, err := client.PutItem(ctx, &dynamodb.PutItemInput{
+            TableName: &tableName,
+            Item: map[string]types.AttributeValue{
+                "file":    &types.AttributeValueMemberS{Value: rollupChunkKey(file, line, chunks)},
+                "rollups": &types.AttributeValueMemberL{Value: buckets},
+            },
+        })
+        if err != nil {
+            return chunks, err
+        }
+        chunks++
+    }
+    return chunks, nil
+}
+
+// Aplica los ítems pendientes del tramo que termina en line. Los que ya no
+// existen se aplicaron antes. Devuelve cuántos no se pudieron aplicar.
+func applyRollupChunks(ctx context.Context, client dynamoAPI, file string, line, chunks int) int {
+    tableName := ingestionsTableName
+    errorCount := 0
+    for chunk := 0; chunk < chunks; chunk++ {
+        key := map[string]types.AttributeValue{"file": &types.AttributeValueMemberS{Value: rollupChunkKey(file, line, chunk)}}
+        output, err := client.GetItem(ctx, &dynamodb.GetItemInput{TableName: &tableName, Key: key, ConsistentRead: aws.Bool(true)})
+        if err != nil {
+            log.Printf("❌ ERROR: Failed to read pending rollups %s: %v", rollupChunkKey(file, line, chunk), err)
+            errorCount++
+            continue
+        }
+        if output == nil || output.Item == nil {
+            continue
+        }
+
+        list, _ := output.Item["rollups"].(*types.AttributeValueMemberL)
+        var items []types.TransactWriteItem
+        if list != nil {
+            for _, value := range list.Value {
+                bucket, ok := value.(*types.AttributeValueMemberM)
+                if !ok {
+                    continue
+                }
+                rollup := rollupKey{UserID: stringAttribute(bucket.Value, "UserId"), Bucket: stringAttribute(bucket.Value, "Bucket")}
+                delta := &rollupDelta{
+                    Count:       int64(numberAttribute(bucket.Value, "tx_count")),
+                    Balance:     int64(numberAttribute(bucket.Value, "balance")),
+                    CreditCount: int64(numberAttribute(bucket.Value, "credit_count")),
+                    CreditTotal: int64(numberAttribute(bucket.Value, "credit_total")),
+                    DebitCount:  int64(numberAttribute(bucket.Value, "debit_count")),
+                    DebitTotal:  int64(numberAttribute(bucket.Value, "debit_total")),
+                }
+                items = append(items, types.TransactWriteItem{Update: rollupUpdate(rollup, delta)})
+            }
+        }
+        items = append(items, types.TransactWriteItem{Delete: &types.Delete{
+            TableName:                &tableName,
+            Key:                      key,
+            ConditionExpression:      aws.String("attribute_exists(#file)"),
+            ExpressionAttributeNames: map[string]string{"#file": "file"},
+        }})
+        if !applyRollupChunk(ctx, client, items) {
+            log.Printf("❌ ERROR: Failed to apply pending rollups %s", rollupChunkKey(file, line, chunk))
+            errorCount++
+        }
+    }
+    return errorCount
+}
+
+// Reintenta con backoff las transacciones canceladas por conflictos con otros
+// archivos del mismo usuario o por throttling. Si la condición del Delete
+// falla, otra invocación ya aplicó el ítem.
+func applyRollupChunk(ctx context.Context, client dynamoAPI, items []types.TransactWriteItem) bool {
+    for attempt := 0; ; attempt++ {
+        _, err := client.TransactWriteItems(ctx, &dynamodb.TransactWriteItemsInput{TransactItems: items})
+        if err == nil {
+            return true
+        }
+        var canceled *types.TransactionCanceledException
+        var throughput *types.ProvisionedThroughputExceededException
+        switch {
+        case errors.As(err, &canceled):
+            if reasons := canceled.CancellationReasons; len(reasons) == len(items) && aws.ToString(reasons[len(items)-1].Code) == "ConditionalCheckFailed" {
+                return true
+            }
+        case errors.As(err, &throughput):
+        default:
+            log.Printf("⚠️ Could not apply %d rollup buckets: %v", len(items)-1, err)
+            return false
+        }
+        if attempt >= batchWriteRetries || !sleepBackoff(ctx, attempt) {
+            return false
+        }
+    }
+}
@@ -0,0 +1,150 @@
+package main
+
+import (
+	"crypto/sha256"
+	"fmt"
+	"math"
+	"reflect"
+	"strconv"
+	"testing"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+// Cómo se armaban el id y el monto antes, con fmt. El formato va en una
+// variable para que vet no marque el desfase de argumentos que tenía.
+var legacyIDFormat = "%s-%s-%s-%.2f-%d"
+
+func legacyUniqueID(date, amountText string, amount float64, lineNumber int) string {
+    data := fmt.Sprintf(legacyIDFormat, date, amountText, amount, lineNumber)
+    return fmt.Sprintf("%x", sha256.Sum256([]byte(data)))[:16]
+}
+
+func legacyAddToRollups(rollups map[rollupKey]*rollupDelta, userID string, date time.Time, amount float64) {
+    cents := int64(math.Round(amount * 100))
+    for _, bucket := range []string{date.Format("2006"), date.Format("2006-01"), date.Format("2006-01-02")} {
+        key := rollupKey{UserID: userID, Bucket: bucket}
+        delta, ok := rollups[key]
+        if !ok {
+            delta = &rollupDelta{}
+            rollups[key] = delta
+        }
+        delta.Count++
+        delta.Balance += cents
+    }
+}
+
+func TestGenerateUniqueID(t *testing.T) {
+    seen := make(map[string]bool)
+    for _, source := range []string{"5d41402abc4b2a76b9719d911017c592", "7d793037a0760186574b0282f2f435e7", "bucket/statement.csv"} {
+        for _, userID := range []string{"user-1", "user-10", ""} {
+            for _, line := range []int{1, 7, 10, 123456} {
+                expected := fmt.Sprintf("%x", sha256.Sum256([]byte(fmt.Sprintf("%s\x00%s\x00%d", source, userID, line))))[:32]
+                id := generateUniqueID(source, []byte(userID), line)
+                if id != expected {
+                    t.Fatalf("%s %s %d: %s, expected %s", source, userID, line, id, expected)
+                }
+                if seen[id] {
+                    t.Fatalf("%s %s %d: repeated id %s", source, userID, line, id)
+                }
+                seen[id] = true
+            }
+        }
+    }
+    // Mismo valor que local_aws/processor.py
+    if id := generateUniqueID("5d41402abc4b2a76b9719d911017c592", []byte("user-1"), 7); id != "3951aa04651add6e53869afda0f263af" {
+        t.Fatalf("id changed: %s", id)
+    }
+}
+
+func TestMovementSource(t *testing.T) {
+    if source := movementSource("bucket/a.csv", "\"5d41402abc4b2a76b9719d911017c592\""); source != "5d41402abc4b2a76b9719d911017c592" {
+        t.Fatalf("source %q", source)
+    }
+    if source := movementSource("bucket/a.csv", ""); source != "bucket/a.csv" {
+        t.Fatalf("source %q", source)
+    }
+}
+
+func TestParseDateMatchesTimeParse(t *testing.T) {
+    for _, text := range []string{"2024-01-10", "2024-02-29", "2023-02-29", "2024-13-01", "2024-00-10", "2024-04-31", "0000-01-01", "2024-1-10", "2024/01/10", "", "2024-01-1x"} {
+        expected, expectedErr := time.Parse("2006-01-02", text)
+        got, err := parseDate([]byte(text))
+        if !reflect.DeepEqual(got, expected) || fmt.Sprint(err) != fmt.Sprint(expectedErr) {
+            t.Fatalf("%q: %v %v, expected %v %v", text, got, err, expected, expectedErr)
+        }
+    }
+}
+
+func TestParseAmountMatchesParseFloat(t *testing.T) {
+    for _, text := range []string{"100.50", "-50.25", "+3", "-0", "0.1", ".5", "5.", "0.3", "999999999999999", "9999999999999999", "123456.789012345", "1e3", "1_000", "", "-", ".", "1.2.3", "abc", "0x10", "Inf"} {
+        expected, expectedErr := strconv.ParseFloat(text, 64)
+        got, err := parseAmount([]byte(text))
+        if math.Float64bits(got) != math.Float64bits(expected) || fmt.Sprint(err) != fmt.Sprint(expectedErr) {
+            t.Fatalf("%q: %v %v, expected %v %v", text, got, err, expected, expectedErr)
+        }
+    }
+}
+
+// Mismos casos que test_parse_cents en app/storage/test/test_batch.py: la
+// API y el procesador redondean los centavos con la misma regla
+func TestAmountCentsRoundsHalfAwayFromZero(t *testing.T) {
+    cases := []struct {
+        text  string
+        cents int64
+    }{
+        {"12.50", 1250}, {"12.5", 1250}, {"-0.05", -5}, {"-7", -700}, {"+60.5", 6050},
+        {"1E+2", 10000}, {"0.125", 13}, {"-0.125", -13}, {"1.005", 101}, {"-2.675", -268},
+        {"0.124", 12}, {"0.0049", 0},
+    }
+    for _, c := range cases {
+        amount, err := parseAmount([]byte(c.text))
+        if err != nil {
+            t.Fatalf("%q: %v", c.text, err)
+        }
+        if cents := amountCents(amount); cents != c.cents {
+            t.Fatalf("%q: %d cents, expected %d", c.text, cents, c.cents)
+        }
+    }
+    if text := formatCents(amountCents(0.125)); text != "0.13" {
+        t.Fatalf("stored amount %s, expected 0.13", text)
+    }
+}
+
+// Costo de una fila válida desde los campos ya separados hasta el ítem de
+// DynamoDB y los rollups: cómo se hacía con fmt, time.Parse y tres Format
+// contra el camino actual
+func BenchmarkRowCost(b *testing.B) {
+    userID, dateText, amountText := []byte("user-1"), []byte("2024-01-15"), []byte("-45.50")
+
+    b.Run("fmt", func(b *testing.B) {
+        b.ReportAllocs()
+        rollups := make(map[rollupKey]*rollupDelta)
+        for i := 0; i < b.N; i++ {
+            date, _ := time.Parse("2006-01-02", string(dateText))
+            amount, _ := strconv.ParseFloat(string(amountText), 64)
+            transaction := Transaction{ID: legacyUniqueID(string(dateText), string(amountText), amount, i), UserID: string(userID), Date: date, Amount: amount}
+            _ = map[string]types.AttributeValue{
+                "id":        &types.AttributeValueMemberS{Value: transaction.ID},
+                "UserId":    &types.AttributeValueMemberS{Value: transaction.UserID},
+                "Date":      &types.AttributeValueMemberS{Value: transaction.Date.Format("2006-01-02")},
+                "amount":    &types.AttributeValueMemberN{Value: fmt.Sprintf("%.2f", transaction.Amount)},
+                "processed": &types.AttributeValueMemberS{Value: transaction.Processed},
+            }
+            legacyAddToRollups(rollups, transaction.UserID, date, amount)
+        }
+    })
+
+    b.Run("current", func(b *testing.B) {
+        b.ReportAllocs()
+        rollups := make(map[rollupKey]*rollupDelta)
+        for i := 0; i < b.N; i++ {
+            date, _ := parseDate(dateText)
+            amount, _ := parseAmount(amountText)
+            transaction := Transaction{ID: generateUniqueID("5d41402abc4b2a76b9719d911017c592", userID, i), UserID: string(userID), Date: date, Amount: amount}
+            transactionItem(transaction)
+            addToRollups(rollups, transaction.UserID, date, amount)
+        }
+    })
+}
@@ -0,0 +1,129 @@
+package main
+
+import (
+	"context"
+	"errors"
+	"hash/fnv"
+	"log"
+	"strconv"
+	"sync"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/aws"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+// Usuarios cuyos movimientos nuevos se reparten entre "UserId#0" ..
+// "UserId#N-1" en lugar de quedar todos bajo UserId, con clave "UserId" y
+// la cantidad de shards en "shards". La API lee UserId y todos sus shards y
+// junta los resultados (MOVEMENT_SHARDING en la API).
+const shardsTableName = "movement_shards"
+
+// Un usuario con más de SHARD_THRESHOLD filas en un archivo pasa a escribirse
+// en SHARD_COUNT shards; 0 desactiva el sharding. El mapa de shards se
+// recarga cada shardMapTTL.
+var (
+    shardThreshold = envInt("SHARD_THRESHOLD", 0)
+    shardCount     = envInt("SHARD_COUNT", 8)
+    shardMapTTL    = time.Minute
+)
+
+// Copia en memoria de movement_shards, compartida entre invocaciones como
+// los clientes
+type shardMap struct {
+    mu     sync.Mutex
+    shards map[string]int
+    loaded time.Time
+}
+
+var userShards = &shardMap{}
+
+// Vuelve a leer la tabla con un Scan si la copia venció. Si falla se sigue
+// con la anterior: un usuario que no figura se escribe bajo UserId, que la
+// API siempre lee, así que nunca se pierden filas.
+func (m *shardMap) Refresh(ctx context.Context, client dynamoAPI) {
+    m.mu.Lock()
+    defer m.mu.Unlock()
+    if m.shards != nil && time.Since(m.loaded) < shardMapTTL {
+        return
+    }
+    shards := make(map[string]int)
+    input := &dynamodb.ScanInput{TableName: aws.String(shardsTableName)}
+    for {
+        output, err := client.Scan(ctx, input)
+        if err != nil {
+            log.Printf("⚠️ Could not load the shard map: %v", err)
+            if m.shards == nil {
+                m.shards = make(map[string]int)
+            }
+            return
+        }
+        for _, item := range output.Items {
+            shards[stringAttribute(item, "UserId")] = numberAttribute(item, "shards")
+        }
+        if len(output.LastEvaluatedKey) == 0 {
+            break
+        }
+        input.ExclusiveStartKey = output.LastEvaluatedKey
+    }
+    m.shards = shards
+    m.loaded = time.Now()
+}
+
+func (m *shardMap) Shards(userID string) int {
+    m.mu.Lock()
+    defer m.mu.Unlock()
+    return m.shards[userID]
+}
+
+// Sube los shards del usuario a `shards` (nunca los baja: lo ya escrito en un
+// shard tiene que seguir leyéndose) y devuelve los que quedaron
+func (m *shardMap) Promote(ctx context.Context, client dynamoAPI, userID string, shards int) int {
+    key := map[string]types.AttributeValue{"UserId": &types.AttributeValueMemberS{Value: userID}}
+    _, err := client.UpdateItem(ctx, &dynamodb.UpdateItemInput{
+        TableName:           aws.String(shardsTableName),
+        Key:                 key,
+        UpdateExpression:    aws.String("SET shards = :shards"),
+        ConditionExpression: aws.String("attribute_not_exists(shards) OR shards < :shards"),
+        ExpressionAttributeValues: map[string]types.AttributeValue{
+            ":shards": &types.AttributeValueMemberN{Value: strconv.Itoa(shards)},
+        },
+    })
+    var conditionFailed *types.ConditionalCheckFailedException
+    if errors.As(err, &conditionFailed) {
+        // Otro contenedor ya lo promovió, con estos shards o más
+        output, getErr := client.GetItem(ctx, &dynamodb.GetItemInput{TableName: aws.String(shardsTableName), Key: key, ConsistentRead: aws.Bool(true)})
+        if getErr != nil {
+            log.Printf("⚠️ Could not read the shards of %s: %v", userID, getErr)
+            return m.Shards(userID)
+        }
+        shards = numberAttribute(output.Item, "shards")
+    } else if err != nil {
+        log.Printf("⚠️ Could not shard %s: %v", userID, err)
+        return m.Shards(userID)
+    }
+
+    m.mu.Lock()
+    defer m.mu.Unlock()
+    if m.shards == nil {
+        m.shards = make(map[string]int)
+    }
+    if shards > m.shards[userID] {
+        m.shards[userID] = shards
+    }
+    log.Printf("🔀 %s is written to %d shards", userID, m.shards[userID])
+    return m.shards[userID]
+}
+
+// Partición del movimiento: UserId sin shards, si no "UserId#n" con n el
+// FNV-1a del id módulo la cantidad de shards (movement_partition en
+// local_aws/processor.py)
+func shardPartition(userID, id string, shards int) string {
+    if shards <= 0 {
+        return userID
+    }
+    hash := fnv.New32a()
+    hash.Write([]byte(id))
+    return userID + "#" + strconv.FormatUint(uint64(hash.Sum32())%uint64(shards), 10)
+}
@@ -0,0 +1,98 @@
+package main
+
+import (
+	"fmt"
+	"strings"
+	"testing"
+
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+// Activa el sharding para un test con un mapa de shards vacío
+func withSharding(t *testing.T, threshold, count int) {
+    previousThreshold, previousCount, previousMap := shardThreshold, shardCount, userShards
+    shardThreshold, shardCount, userShards = threshold, count, &shardMap{}
+    t.Cleanup(func() {
+        shardThreshold, shardCount, userShards = previousThreshold, previousCount, previousMap
+    })
+}
+
+// UserId con el que quedó guardado cada movimiento
+func (f *fakeDynamo) partitions() map[string]int {
+    f.mu.Lock()
+    defer f.mu.Unlock()
+    partitions := make(map[string]int)
+    for _, item := range f.items {
+        partitions[item["UserId"].(*types.AttributeValueMemberS).Value]++
+    }
+    return partitions
+}
+
+func TestShardPartition(t *testing.T) {
+    if partition := shardPartition("user-1", "tx-1", 0); partition != "user-1" {
+        t.Fatalf("unsharded partition %q", partition)
+    }
+    seen := make(map[string]bool)
+    for i := 0; i < 200; i++ {
+        partition := shardPartition("user-1", fmt.Sprintf("tx-%d", i), 4)
+        if !strings.HasPrefix(partition, "user-1#") || partition != shardPartition("user-1", fmt.Sprintf("tx-%d", i), 4) {
+            t.Fatalf("partition %q", partition)
+        }
+        seen[partition] = true
+    }
+    if len(seen) != 4 {
+        t.Fatalf("rows spread over %d shards, expected 4", len(seen))
+    }
+    // Mismo valor que local_aws/processor.py
+    if partition := shardPartition("user-1", "3951aa04651add6e53869afda0f263af", 8); partition != "user-1#4" {
+        t.Fatalf("partition changed: %s", partition)
+    }
+}
+
+func TestBatchWriterShardsHeavyUsers(t *testing.T) {
+    withSharding(t, 30, 4)
+    fake := newFakeDynamo(0)
+    transactions := testTransactions(100)
+    for i := 0; i < 5; i++ {
+        transactions = append(transactions, Transaction{ID: fmt.Sprintf("light-%d", i), UserID: "user-2", Date: transactions[i].Date, Processed: "Ok"})
+    }
+
+    writer := writeAll(fake, transactions)
+
+    if fake.shards["user-1"] != 4 || fake.shards["user-2"] != 0 {
+        t.Fatalf("shard map %v", fake.shards)
+    }
+    partitions := fake.partitions()
+    // Las filas hasta el umbral quedan bajo UserId, el resto en los shards
+    if partitions["user-1"] != 30 || partitions["user-2"] != 5 {
+        t.Fatalf("partitions %v", partitions)
+    }
+    sharded := 0
+    for shard := 0; shard < 4; shard++ {
+        sharded += partitions[fmt.Sprintf("user-1#%d", shard)]
+    }
+    if sharded != 70 {
+        t.Fatalf("%d rows in shards, expected 70: %v", sharded, partitions)
+    }
+    // Los rollups siguen siendo del usuario
+    if writer.written != 105 || rollupCount(writer.rollups, "2024") != 100 {
+        t.Fatalf("written %d, 2024 rollup %d", writer.written, rollupCount(writer.rollups, "2024"))
+    }
+}
+
+func TestBatchWriterUsesStoredShardMap(t *testing.T) {
+    withSharding(t, 1000, 8)
+    fake := newFakeDynamo(0)
+    // Promovido por otro contenedor con menos shards que SHARD_COUNT
+    fake.shards["user-1"] = 2
+
+    writeAll(fake, testTransactions(50))
+
+    partitions := fake.partitions()
+    if partitions["user-1#0"]+partitions["user-1#1"] != 50 {
+        t.Fatalf("partitions %v", partitions)
+    }
+    if fake.shards["user-1"] != 2 {
+        t.Fatalf("shards changed to %d", fake.shards["user-1"])
+    }
+}
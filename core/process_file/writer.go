@@ -0,0 +1,462 @@
+package main
+
+import (
+	"context"
+	"errors"
+	"log"
+	"math/rand"
+	"sync"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/aws"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb"
+	"github.com/aws/aws-sdk-go-v2/service/dynamodb/types"
+)
+
+// Ítems por lote: el máximo de un BatchWriteItem. Cada lote es además un
+// BatchGetItem (hasta 100 claves) y, para las filas que la lectura no
+// descarta, un TransactWriteItems (hasta 100 acciones).
+const batchWriteLimit = 25
+
+// WRITE_WORKERS lotes en vuelo a la vez; BATCH_WRITE_RETRIES reintentos de
+// ítems sin procesar o cancelados por throttling o conflictos antes de darlos
+// por fallidos
+var (
+    writeWorkers      = envInt("WRITE_WORKERS", 8)
+    batchWriteRetries = envInt("BATCH_WRITE_RETRIES", 8)
+    retryBaseDelay    = 50 * time.Millisecond
+    retryMaxDelay     = 2 * time.Second
+)
+
+// Ids escritos o encontrados por este contenedor, compartido entre
+// invocaciones como los clientes. Un id marcado que la lectura previa no
+// encuentra (un falso positivo, o una fila que cambió entre tanto) se escribe
+// con condición y no con BatchWriteItem. DEDUPE_FILTER_SIZE ids con 1% de falsos
+// positivos son unos 1.2MB por millón.
+var seenIDs = newBloomFilter(envInt("DEDUPE_FILTER_SIZE", 1000000), 0.01)
+
+const movementCondition = "attribute_not_exists(id)"
+
+// Subconjunto del cliente de DynamoDB que usa el procesador, para poder
+// reemplazarlo en tests y benchmarks
+type dynamoAPI interface {
+    PutItem(ctx context.Context, params *dynamodb.PutItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.PutItemOutput, error)
+    GetItem(ctx context.Context, params *dynamodb.GetItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.GetItemOutput, error)
+    BatchGetItem(ctx context.Context, params *dynamodb.BatchGetItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.BatchGetItemOutput, error)
+    BatchWriteItem(ctx context.Context, params *dynamodb.BatchWriteItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.BatchWriteItemOutput, error)
+    TransactWriteItems(ctx context.Context, params *dynamodb.TransactWriteItemsInput, optFns ...func(*dynamodb.Options)) (*dynamodb.TransactWriteItemsOutput, error)
+    UpdateItem(ctx context.Context, params *dynamodb.UpdateItemInput, optFns ...func(*dynamodb.Options)) (*dynamodb.UpdateItemOutput, error)
+    Scan(ctx context.Context, params *dynamodb.ScanInput, optFns ...func(*dynamodb.Options)) (*dynamodb.ScanOutput, error)
+}
+
+func transactionItem(transaction Transaction) map[string]types.AttributeValue {
+    partition := transaction.Partition
+    if partition == "" {
+        partition = transaction.UserID
+    }
+    return map[string]types.AttributeValue{
+        "id":        &types.AttributeValueMemberS{Value: transaction.ID},
+        "UserId":    &types.AttributeValueMemberS{Value: partition},
+        "Date":      &types.AttributeValueMemberS{Value: transaction.Date.Format("2006-01-02")},
+        "amount":    &types.AttributeValueMemberN{Value: formatCents(amountCents(transaction.Amount))},
+        "processed": &types.AttributeValueMemberS{Value: transaction.Processed},
+    }
+}
+
+// Agrupa las transacciones en lotes de 25 y los escribe con un pool acotado
+// de workers. Solo se escriben los movimientos cuyo id no existe: los rollups
+// se acumulan solo con los que DynamoDB insertó, así reprocesar un archivo no
+// los vuelve a sumar. Las filas guardan el archivo
+// del que salieron en "file"; las que ya estaban escritas por el mismo
+// archivo (una invocación anterior que murió antes de guardar sus rollups)
+// cuentan como escritas y no como duplicados.
+type batchWriter struct {
+    ctx       context.Context
+    client    dynamoAPI
+    tableName string
+    // "bucket/key" del archivo; vacío no marca las filas
+    file      string
+    batches   chan []Transaction
+    pendingMu sync.Mutex
+    pending   []Transaction
+    wg        sync.WaitGroup
+    // Lotes encolados que todavía no terminaron de escribirse
+    inflight  sync.WaitGroup
+    mu        sync.Mutex
+    written   int
+    // Movimientos que ya estaban escritos (mismo id)
+    duplicates int
+    failed    int
+    rollups   map[rollupKey]*rollupDelta
+    errors    *lineErrorLogger
+    started   time.Time
+    // Filas encoladas por usuario, para promover a los que pasan SHARD_THRESHOLD
+    userRows  map[string]int
+}
+
+func newBatchWriter(ctx context.Context, client dynamoAPI, tableName, file string, workers int, errors *lineErrorLogger) *batchWriter {
+    if workers < 1 {
+        workers = 1
+    }
+    w := &batchWriter{
+        ctx:       ctx,
+        client:    client,
+        tableName: tableName,
+        file:      file,
+        batches:   make(chan []Transaction, workers),
+        rollups:   make(map[rollupKey]*rollupDelta),
+        errors:    errors,
+        started:   time.Now(),
+        userRows:  make(map[string]int),
+    }
+    if shardThreshold > 0 {
+        userShards.Refresh(ctx, client)
+    }
+    for i := 0; i < workers; i++ {
+        w.wg.Add(1)
+        go w.work()
+    }
+    return w
+}
+
+// Encola una transacción; bloquea si todos los workers están ocupados,
+// así la memoria queda acotada a unos pocos lotes. Se puede llamar desde
+// varias goroutines (una por rango del archivo).
+func (w *batchWriter) Put(transaction Transaction) {
+    w.pendingMu.Lock()
+    defer w.pendingMu.Unlock()
+    if shardThreshold > 0 {
+        transaction.Partition = w.partition(transaction)
+    }
+    w.pending = append(w.pending, transaction)
+    if len(w.pending) == batchWriteLimit {
+        w.send()
+    }
+}
+
+// Partición de la transacción. Un usuario sin shards que pasa SHARD_THRESHOLD
+// filas en este archivo se promueve una sola vez; sus filas anteriores
+// quedan bajo UserId. Llamar con pendingMu tomado.
+func (w *batchWriter) partition(transaction Transaction) string {
+    shards := userShards.Shards(transaction.UserID)
+    if shards == 0 {
+        w.userRows[transaction.UserID]++
+        if w.userRows[transaction.UserID] == shardThreshold+1 {
+            shards = userShards.Promote(w.ctx, w.client, transaction.UserID, shardCount)
+        }
+    }
+    return shardPartition(transaction.UserID, transaction.ID, shards)
+}
+
+// Encola el lote pendiente; llamar con pendingMu tomado
+func (w *batchWriter) send() {
+    if len(w.pending) == 0 {
+        return
+    }
+    w.inflight.Add(1)
+    w.batches <- w.pending
+    w.pending = nil
+}
+
+// Envía el lote pendiente y espera a que se escriba todo lo encolado hasta
+// ahora. Después de Flush, written y failed cubren cada Put anterior.
+func (w *batchWriter) Flush() {
+    w.pendingMu.Lock()
+    w.send()
+    w.pendingMu.Unlock()
+    w.inflight.Wait()
+}
+
+// Devuelve los rollups acumulados hasta ahora y empieza de cero, para
+// aplicarlos en cada checkpoint sin volver a sumarlos al final
+func (w *batchWriter) TakeRollups() map[rollupKey]*rollupDelta {
+    w.mu.Lock()
+    defer w.mu.Unlock()
+    rollups := w.rollups
+    w.rollups = make(map[rollupKey]*rollupDelta)
+    return rollups
+}
+
+// Envía el último lote, espera a los workers y devuelve los rollups de lo escrito
+func (w *batchWriter) Close() map[rollupKey]*rollupDelta {
+    w.pendingMu.Lock()
+    w.send()
+    w.pendingMu.Unlock()
+    close(w.batches)
+    w.wg.Wait()
+    return w.rollups
+}
+
+// Filas escritas por segundo desde que se creó el writer
+func (w *batchWriter) Throughput() float64 {
+    elapsed := time.Since(w.started).Seconds()
+    if elapsed == 0 {
+        return 0
+    }
+    return float64(w.written) / elapsed
+}
+
+func (w *batchWriter) work() {
+    defer w.wg.Done()
+    for batch := range w.batches {
+        written, duplicates, failed := w.writeBatch(batch)
+        w.mu.Lock()
+        w.written += len(written)
+        w.duplicates += duplicates
+        w.failed += failed
+        for _, transaction := range written {
+            addToRollups(w.rollups, transaction.UserID, transaction.Date, transaction.Amount)
+        }
+        w.mu.Unlock()
+        w.inflight.Done()
+    }
+}
+
+// Escribe un lote. Primero lee todos sus ids con un BatchGetItem
+// consistente: los que existen son duplicados (o escritos, si la fila es de
+// este archivo). Los que la lectura confirma que no existen se escriben con
+// BatchWriteItem, un WCU por fila. Los que no puede descartar, porque la
+// lectura falló o el filtro de Bloom dice que este contenedor ya vio el id,
+// van en un TransactWriteItems condicionado a que el id no exista, que cuesta
+// dos. Devuelve las transacciones insertadas, cuántas ya existían y cuántas
+// fallaron.
+func (w *batchWriter) writeBatch(batch []Transaction) ([]Transaction, int, int) {
+    existing, unchecked := w.existingIDs(batch)
+    duplicates := 0
+    var written, fresh, flagged []Transaction
+    for _, transaction := range batch {
+        owner, found := existing[transaction.ID]
+        switch {
+        case found && w.owns(owner):
+            written = append(written, transaction)
+        case found:
+            duplicates++
+        case unchecked[transaction.ID] || seenIDs.MayContain(transaction.ID):
+            flagged = append(flagged, transaction)
+        default:
+            fresh = append(fresh, transaction)
+        }
+    }
+
+    inserted, failed := w.batchWrite(fresh)
+    written = append(written, inserted...)
+    inserted, conditionFailed, transactFailed := w.transactWrite(flagged)
+    written = append(written, inserted...)
+    duplicates += conditionFailed
+    failed += transactFailed
+    if failed > 0 {
+        return written, duplicates, failed
+    }
+
+    ids := make([]string, 0, len(batch))
+    for _, transaction := range batch {
+        ids = append(ids, transaction.ID)
+    }
+    seenIDs.Add(ids...)
+    return written, duplicates, 0
+}
+
+// Ítem de la tabla movements, con el archivo del que sale la fila
+func (w *batchWriter) movementItem(transaction Transaction) map[string]types.AttributeValue {
+    item := transactionItem(transaction)
+    if w.file != "" {
+        item["file"] = &types.AttributeValueMemberS{Value: w.file}
+    }
+    return item
+}
+
+// Escribe con un BatchWriteItem filas que la lectura confirmó nuevas. Los
+// UnprocessedItems y los rechazos por throughput se reintentan con backoff
+// exponencial y jitter completo. Devuelve las escritas y cuántas fallaron.
+func (w *batchWriter) batchWrite(batch []Transaction) ([]Transaction, int) {
+    if len(batch) == 0 {
+        return nil, 0
+    }
+    byID := make(map[string]Transaction, len(batch))
+    requests := make([]types.WriteRequest, len(batch))
+    for i, transaction := range batch {
+        byID[transaction.ID] = transaction
+        requests[i] = types.WriteRequest{PutRequest: &types.PutRequest{Item: w.movementItem(transaction)}}
+    }
+
+    var written []Transaction
+    for attempt := 0; ; attempt++ {
+        output, err := w.client.BatchWriteItem(w.ctx, &dynamodb.BatchWriteItemInput{
+            RequestItems: map[string][]types.WriteRequest{w.tableName: requests},
+        })
+        var throughput *types.ProvisionedThroughputExceededException
+        var unprocessed []types.WriteRequest
+        switch {
+        case err == nil:
+            unprocessed = output.UnprocessedItems[w.tableName]
+        case errors.As(err, &throughput):
+            unprocessed = requests
+        default:
+            w.errors.Printf("❌ ERROR: Failed to write batch of %d transactions to DynamoDB: %v", len(requests), err)
+            return written, len(requests)
+        }
+
+        retry := make(map[string]bool, len(unprocessed))
+        for _, request := range unprocessed {
+            retry[stringAttribute(request.PutRequest.Item, "id")] = true
+        }
+        for _, request := range requests {
+            if id := stringAttribute(request.PutRequest.Item, "id"); !retry[id] {
+                written = append(written, byID[id])
+            }
+        }
+        requests = unprocessed
+        if len(requests) == 0 {
+            return written, 0
+        }
+        if attempt >= batchWriteRetries {
+            w.errors.Printf("❌ ERROR: %d transactions still unprocessed after %d retries", len(requests), attempt)
+            return written, len(requests)
+        }
+        if !sleepBackoff(w.ctx, attempt) {
+            return written, len(requests)
+        }
+    }
+}
+
+// Escribe con TransactWriteItems condicionados a que cada id no exista. Si
+// la transacción se cancela, los ítems cuya condición falló son duplicados
+// (o escritos, si la fila es de este archivo), los cancelados por throttling
+// o conflictos se reintentan con backoff exponencial y jitter completo y el
+// resto se reintenta enseguida. Devuelve las insertadas, cuántas ya existían
+// y cuántas fallaron.
+func (w *batchWriter) transactWrite(pending []Transaction) ([]Transaction, int, int) {
+    duplicates := 0
+    var written []Transaction
+    // Los ítems que cancelaron la transacción por throttling o conflicto
+    // esperan en deferred mientras los que solo se cancelaron con ellos se
+    // reintentan enseguida en una transacción aparte
+    var deferred []Transaction
+    for attempt := 0; len(pending) > 0 || len(deferred) > 0; {
+        if len(pending) == 0 {
+            if attempt >= batchWriteRetries {
+                w.errors.Printf("❌ ERROR: %d transactions still unprocessed after %d retries", len(deferred), attempt)
+                return written, duplicates, len(deferred)
+            }
+            if !sleepBackoff(w.ctx, attempt) {
+                return written, duplicates, len(deferred)
+            }
+            attempt++
+            pending, deferred = deferred, nil
+        }
+
+        items := make([]types.TransactWriteItem, len(pending))
+        for i, transaction := range pending {
+            items[i] = types.TransactWriteItem{Put: &types.Put{
+                TableName:           &w.tableName,
+                Item:                w.movementItem(transaction),
+                ConditionExpression: aws.String(movementCondition),
+                // Para saber de qué archivo es la fila que ya existe
+                ReturnValuesOnConditionCheckFailure: types.ReturnValuesOnConditionCheckFailureAllOld,
+            }}
+        }
+        _, err := w.client.TransactWriteItems(w.ctx, &dynamodb.TransactWriteItemsInput{TransactItems: items})
+        if err == nil {
+            written = append(written, pending...)
+            pending = nil
+            continue
+        }
+
+        // Los errores del SDK llegan envueltos en un *smithy.OperationError
+        var canceled *types.TransactionCanceledException
+        var throughput *types.ProvisionedThroughputExceededException
+        switch {
+        case errors.As(err, &canceled):
+            retry := pending[:0:0]
+            for i, transaction := range pending {
+                code := "ThrottlingError"
+                var existing map[string]types.AttributeValue
+                if i < len(canceled.CancellationReasons) {
+                    code = aws.ToString(canceled.CancellationReasons[i].Code)
+                    existing = canceled.CancellationReasons[i].Item
+                }
+                switch {
+                case code == "ConditionalCheckFailed" && w.owns(stringAttribute(existing, "file")):
+                    written = append(written, transaction)
+                case code == "ConditionalCheckFailed":
+                    duplicates++
+                case code == "" || code == "None":
+                    retry = append(retry, transaction)
+                default:
+                    // ThrottlingError, TransactionConflict, ProvisionedThroughputExceeded...
+                    deferred = append(deferred, transaction)
+                }
+            }
+            pending = retry
+        case errors.As(err, &throughput):
+            deferred = append(deferred, pending...)
+            pending = nil
+        default:
+            w.errors.Printf("❌ ERROR: Failed to write batch of %d transactions to DynamoDB: %v", len(pending)+len(deferred), err)
+            return written, duplicates, len(pending) + len(deferred)
+        }
+    }
+    return written, duplicates, 0
+}
+
+// Si la fila ya escrita con el valor "file" de owner salió de este archivo
+func (w *batchWriter) owns(owner string) bool {
+    return w.file != "" && owner == w.file
+}
+
+// Ids del lote que ya están en la tabla, con el "file" de cada fila, y los
+// ids que no se pudieron consultar. La lectura es consistente: un id que no
+// aparece no estaba escrito cuando se leyó.
+func (w *batchWriter) existingIDs(batch []Transaction) (map[string]string, map[string]bool) {
+    keys := make([]map[string]types.AttributeValue, len(batch))
+    for i, transaction := range batch {
+        keys[i] = map[string]types.AttributeValue{"id": &types.AttributeValueMemberS{Value: transaction.ID}}
+    }
+
+    existing := make(map[string]string, len(keys))
+    request := map[string]types.KeysAndAttributes{w.tableName: {
+        Keys:                     keys,
+        ConsistentRead:           aws.Bool(true),
+        ProjectionExpression:     aws.String("id, #file"),
+        ExpressionAttributeNames: map[string]string{"#file": "file"},
+    }}
+    for attempt := 0; len(request) > 0 && attempt <= batchWriteRetries; attempt++ {
+        if attempt > 0 && !sleepBackoff(w.ctx, attempt-1) {
+            break
+        }
+        output, err := w.client.BatchGetItem(w.ctx, &dynamodb.BatchGetItemInput{RequestItems: request})
+        if err != nil {
+            log.Printf("⚠️ Could not check %d movements: %v", len(request[w.tableName].Keys), err)
+            break
+        }
+        for _, item := range output.Responses[w.tableName] {
+            existing[stringAttribute(item, "id")] = stringAttribute(item, "file")
+        }
+        request = output.UnprocessedKeys
+    }
+
+    // Sin respuesta no se sabe si existen: se escriben con condición
+    unchecked := make(map[string]bool)
+    for _, key := range request[w.tableName].Keys {
+        unchecked[stringAttribute(key, "id")] = true
+    }
+    return existing, unchecked
+}
+
+// Espera entre 0 y min(retryMaxDelay, retryBaseDelay*2^attempt); false si el
+// contexto se canceló (por ejemplo, se acaba el tiempo de la Lambda)
+func sleepBackoff(ctx context.Context, attempt int) bool {
+    limit := retryBaseDelay << uint(attempt)
+    if limit > retryMaxDelay || limit <= 0 {
+        limit = retryMaxDelay
+    }
+    timer := time.NewTimer(time.Duration(rand.Int63n(int64(limit) + 1)))
+    defer timer.Stop()
+    select {
+    case <-timer.C:
+        return true
+    case <-ctx.Done():
+        log.Printf("⏱️ Context cancelled while retrying batch: %v", ctx.Err())
+        return false
+    }
+}